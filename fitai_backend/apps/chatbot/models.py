@@ -1,6 +1,7 @@
 # apps/chatbot/models.py
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from datetime import timedelta
@@ -90,6 +91,25 @@ class Conversation(models.Model):
         self.extend_expiration()
         self.save(update_fields=['last_activity_at', 'expires_at'])
     
+    def record_messages(self, messages: int, ai_responses: int = 0):
+        """
+        Contadores + atividade + expiração em um único UPDATE com F(), sem
+        sobrescrever incrementos concorrentes. Reflete os valores na instância.
+        """
+        now = timezone.now()
+        expires_at = now + timedelta(days=7)
+        Conversation.objects.filter(pk=self.pk).update(
+            message_count=models.F('message_count') + messages,
+            ai_responses_count=models.F('ai_responses_count') + ai_responses,
+            last_activity_at=now,
+            updated_at=now,
+            expires_at=expires_at,
+        )
+        self.message_count += messages
+        self.ai_responses_count += ai_responses
+        self.last_activity_at = self.updated_at = now
+        self.expires_at = expires_at
+    
     def __str__(self):
         return f"{self.title} - {self.user.username}"
     
@@ -159,15 +179,13 @@ class Message(models.Model):
     referenced_exercise_id = models.PositiveIntegerField(null=True, blank=True, help_text="ID do exercício referenciado")
     
     def save(self, *args, **kwargs):
-        # Atualizar contador de mensagens na conversa
-        if not self.pk:  # Apenas em criação
-            conversation = self.conversation
-            conversation.message_count += 1
-            if self.message_type == 'ai':
-                conversation.ai_responses_count += 1
-            conversation.update_activity()
-        
+        creating = not self.pk
         super().save(*args, **kwargs)
+        
+        # Atualizar contador de mensagens na conversa (apenas em criação).
+        # Turnos completos do chat usam bulk_create + um único record_messages
+        if creating:
+            self.conversation.record_messages(1, 1 if self.message_type == 'ai' else 0)
     
     def mark_as_processed(self):
         """Marca mensagem como processada"""
@@ -234,9 +252,14 @@ class ChatContext(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    @staticmethod
+    def cache_key(conversation_id):
+        """Chave do cache do contexto da conversa (ver services/context_store.py)"""
+        return f"chat_context:{conversation_id}"
+    
     @classmethod
     def set_context(cls, conversation, context_type, key, value, relevance=1.0):
-        """Método helper para definir contexto"""
+        """Método helper para definir contexto (escrita direta; invalida o cache)"""
         context, created = cls.objects.get_or_create(
             conversation=conversation,
             context_type=context_type,
@@ -253,6 +276,7 @@ class ChatContext(models.Model):
             context.updated_at = timezone.now()
             context.save()
         
+        cache.delete(cls.cache_key(conversation.id))
         return context
     
     @classmethod
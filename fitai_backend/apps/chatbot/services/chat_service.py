@@ -1,5 +1,6 @@
 # apps/chatbot/services/chat_service.py
 # VERSÃO COMPLETA COM FLUXO DE GERAÇÃO DE TREINO
+import hashlib
 import json
 import time
 import re
@@ -8,18 +9,55 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 from django.conf import settings
 from django.core.cache import cache
+from django.db import transaction
 from django.utils import timezone
 from django.contrib.auth.models import User
 
 from ..models import Conversation, Message, ChatContext
+from .context_store import get_context_store, new_context_store
+from .conversation_summary import SUMMARY_KEY, SUMMARY_TYPE, ConversationSummarizer
+from .response_cache import get_response_cache
 from apps.users.models import UserProfile
 from apps.workouts.models import Workout, WorkoutSession
-from apps.recommendations.services.ai_service import AIService
+from apps.recommendations.services.ai_service import get_ai_service
+from apps.recommendations.services.prompt_registry import estimate_tokens, prompts
 import traceback
 
 logger = logging.getLogger(__name__)
 
 
+# Persona e diretrizes fixas no prefixo; perfil, foco da intenção e histórico no sufixo
+CHAT_SYSTEM_PROMPT = prompts.register(
+    'chat_system',
+    prefix="""Você é Alex, um personal trainer virtual especialista em fitness com 10 anos de experiência.
+
+PERSONALIDADE:
+- Amigável, motivador e profissional
+- Usa linguagem clara e acessível
+- Encoraja sem ser excessivo
+- Foca na segurança e na progressão gradual
+- Baseado em evidência científica
+
+DIRETRIZES DE RESPOSTA:
+- Máximo 200 palavras por resposta
+- Use emojis ocasionalmente para engajamento
+- Seja específico e prático
+- Sempre priorize a segurança
+- Adapte ao nível do usuário
+- Sempre termine perguntando se precisa de mais alguma coisa ou esclarecimento adicional""",
+    suffix="{profile}{intent_focus}{workout_history}"
+)
+
+CHAT_INTENT_FOCUS = {
+    'workout_request': "\nFOCO: Recomende exercícios seguros e progressivos. Sempre inclua aquecimento e alongamento.",
+    'technique_question': "\nFOCO: Explique técnica com clareza, enfatize segurança e sugira progressões.",
+    'nutrition_advice': "\nFOCO: Dê orientações gerais, sempre recomende consulta com nutricionista para planos específicos.",
+    'progress_inquiry': "\nFOCO: Analise dados disponíveis, celebre conquistas e sugira próximos passos.",
+    'motivation_need': "\nFOCO: Seja encorajador, lembre dos benefícios e sugira estratégias práticas.",
+    'injury_concern': "\nFOCO: Priorize segurança, recomende descanso se necessário e consulta profissional."
+}
+
+
 # ============================================================
 # 🔥 CLASSE DE FLUXO DE GERAÇÃO DE TREINO
 # ============================================================
@@ -619,7 +657,9 @@ class ChatService:
     """
     
     def __init__(self):
-        self.ai_service = AIService()
+        self.ai_service = get_ai_service()
+        self.summarizer = ConversationSummarizer()
+        self.response_cache = get_response_cache()
         self.max_context_messages = 10
         self.conversation_timeout_hours = 24
         
@@ -660,7 +700,7 @@ class ChatService:
                         confidence_score=welcome_response.get('confidence', 0.8)
                     )
             else:
-                user_message = self._save_user_message(conversation, initial_message)
+                # process_user_message grava a mensagem do usuário (uma vez só)
                 ai_response = self.process_user_message(conversation.id, initial_message)
             
             return {
@@ -686,135 +726,223 @@ class ChatService:
         start_time = time.time()
         
         try:
-            conversation = Conversation.objects.get(id=conversation_id)
+            turn = self._prepare_turn(conversation_id, message)
+            if 'error' in turn:
+                return turn
             
-            if conversation.is_expired():
-                return {'error': 'Conversa expirada'}
+            conversation = turn['conversation']
+            intent_analysis = turn['intent_analysis']
             
-            # Salvar mensagem do usuário
-            user_message = self._save_user_message(conversation, message)
-            
-            intent_analysis = self._analyze_message_intent(message, conversation)
-            user_message.intent_detected = intent_analysis.get('intent', 'general_question')
-            user_message.save()
+            # Gerar resposta da IA
+            ai_response = self._generate_ai_response(
+                conversation, message, intent_analysis, turn['cache_context'], turn['user_message'].id
+            )
             
-            self._update_conversation_context(conversation, message, intent_analysis)
+            return self._finalize_ai_turn(conversation, message, intent_analysis, ai_response, start_time)
             
-            # Gerar resposta da IA
-            ai_response = self._generate_ai_response(conversation, message, intent_analysis)
-            
-            if ai_response and ai_response.get('success'):
-                # 🔥 DEBUG: LOG ANTES DE DETECTAR
-                logger.error("=" * 80)
-                logger.error("🔍 TENTANDO DETECTAR PLANO DE TREINO")
-                logger.error(f"📝 Conteúdo da IA (primeiros 500 chars):")
-                logger.error(ai_response['content'][:500])
-                logger.error("=" * 80)
-                
-                # 🔥 DETECÇÃO AUTOMÁTICA DE PLANO
-                plan_info = WorkoutPlanExtractor.extract_plan_info(ai_response['content'])
+        except Conversation.DoesNotExist:
+            return {'error': 'Conversa não encontrada'}
+        except Exception as e:
+            logger.error(f"❌ ERRO no process_user_message: {e}")
+            logger.error(traceback.format_exc())
+            return {
+                'error': 'Erro ao processar mensagem',
+                'details': str(e),
+                'method': 'error_handler'
+            }
+    
+    def _prepare_turn(self, conversation_id: int, message: str) -> Dict:
+        """
+        Detecta intenção, atualiza contexto e grava a mensagem do usuário (já
+        com a intenção, um INSERT): ela não se perde se a resposta não chegar
+        ao fim (ex: cliente desconecta do stream). Os contadores da conversa
+        são atualizados uma vez, no fim do turno (_persist_turn)
+        """
+        conversation = Conversation.objects.get(id=conversation_id)
+        
+        if conversation.is_expired():
+            return {'error': 'Conversa expirada'}
+        
+        intent_analysis = self._analyze_message_intent(message, conversation)
+        
+        self._update_conversation_context(conversation, message, intent_analysis)
+        
+        return {
+            'conversation': conversation,
+            'intent_analysis': intent_analysis,
+            # Antes de gravar a mensagem do turno: ela não conta como conversa anterior
+            'cache_context': self._shared_cache_context(conversation),
+            'user_message': self._save_user_message(
+                conversation, message, intent_analysis.get('intent', 'general_question')
+            ),
+        }
+    
+    def _finalize_ai_turn(self, conversation: Conversation, message: str, intent_analysis: Dict,
+                          ai_response: Optional[Dict], start_time: float) -> Dict:
+        """Detecta planos de treino e persiste o fim do turno (resposta da IA ou fallback + contadores)"""
+        if ai_response and ai_response.get('success'):
+            # 🔥 DEBUG: LOG ANTES DE DETECTAR
+            logger.error("=" * 80)
+            logger.error("🔍 TENTANDO DETECTAR PLANO DE TREINO")
+            logger.error(f"📝 Conteúdo da IA (primeiros 500 chars):")
+            logger.error(ai_response['content'][:500])
+            logger.error("=" * 80)
+            
+            # 🔥 DETECÇÃO AUTOMÁTICA DE PLANO
+            plan_info = WorkoutPlanExtractor.extract_plan_info(ai_response['content'])
+            
+            # 🔥 DEBUG: LOG DEPOIS DE DETECTAR
+            logger.error("=" * 80)
+            logger.error(f"🎯 RESULTADO DA DETECÇÃO:")
+            logger.error(f"   plan_info = {plan_info}")
+            logger.error("=" * 80)
+            
+            if plan_info:
+                logger.error("🏋️ Plano detectado! Criando treinos...")
                 
-                # 🔥 DEBUG: LOG DEPOIS DE DETECTAR
-                logger.error("=" * 80)
-                logger.error(f"🎯 RESULTADO DA DETECÇÃO:")
-                logger.error(f"   plan_info = {plan_info}")
-                logger.error("=" * 80)
+                workout_creation = self._create_workouts_from_plan(
+                    conversation,
+                    plan_info
+                )
                 
-                if plan_info:
-                    logger.error("🏋️ Plano detectado! Criando treinos...")
+                if workout_creation.get('success'):
+                    logger.error(f"✅ {len(workout_creation['workouts'])} treinos criados!")
                     
-                    workout_creation = self._create_workouts_from_plan(
+                    structured_response = self._create_workout_success_response(
                         conversation,
+                        ai_response['content'],
+                        workout_creation['workouts'],
                         plan_info
                     )
                     
-                    if workout_creation.get('success'):
-                        logger.error(f"✅ {len(workout_creation['workouts'])} treinos criados!")
-                        
-                        structured_response = self._create_workout_success_response(
-                            conversation,
-                            ai_response['content'],
-                            workout_creation['workouts'],
-                            plan_info
-                        )
-                        
-                        ai_message = self._save_ai_message(
-                            conversation,
-                            structured_response['response'],
-                            response_time_ms=round((time.time() - start_time) * 1000, 2),
-                            confidence_score=ai_response.get('confidence_score', 0.8),
-                            intent='workout_generated'
-                        )
-                        
-                        conversation.message_count += 2
-                        conversation.ai_responses_count += 1
-                        conversation.last_activity_at = timezone.now()
-                        conversation.save()
-                        
-                        return {
-                            'message_id': ai_message.id,
-                            'response': structured_response['response'],
-                            'conversation_updated': True,
-                            'intent_detected': 'workout_generated',
-                            'action': 'workouts_created',
-                            'workouts_created': len(workout_creation['workouts']),
-                            'workout_ids': [w['id'] for w in workout_creation['workouts']],
-                            'options': structured_response.get('options', []),
-                            'method': 'ai_plan_extraction',
-                        }
-                
-                # Resposta normal (sem plano detectado)
-                ai_message = self._save_ai_message(
-                    conversation,
-                    ai_response['content'],
-                    response_time_ms=round((time.time() - start_time) * 1000, 2),
-                    confidence_score=ai_response.get('confidence_score', 0.8),
-                    intent=intent_analysis.get('intent')
-                )
-                
-                conversation.message_count += 2
-                conversation.ai_responses_count += 1
-                conversation.last_activity_at = timezone.now()
-                conversation.save()
-                
-                return {
-                    'message_id': ai_message.id,
-                    'response': ai_response['content'],
-                    'conversation_updated': True,
-                    'intent_detected': intent_analysis.get('intent'),
-                    'confidence_score': ai_response.get('confidence_score'),
-                    'method': 'gemini_ai',
-                }
-            
-            # Fallback se IA falhou
-            fallback_response = self._generate_fallback_response(
-                conversation, message, intent_analysis
-            )
+                    ai_message = self._persist_turn(
+                        conversation,
+                        structured_response['response'],
+                        response_time_ms=round((time.time() - start_time) * 1000, 2),
+                        confidence_score=ai_response.get('confidence_score', 0.8),
+                        intent='workout_generated'
+                    )
+                    
+                    return {
+                        'message_id': ai_message.id,
+                        'response': structured_response['response'],
+                        'conversation_updated': True,
+                        'intent_detected': 'workout_generated',
+                        'action': 'workouts_created',
+                        'workouts_created': len(workout_creation['workouts']),
+                        'workout_ids': [w['id'] for w in workout_creation['workouts']],
+                        'options': structured_response.get('options', []),
+                        'method': 'ai_plan_extraction',
+                    }
             
-            ai_message = self._save_ai_message(
+            # Resposta normal (sem plano detectado)
+            ai_message = self._persist_turn(
                 conversation,
-                fallback_response,
+                ai_response['content'],
                 response_time_ms=round((time.time() - start_time) * 1000, 2),
-                confidence_score=0.6,
+                confidence_score=ai_response.get('confidence_score', 0.8),
                 intent=intent_analysis.get('intent')
             )
             
-            conversation.message_count += 2
-            conversation.ai_responses_count += 1
-            conversation.last_activity_at = timezone.now()
-            conversation.save()
-            
             return {
                 'message_id': ai_message.id,
-                'response': fallback_response,
+                'response': ai_response['content'],
                 'conversation_updated': True,
-                'method': 'rule_based_fallback',
+                'intent_detected': intent_analysis.get('intent'),
+                'confidence_score': ai_response.get('confidence_score'),
+                'method': ai_response.get('method', 'gemini_ai'),
             }
-            
+        
+        # Fallback se IA falhou
+        fallback_response = self._generate_fallback_response(
+            conversation, message, intent_analysis
+        )
+        
+        ai_message = self._persist_turn(
+            conversation,
+            fallback_response,
+            response_time_ms=round((time.time() - start_time) * 1000, 2),
+            confidence_score=0.6,
+            intent=intent_analysis.get('intent')
+        )
+        
+        return {
+            'message_id': ai_message.id,
+            'response': fallback_response,
+            'conversation_updated': True,
+            'method': 'rule_based_fallback',
+        }
+        
+    # =========================================================================
+    # 📡 STREAMING (SSE)
+    # =========================================================================
+    
+    def prepare_streaming_turn(self, conversation_id: int, message: str) -> Dict:
+        """
+        Primeira etapa do modo streaming: persiste a mensagem do usuário e monta o prompt
+        (a mensagem fica gravada mesmo se o cliente desconectar antes do fim).
+        'prompt' vem None quando a IA está indisponível (a resposta será o fallback).
+        """
+        start_time = time.time()
+        
+        try:
+            turn = self._prepare_turn(conversation_id, message)
         except Conversation.DoesNotExist:
             return {'error': 'Conversa não encontrada'}
+        
+        if 'error' in turn:
+            return turn
+        
+        turn['message'] = message
+        turn['start_time'] = start_time
+        turn['prompt'] = None
+        
+        cached = self._cached_response(
+            turn['conversation'], message, turn['intent_analysis'], turn['cache_context']
+        )
+        if cached:
+            turn['cached_response'] = cached['content']
+            return turn
+        
+        if self.ai_service.is_available:
+            try:
+                turn['prompt'] = self._build_chat_prompt(
+                    turn['conversation'], message, turn['intent_analysis'], turn['user_message'].id
+                )
+            except Exception as e:
+                logger.error(f"Error building streaming prompt: {e}")
+        
+        return turn
+    
+    def stream_ai_tokens(self, turn: Dict):
+        """Produz os trechos da resposta do Gemini conforme chegam (sem acesso ao banco)"""
+        if turn.get('cached_response'):
+            return iter((turn['cached_response'],))
+        if not turn.get('prompt'):
+            return iter(())
+        return self.ai_service._make_gemini_stream_request(turn['prompt'])
+    
+    def finalize_streaming_turn(self, turn: Dict, content: str) -> Dict:
+        """Última etapa do streaming: persiste a mensagem final da IA"""
+        try:
+            ai_response = None
+            if content and content.strip():
+                ai_response = self._process_ai_response(content.strip(), turn['intent_analysis'])
+                if turn.get('cached_response'):
+                    ai_response['method'] = 'semantic_cache'
+                else:
+                    self._cache_response(turn['conversation'], turn['message'], turn['intent_analysis'],
+                                         content.strip(), turn['cache_context'])
+            
+            return self._finalize_ai_turn(
+                turn['conversation'],
+                turn['message'],
+                turn['intent_analysis'],
+                ai_response,
+                turn['start_time']
+            )
         except Exception as e:
-            logger.error(f"❌ ERRO no process_user_message: {e}")
+            logger.error(f"❌ ERRO no finalize_streaming_turn: {e}")
             logger.error(traceback.format_exc())
             return {
                 'error': 'Erro ao processar mensagem',
@@ -985,25 +1113,15 @@ class ChatService:
     def _check_workout_generation_flow(self, conversation_id: int, message: str) -> dict:
         try:
             conversation = Conversation.objects.get(id=conversation_id)
+            store = get_context_store(conversation)
             
-            context = ChatContext.objects.filter(
-                conversation=conversation,
-                context_type='workflow',
-                context_key='workout_generation'
-            ).first()
-            
-            if not context:
-               # context = ChatContext.set_context(...)
-               context = ChatContext.set_context(
-                conversation=conversation,
-                context_type='workflow',
-                key='workout_generation',
-                value={'workout_flow_state': WorkoutGenerationFlow.STATE_INITIAL, 'workout_flow_data': {}},
-                relevance=1.0
-)
+            flow = store.get('workflow', 'workout_generation')
+            if flow is None:
+                flow = {'workout_flow_state': WorkoutGenerationFlow.STATE_INITIAL, 'workout_flow_data': {}}
+                self._save_workout_flow(store, flow['workout_flow_state'], flow['workout_flow_data'])
             
-            flow_state = context.context_value.get('workout_flow_state')
-            flow_data = context.context_value.get('workout_flow_data', {})
+            flow_state = flow.get('workout_flow_state')
+            flow_data = dict(flow.get('workout_flow_data', {}))
             
             logger.info(f"📊 Estado: {flow_state} | Dados: {flow_data}")
             
@@ -1024,16 +1142,7 @@ class ChatService:
                         correct_state = WorkoutGenerationFlow.STATE_WAITING_DAYS
                     
                     # Atualizar
-                    ChatContext.set_context(
-                        conversation=conversation,
-                        context_type='workflow',
-                        key='workout_generation',
-                        value={
-                            'workout_flow_state': correct_state,
-                            'workout_flow_data': flow_data
-                        },
-                        relevance=1.0
-                    )
+                    self._save_workout_flow(store, correct_state, flow_data)
                     
                     flow_state = correct_state
                     logger.info(f"✅ Estado corrigido para: {flow_state}")
@@ -1066,16 +1175,7 @@ class ChatService:
                     prompt = WorkoutGenerationFlow.get_days_prompt(focus_info['label'])
                     
                     # Salvar estado
-                    ChatContext.set_context(
-                        conversation=conversation,
-                        context_type='workflow',
-                        key='workout_generation',
-                        value={
-                            'workout_flow_state': prompt['next_state'],
-                            'workout_flow_data': flow_data
-                        },
-                        relevance=1.0
-                    )
+                    self._save_workout_flow(store, prompt['next_state'], flow_data)
                     
                     logger.info(f"✅ Focus: {focus_info['label']} | Próximo: {prompt['next_state']}")
                     
@@ -1107,16 +1207,7 @@ class ChatService:
                     prompt = WorkoutGenerationFlow.get_difficulty_prompt(days)
                     
                     # Salvar estado
-                    ChatContext.set_context(
-                        conversation=conversation,
-                        context_type='workflow',
-                        key='workout_generation',
-                        value={
-                            'workout_flow_state': prompt['next_state'],
-                            'workout_flow_data': flow_data
-                        },
-                        relevance=1.0
-                    )
+                    self._save_workout_flow(store, prompt['next_state'], flow_data)
                     
                     logger.info(f"✅ Dias: {days} | Próximo: {prompt['next_state']}")
                     
@@ -1160,16 +1251,7 @@ class ChatService:
                     )
                     
                     # Salvar estado
-                    ChatContext.set_context(
-                        conversation=conversation,
-                        context_type='workflow',
-                        key='workout_generation',
-                        value={
-                            'workout_flow_state': prompt['next_state'],
-                            'workout_flow_data': flow_data
-                        },
-                        relevance=1.0
-                    )
+                    self._save_workout_flow(store, prompt['next_state'], flow_data)
                     
                     logger.info(f"✅ Dificuldade: {difficulty_info['label']} | Próximo: {prompt['next_state']}")
                     
@@ -1221,7 +1303,7 @@ class ChatService:
             from apps.users.models import UserProfile
             from apps.workouts.models import Workout, WorkoutExercise
             from apps.exercises.models import Exercise
-            from apps.recommendations.services.ai_service import AIService
+            from apps.recommendations.services.ai_service import get_ai_service
             
             logger.info(f"🤖 Gerando treino IA via chat para {user.email}")
             logger.info(f"   Preferências: {preferences}")
@@ -1249,7 +1331,7 @@ class ChatService:
             )
             
             # 3. Chamar IA para gerar plano
-            ai_service = AIService()
+            ai_service = get_ai_service()
             if not ai_service.is_available:
                 logger.warning("IA não disponível, usando fallback")
                 return self._generate_fallback_workout(user, preferences)
@@ -1445,21 +1527,21 @@ class ChatService:
         try:
             conversation = Conversation.objects.get(id=conversation_id)
             
-            ChatContext.set_context(
-                conversation=conversation,
-                context_type='workflow',
-                key='workout_generation',
-                value={
-                    'workout_flow_state': None,
-                    'workout_flow_data': {}
-                },
-                relevance=0.5
-            )
+            self._save_workout_flow(get_context_store(conversation), None, {}, relevance=0.5)
             
             logger.info(f"✅ Fluxo limpo: conversa {conversation_id}")
             
         except Exception as e:
             logger.error(f"❌ Erro ao limpar fluxo: {e}")
+    
+    def _save_workout_flow(self, store, state, flow_data: Dict, relevance: float = 1.0):
+        """Grava o estado do fluxo de geração de treino (um upsert, sem leitura)"""
+        store.set(
+            'workflow', 'workout_generation',
+            {'workout_flow_state': state, 'workout_flow_data': dict(flow_data)},
+            relevance=relevance
+        )
+        store.flush()
 
     # 🔥 ADICIONAR: Método auxiliar no ChatService
     def get_flow_state(self, conversation_id: int) -> dict:
@@ -1533,13 +1615,14 @@ class ChatService:
     
     def _initialize_conversation_context(self, conversation: Conversation):
         """Carrega contexto inicial do usuário para personalização"""
+        store = new_context_store(conversation)
         try:
             user = conversation.user
             
             try:
                 profile = UserProfile.objects.get(user=user)
-                ChatContext.set_context(
-                    conversation, 'user_profile', 'basic_info',
+                store.set(
+                    'user_profile', 'basic_info',
                     {
                         'goal': profile.goal,
                         'activity_level': profile.activity_level,
@@ -1551,8 +1634,8 @@ class ChatService:
                     relevance=1.0
                 )
             except UserProfile.DoesNotExist:
-                ChatContext.set_context(
-                    conversation, 'user_profile', 'basic_info',
+                store.set(
+                    'user_profile', 'basic_info',
                     {'profile_complete': False},
                     relevance=0.5
                 )
@@ -1572,25 +1655,27 @@ class ChatService:
                     'duration': session.actual_duration
                 })
             
-            ChatContext.set_context(
-                conversation, 'workout_history', 'recent_workouts',
+            store.set(
+                'workout_history', 'recent_workouts',
                 {'recent_sessions': workout_history},
                 relevance=0.8
             )
             
-            ChatContext.set_context(
-                conversation, 'preferences', 'conversation_style',
+            store.set(
+                'preferences', 'conversation_style',
                 {'preferred_response_length': 'medium', 'technical_level': 'intermediate'},
                 relevance=0.6
             )
             
+            store.flush()
         except Exception as e:
             logger.error(f"Error initializing conversation context: {e}")
     
     def _analyze_message_intent(self, message: str, conversation: Conversation) -> Dict:
         """Analisa intenção da mensagem usando regras"""
         try:
-            cache_key = f"intent_analysis_{hash(message.lower())}"
+            # hash() de str muda a cada processo; sha256 é o mesmo em todos os workers
+            cache_key = f"intent_analysis_{hashlib.sha256(message.lower().encode('utf-8')).hexdigest()[:32]}"
             cached_intent = cache.get(cache_key)
             if cached_intent:
                 return cached_intent
@@ -1642,37 +1727,29 @@ class ChatService:
             'requires_personalization': True
         }
     
-    def _generate_ai_response(self, conversation: Conversation, message: str, intent_analysis: Dict) -> Optional[Dict]:
-        """Gera resposta usando Gemini"""
+    def _generate_ai_response(self, conversation: Conversation, message: str, intent_analysis: Dict,
+                              cache_context: Optional[str] = None,
+                              current_message_id: Optional[int] = None) -> Optional[Dict]:
+        """
+        Gera resposta usando Gemini (ou o cache semântico, para perguntas
+        frequentes, quando cache_context não é None - ver _shared_cache_context)
+        """
+        cached = self._cached_response(conversation, message, intent_analysis, cache_context)
+        if cached:
+            return cached
+        
         if not self.ai_service.is_available:
             logger.warning("Gemini AI not available, will use fallback")
             return None
         
         try:
-            context_data = self._build_conversation_context(conversation)
-            recent_messages = conversation.get_last_messages(6)
-            
-            conversation_history = ""
-            for msg in reversed(recent_messages):
-                role = "Usuário" if msg.message_type == 'user' else "Alex"
-                conversation_history += f"{role}: {msg.content}\n"
-            
-            system_context = self._build_fitness_chat_system_prompt(intent_analysis, context_data)
-            
-            full_prompt = f"""{system_context}
-
-HISTÓRICO DA CONVERSA:
-{conversation_history}
-
-MENSAGEM ATUAL DO USUÁRIO:
-{message}
-
-Responda de forma natural, personalizada e útil. Máximo 200 palavras."""
+            full_prompt = self._build_chat_prompt(conversation, message, intent_analysis, current_message_id)
             
             response = self.ai_service._make_gemini_request(full_prompt)
             
             if response:
                 processed_response = self._process_ai_response(response, intent_analysis)
+                self._cache_response(conversation, message, intent_analysis, response, cache_context)
                 return processed_response
             
         except Exception as e:
@@ -1680,52 +1757,117 @@ Responda de forma natural, personalizada e útil. Máximo 200 palavras."""
         
         return None
     
-    def _build_fitness_chat_system_prompt(self, intent_analysis: Dict, context_data: Dict) -> str:
-        """Constrói prompt de sistema otimizado para chat fitness"""
-        user_profile = context_data.get('user_profile', {})
-        workout_history = context_data.get('workout_history', {})
+    def _shared_cache_context(self, conversation: Conversation) -> Optional[str]:
+        """
+        Escopo extra do cache semântico para este turno, ou None se ele não pode
+        usar o cache. A resposta guardada foi gerada com o prompt inteiro de quem
+        perguntou: só é compartilhável quando o prompt não leva nada da conversa
+        (nenhuma mensagem anterior do usuário nem resumo). O que ainda vai no
+        prompt além do perfil - tipo da conversa (boas-vindas) e quantidade de
+        treinos recentes - entra no escopo.
+        """
+        store = get_context_store(conversation)
+        if store.get(SUMMARY_TYPE, SUMMARY_KEY):
+            return None
+        if conversation.messages.filter(message_type='user').exists():
+            return None
+        
+        recent_sessions = (store.get('workout_history', 'recent_workouts') or {}).get('recent_sessions') or []
+        return f"{conversation.conversation_type}:{len(recent_sessions)}"
+    
+    def _cached_response(self, conversation: Conversation, message: str, intent_analysis: Dict,
+                         cache_context: Optional[str]) -> Optional[Dict]:
+        """Resposta do cache semântico para uma pergunta quase igual (mesma intenção, perfil e contexto)"""
+        if cache_context is None:
+            return None
+        
+        content = self.response_cache.lookup(
+            message,
+            intent_analysis.get('intent', 'general_question'),
+            get_context_store(conversation).get('user_profile', 'basic_info'),
+            conversation.user.first_name,
+            cache_context,
+        )
+        if not content:
+            return None
         
-        base_prompt = """Você é Alex, um personal trainer virtual especialista em fitness com 10 anos de experiência.
+        processed_response = self._process_ai_response(content, intent_analysis)
+        processed_response['method'] = 'semantic_cache'
+        return processed_response
+    
+    def _cache_response(self, conversation: Conversation, message: str, intent_analysis: Dict, content: str,
+                        cache_context: Optional[str]):
+        if cache_context is None:
+            return
+        
+        self.response_cache.store(
+            message,
+            intent_analysis.get('intent', 'general_question'),
+            content,
+            get_context_store(conversation).get('user_profile', 'basic_info'),
+            conversation.user.first_name,
+            cache_context,
+        )
+    
+    def _build_chat_prompt(self, conversation: Conversation, message: str, intent_analysis: Dict,
+                           current_message_id: Optional[int] = None) -> str:
+        """
+        Monta o prompt completo do chat (sistema + resumo + histórico + mensagem
+        atual), mantendo o histórico dentro de CHATBOT_CONTEXT_SETTINGS['PROMPT_TOKEN_BUDGET'].
+        current_message_id: a mensagem do turno, já gravada, fica fora do histórico
+        """
+        context_data = self._build_conversation_context(conversation)
+        system_context = self._build_fitness_chat_system_prompt(intent_analysis, context_data)
+        closing = "Responda de forma natural, personalizada e útil. Máximo 200 palavras."
+        
+        reserved_tokens = sum(estimate_tokens(part) for part in (system_context, message, closing))
+        history = self.summarizer.build_history(
+            conversation, get_context_store(conversation), reserved_tokens,
+            exclude_message_id=current_message_id
+        )
+        logger.debug(
+            f"Chat prompt: ~{reserved_tokens + history.tokens} tokens "
+            f"(histórico {history.tokens}, resumo atualizado: {history.summarized})"
+        )
+        
+        summary_block = f"""
+RESUMO DA CONVERSA ATÉ AQUI:
+{history.summary}
+""" if history.summary else ""
+        
+        return system_context.extend(f"""
+{summary_block}
+HISTÓRICO DA CONVERSA:
+{history.history}
 
-PERSONALIDADE:
-- Amigável, motivador e profissional
-- Usa linguagem clara e acessível
-- Encoraja sem ser excessivo
-- Foca na segurança e na progressão gradual
-- Baseado em evidência científica
+MENSAGEM ATUAL DO USUÁRIO:
+{message}
 
-DIRETRIZES DE RESPOSTA:
-- Máximo 200 palavras por resposta
-- Use emojis ocasionalmente para engajamento
-- Seja específico e prático
-- Sempre priorize a segurança
-- Adapte ao nível do usuário"""
+{closing}""")
+    
+    def _build_fitness_chat_system_prompt(self, intent_analysis: Dict, context_data: Dict) -> str:
+        """Constrói prompt de sistema otimizado para chat fitness (template 'chat_system')"""
+        user_profile = context_data.get('user_profile', {})
+        workout_history = context_data.get('workout_history', {})
         
+        profile_lines = ""
         if user_profile.get('goal'):
-            base_prompt += f"\n\nOBJETIVO DO USUÁRIO: {user_profile['goal']}"
+            profile_lines += f"\n\nOBJETIVO DO USUÁRIO: {user_profile['goal']}"
         
         if user_profile.get('activity_level'):
-            base_prompt += f"\nNÍVEL ATUAL: {user_profile['activity_level']}"
-        
-        intent_contexts = {
-            'workout_request': "\nFOCO: Recomende exercícios seguros e progressivos. Sempre inclua aquecimento e alongamento.",
-            'technique_question': "\nFOCO: Explique técnica com clareza, enfatize segurança e sugira progressões.",
-            'nutrition_advice': "\nFOCO: Dê orientações gerais, sempre recomende consulta com nutricionista para planos específicos.",
-            'progress_inquiry': "\nFOCO: Analise dados disponíveis, celebre conquistas e sugira próximos passos.",
-            'motivation_need': "\nFOCO: Seja encorajador, lembre dos benefícios e sugira estratégias práticas.",
-            'injury_concern': "\nFOCO: Priorize segurança, recomende descanso se necessário e consulta profissional."
-        }
+            profile_lines += f"\nNÍVEL ATUAL: {user_profile['activity_level']}"
         
         intent = intent_analysis.get('intent', 'general_question')
-        if intent in intent_contexts:
-            base_prompt += intent_contexts[intent]
         
+        history_line = ""
         if workout_history.get('recent_sessions'):
-            base_prompt += f"\n\nHISTÓRICO RECENTE: {len(workout_history['recent_sessions'])} treinos realizados recentemente."
+            history_line = f"\n\nHISTÓRICO RECENTE: {len(workout_history['recent_sessions'])} treinos realizados recentemente."
         
-        base_prompt += "\n\nSempre termine perguntando se precisa de mais alguma coisa ou esclarecimento adicional."
-        
-        return base_prompt
+        return CHAT_SYSTEM_PROMPT.render(
+            profile=profile_lines,
+            intent_focus=CHAT_INTENT_FOCUS.get(intent, ''),
+            workout_history=history_line,
+        )
     
     def _process_ai_response(self, response: str, intent_analysis: Dict) -> Dict:
         """Processa resposta da IA para extrair metadados úteis"""
@@ -1861,78 +2003,103 @@ Você é Alex, um personal trainer virtual. Responda apenas com a mensagem, sem
         
         return None
     
-    def _save_user_message(self, conversation: Conversation, content: str) -> Message:
-        """Salva mensagem do usuário"""
-        return Message.objects.create(
+    def _build_user_message(self, conversation: Conversation, content: str,
+                            intent: str = None) -> Message:
+        """Mensagem do usuário (não salva)"""
+        return Message(
             conversation=conversation,
             message_type='user',
             content=content,
+            intent_detected=intent,
             status='delivered'
         )
     
-    def _save_ai_message(self, conversation: Conversation, content: str, 
-                        response_time_ms: int = 0, confidence_score: float = 0.8,
-                        intent: str = None) -> Message:
-        """Salva mensagem da IA com modelo Gemini"""
-        return Message.objects.create(
+    def _build_ai_message(self, conversation: Conversation, content: str,
+                          response_time_ms: int = 0, confidence_score: float = 0.8,
+                          intent: str = None) -> Message:
+        """Mensagem da IA com modelo Gemini (não salva)"""
+        return Message(
             conversation=conversation,
             message_type='ai',
             content=content,
             confidence_score=confidence_score,
             ai_model_version=getattr(settings, 'GEMINI_MODEL', 'gemini-2.5-flash'),
             response_time_ms=response_time_ms,
-            tokens_used=len(content.split()) * 1.3,
+            tokens_used=int(len(content.split()) * 1.3),
             intent_detected=intent,
             status='delivered'
         )
     
-    def _build_conversation_context(self, conversation: Conversation) -> Dict:
-        """Constrói contexto completo da conversa"""
-        context_data = {}
-        contexts = ChatContext.get_context(conversation)
+    def _save_ai_message(self, conversation: Conversation, content: str, 
+                        response_time_ms: int = 0, confidence_score: float = 0.8,
+                        intent: str = None) -> Message:
+        """Salva mensagem avulsa da IA (ex: boas-vindas)"""
+        message = self._build_ai_message(conversation, content, response_time_ms, confidence_score, intent)
+        message.save()
+        return message
+    
+    def _save_user_message(self, conversation: Conversation, content: str, intent: str = None) -> Message:
+        """
+        Grava a mensagem do usuário no início do turno, sem mexer nos contadores
+        da conversa (bulk_create não passa por Message.save): eles são
+        atualizados junto com a resposta, em _persist_turn
+        """
+        message = self._build_user_message(conversation, content, intent)
+        Message.objects.bulk_create([message])
+        return message
+    
+    def _persist_turn(self, conversation: Conversation, ai_content: str, **ai_fields) -> Message:
+        """
+        Grava o fim do turno como uma unidade: a mensagem da IA, os contadores
+        da conversa (usuário + IA) em um único UPDATE com F() e o contexto
+        alterado no turno em um upsert. Retorna a mensagem da IA.
+        """
+        ai_message = self._build_ai_message(conversation, ai_content, **ai_fields)
         
-        for context in contexts:
-            context_type = context.context_type
-            if context_type not in context_data:
-                context_data[context_type] = {}
-            context_data[context_type][context.context_key] = context.context_value
+        with transaction.atomic():
+            Message.objects.bulk_create([ai_message])
+            conversation.record_messages(2, 1)
+            get_context_store(conversation).flush()
         
-        return context_data
+        return ai_message
+    
+    def _build_conversation_context(self, conversation: Conversation) -> Dict:
+        """Constrói contexto completo da conversa (store do turno: cache ou uma consulta)"""
+        return get_context_store(conversation).as_dict()
     
     def _update_conversation_context(self, conversation: Conversation, message: str, intent_analysis: Dict):
-        """Atualiza contexto da conversa baseado na mensagem atual"""
+        """
+        Atualiza contexto da conversa baseado na mensagem atual. As mudanças
+        ficam em memória e são gravadas com o turno (_persist_turn)
+        """
         try:
+            store = get_context_store(conversation)
+            
             message_length = len(message.split())
             if message_length > 20:
-                ChatContext.set_context(
-                    conversation, 'preferences', 'message_style',
+                store.set(
+                    'preferences', 'message_style',
                     {'prefers_detailed': True, 'last_message_length': message_length},
                     relevance=0.7
                 )
             
             intent = intent_analysis.get('intent')
             if intent:
-                current_topics = ChatContext.get_context(
-                    conversation, 'preferences', 'topics_of_interest'
-                ).first()
+                current_topics = store.get('preferences', 'topics_of_interest')
                 
                 if current_topics:
-                    topics = current_topics.context_value.get('topics', [])
+                    topics = list(current_topics.get('topics', []))
                     if intent not in topics:
                         topics.append(intent)
                         topics = topics[-5:]
-                    
-                    ChatContext.set_context(
-                        conversation, 'preferences', 'topics_of_interest',
-                        {'topics': topics},
-                        relevance=0.6
-                    )
                 else:
-                    ChatContext.set_context(
-                        conversation, 'preferences', 'topics_of_interest',
-                        {'topics': [intent]},
-                        relevance=0.6
-                    )
+                    topics = [intent]
+                
+                store.set(
+                    'preferences', 'topics_of_interest',
+                    {'topics': topics},
+                    relevance=0.6
+                )
             
         except Exception as e:
             logger.error(f"Error updating conversation context: {e}")
@@ -0,0 +1,141 @@
+"""
+Contexto da conversa em memória, na frente da tabela ChatContext
+
+Cada turno lia todas as linhas de ChatContext (_build_conversation_context),
+fazia outra leitura filtrada e um ou dois get_or_create + save por chave
+(_update_conversation_context, fluxo de geração de treino). Aqui:
+- o contexto da conversa é carregado uma vez por turno - do cache
+  (CACHE_TIMEOUTS['chatbot_context']) ou, se não estiver lá, com uma consulta
+- leituras e escritas do turno acontecem em memória (a mesma instância fica
+  presa ao objeto Conversation durante o turno)
+- no fim do turno as chaves alteradas vão para o banco em um único upsert
+  (bulk_create com update_conflicts) e o cache é atualizado
+ChatContext.set_context continua existindo e invalida a entrada do cache.
+"""
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from ..models import ChatContext, Conversation
+
+logger = logging.getLogger(__name__)
+
+STORE_ATTRIBUTE = '_chat_context_store'
+
+# (context_type, context_key) -> (valor, relevância, expires_at)
+Entries = Dict[Tuple[str, str], Tuple[Any, float, Optional[Any]]]
+
+
+def _cache_timeout() -> int:
+    return getattr(settings, 'CACHE_TIMEOUTS', {}).get('chatbot_context', 3600)
+
+
+class ConversationContextStore:
+    """Contexto de uma conversa: lido uma vez, alterado em memória, gravado com um upsert"""
+
+    def __init__(self, conversation: Conversation, entries: Entries):
+        self.conversation = conversation
+        self.entries = entries
+        self.dirty = set()
+
+    @classmethod
+    def load(cls, conversation: Conversation) -> 'ConversationContextStore':
+        entries = cache.get(ChatContext.cache_key(conversation.id))
+        if entries is None:
+            rows = ChatContext.objects.filter(conversation=conversation).values_list(
+                'context_type', 'context_key', 'context_value', 'relevance_score', 'expires_at'
+            )
+            entries = {
+                (context_type, key): (value, relevance, expires_at)
+                for context_type, key, value, relevance, expires_at in rows
+            }
+            cache.set(ChatContext.cache_key(conversation.id), entries, _cache_timeout())
+        return cls(conversation, entries)
+
+    @staticmethod
+    def _expired(expires_at) -> bool:
+        return expires_at is not None and expires_at <= timezone.now()
+
+    # =========================================================================
+    # 📖 LEITURA / ✏️ ESCRITA (em memória)
+    # =========================================================================
+
+    def get(self, context_type: str, key: str, default=None):
+        entry = self.entries.get((context_type, key))
+        if entry is None or self._expired(entry[2]):
+            return default
+        return entry[0]
+
+    def set(self, context_type: str, key: str, value, relevance: float = 1.0):
+        """Altera em memória; só marca para gravação se algo mudou"""
+        current = self.entries.get((context_type, key))
+        expires_at = current[2] if current else None
+        if current is not None and current[0] == value and current[1] == relevance:
+            return
+        self.entries[(context_type, key)] = (value, relevance, expires_at)
+        self.dirty.add((context_type, key))
+
+    def as_dict(self) -> Dict[str, Dict[str, Any]]:
+        """{tipo: {chave: valor}} dos contextos não expirados (formato de _build_conversation_context)"""
+        context_data: Dict[str, Dict[str, Any]] = {}
+        ordered = sorted(self.entries.items(), key=lambda item: -item[1][1])
+        for (context_type, key), (value, _, expires_at) in ordered:
+            if not self._expired(expires_at):
+                context_data.setdefault(context_type, {})[key] = value
+        return context_data
+
+    # =========================================================================
+    # 💾 GRAVAÇÃO (fim do turno)
+    # =========================================================================
+
+    def flush(self) -> int:
+        """Grava as chaves alteradas em um upsert e atualiza o cache; retorna quantas"""
+        if not self.dirty:
+            return 0
+
+        rows = [
+            ChatContext(
+                conversation=self.conversation,
+                context_type=context_type,
+                context_key=key,
+                context_value=self.entries[(context_type, key)][0],
+                relevance_score=self.entries[(context_type, key)][1],
+            )
+            for context_type, key in sorted(self.dirty)
+        ]
+        try:
+            ChatContext.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['conversation', 'context_type', 'context_key'],
+                update_fields=['context_value', 'relevance_score', 'updated_at'],
+            )
+        except Exception as e:
+            logger.error(f"Error flushing conversation context {self.conversation.id}: {e}")
+            # O cache não pode ficar à frente do banco
+            cache.delete(ChatContext.cache_key(self.conversation.id))
+            raise
+        cache.set(ChatContext.cache_key(self.conversation.id), self.entries, _cache_timeout())
+
+        flushed = len(self.dirty)
+        self.dirty.clear()
+        return flushed
+
+
+def get_context_store(conversation: Conversation) -> ConversationContextStore:
+    """Store do turno atual: carregado na primeira chamada e preso à instância da conversa"""
+    store = getattr(conversation, STORE_ATTRIBUTE, None)
+    if store is None:
+        store = ConversationContextStore.load(conversation)
+        setattr(conversation, STORE_ATTRIBUTE, store)
+    return store
+
+
+def new_context_store(conversation: Conversation) -> ConversationContextStore:
+    """Store vazio para uma conversa recém-criada (sem consulta)"""
+    store = ConversationContextStore(conversation, {})
+    setattr(conversation, STORE_ATTRIBUTE, store)
+    return store
@@ -0,0 +1,156 @@
+"""
+Resumo incremental da conversa com orçamento de tokens
+
+_build_chat_prompt colava as últimas 6 mensagens na íntegra depois do prompt
+de sistema: respostas longas da IA faziam o prompt crescer sem limite (e o
+tamanho do prompt é o que mais pesa na latência e no custo do Gemini). Aqui:
+- as mensagens ainda não resumidas entram na íntegra (no mínimo as últimas
+  RECENT_MESSAGES)
+- a cada SUMMARY_EVERY_TURNS turnos fora dessa janela, ou quando o prompt
+  estimado passa de PROMPT_TOKEN_BUDGET, as mais antigas viram linhas de um
+  resumo guardado no ChatContext ('conversation_summary', 'rolling')
+- o resumo é extrativo (primeira frase de cada mensagem): não custa uma
+  chamada extra ao Gemini e é determinístico; ele mesmo é limitado a
+  SUMMARY_MAX_TOKENS (descarta as linhas mais antigas)
+- se ainda assim não couber, cada mensagem na íntegra é encurtada
+O resumo é alterado no store do turno e gravado junto com ele (_persist_turn).
+"""
+import re
+import logging
+from dataclasses import dataclass
+from typing import List, Optional
+
+from django.conf import settings
+
+from apps.recommendations.services.prompt_registry import estimate_tokens
+from ..models import Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_TYPE = 'conversation_summary'
+SUMMARY_KEY = 'rolling'
+MAX_UNSUMMARIZED = 40          # mensagens lidas por turno (conversas antigas sem resumo)
+SUMMARY_LINE_WORDS = 30
+MIN_MESSAGE_TOKENS = 40
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    words = text.split()
+    max_words = max(1, int(max_tokens / 1.3))
+    if len(words) <= max_words and estimate_tokens(text) <= max_tokens:
+        return text
+    return ' '.join(words[:max_words])[:max_tokens * 4].rstrip() + '…'
+
+
+def _role(message: Message) -> str:
+    return "Usuário" if message.message_type == 'user' else "Alex"
+
+
+@dataclass
+class PromptHistory:
+    summary: str            # linhas do resumo (vazio se ainda não houver)
+    history: str            # mensagens na íntegra, uma por linha
+    tokens: int             # estimativa de summary + history
+    summarized: bool        # o resumo foi atualizado neste turno
+
+
+class ConversationSummarizer:
+    """Monta o histórico do prompt dentro do orçamento, atualizando o resumo quando preciso"""
+
+    def __init__(self, token_budget: Optional[int] = None, recent_messages: Optional[int] = None,
+                 min_recent_messages: Optional[int] = None, every_turns: Optional[int] = None,
+                 summary_max_tokens: Optional[int] = None):
+        config = getattr(settings, 'CHATBOT_CONTEXT_SETTINGS', {})
+        self.token_budget = token_budget or config.get('PROMPT_TOKEN_BUDGET', 1800)
+        self.recent_messages = recent_messages or config.get('RECENT_MESSAGES', 6)
+        self.min_recent_messages = min_recent_messages or config.get('MIN_RECENT_MESSAGES', 2)
+        self.every_turns = every_turns or config.get('SUMMARY_EVERY_TURNS', 3)
+        self.summary_max_tokens = summary_max_tokens or config.get('SUMMARY_MAX_TOKENS', 300)
+
+    def build_history(self, conversation: Conversation, store, reserved_tokens: int = 0,
+                      exclude_message_id: Optional[int] = None) -> PromptHistory:
+        """
+        reserved_tokens: o que o prompt já gasta fora do histórico (sistema,
+        mensagem atual, instruções finais)
+        exclude_message_id: mensagem atual, já gravada (vai no prompt à parte)
+        """
+        state = store.get(SUMMARY_TYPE, SUMMARY_KEY) or {}
+        lines: List[str] = list(state.get('lines', []))
+        covered_until = state.get('covered_until', 0)
+
+        unsummarized = conversation.messages.filter(id__gt=covered_until)
+        if exclude_message_id is not None:
+            unsummarized = unsummarized.exclude(id=exclude_message_id)
+        messages = list(unsummarized.order_by('-id')[:MAX_UNSUMMARIZED])
+        messages.reverse()
+
+        split = max(0, len(messages) - self.recent_messages)
+        pending, recent = messages[:split], messages[split:]
+        available = max(0, self.token_budget - reserved_tokens)
+
+        folded: List[Message] = []
+        over_budget = self._tokens(lines, pending + recent) > available
+        if len(pending) >= self.every_turns * 2 or over_budget:
+            folded = list(pending)
+            lines += [self._condense(message) for message in pending]
+            while len(recent) > self.min_recent_messages and self._tokens(lines, recent) > available:
+                message = recent.pop(0)
+                folded.append(message)
+                lines.append(self._condense(message))
+            pending = []
+
+        if folded:
+            lines = self._trim(lines)
+            store.set(SUMMARY_TYPE, SUMMARY_KEY, {
+                'lines': lines,
+                'covered_until': folded[-1].id,
+                'messages': state.get('messages', 0) + len(folded),
+            }, relevance=0.9)
+            logger.debug(f"Conversation {conversation.id}: {len(folded)} messages folded into summary")
+
+        history_messages = pending + recent
+        summary = '\n'.join(f"- {line}" for line in lines)
+        history = self._format(history_messages, available - estimate_tokens(summary))
+
+        return PromptHistory(
+            summary=summary,
+            history=history,
+            tokens=estimate_tokens(summary) + estimate_tokens(history),
+            summarized=bool(folded),
+        )
+
+    # =========================================================================
+    # 🔧 AUXILIARES
+    # =========================================================================
+
+    def _tokens(self, lines: List[str], messages: List[Message]) -> int:
+        return estimate_tokens('\n'.join(lines)) + sum(
+            estimate_tokens(f"{_role(m)}: {m.content}") for m in messages
+        )
+
+    def _condense(self, message: Message) -> str:
+        """Uma linha por mensagem: primeira frase, no máximo SUMMARY_LINE_WORDS palavras"""
+        text = ' '.join(message.content.split())
+        first_sentence = _SENTENCE_END.split(text, maxsplit=1)[0]
+        words = first_sentence.split()
+        if len(words) > SUMMARY_LINE_WORDS:
+            first_sentence = ' '.join(words[:SUMMARY_LINE_WORDS]) + '…'
+        return f"{_role(message)}: {first_sentence}"
+
+    def _trim(self, lines: List[str]) -> List[str]:
+        """Mantém o resumo dentro de summary_max_tokens descartando as linhas mais antigas"""
+        while len(lines) > 1 and estimate_tokens('\n'.join(lines)) > self.summary_max_tokens:
+            lines = lines[1:]
+        return lines
+
+    def _format(self, messages: List[Message], available: int) -> str:
+        """Mensagens na íntegra; se não couberem, cada uma é encurtada por igual"""
+        formatted = [f"{_role(m)}: {m.content}" for m in messages]
+        if not formatted or estimate_tokens('\n'.join(formatted)) <= available:
+            return '\n'.join(formatted)
+
+        per_message = max(MIN_MESSAGE_TOKENS, available // len(formatted))
+        return '\n'.join(_truncate(line, per_message) for line in formatted)
+
@@ -0,0 +1,238 @@
+"""
+Cache semântico de respostas do chat (perguntas frequentes)
+
+Mensagens quase iguais ("Quantas séries para hipertrofia?", "quantas series
+pra hipertrofia") iam cada uma ao Gemini. Aqui:
+- a mensagem é normalizada (minúsculas, sem acentos, tokens alfanuméricos,
+  sem stopwords) e vira um conjunto de shingles (trigramas de caracteres de
+  cada token - tolera flexões como fazer/faço)
+- uma assinatura MinHash (NUM_PERM permutações) é dividida em BANDS faixas
+  (LSH): mensagens parecidas caem na mesma faixa e viram candidatas; a
+  candidata só é servida se a similaridade de Jaccard real passar de
+  SIMILARITY_THRESHOLD e se números e negações forem os mesmos ("treino de
+  3 dias" x "treino de 5 dias", "posso treinar em jejum" x "não posso...")
+- o índice fica no cache do Django (compartilhado entre workers), escopado
+  por intenção + faixa de perfil (objetivo e nível) + o restante do contexto
+  que vai no prompt (`context`, definido por quem chama), com TTL
+- a resposta foi gerada com o prompt inteiro de quem perguntou: quem chama só
+  usa o cache em turnos sem conversa anterior (ChatService._shared_cache_context)
+- o nome do usuário é trocado por um marcador antes de guardar e preenchido
+  com o nome de quem pergunta ao servir
+- hits/misses/stores são contados no cache para acompanhar a taxa de acerto
+Intenções sensíveis (lesão) e mensagens muito curtas ou longas não usam o cache.
+"""
+import hashlib
+import logging
+import re
+import time
+import unicodedata
+from typing import Dict, FrozenSet, List, Optional
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'chat_rc'
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+MAX_BAND_ENTRIES = 20
+NAME_MARKER = '⟪nome⟫'
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_rng = np.random.RandomState(1_000_003)  # semente fixa: assinaturas iguais em todos os processos
+_PERM_A = _rng.randint(1, 2 ** 31 - 1, NUM_PERM).astype(np.uint64)
+_PERM_B = _rng.randint(0, 2 ** 31 - 1, NUM_PERM).astype(np.uint64)
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+STOPWORDS = frozenset("""
+a o as os um uma uns umas de do da dos das no na nos nas em por para pra pro com
+e ou que se eu me meu minha voce vc te ti lhe ele ela isso isto esse essa este esta
+qual quais como quando onde porque pq ao aos ate sobre mais muito bem entao la ai
+oi ola alex favor obrigado obrigada gostaria queria quero saber pode poderia
+""".split())
+
+NEGATIONS = frozenset({'nao', 'nunca', 'nem', 'sem', 'jamais', 'nenhum', 'nenhuma'})
+
+
+def normalize_message(message: str) -> List[str]:
+    """Tokens da mensagem: minúsculas, sem acentos, sem pontuação e sem stopwords"""
+    text = unicodedata.normalize('NFKD', message.lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return [token for token in _TOKEN.findall(text) if token not in STOPWORDS]
+
+
+def _guard_tokens(tokens: List[str]) -> FrozenSet[str]:
+    """Tokens que mudam o sentido da resposta e precisam bater exatamente"""
+    return frozenset(token for token in tokens if token.isdigit() or token in NEGATIONS)
+
+
+def _shingles(tokens: List[str]) -> FrozenSet[str]:
+    shingles = set()
+    for token in tokens:
+        padded = f"_{token}_"
+        shingles.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(shingles)
+
+
+def _stable_hash(text: str, size: int = 8) -> str:
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=size).hexdigest()
+
+
+def _minhash(shingles: FrozenSet[str]) -> np.ndarray:
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=4).digest(), 'little') for s in shingles],
+        dtype=np.uint64,
+    )
+    # a < 2^31 e h < 2^32: a*h + b cabe em uint64 sem overflow
+    permuted = (np.outer(_PERM_A, hashes) + _PERM_B[:, None]) % _MERSENNE_PRIME
+    return permuted.min(axis=1)
+
+
+def _band_keys(scope: str, signature: np.ndarray) -> List[str]:
+    return [
+        f"{KEY_PREFIX}:{scope}:b{band}:{_stable_hash(signature[band * ROWS:(band + 1) * ROWS].tobytes().hex())}"
+        for band in range(BANDS)
+    ]
+
+
+def _jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def profile_bucket(profile: Optional[Dict]) -> str:
+    """Faixa de perfil do escopo: objetivo + nível (respostas não vazam entre perfis diferentes)"""
+    profile = profile or {}
+    goal = ' '.join(normalize_message(str(profile.get('goal') or ''))) or 'any'
+    level = ' '.join(normalize_message(str(profile.get('activity_level') or ''))) or 'any'
+    return f"{goal}|{level}"
+
+
+class SemanticResponseCache:
+    def __init__(self, ttl: Optional[int] = None, threshold: Optional[float] = None):
+        config = getattr(settings, 'CHATBOT_RESPONSE_CACHE', {})
+        self.enabled = config.get('ENABLED', True)
+        self.ttl = ttl or config.get('TTL_SECONDS', 86400)
+        self.threshold = threshold or config.get('SIMILARITY_THRESHOLD', 0.75)
+        self.min_tokens = config.get('MIN_TOKENS', 2)
+        self.max_tokens = config.get('MAX_TOKENS', 30)
+        self.excluded_intents = set(config.get('EXCLUDED_INTENTS', ['injury_concern']))
+
+    def _scope(self, intent: str, profile: Optional[Dict], context: str = '') -> str:
+        return _stable_hash(f"{intent}:{profile_bucket(profile)}:{context}")
+
+    def _tokens_for(self, message: str, intent: str) -> Optional[List[str]]:
+        """Tokens normalizados da mensagem, ou None se ela não deve usar o cache"""
+        if not self.enabled or intent in self.excluded_intents:
+            return None
+        tokens = normalize_message(message)
+        if not self.min_tokens <= len(tokens) <= self.max_tokens:
+            return None
+        return tokens
+
+    # =========================================================================
+    # 🔍 CONSULTA / 💾 GRAVAÇÃO
+    # =========================================================================
+
+    def lookup(self, message: str, intent: str, profile: Optional[Dict] = None,
+               user_name: str = '', context: str = '') -> Optional[str]:
+        """Resposta guardada para uma pergunta quase igual no mesmo escopo, ou None"""
+        tokens = self._tokens_for(message, intent)
+        if tokens is None:
+            return None
+        shingles, guard = _shingles(tokens), _guard_tokens(tokens)
+
+        try:
+            scope = self._scope(intent, profile, context)
+            band_hits = cache.get_many(_band_keys(scope, _minhash(shingles)))
+            candidate_ids = {entry_id for ids in band_hits.values() for entry_id in ids}
+            entries = cache.get_many([f"{KEY_PREFIX}:entry:{entry_id}" for entry_id in candidate_ids])
+        except Exception as e:
+            logger.warning(f"Response cache lookup failed: {e}")
+            return None
+
+        best, best_score = None, self.threshold
+        for entry in entries.values():
+            if entry['guard'] != guard:
+                continue
+            score = _jaccard(shingles, entry['shingles'])
+            if score >= best_score:
+                best, best_score = entry, score
+
+        if best is None:
+            self._count('misses')
+            return None
+
+        self._count('hits')
+        logger.debug(f"Response cache hit (jaccard {best_score:.2f})")
+        return best['response'].replace(NAME_MARKER, user_name or 'amigo(a)')
+
+    def store(self, message: str, intent: str, response: str, profile: Optional[Dict] = None,
+              user_name: str = '', context: str = ''):
+        tokens = self._tokens_for(message, intent)
+        if tokens is None or not response:
+            return
+        shingles = _shingles(tokens)
+
+        if user_name and len(user_name) >= 2:
+            response = re.sub(rf'\b{re.escape(user_name)}\b', NAME_MARKER, response)
+
+        scope = self._scope(intent, profile, context)
+        entry_id = _stable_hash(f"{scope}:{' '.join(sorted(shingles))}", size=12)
+        band_keys = _band_keys(scope, _minhash(shingles))
+        try:
+            cache.set(f"{KEY_PREFIX}:entry:{entry_id}", {
+                'shingles': shingles,
+                'guard': _guard_tokens(tokens),
+                'response': response,
+                'created_at': time.time(),
+            }, self.ttl)
+            # get + set por faixa: uma corrida só perde a indexação de uma entrada (não é servida errada)
+            existing = cache.get_many(band_keys)
+            updated = {}
+            for key in band_keys:
+                ids = [i for i in existing.get(key, []) if i != entry_id]
+                updated[key] = (ids + [entry_id])[-MAX_BAND_ENTRIES:]
+            cache.set_many(updated, self.ttl)
+            self._count('stores')
+        except Exception as e:
+            logger.warning(f"Response cache store failed: {e}")
+
+    # =========================================================================
+    # 📊 TAXA DE ACERTO
+    # =========================================================================
+
+    def _count(self, counter: str):
+        key = f"{KEY_PREFIX}:stats:{counter}"
+        try:
+            cache.add(key, 0, None)
+            cache.incr(key)
+        except Exception:
+            pass
+
+    def stats(self) -> Dict:
+        counters = cache.get_many([f"{KEY_PREFIX}:stats:{name}" for name in ('hits', 'misses', 'stores')])
+        hits = counters.get(f"{KEY_PREFIX}:stats:hits", 0)
+        misses = counters.get(f"{KEY_PREFIX}:stats:misses", 0)
+        return {
+            'enabled': self.enabled,
+            'hits': hits,
+            'misses': misses,
+            'stores': counters.get(f"{KEY_PREFIX}:stats:stores", 0),
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+        }
+
+
+_response_cache: Optional[SemanticResponseCache] = None
+
+
+def get_response_cache() -> SemanticResponseCache:
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = SemanticResponseCache()
+    return _response_cache
@@ -3,6 +3,7 @@ from django.test import TestCase
 from django.contrib.auth.models import User
 from rest_framework.test import APIClient
 from rest_framework import status
+from asgiref.sync import async_to_sync
 from .models import Conversation, Message
 from .services.chat_service import ChatService
 
@@ -48,8 +49,254 @@ class ChatbotIntegrationTest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertTrue(response.data['message_sent'])
     
+    def test_send_message_streaming(self):
+        """Teste do modo streaming (SSE) - sem IA cai no fallback e persiste a mensagem"""
+        conversation = Conversation.objects.create(
+            user=self.user,
+            conversation_type='general_fitness'
+        )
+        
+        response = self.client.post(
+            f'/api/v1/chat/conversations/{conversation.id}/message/?stream=true',
+            {'message': 'Como melhorar minha resistência?'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        
+        async def collect():
+            return b''.join([chunk async for chunk in response.streaming_content]).decode()
+        
+        body = async_to_sync(collect)()
+        self.assertIn('event: start', body)
+        self.assertIn('event: done', body)
+        self.assertEqual(
+            Message.objects.filter(conversation=conversation, message_type='ai').count(), 1
+        )
+    
     def test_chat_service_initialization(self):
         """Teste de inicialização do serviço"""
         chat_service = ChatService()
         self.assertIsNotNone(chat_service)
-        self.assertIsNotNone(chat_service.ai_service)
\ No newline at end of file
+        self.assertIsNotNone(chat_service.ai_service)
+
+class ChatTurnPersistenceTest(TestCase):
+    """Um turno do chat: mensagem do usuário gravada no início, um UPDATE da conversa no fim"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='turn_user')
+        self.conversation = Conversation.objects.create(user=self.user, conversation_type='general_fitness')
+
+    def test_turn_is_written_once_and_counted_once(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            result = ChatService().process_user_message(self.conversation.id, 'Como melhorar meu agachamento?')
+
+        self.assertNotIn('error', result)
+        sql = [query['sql'] for query in queries.captured_queries]
+        self.assertEqual(sum(1 for q in sql if q.startswith('INSERT INTO "chatbot_message"')), 2)
+        self.assertEqual(sum(1 for q in sql if q.startswith('UPDATE "chatbot_conversation"')), 1)
+
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.message_count, 2)
+        self.assertEqual(self.conversation.ai_responses_count, 1)
+        user_message = Message.objects.get(conversation=self.conversation, message_type='user')
+        self.assertTrue(user_message.intent_detected)
+        self.assertEqual(result['message_id'], Message.objects.get(message_type='ai').id)
+
+    def test_stream_keeps_user_message_when_turn_is_not_finalized(self):
+        from unittest.mock import patch
+        from apps.recommendations.services.ai_service import AIService
+        from apps.recommendations.services.llm_providers import LocalStubProvider
+
+        stub = LocalStubProvider(responses_path='', latency_ms=0, jitter_ms=0)
+        with patch('apps.recommendations.services.ai_service.get_llm_provider', return_value=stub):
+            service = ChatService()
+            service.ai_service = AIService()
+        turn = service.prepare_streaming_turn(self.conversation.id, 'Quantas séries para hipertrofia?')
+
+        # O cliente desconectou: finalize_streaming_turn nunca roda
+        self.assertNotIn('error', turn)
+        user_message = Message.objects.get(conversation=self.conversation, message_type='user')
+        self.assertEqual(user_message.id, turn['user_message'].id)
+        self.assertTrue(user_message.intent_detected)
+        # A mensagem atual vai no prompt à parte, não repetida no histórico
+        self.assertEqual(turn['prompt'].count('Quantas séries para hipertrofia?'), 1)
+
+    def test_single_message_save_counts_once(self):
+        Message.objects.create(conversation=self.conversation, message_type='ai', content='Bem-vindo!')
+        self.conversation.refresh_from_db()
+        self.assertEqual((self.conversation.message_count, self.conversation.ai_responses_count), (1, 1))
+
+
+class ConversationContextStoreTest(TestCase):
+    """Contexto da conversa: lido do cache, alterado em memória e gravado em um upsert por turno"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(username='context_user')
+        self.conversation = Conversation.objects.create(user=self.user, conversation_type='general_fitness')
+
+    def _run_turn(self, message):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            result = ChatService().process_user_message(self.conversation.id, message)
+        self.assertNotIn('error', result)
+        return [query['sql'] for query in queries.captured_queries if 'chatbot_chatcontext' in query['sql']]
+
+    def test_context_read_from_cache_and_upserted_once_per_turn(self):
+        from .models import ChatContext
+
+        first = self._run_turn('Como melhorar meu agachamento?')
+        second = self._run_turn('Quero ganhar massa muscular nas pernas')
+
+        self.assertEqual(sum(1 for q in first if q.startswith('SELECT')), 1)
+        self.assertEqual(sum(1 for q in second if q.startswith('SELECT')), 0)
+        for turn in (first, second):
+            self.assertLessEqual(sum(1 for q in turn if q.startswith('INSERT')), 1)
+            self.assertFalse(any(q.startswith('UPDATE') for q in turn))
+
+        topics = ChatContext.objects.get(
+            conversation=self.conversation, context_key='topics_of_interest'
+        ).context_value['topics']
+        self.assertEqual(len(topics), len(set(topics)))
+        self.assertGreaterEqual(len(topics), 1)
+
+    def test_set_context_invalidates_cache(self):
+        from .models import ChatContext
+        from .services.context_store import get_context_store
+
+        get_context_store(self.conversation)
+        ChatContext.set_context(self.conversation, 'preferences', 'conversation_style', {'technical_level': 'advanced'})
+
+        conversation = Conversation.objects.get(id=self.conversation.id)
+        self.assertEqual(
+            get_context_store(conversation).get('preferences', 'conversation_style'),
+            {'technical_level': 'advanced'}
+        )
+
+
+class ConversationSummaryTest(TestCase):
+    """Histórico do prompt: resumo incremental e orçamento de tokens"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(username='summary_user')
+        self.conversation = Conversation.objects.create(user=self.user, conversation_type='general_fitness')
+
+    def _add_turns(self, count, ai_words=10):
+        for i in range(count):
+            Message.objects.create(conversation=self.conversation, message_type='user',
+                                   content=f'Pergunta {i} sobre treino. Detalhe extra.')
+            Message.objects.create(conversation=self.conversation, message_type='ai',
+                                   content=f'Resposta {i}. ' + 'palavra ' * ai_words)
+
+    def _history(self, summarizer, reserved_tokens=0):
+        from .services.context_store import get_context_store
+
+        conversation = Conversation.objects.get(id=self.conversation.id)
+        store = get_context_store(conversation)
+        history = summarizer.build_history(conversation, store, reserved_tokens)
+        store.flush()
+        return history
+
+    def test_folds_old_turns_every_n_turns(self):
+        from .services.conversation_summary import ConversationSummarizer
+
+        summarizer = ConversationSummarizer(token_budget=5000, recent_messages=4, every_turns=2)
+        self._add_turns(3)
+        history = self._history(summarizer)
+        self.assertFalse(history.summarized)
+        self.assertIn('Pergunta 0', history.history)
+
+        self._add_turns(1)
+        history = self._history(summarizer)
+        self.assertTrue(history.summarized)
+        self.assertIn('Usuário: Pergunta 0 sobre treino.', history.summary)
+        self.assertNotIn('Detalhe extra', history.summary)
+        self.assertNotIn('Pergunta 1', history.history)
+        self.assertEqual(history.history.count('\n') + 1, 4)
+
+        # Próximo turno lê o resumo salvo e não resume de novo
+        self.assertFalse(self._history(summarizer).summarized)
+
+    def test_prompt_stays_within_token_budget(self):
+        from .services.conversation_summary import ConversationSummarizer, estimate_tokens
+
+        summarizer = ConversationSummarizer(token_budget=900, recent_messages=6, every_turns=10)
+        self._add_turns(3, ai_words=400)
+        history = self._history(summarizer, reserved_tokens=300)
+
+        self.assertTrue(history.summarized)
+        self.assertLessEqual(history.tokens, 600)
+        self.assertEqual(history.tokens, estimate_tokens(history.summary) + estimate_tokens(history.history))
+        self.assertIn('Resposta 0.', history.summary)
+
+
+class SemanticResponseCacheTest(TestCase):
+    """Cache semântico: quase-duplicatas no mesmo escopo, sem trocar sentido nem nome"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from .services.response_cache import SemanticResponseCache
+        cache.clear()
+        self.cache = SemanticResponseCache(ttl=60, threshold=0.75)
+        self.profile = {'goal': 'ganhar massa', 'activity_level': 'moderado'}
+
+    def test_serves_near_duplicates_in_same_scope(self):
+        self.cache.store('Quantas séries para hipertrofia?', 'workout_request',
+                         'Ana, faça de 3 a 5 séries por exercício.', self.profile, 'Ana')
+
+        self.assertEqual(
+            self.cache.lookup('quantas series pra hipertrofia', 'workout_request', self.profile, 'Bruno'),
+            'Bruno, faça de 3 a 5 séries por exercício.'
+        )
+        self.assertIsNone(self.cache.lookup('quantas series pra hipertrofia', 'nutrition_advice', self.profile))
+        self.assertIsNone(self.cache.lookup('quantas series pra hipertrofia', 'workout_request',
+                                            {'goal': 'perder peso', 'activity_level': 'moderado'}))
+        self.assertIsNone(self.cache.lookup('como fazer supino reto', 'workout_request', self.profile))
+        self.assertEqual(self.cache.stats()['hit_rate'], 0.25)  # 1 hit, 3 misses
+
+    def test_numbers_and_negations_must_match(self):
+        self.cache.store('posso treinar em jejum', 'general_question', 'Pode, com cuidado.')
+        self.cache.store('treino de 3 dias para iniciante', 'workout_request', 'Plano de 3 dias.')
+
+        self.assertEqual(self.cache.lookup('Posso treinar em jejum?', 'general_question'), 'Pode, com cuidado.')
+        self.assertIsNone(self.cache.lookup('não posso treinar em jejum', 'general_question'))
+        self.assertIsNone(self.cache.lookup('treino de 5 dias para iniciante', 'workout_request'))
+
+    def test_chat_turn_skips_llm_on_cache_hit(self):
+        from unittest.mock import patch
+        from apps.recommendations.services.ai_service import AIService
+        from apps.recommendations.services.llm_providers import LocalStubProvider
+
+        stub = LocalStubProvider(responses_path='', latency_ms=0, jitter_ms=0)
+        with patch('apps.recommendations.services.ai_service.get_llm_provider', return_value=stub):
+            service = ChatService()
+            service.ai_service = AIService()
+        service.response_cache = self.cache
+
+        conversations = [
+            Conversation.objects.create(user=User.objects.create_user(username=f'cache_user{i}'),
+                                        conversation_type='general_fitness')
+            for i in range(2)
+        ]
+
+        with patch.object(service.ai_service, '_make_gemini_request',
+                          wraps=service.ai_service._make_gemini_request) as llm_call:
+            first = service.process_user_message(conversations[0].id, 'Quantas séries para hipertrofia?')
+            second = service.process_user_message(conversations[1].id, 'quantas séries pra hipertrofia')
+            # Com conversa anterior a resposta depende do histórico: nem serve nem guarda
+            follow_up = service.process_user_message(conversations[1].id, 'Quantas séries para hipertrofia?')
+
+        self.assertEqual(llm_call.call_count, 2)
+        self.assertEqual(first['method'], 'gemini_ai')
+        self.assertEqual(second['method'], 'semantic_cache')
+        self.assertEqual(second['response'], first['response'])
+        self.assertEqual(follow_up['method'], 'gemini_ai')
+        self.assertEqual(self.cache.stats()['stores'], 1)
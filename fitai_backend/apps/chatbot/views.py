@@ -10,11 +10,14 @@ from django.conf import settings
 from datetime import datetime, timedelta
 from functools import wraps
 from typing import Dict, List  # Adicionado esta linha
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
 
 from .models import Conversation, Message, ChatContext, ChatMetrics
 from .services.chat_service import ChatService
 from apps.users.models import UserProfile
-from apps.recommendations.services.ai_service import AIService
+from apps.recommendations.services.ai_service import get_ai_service
+from apps.core import rate_limit
 
 import logging
 import time
@@ -22,69 +25,68 @@ import json
 
 logger = logging.getLogger(__name__)
 
+CHATBOT_SCOPE = 'chatbot'
+
 
 def rate_limit_chatbot(max_requests_per_hour=30, max_requests_per_day=200):
     """
     Rate limiting específico para chatbot (mais permissivo que IA geral)
+    Contadores atômicos de apps.core.rate_limit; só requisições bem-sucedidas contam
     """
+    windows = (rate_limit.hourly(max_requests_per_hour), rate_limit.daily(max_requests_per_day))
+    
     def decorator(view_func):
         @wraps(view_func)
         def wrapper(request, *args, **kwargs):
             if not request.user.is_authenticated:
                 return view_func(request, *args, **kwargs)
             
-            user_id = request.user.id
-            now = datetime.now()
-            
-            # Chaves de rate limiting específicas para chatbot
-            hourly_key = f"chatbot_requests_{user_id}_{now.strftime('%Y%m%d%H')}"
-            daily_key = f"chatbot_requests_{user_id}_{now.strftime('%Y%m%d')}"
+            # Reserva a vaga antes de executar: sem corrida entre verificar e contar
+            limit = rate_limit.hit(CHATBOT_SCOPE, request.user.id, windows)
             
-            # Verificar limites
-            hourly_requests = cache.get(hourly_key, 0)
-            daily_requests = cache.get(daily_key, 0)
-            
-            if hourly_requests >= max_requests_per_hour:
+            if limit.exceeded is windows[0]:
                 return Response({
                     'error': 'Limite de mensagens por hora excedido',
                     'message': f'Máximo de {max_requests_per_hour} mensagens por hora',
-                    'retry_after': 3600 - (now.minute * 60 + now.second),
+                    'retry_after': limit.retry_after,
                     'suggestion': 'Que tal fazer uma pausa? O chat estará disponível em breve!',
                     'current_usage': {
-                        'hourly': hourly_requests,
-                        'daily': daily_requests,
+                        'hourly': limit.usage['Hourly'],
+                        'daily': limit.usage['Daily'],
                         'limits': {
                             'hourly_limit': max_requests_per_hour,
                             'daily_limit': max_requests_per_day
                         }
                     }
-                }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+                }, status=status.HTTP_429_TOO_MANY_REQUESTS, headers=limit.headers('X-Chatbot'))
             
-            if daily_requests >= max_requests_per_day:
+            if limit.exceeded is windows[1]:
                 return Response({
                     'error': 'Limite diário de mensagens excedido',
                     'message': f'Máximo de {max_requests_per_day} mensagens por dia',
-                    'retry_after': 86400 - (now.hour * 3600 + now.minute * 60 + now.second),
+                    'retry_after': limit.retry_after,
                     'suggestion': 'Retorne amanhã para continuar nossa conversa!',
                     'current_usage': {
-                        'hourly': hourly_requests,
-                        'daily': daily_requests
+                        'hourly': limit.usage['Hourly'],
+                        'daily': limit.usage['Daily']
                     }
-                }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+                }, status=status.HTTP_429_TOO_MANY_REQUESTS, headers=limit.headers('X-Chatbot'))
             
             # Executar view
-            response = view_func(request, *args, **kwargs)
+            try:
+                response = view_func(request, *args, **kwargs)
+            except Exception:
+                rate_limit.refund(limit)
+                raise
             
-            # Atualizar contadores apenas se a requisição foi bem-sucedida
-            if 200 <= response.status_code < 300:
-                cache.set(hourly_key, hourly_requests + 1, 3600)
-                cache.set(daily_key, daily_requests + 1, 86400)
-                
-                # Headers informativos
-                response['X-Chatbot-Hourly-Limit'] = str(max_requests_per_hour)
-                response['X-Chatbot-Hourly-Remaining'] = str(max_requests_per_hour - hourly_requests - 1)
-                response['X-Chatbot-Daily-Limit'] = str(max_requests_per_day)
-                response['X-Chatbot-Daily-Remaining'] = str(max_requests_per_day - daily_requests - 1)
+            # Só requisições bem-sucedidas consomem o limite
+            if not 200 <= response.status_code < 300:
+                rate_limit.refund(limit)
+                return response
+            
+            # Headers informativos
+            for header, value in limit.headers('X-Chatbot').items():
+                response[header] = value
             
             return response
         return wrapper
@@ -96,7 +98,7 @@ def test_chatbot_api(request):
     """Teste da API do chatbot com status detalhado"""
     try:
         chat_service = ChatService()
-        ai_service = AIService()
+        ai_service = get_ai_service()
     except Exception as e:
         logger.error(f"Error initializing services: {e}")
         chat_service = None
@@ -110,7 +112,8 @@ def test_chatbot_api(request):
             "openai_available": ai_service.is_available if ai_service else False,
             "chat_service_ready": chat_service is not None,
             "fallback_responses_enabled": True,
-            "response_methods": ["ai_powered", "rule_based_fallback"]
+            "response_methods": ["ai_powered", "semantic_cache", "rule_based_fallback"],
+            "response_cache": chat_service.response_cache.stats() if chat_service else None
         },
         "features_available": {
             "start_conversation": True,
@@ -391,6 +394,10 @@ def send_message(request, conversation_id):
                 'suggestion': 'Tente novamente em alguns minutos'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
+        # 📡 Modo streaming (SSE): tokens enviados conforme chegam do Gemini
+        if _wants_streaming(request):
+            return _build_streaming_response(request, chat_service, conversation_id, message)
+        
         # Processar mensagem
         response_data = chat_service.process_user_message(conversation_id, message)
         
@@ -1096,6 +1103,114 @@ def get_chat_analytics(request):
 
 # FUNÇÕES AUXILIARES
 
+# =============================================================================
+# 📡 STREAMING (SSE) DO SEND_MESSAGE
+# =============================================================================
+
+def _wants_streaming(request) -> bool:
+    """Cliente pediu streaming via ?stream=true ou {"stream": true} no corpo"""
+    flag = request.query_params.get('stream', request.data.get('stream', False))
+    return str(flag).lower() in ('1', 'true', 'yes')
+
+
+def _sse_event(event: str, data) -> str:
+    """Formata um evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+async def _stream_chat_events(user, chat_service: ChatService, conversation_id: int, message: str):
+    """
+    Gerador assíncrono do SSE.
+    Banco de dados roda via sync_to_async (thread compartilhada do Django);
+    a leitura do stream do Gemini roda em thread própria para não bloquear o event loop.
+    """
+    start_time = time.time()
+    
+    turn = await sync_to_async(chat_service.prepare_streaming_turn)(conversation_id, message)
+    if 'error' in turn:
+        yield _sse_event('error', {
+            'error': turn['error'],
+            'conversation_id': conversation_id
+        })
+        return
+    
+    yield _sse_event('start', {
+        'conversation_id': conversation_id,
+        'intent_detected': turn['intent_analysis'].get('intent'),
+        'ai_streaming': bool(turn.get('prompt') or turn.get('cached_response'))
+    })
+    
+    tokens = chat_service.stream_ai_tokens(turn)
+    next_token = sync_to_async(lambda: next(tokens, None), thread_sensitive=False)
+    
+    chunks = []
+    time_to_first_token_ms = None
+    
+    try:
+        while True:
+            token = await next_token()
+            if token is None:
+                break
+            if time_to_first_token_ms is None:
+                time_to_first_token_ms = round((time.time() - start_time) * 1000, 2)
+            chunks.append(token)
+            yield _sse_event('token', {'content': token})
+    except Exception as e:
+        logger.error(f"Error streaming AI response for conversation {conversation_id}: {e}")
+    
+    # Persistir mensagem final (plano de treino, fallback etc.) quando o stream termina
+    response_data = await sync_to_async(chat_service.finalize_streaming_turn)(turn, ''.join(chunks))
+    
+    if 'error' in response_data:
+        yield _sse_event('error', {
+            'message_processing_failed': True,
+            'error': response_data['error'],
+            'conversation_id': conversation_id
+        })
+        return
+    
+    try:
+        await sync_to_async(ChatMetrics.update_daily_metrics)(user)
+    except Exception as e:
+        logger.warning(f"Failed to update chat metrics: {e}")
+    
+    yield _sse_event('done', {
+        'message_sent': True,
+        'conversation_id': conversation_id,
+        'ai_response': {
+            'content': response_data['response'],
+            'message_id': response_data['message_id'],
+            'confidence_score': response_data.get('confidence_score', 0.8),
+            'response_method': response_data.get('method', 'unknown'),
+            'intent_detected': response_data.get('intent_detected'),
+        },
+        'action': response_data.get('action'),
+        'workout_ids': response_data.get('workout_ids', []),
+        'options': response_data.get('options', []),
+        'metadata': {
+            'processed_at': timezone.now().isoformat(),
+            'time_to_first_token_ms': time_to_first_token_ms,
+            'total_processing_time_ms': round((time.time() - start_time) * 1000, 2),
+            'fallback_used': response_data.get('method') == 'rule_based_fallback'
+        }
+    })
+
+
+def _build_streaming_response(request, chat_service: ChatService, conversation_id: int, message: str):
+    """
+    StreamingHttpResponse com gerador assíncrono: sob ASGI (fitai/asgi.py) os tokens
+    saem conforme chegam e nenhum worker fica preso durante a geração.
+    Sob WSGI o Django consome o gerador inteiro antes de responder (funciona, sem streaming).
+    """
+    response = StreamingHttpResponse(
+        _stream_chat_events(request.user, chat_service, conversation_id, message),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Desativa buffer do nginx
+    return response
+
+
 def _get_favorite_conversation_type(user) -> str:
     """Identifica tipo de conversa mais usado pelo usuário"""
     try:
@@ -0,0 +1,185 @@
+"""
+Rate limiting compartilhado (contadores atômicos no cache)
+
+AIService._check_rate_limit/_update_rate_limit_counter, rate_limit_user e
+rate_limit_chatbot faziam get seguido de set na mesma chave: sob
+concorrência contagens se perdiam, o limite era ultrapassado e cada
+verificação custava duas idas ao cache. Aqui:
+- cada janela (minuto, hora, dia) é um contador de janela fixa, incrementado
+  com cache.incr (atômico no Redis e no LocMemCache); a chave expira sozinha
+- a vaga é reservada antes (hit) e devolvida (refund) se a ação não
+  acontecer ou não puder contar - sem corrida entre verificar e contar
+- se o cache compartilhado cair, usa um LocMemCache do processo (limite por
+  processo em vez de global, mas nunca derruba a requisição) e volta a tentar
+  o compartilhado a cada FALLBACK_RETRY_SECONDS
+- RateLimitResult traz uso/restante/reset de cada janela para os headers
+"""
+import time
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'rl'
+FALLBACK_RETRY_SECONDS = 30
+
+_fallback = LocMemCache('fitai-rate-limit-fallback', {'TIMEOUT': None})
+_fallback_since: Optional[float] = None   # time.monotonic() da última falha do cache compartilhado
+
+
+@dataclass(frozen=True)
+class Window:
+    """Limite de `limit` ações a cada `seconds` segundos"""
+    name: str       # usado nos headers: Minute, Hourly, Daily...
+    limit: int
+    seconds: int
+
+
+def minute(limit: int) -> Window:
+    return Window('Minute', limit, 60)
+
+
+def hourly(limit: int) -> Window:
+    return Window('Hourly', limit, 3600)
+
+
+def daily(limit: int) -> Window:
+    return Window('Daily', limit, 86400)
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    windows: Sequence[Window]
+    usage: Dict[str, int] = field(default_factory=dict)        # janela -> contagem atual
+    reset_in: Dict[str, int] = field(default_factory=dict)     # janela -> segundos até zerar
+    exceeded: Optional[Window] = None
+    keys: Dict[str, str] = field(default_factory=dict, repr=False)
+    cost: int = 1
+
+    def remaining(self, name: str) -> int:
+        window = next(w for w in self.windows if w.name == name)
+        return max(0, window.limit - self.usage.get(name, 0))
+
+    @property
+    def retry_after(self) -> int:
+        return self.reset_in.get(self.exceeded.name, 0) if self.exceeded else 0
+
+    def headers(self, prefix: str = 'X-RateLimit') -> Dict[str, str]:
+        headers = {}
+        for window in self.windows:
+            headers[f"{prefix}-{window.name}-Limit"] = str(window.limit)
+            headers[f"{prefix}-{window.name}-Remaining"] = str(self.remaining(window.name))
+        return headers
+
+
+# =============================================================================
+# 🔧 OPERAÇÕES NO CACHE
+# =============================================================================
+
+def _fallback_active() -> bool:
+    """Fallback em uso até FALLBACK_RETRY_SECONDS depois da última falha"""
+    return _fallback_since is not None and time.monotonic() - _fallback_since < FALLBACK_RETRY_SECONDS
+
+
+def _switch_to_fallback(error: Exception):
+    global _fallback_since
+    if _fallback_since is None:
+        logger.error(f"Rate limit cache unavailable, using per-process fallback: {error}")
+    else:
+        logger.warning(f"Rate limit cache still unavailable: {error}")
+    _fallback_since = time.monotonic()
+
+
+def _shared_cache_ok():
+    global _fallback_since
+    if _fallback_since is not None:
+        logger.info("Rate limit cache available again, leaving per-process fallback")
+        _fallback_since = None
+
+
+def _window_key(scope: str, identity, window: Window, now: float) -> str:
+    return f"{KEY_PREFIX}:{scope}:{identity}:{window.seconds}:{int(now // window.seconds)}"
+
+
+def _incr(backend, key: str, delta: int, timeout: int) -> int:
+    """Incremento atômico; cria a chave (com expiração) na primeira vez"""
+    try:
+        return backend.incr(key, delta)
+    except ValueError:
+        # Chave ausente: add é atômico, só um processo a cria
+        if backend.add(key, delta, timeout):
+            return delta
+        return backend.incr(key, delta)
+
+
+def _apply(operation, *args):
+    if _fallback_active():
+        return operation(_fallback, *args)
+    try:
+        value = operation(cache, *args)
+    except ValueError:
+        _shared_cache_ok()
+        raise  # chave ausente/expirada: não é falha do cache
+    except Exception as e:
+        _switch_to_fallback(e)
+        return operation(_fallback, *args)
+    _shared_cache_ok()
+    return value
+
+
+# =============================================================================
+# 🚦 API
+# =============================================================================
+
+def hit(scope: str, identity, windows: Sequence[Window], cost: int = 1) -> RateLimitResult:
+    """
+    Reserva `cost` em todas as janelas (um incr por janela). Se alguma
+    passar do limite, desfaz a reserva e retorna allowed=False.
+    """
+    now = time.time()
+    result = RateLimitResult(allowed=True, windows=windows, cost=cost)
+    for window in windows:
+        key = _window_key(scope, identity, window, now)
+        result.keys[window.name] = key
+        result.usage[window.name] = _apply(_incr, key, cost, window.seconds + 1)
+        result.reset_in[window.name] = int(window.seconds - now % window.seconds)
+        if result.exceeded is None and result.usage[window.name] > window.limit:
+            result.exceeded = window
+
+    if result.exceeded is not None:
+        refund(result)
+        result.allowed = False
+    return result
+
+
+def refund(result: RateLimitResult):
+    """Devolve a reserva feita por hit (ex: a view respondeu com erro)"""
+    for window in result.windows:
+        key = result.keys.get(window.name)
+        if key is None:
+            continue
+        try:
+            _apply(lambda backend, k, d: backend.decr(k, d), key, result.cost)
+            result.usage[window.name] -= result.cost
+        except ValueError:
+            pass  # janela já expirou
+
+
+def peek(scope: str, identity, windows: Sequence[Window]) -> Dict[str, int]:
+    """Contagem atual de cada janela sem consumir (um get_many)"""
+    now = time.time()
+    keys = {window.name: _window_key(scope, identity, window, now) for window in windows}
+    values = _apply(lambda backend, k: backend.get_many(k), list(keys.values()))
+    return {name: values.get(key, 0) for name, key in keys.items()}
+
+
+def reset(scope: str, identity, windows: Sequence[Window]):
+    """Zera as janelas atuais (comandos administrativos e testes)"""
+    now = time.time()
+    keys: List[str] = [_window_key(scope, identity, window, now) for window in windows]
+    _apply(lambda backend, k: backend.delete_many(k), keys)
@@ -1,3 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from . import rate_limit
+
+
+class RateLimitTest(TestCase):
+    """Contadores atômicos de janela fixa"""
+
+    def setUp(self):
+        cache.clear()
+        self.windows = (rate_limit.hourly(3), rate_limit.daily(5))
+
+    def test_denies_after_limit_without_counting_denials(self):
+        results = [rate_limit.hit('test', 1, self.windows) for _ in range(5)]
+        self.assertEqual([r.allowed for r in results], [True, True, True, False, False])
+        self.assertIs(results[-1].exceeded, self.windows[0])
+        self.assertGreater(results[-1].retry_after, 0)
+        # Negadas são devolvidas: a janela diária ficou em 3
+        self.assertEqual(rate_limit.peek('test', 1, self.windows), {'Hourly': 3, 'Daily': 3})
+        self.assertEqual(results[2].headers()['X-RateLimit-Hourly-Remaining'], '0')
+        self.assertEqual(results[2].headers()['X-RateLimit-Daily-Remaining'], '2')
+
+    def test_refund_and_isolation(self):
+        result = rate_limit.hit('test', 1, self.windows)
+        rate_limit.refund(result)
+        self.assertEqual(rate_limit.peek('test', 1, self.windows), {'Hourly': 0, 'Daily': 0})
+        rate_limit.hit('test', 2, self.windows)
+        self.assertEqual(rate_limit.peek('test', 1, self.windows)['Hourly'], 0)
+
+    def test_concurrent_hits_never_exceed_limit(self):
+        windows = (rate_limit.minute(10),)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            allowed = list(pool.map(lambda _: rate_limit.hit('burst', 1, windows).allowed, range(40)))
+        self.assertEqual(sum(allowed), 10)
+
+    def test_falls_back_to_local_cache_when_shared_cache_fails(self):
+        with patch.object(rate_limit, '_fallback_since', None), \
+                patch.object(rate_limit.cache, 'incr', side_effect=ConnectionError('redis down')):
+            self.assertTrue(rate_limit.hit('fallback', 1, self.windows).allowed)
+            self.assertTrue(rate_limit._fallback_active())
+            self.assertEqual(rate_limit.peek('fallback', 1, self.windows)['Hourly'], 1)
+
+    def test_retries_shared_cache_after_cooldown(self):
+        with patch.object(rate_limit, '_fallback_since', None):
+            with patch.object(rate_limit.cache, 'incr', side_effect=ConnectionError('redis down')):
+                rate_limit.hit('recover', 1, self.windows)
+            # Ainda no cooldown: o cache compartilhado nem é consultado
+            rate_limit.hit('recover', 1, self.windows)
+            self.assertEqual(cache.get_many(rate_limit.hit('recover', 2, self.windows).keys.values()), {})
+
+            rate_limit._fallback_since -= rate_limit.FALLBACK_RETRY_SECONDS
+            result = rate_limit.hit('recover', 1, self.windows)
+            self.assertIsNone(rate_limit._fallback_since)
+            self.assertEqual(cache.get(result.keys['Hourly']), 1)
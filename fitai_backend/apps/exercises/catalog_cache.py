@@ -0,0 +1,111 @@
+"""
+Cache versionado do catálogo (exercícios e treinos públicos)
+
+O catálogo muda poucas vezes por semana e é lido o tempo todo. Cada payload
+fica pronto no cache como JSON já serializado, com chave que inclui uma versão
+global do catálogo. Os signals de Exercise/Workout incrementam essa versão, o
+que invalida tudo de uma vez sem precisar apagar chaves.
+
+O ETag é o hash do JSON: o app Flutter manda If-None-Match e recebe 304 quando
+nada mudou.
+"""
+import hashlib
+import json
+import time
+import logging
+from typing import Callable, Dict, Optional, Tuple
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION_KEY = 'catalog_version'
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24  # 24 horas (a versão invalida antes disso)
+
+
+# =============================================================================
+# 🔢 VERSÃO DO CATÁLOGO
+# =============================================================================
+
+def get_catalog_version() -> int:
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Timestamp evita reaproveitar ETags antigos depois de um flush do cache
+        version = int(time.time())
+        cache.add(CATALOG_VERSION_KEY, version, None)
+        version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def bump_catalog_version() -> int:
+    """Invalida todos os payloads do catálogo (chamado pelos signals)"""
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        # Chave ainda não existe (cache novo)
+        version = int(time.time())
+        cache.set(CATALOG_VERSION_KEY, version, None)
+        return version
+
+
+# =============================================================================
+# 📦 PAYLOADS
+# =============================================================================
+
+def _cache_key(name: str, params: Optional[Dict]) -> str:
+    params_hash = hashlib.md5(
+        json.dumps(params or {}, sort_keys=True, default=str).encode()
+    ).hexdigest()[:16]
+    return f"catalog:{get_catalog_version()}:{name}:{params_hash}"
+
+
+def get_or_build(name: str, params: Optional[Dict], builder: Callable[[], object]):
+    """Dados Python do catálogo (para uso interno, ex: geração de treino por regras)"""
+    key = f"{_cache_key(name, params)}:data"
+    data = cache.get(key)
+    if data is None:
+        data = builder()
+        cache.set(key, data, CATALOG_CACHE_TIMEOUT)
+    return data
+
+
+def get_or_build_payload(name: str, params: Optional[Dict],
+                         builder: Callable[[], Dict]) -> Tuple[str, str]:
+    """Retorna (etag, json_serializado) do payload, construindo se necessário"""
+    key = _cache_key(name, params)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    body = json.dumps(builder(), cls=DjangoJSONEncoder, ensure_ascii=False)
+    etag = '"%s"' % hashlib.sha1(body.encode()).hexdigest()
+    cache.set(key, (etag, body), CATALOG_CACHE_TIMEOUT)
+    return etag, body
+
+
+def _etag_matches(request, etag: str) -> bool:
+    header = request.headers.get('If-None-Match', '')
+    if not header:
+        return False
+    candidates = [value.strip().removeprefix('W/') for value in header.split(',')]
+    return '*' in candidates or etag in candidates
+
+
+def cached_catalog_response(request, name: str, params: Optional[Dict],
+                            builder: Callable[[], Dict]) -> HttpResponse:
+    """
+    Resposta JSON pré-serializada com ETag.
+    304 sem corpo quando o cliente já tem a versão atual.
+    """
+    etag, body = get_or_build_payload(name, params, builder)
+
+    if _etag_matches(request, etag):
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(body, content_type='application/json')
+
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
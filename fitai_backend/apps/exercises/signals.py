@@ -0,0 +1,15 @@
+"""
+Signals do app de exercícios
+Qualquer alteração em Exercise invalida o cache versionado do catálogo
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Exercise
+from .catalog_cache import bump_catalog_version
+
+
+@receiver(post_save, sender=Exercise)
+@receiver(post_delete, sender=Exercise)
+def exercise_changed(sender, instance, **kwargs):
+    bump_catalog_version()
@@ -1,3 +1,40 @@
 from django.test import TestCase
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+from rest_framework import status
 
-# Create your tests here.
+from .models import Exercise
+
+
+class ExerciseCatalogCacheTest(TestCase):
+    """Cache versionado do catálogo com ETag / If-None-Match"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='exercise_user', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        Exercise.objects.create(name='Agachamento', description='teste', muscle_group='legs')
+        Exercise.objects.create(name='Supino', description='teste', muscle_group='chest')
+
+    def test_list_exercises_etag_round_trip(self):
+        first = self.client.get('/api/v1/exercises/')
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.json()['total'], 2)
+        self.assertTrue(first.has_header('ETag'))
+
+        not_modified = self.client.get('/api/v1/exercises/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(not_modified.content, b'')
+
+    def test_exercise_change_invalidates_payloads(self):
+        first = self.client.get('/api/v1/exercises/by_muscle_group/', {'muscle_group': 'legs'})
+        self.assertEqual(first.json()['total'], 1)
+
+        Exercise.objects.create(name='Leg press', description='teste', muscle_group='legs')
+
+        second = self.client.get(
+            '/api/v1/exercises/by_muscle_group/', {'muscle_group': 'legs'},
+            HTTP_IF_NONE_MATCH=first['ETag']
+        )
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.json()['total'], 2)
@@ -4,6 +4,7 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.db.models import Q
 from .models import Exercise
+from .catalog_cache import cached_catalog_response
 
 @api_view(['GET'])
 def test_exercises_api(request):
@@ -12,59 +13,44 @@ def test_exercises_api(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def list_exercises(request):
-    """Lista todos os exercícios disponíveis"""
-    exercises = Exercise.objects.all()
-    data = []
+    """Lista todos os exercícios disponíveis (cache versionado + ETag)"""
+    def build():
+        data = list(Exercise.objects.values(
+            'id', 'name', 'description', 'muscle_group', 'difficulty_level',
+            'equipment_needed', 'duration_minutes', 'calories_per_minute',
+            'video_url', 'instructions',
+        ))
+        return {
+            'exercises': data,
+            'total': len(data)
+        }
     
-    for exercise in exercises:
-        data.append({
-            'id': exercise.id,
-            'name': exercise.name,
-            'description': exercise.description,
-            'muscle_group': exercise.muscle_group,
-            'difficulty_level': exercise.difficulty_level,
-            'equipment_needed': exercise.equipment_needed,
-            'duration_minutes': exercise.duration_minutes,
-            'calories_per_minute': exercise.calories_per_minute,
-            'video_url': exercise.video_url,
-            'instructions': exercise.instructions,
-        })
-    
-    return Response({
-        'exercises': data,
-        'total': len(data)
-    })
+    return cached_catalog_response(request, 'list_exercises', None, build)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def exercises_by_muscle_group(request):
-    """Lista exercícios por grupo muscular"""
+    """Lista exercícios por grupo muscular (cache versionado + ETag)"""
     muscle_group = request.GET.get('muscle_group')
     
     if not muscle_group:
         return Response({"error": "Parâmetro muscle_group é obrigatório"}, 
                        status=status.HTTP_400_BAD_REQUEST)
     
-    exercises = Exercise.objects.filter(muscle_group=muscle_group)
-    data = []
-    
-    for exercise in exercises:
-        data.append({
-            'id': exercise.id,
-            'name': exercise.name,
-            'description': exercise.description,
-            'difficulty_level': exercise.difficulty_level,
-            'equipment_needed': exercise.equipment_needed,
-            'duration_minutes': exercise.duration_minutes,
-            'video_url': exercise.video_url,
-            'instructions': exercise.instructions,
-        })
+    def build():
+        data = list(Exercise.objects.filter(muscle_group=muscle_group).values(
+            'id', 'name', 'description', 'difficulty_level', 'equipment_needed',
+            'duration_minutes', 'video_url', 'instructions',
+        ))
+        return {
+            'muscle_group': muscle_group,
+            'exercises': data,
+            'total': len(data)
+        }
     
-    return Response({
-        'muscle_group': muscle_group,
-        'exercises': data,
-        'total': len(data)
-    })
+    return cached_catalog_response(
+        request, 'exercises_by_muscle_group', {'muscle_group': muscle_group}, build
+    )
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
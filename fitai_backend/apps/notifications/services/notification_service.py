@@ -17,7 +17,7 @@ from ..models import (
 )
 from apps.users.models import UserProfile
 from apps.workouts.models import WorkoutSession, Workout
-from apps.recommendations.services.ai_service import AIService
+from apps.recommendations.services.ai_service import get_ai_service
 
 logger = logging.getLogger(__name__)
 
@@ -33,7 +33,7 @@ class NotificationService:
     def _get_ai_service(self):
         """Inicializa AIService se disponível"""
         try:
-            return AIService()
+            return get_ai_service()
         except Exception as e:
             logger.warning(f"AIService não disponível: {e}")
             return None
@@ -9,7 +9,7 @@ from django.conf import settings
 from django.utils import timezone
 
 from apps.users.models import UserProfile
-from apps.recommendations.services.ai_service import AIService
+from apps.recommendations.services.ai_service import get_ai_service
 from apps.recommendations.services.recommendation_engine import RecommendationEngine
 from apps.workouts.models import WorkoutSession
 
@@ -50,6 +50,32 @@ class Command(BaseCommand):
             action='store_true',
             help='Saída detalhada'
         )
+        
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='generate_batch: processos em paralelo (cada um com sua conexão ao banco)'
+        )
+        
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help='generate_batch: usuários em andamento ao mesmo tempo por processo'
+        )
+        
+        parser.add_argument(
+            '--checkpoint',
+            type=str,
+            help='generate_batch: arquivo de checkpoint com os usuários concluídos'
+        )
+        
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='generate_batch: retomar a partir do checkpoint'
+        )
 
     def handle(self, *args, **options):
         """Handler principal do comando"""
@@ -89,7 +115,7 @@ class Command(BaseCommand):
         """Testa integração com OpenAI"""
         self.stdout.write("🧪 TESTANDO INTEGRAÇÃO OPENAI")
         
-        ai_service = AIService()
+        ai_service = get_ai_service()
         
         # 1. Teste de disponibilidade
         self.stdout.write(f"API Disponível: {ai_service.is_available}")
@@ -188,11 +214,12 @@ class Command(BaseCommand):
             self.stdout.write(f"  {key}: {value}")
         
         # 2. Estado do cache
-        ai_service = AIService()
+        ai_service = get_ai_service()
         self.stdout.write("\n💾 CACHE:")
         
-        rate_limit_data = cache.get(ai_service.rate_limit_cache_key, {})
-        self.stdout.write(f"  Rate limit count: {rate_limit_data.get('count', 0)}")
+        quota_usage = ai_service.get_quota_usage()
+        self.stdout.write(f"  Cota Gemini (minuto): {quota_usage['Minute']}/{settings.GEMINI_RATE_LIMIT_PER_MINUTE}")
+        self.stdout.write(f"  Cota Gemini (dia): {quota_usage['Daily']}/{settings.GEMINI_RATE_LIMIT_PER_DAY}")
         
         temp_disabled = cache.get("openai_temp_disabled", False)
         self.stdout.write(f"  Temporariamente desabilitado: {temp_disabled}")
@@ -226,7 +253,7 @@ class Command(BaseCommand):
             issues.append("API Key não configurada")
             recommendations.append("Configure OPENAI_API_KEY no arquivo .env")
         
-        if rate_limit_data.get('count', 0) > 40:
+        if quota_usage['Daily'] > settings.GEMINI_RATE_LIMIT_PER_DAY * 0.8:
             issues.append("Rate limit próximo do limite")
             recommendations.append("Monitore uso da API ou aumente limite")
         
@@ -267,7 +294,11 @@ class Command(BaseCommand):
             )
             return
         
-        ai_service = AIService()
+        if options['workers'] > 1 or options['concurrency'] > 1 or options['checkpoint'] or options['resume']:
+            self._generate_batch_parallel([user.id for user in users], options)
+            return
+        
+        ai_service = get_ai_service()
         recommendation_engine = RecommendationEngine()
         
         success_count = 0
@@ -303,11 +334,53 @@ class Command(BaseCommand):
         self.stdout.write(f"  Erros: {error_count}")
         self.stdout.write(f"  Taxa de sucesso: {success_count/(success_count+error_count)*100:.1f}%")
 
+    def _generate_batch_parallel(self, user_ids, options):
+        """generate_batch em pool de processos; o token bucket compartilhado substitui o sleep fixo"""
+        from apps.recommendations.services.parallel_runner import default_checkpoint_path, run_parallel
+        
+        checkpoint_path = options['checkpoint'] or default_checkpoint_path('ai_generate_batch')
+        self.stdout.write(
+            f"⚡ {max(1, options['workers'])} processos x {max(1, options['concurrency'])} concorrentes "
+            f"(checkpoint: {checkpoint_path})"
+        )
+        
+        def on_chunk(results, report):
+            if options['verbose']:
+                for user_id, status, created, seconds, error in results:
+                    self.stdout.write(f"  {user_id}: {status} ({created} recomendações, {seconds:.2f}s) {error}")
+        
+        report = run_parallel(
+            user_ids,
+            algorithm='hybrid',
+            limit=3,
+            workers=max(1, options['workers']),
+            concurrency=max(1, options['concurrency']),
+            force_refresh=True,
+            checkpoint_path=checkpoint_path,
+            resume=options['resume'],
+            on_chunk=on_chunk,
+        )
+        
+        processed = report.succeeded + report.empty + report.errors
+        self.stdout.write(f"\n📊 RESULTADOS:")
+        self.stdout.write(f"  Sucessos: {report.succeeded}")
+        self.stdout.write(f"  Erros: {report.empty + report.errors}")
+        if report.resumed:
+            self.stdout.write(f"  Já concluídos (checkpoint): {report.resumed}")
+            if not report.users:
+                self.stdout.write(self.style.WARNING(
+                    "  ⚠️ O checkpoint já cobria todos os usuários - rode sem --resume para recomeçar"
+                ))
+        if processed:
+            self.stdout.write(f"  Taxa de sucesso: {report.succeeded/processed*100:.1f}%")
+        self.stdout.write(f"  Throughput: {report.users_per_second:.2f} usuários/s")
+        self.stdout.write(f"  Tempo por usuário (p95): {report.p95:.2f}s")
+
     def handle_stats(self, options):
         """Mostra estatísticas detalhadas"""
         self.stdout.write("📊 ESTATÍSTICAS DE IA")
         
-        ai_service = AIService()
+        ai_service = get_ai_service()
         
         # Stats da API
         api_stats = ai_service.get_api_usage_stats()
@@ -364,11 +437,13 @@ class Command(BaseCommand):
         """Limpa cache de IA"""
         self.stdout.write("🧹 LIMPANDO CACHE DE IA")
         
-        ai_service = AIService()
+        ai_service = get_ai_service()
+        
+        # Zerar a cota local do Gemini
+        ai_service.reset_quota()
         
         # Listar itens que serão limpos
         items_to_clear = [
-            ai_service.rate_limit_cache_key,
             "openai_temp_disabled",
         ]
         
@@ -478,7 +553,7 @@ class Command(BaseCommand):
         if not settings.OPENAI_API_KEY:
             return False, "API Key não configurada"
         
-        ai_service = AIService()
+        ai_service = get_ai_service()
         if not ai_service.is_available:
             return False, "Serviço não disponível"
         
@@ -502,7 +577,7 @@ class Command(BaseCommand):
     def _validate_ai_services(self):
         """Valida serviços de IA"""
         try:
-            ai_service = AIService()
+            ai_service = get_ai_service()
             recommendation_engine = RecommendationEngine()
             
             if not hasattr(ai_service, 'generate_personalized_workout_plan'):
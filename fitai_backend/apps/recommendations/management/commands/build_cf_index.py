@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+
+from apps.recommendations.services import collaborative
+
+
+class Command(BaseCommand):
+    help = 'Pré-calcula o índice de filtragem colaborativa (vizinhos top-K de cada treino)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--neighbours',
+            type=int,
+            default=None,
+            help='Vizinhos mantidos por treino (default: CF_NEIGHBOURS)'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default=None,
+            help='Arquivo .npz de saída (default: CF_INDEX_PATH)'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        self.stdout.write(self.style.HTTP_INFO('🧮 Calculando índice de filtragem colaborativa...'))
+
+        index = collaborative.build_index(k=options['neighbours'])
+        path = collaborative.save_index(index, options['output'] or settings.CF_INDEX_PATH)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✅ Índice salvo em {path}\n'
+                f'   Usuários: {index.n_users}\n'
+                f'   Treinos: {index.n_items}\n'
+                f'   Pares de vizinhos: {index.neighbours.nnz}\n'
+                f'   Tempo: {time.perf_counter() - started:.2f}s'
+            )
+        )
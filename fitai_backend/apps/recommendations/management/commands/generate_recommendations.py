@@ -35,6 +35,33 @@ class Command(BaseCommand):
             action='store_true',
             help='Forçar geração mesmo se já existem recomendações recentes'
         )
+        parser.add_argument(
+            '--batch',
+            action='store_true',
+            help='Pipeline offline vetorizado (job noturno): grava o top-N de todos os usuários servido pela API'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Processos em paralelo (cada um com sua conexão ao banco)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help='Usuários em andamento ao mesmo tempo dentro de cada processo'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            type=str,
+            help='Arquivo de checkpoint com os usuários concluídos (modo paralelo)'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Retomar a partir do checkpoint, pulando usuários já concluídos'
+        )
 
     def handle(self, *args, **options):
         algorithm = options['algorithm']
@@ -74,6 +101,14 @@ class Command(BaseCommand):
         
         self.stdout.write(f'📊 Processando {total_users} usuários...\n')
         
+        if options['batch']:
+            self._run_batch(users, limit)
+            return
+        
+        if options['workers'] > 1 or options['concurrency'] > 1 or options['checkpoint'] or options['resume']:
+            self._run_parallel(users, algorithm, limit, force_refresh, options)
+            return
+        
         # Inicializar motor de recomendações
         recommendation_engine = RecommendationEngine()
         
@@ -143,6 +178,75 @@ class Command(BaseCommand):
         
         self.stdout.write('\n✅ Comando executado com sucesso!')
 
+    def _run_batch(self, users, limit):
+        """Lote vetorizado: poucas consultas em massa + bulk_create por bloco de usuários"""
+        from apps.recommendations.services.batch_recommender import run_batch
+        
+        report = run_batch([user.id for user in users], limit=limit)
+        
+        self.stdout.write('\n' + '='*50)
+        self.stdout.write(self.style.SUCCESS('🎉 LOTE DE RECOMENDAÇÕES CONCLUÍDO!'))
+        self.stdout.write('='*50)
+        self.stdout.write(f'  • Usuários processados: {report.users}')
+        self.stdout.write(f'  • Recomendações gravadas: {report.recommendations}')
+        self.stdout.write(f'  • Blocos: {report.chunks}')
+        self.stdout.write(f'  • Tempo total: {report.seconds:.2f}s ({report.users_per_second:.0f} usuários/s)')
+        for stage, seconds in report.timings.items():
+            self.stdout.write(f'    - {stage}: {seconds:.2f}s')
+        
+        if report.recommendations > 0:
+            self._show_quality_report('hybrid')
+
+    def _run_parallel(self, users, algorithm, limit, force_refresh, options):
+        """Pool de processos + chamadas de IA concorrentes sob um token bucket compartilhado"""
+        from apps.recommendations.services.parallel_runner import default_checkpoint_path, run_parallel
+        
+        workers = max(1, options['workers'])
+        concurrency = max(1, options['concurrency'])
+        checkpoint_path = options['checkpoint'] or default_checkpoint_path(f'generate_recommendations_{algorithm}')
+        
+        self.stdout.write(f'⚡ Modo paralelo: {workers} processos x {concurrency} concorrentes')
+        self.stdout.write(f'💾 Checkpoint: {checkpoint_path}{" (retomando)" if options["resume"] else ""}\n')
+        
+        def on_chunk(results, report):
+            self.stdout.write(
+                f'  ... {report.users} usuários ({report.succeeded} ok, '
+                f'{report.skipped} pulados, {report.errors} erros)'
+            )
+        
+        report = run_parallel(
+            [user.id for user in users],
+            algorithm=algorithm,
+            limit=limit,
+            workers=workers,
+            concurrency=concurrency,
+            force_refresh=force_refresh,
+            checkpoint_path=checkpoint_path,
+            resume=options['resume'],
+            on_chunk=on_chunk,
+        )
+        
+        self.stdout.write('\n' + '='*50)
+        self.stdout.write(self.style.SUCCESS('🎉 GERAÇÃO PARALELA CONCLUÍDA!'))
+        self.stdout.write('='*50)
+        self.stdout.write(f'  • Usuários processados: {report.users}')
+        if report.resumed:
+            self.stdout.write(f'  • Já concluídos no checkpoint: {report.resumed}')
+            if not report.users:
+                self.stdout.write(self.style.WARNING(
+                    '  ⚠️ O checkpoint já cobria todos os usuários - rode sem --resume para recomeçar'
+                ))
+        self.stdout.write(f'  • Gerações bem-sucedidas: {report.succeeded}')
+        self.stdout.write(f'  • Sem recomendações: {report.empty}')
+        self.stdout.write(f'  • Usuários pulados: {report.skipped}')
+        self.stdout.write(f'  • Erros: {report.errors}')
+        self.stdout.write(f'  • Total de recomendações criadas: {report.recommendations}')
+        self.stdout.write(f'  • Throughput: {report.users_per_second:.1f} usuários/s em {report.seconds:.2f}s')
+        self.stdout.write(f'  • Tempo por usuário: p50 {report.percentile(50):.2f}s, p95 {report.p95:.2f}s')
+        
+        if report.recommendations > 0:
+            self._show_quality_report(algorithm)
+
     def _show_quality_report(self, algorithm):
         """Mostra relatório de qualidade das recomendações geradas"""
         try:
@@ -175,8 +279,8 @@ class Command(BaseCommand):
 
     def _check_ai_availability(self):
         """Verifica se a IA está disponível"""
-        from apps.recommendations.services.ai_service import AIService
-        ai_service = AIService()
+        from apps.recommendations.services.ai_service import get_ai_service
+        ai_service = get_ai_service()
         
         if ai_service.is_available:
             self.stdout.write(self.style.SUCCESS('🤖 IA (OpenAI) disponível'))
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.recommendations.services.llm_executor import LLMExecutor
+from apps.recommendations.services.llm_providers import build_provider
+
+DEFAULT_PROMPTS = [
+    "Monte um treino de 30 minutos para iniciante focado em pernas.",
+    "Quais exercícios ajudam a melhorar o condicionamento cardiovascular?",
+    "Como devo me alimentar antes de um treino de força?",
+    "Sugira um alongamento rápido para depois da corrida.",
+]
+
+
+class Command(BaseCommand):
+    help = 'Dispara prompts concorrentes contra um provedor de LLM e mostra o perfil de latência'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--provider',
+            type=str,
+            default='stub',
+            choices=['stub', 'gemini'],
+            help='Provedor a medir (default: stub - não consome cota)'
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=100,
+            help='Total de requisições'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=10,
+            help='Requisições simultâneas'
+        )
+        parser.add_argument(
+            '--prompts',
+            type=str,
+            default=None,
+            help='Arquivo JSONL com prompts ({"prompt": ...} por linha)'
+        )
+        parser.add_argument(
+            '--executor',
+            action='store_true',
+            help='Passa pelo LLMExecutor (fila, deadline, retry e hedge) como em produção'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            provider = build_provider(options['provider'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if not provider.is_available:
+            raise CommandError(f"Provedor '{provider.name}' indisponível")
+
+        prompts = self._load_prompts(options['prompts'])
+        self.stdout.write(self.style.HTTP_INFO(
+            f"⏱️ {options['requests']} requisições ao provedor '{provider.name}' "
+            f"(concorrência {options['concurrency']})..."
+        ))
+
+        executor = LLMExecutor(provider) if options['executor'] else None
+        started = time.perf_counter()
+        latencies, errors = asyncio.run(
+            self._run(executor or provider, prompts, options['requests'], options['concurrency'])
+        )
+        elapsed = time.perf_counter() - started
+
+        if not latencies:
+            raise CommandError(f"Todas as {errors} requisições falharam")
+
+        latencies = np.array(latencies) * 1000
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✅ Concluído em {elapsed:.2f}s ({len(latencies) / elapsed:.1f} req/s)\n'
+                f'   Erros: {errors}\n'
+                f'   p50: {np.percentile(latencies, 50):.0f}ms\n'
+                f'   p95: {np.percentile(latencies, 95):.0f}ms\n'
+                f'   p99: {np.percentile(latencies, 99):.0f}ms\n'
+                f'   máx: {latencies.max():.0f}ms'
+            )
+        )
+        if executor:
+            self.stdout.write(f'   Executor: {executor.stats.snapshot()}')
+
+    def _load_prompts(self, path):
+        if not path:
+            return DEFAULT_PROMPTS
+        with open(path, encoding='utf-8') as f:
+            prompts = [json.loads(line)['prompt'] for line in f if line.strip()]
+        if not prompts:
+            raise CommandError(f"Nenhum prompt em {path}")
+        return prompts
+
+    async def _run(self, provider, prompts, total, concurrency):
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        latencies, errors = [], 0
+
+        async def one(i):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    await provider.agenerate(prompts[i % len(prompts)])
+                    latencies.append(time.perf_counter() - started)
+                except Exception as e:
+                    errors += 1
+                    self.stderr.write(f"❌ {e}")
+
+        await asyncio.gather(*(one(i) for i in range(total)))
+        return latencies, errors
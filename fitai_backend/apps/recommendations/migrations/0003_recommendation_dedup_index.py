@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 05:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0002_alter_recommendation_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recommendation',
+            index=models.Index(fields=['usuario', 'workout_recomendado', 'data_geracao'], name='recommendat_usuario_679edd_idx'),
+        ),
+    ]
@@ -1,3 +1,6 @@
+from datetime import timedelta
+from typing import Dict, Iterable, List
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -113,6 +116,43 @@ class Recommendation(models.Model):
         """Retorna o score de confiança em percentual"""
         return f"{self.score_confianca * 100:.0f}%"
     
+    @classmethod
+    def bulk_create_new(cls, recommendations_by_user: Dict[int, Iterable[Dict]], algorithm: str,
+                        window: timedelta = timedelta(days=1)) -> List['Recommendation']:
+        """
+        Grava apenas os pares (usuário, treino) sem recomendação na janela:
+        uma consulta para os pares existentes + um bulk_create para o resto.
+        Cada item: {'workout_id', 'confidence_score', 'reason'}.
+        """
+        recommendations_by_user = {
+            user_id: list(recs) for user_id, recs in recommendations_by_user.items() if recs
+        }
+        if not recommendations_by_user:
+            return []
+        
+        workout_ids = {rec['workout_id'] for recs in recommendations_by_user.values() for rec in recs}
+        existing = set(cls.objects.filter(
+            usuario_id__in=recommendations_by_user.keys(),
+            workout_recomendado_id__in=workout_ids,
+            data_geracao__gte=timezone.now() - window
+        ).values_list('usuario_id', 'workout_recomendado_id'))
+        
+        objects = []
+        for user_id, recs in recommendations_by_user.items():
+            for rec in recs:
+                pair = (user_id, rec['workout_id'])
+                if pair in existing:
+                    continue
+                existing.add(pair)  # duplicatas na própria lista
+                objects.append(cls(
+                    usuario_id=user_id,
+                    workout_recomendado_id=rec['workout_id'],
+                    algoritmo_utilizado=algorithm,
+                    score_confianca=rec['confidence_score'],
+                    motivo_recomendacao=rec['reason']
+                ))
+        return cls.objects.bulk_create(objects, batch_size=1000)
+    
     class Meta:
         verbose_name = "Recomendação"
         verbose_name_plural = "Recomendações"
@@ -121,6 +161,8 @@ class Recommendation(models.Model):
             models.Index(fields=['usuario', '-data_geracao']),
             models.Index(fields=['aceita_pelo_usuario']),
             models.Index(fields=['visualizada']),
+            # Deduplicação de bulk_create_new (pares usuário/treino do último dia)
+            models.Index(fields=['usuario', 'workout_recomendado', 'data_geracao']),
         ]
         # Evita recomendar o mesmo treino múltiplas vezes ao mesmo usuário
         # (comentado porque pode querer recomendar o mesmo treino depois de um tempo)
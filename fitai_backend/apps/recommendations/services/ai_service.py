@@ -1,138 +1,326 @@
-import google.generativeai as genai
+import asyncio
 import json
 import logging
 import time
 from datetime import datetime, timedelta
 from django.conf import settings
 from django.core.cache import cache
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
+from apps.core import rate_limit
 from apps.users.models import UserProfile
 from apps.exercises.models import Exercise
-from apps.workouts.models import Workout, WorkoutSession, ExerciseLog
+from apps.workouts import analytics
+from apps.workouts.models import Workout, WorkoutSession, ExerciseLog, UserTrainingStats
+from .llm_executor import LLMQueueFullError, get_llm_executor
+from .llm_providers import get_llm_provider
+from .prompt_registry import prompts
 
 
 logger = logging.getLogger(__name__)
 
+GEMINI_QUOTA_SCOPE = 'gemini'
+
+
+# =============================================================================
+# 📝 PROMPTS (prefixo fixo + dados do usuário no sufixo - ver prompt_registry)
+# =============================================================================
+
+WORKOUT_PLAN_PROMPT = prompts.register(
+    'workout_plan',
+    prefix="""Você é um personal trainer expert. Crie um plano de treino personalizado.
+
+RESPONDA APENAS COM JSON VÁLIDO (sem markdown):
+{
+    "workout_name": "Nome motivador",
+    "description": "Descrição inspiradora (máx 100 palavras)",
+    "estimated_duration": "<duração em minutos, número>",
+    "difficulty_level": "<dificuldade informada>",
+    "target_focus": "<foco informado>",
+    "exercises": [
+        {
+            "order": 1,
+            "name": "Nome do exercício",
+            "muscle_group": "grupo muscular",
+            "sets": 3,
+            "reps": "12-15",
+            "rest_seconds": 45,
+            "instructions": "instruções claras",
+            "modifications": "adaptações",
+            "safety_tips": "dicas de segurança"
+        }
+    ],
+    "warm_up": {
+        "duration_minutes": 5,
+        "exercises": ["exercício 1", "exercício 2"],
+        "instructions": "instruções de aquecimento"
+    },
+    "cool_down": {
+        "duration_minutes": 5,
+        "exercises": ["alongamento 1", "alongamento 2"],
+        "instructions": "instruções de relaxamento"
+    },
+    "ai_coaching_tips": [
+        "dica técnica",
+        "motivação personalizada"
+    ]
+}
+
+IMPORTANTE: 
+- Incluir 6-10 exercícios apropriados
+- Instruções de segurança claras
+- Progressão lógica dos exercícios
+- Responda APENAS com o JSON, sem texto adicional
+""",
+    suffix="""
+PERFIL DO USUÁRIO:
+- Nome: {name}
+- Objetivo: {goal}
+- Nível: {level}
+- Idade: {age}
+- Histórico: {history}
+
+ESPECIFICAÇÕES:
+- Duração: {duration} minutos
+- Foco: {focus}
+- Dificuldade: {difficulty}"""
+)
+
+DAILY_RECOMMENDATION_PROMPT = prompts.register(
+    'daily_recommendation',
+    prefix="""Você é um personal trainer expert. Crie UMA recomendação específica para HOJE.
+
+RESPONDA APENAS COM JSON VÁLIDO (sem markdown):
+{
+    "recommendation_type": "workout|rest|active_recovery|motivation",
+    "title": "Título curto (máx 40 caracteres)",
+    "message": "Mensagem motivacional (máx 120 caracteres)",
+    "focus_area": "chest|back|legs|cardio|recovery|full_body",
+    "reasoning": "Explicação clara",
+    "intensity": "low|moderate|high",
+    "suggested_duration": 30,
+    "motivational_tip": "Dica prática (máx 80 caracteres)",
+    "emoji": "emoji apropriado"
+}
+
+IMPORTANTE:
+- Use o nome do usuário
+- Seja específico sobre grupos musculares
+- Se treinou 5+ vezes esta semana → sugerir descanso
+- Se grupo sobrecarregado → recuperação ativa DESSE grupo
+- Se grupo negligenciado → treino do grupo negligenciado
+""",
+    suffix="""
+PERFIL DO USUÁRIO:
+- Nome: {name}
+- Objetivo: {goal}
+- Nível: {level}
+
+CONTEXTO ATUAL:
+- Dia: {current_day}
+- Treinos esta semana: {workouts_this_week}
+- Dias desde último treino: {days_since}
+- Frequência semanal: {weekly_frequency}
+
+ANÁLISE MUSCULAR:
+- Grupos SOBRECARREGADOS: {overtrained}
+- Grupos NEGLIGENCIADOS: {underworked}"""
+)
+
 
 class AIService:
     """
     Serviço principal de integração com IA (Google Gemini)
     Migrado de OpenAI para Gemini - mantém compatibilidade com código existente
+    As chamadas passam pelo provedor configurado (llm_providers): Gemini em
+    produção ou o stub local em testes de carga.
     """
     
     def __init__(self):
-        self.model = None
-        self.is_available = False
-        self.rate_limit_cache_key = "gemini_rate_limit"
-        self._initialize_client()
+        self.client = get_llm_provider()
+        # Concorrência, deadline, retry e hedge das chamadas (compartilhado pelo processo)
+        self.executor = get_llm_executor(self.client)
+        # Override local (testes/diagnóstico); None = usar o provedor compartilhado
+        self._available_override = None
+    
+    @property
+    def model(self):
+        """Modelo Gemini do provedor (None para provedores sem modelo do SDK)"""
+        return getattr(self.client, 'model', None)
+    
+    @property
+    def is_available(self) -> bool:
+        """Lê a saúde em cache do provedor compartilhado (sem chamada de rede)"""
+        if self._available_override is not None:
+            return self._available_override
+        return self.client.is_available
+    
+    @is_available.setter
+    def is_available(self, value):
+        self._available_override = value
     
     def _initialize_client(self):
-        """Inicializa cliente Gemini"""
-        try:
-            if not settings.GEMINI_API_KEY or settings.GEMINI_API_KEY.strip() == '':
-                logger.warning("Gemini API key not configured or empty")
-                return
-            
-            # Configurar Gemini
-            genai.configure(api_key=settings.GEMINI_API_KEY)
-            
-            # Inicializar modelo
-            self.model = genai.GenerativeModel(
-                model_name=settings.GEMINI_MODEL,
-                generation_config={
-                    'temperature': settings.GEMINI_TEMPERATURE,
-                    'max_output_tokens': settings.GEMINI_MAX_TOKENS,
-                }
-            )
-            
-            # Teste rápido de conectividade
-            if self._test_api_connection():
-                self.is_available = True
-                logger.info(f"Gemini client initialized successfully with model {settings.GEMINI_MODEL}")
-            else:
-                logger.error("Gemini API test failed")
-                
-        except Exception as e:
-            logger.error(f"Failed to initialize Gemini client: {e}")
-            self.is_available = False
+        """Reinicializa o provedor compartilhado (ex: após trocar a API key)"""
+        self.client.reset()
+        if not self.client.is_available:
+            logger.warning("LLM provider unavailable (Gemini API key not configured or empty?)")
     
     def _test_api_connection(self) -> bool:
-        """Testa conexão com a API Gemini"""
-        try:
-            if not self.model:
-                return False
-            
-            # Fazer uma requisição simples para testar
-            response = self.model.generate_content("Test")
-            return bool(response.text)
-            
-        except Exception as e:
-            logger.error(f"Gemini API test failed: {e}")
-            return False
-    
-    def _check_rate_limit(self) -> bool:
-        """Verifica rate limiting (Gemini tem limites mais generosos)"""
-        rate_limit_data = cache.get(self.rate_limit_cache_key, {"count": 0, "reset_time": time.time()})
-        
-        current_time = time.time()
-        
-        # Reset contador a cada minuto para Gemini
-        if current_time - rate_limit_data["reset_time"] > 60:
-            rate_limit_data = {"count": 0, "reset_time": current_time}
-        
-        # Limite do Gemini: 15 requisições por minuto no free tier
-        if rate_limit_data["count"] >= settings.GEMINI_RATE_LIMIT_PER_MINUTE:
-            logger.warning("Gemini rate limit reached locally")
-            return False
-            
-        return True
+        """Verificação explícita de saúde - usar apenas em diagnóstico/monitoramento"""
+        return self.client.check_health()
     
-    def _update_rate_limit_counter(self):
-        """Atualiza contador de rate limiting"""
-        rate_limit_data = cache.get(self.rate_limit_cache_key, {"count": 0, "reset_time": time.time()})
-        rate_limit_data["count"] += 1
-        cache.set(self.rate_limit_cache_key, rate_limit_data, 60)  # Cache por 1 minuto
+    def _quota_windows(self):
+        return (
+            rate_limit.minute(settings.GEMINI_RATE_LIMIT_PER_MINUTE),
+            rate_limit.daily(settings.GEMINI_RATE_LIMIT_PER_DAY),
+        )
     
-    def _make_gemini_request(self, prompt: str) -> Optional[str]:
-        """Faz requisição segura para Gemini"""
-        if not self.is_available or not self.model:
+    def _check_rate_limit(self) -> Optional[rate_limit.RateLimitResult]:
+        """
+        Reserva uma chamada na cota global do Gemini (por minuto e por dia).
+        Contador atômico compartilhado entre processos: verificar e contar é
+        uma operação só. Retorna a reserva (para _refund_quota) ou None se a
+        cota acabou.
+        """
+        result = rate_limit.hit(GEMINI_QUOTA_SCOPE, 'global', self._quota_windows())
+        if not result.allowed:
+            logger.warning(f"Gemini {result.exceeded.name.lower()} quota reached")
             return None
-        
-        # Verificar rate limiting
-        if not self._check_rate_limit():
-            logger.warning("Skipping Gemini request due to rate limiting")
+        return result
+    
+    def _refund_quota(self, reservation: Optional[rate_limit.RateLimitResult]):
+        """Devolve a cota de uma chamada que não chegou a ser enviada ao provedor"""
+        if reservation is not None:
+            rate_limit.refund(reservation)
+    
+    def get_quota_usage(self) -> Dict[str, int]:
+        """Chamadas já feitas na janela atual ({'Minute': n, 'Daily': n})"""
+        return rate_limit.peek(GEMINI_QUOTA_SCOPE, 'global', self._quota_windows())
+    
+    def reset_quota(self):
+        rate_limit.reset(GEMINI_QUOTA_SCOPE, 'global', self._quota_windows())
+    
+    def _can_send_request(self, kind: str) -> Tuple[bool, Optional[rate_limit.RateLimitResult]]:
+        """
+        Disponibilidade, circuit breaker, cota local e limitador compartilhado.
+        Retorna (pode enviar, reserva de cota) - a reserva é devolvida se a
+        chamada não chegar ao provedor.
+        """
+        if not self.is_available:
+            return False, None
+        
+        # Circuit breaker aberto: não insistir em uma API que está falhando
+        if not self.client.allow_request():
+            logger.warning(f"Skipping {kind}: circuit breaker open")
+            return False, None
+        
+        # Verificar rate limiting (o stub local não consome cota)
+        quota = None
+        if self.client.uses_quota:
+            quota = self._check_rate_limit()
+            if quota is None:
+                logger.warning(f"Skipping {kind} due to rate limiting")
+                return False, None
+        
+        if not self.client.acquire_request_slot():
+            logger.warning(f"Skipping {kind}: shared rate limiter timeout")
+            self._refund_quota(quota)
+            return False, None
+        
+        return True, quota
+    
+    def _handle_request_error(self, error: Exception, quota: Optional[rate_limit.RateLimitResult] = None):
+        logger.error(f"LLM provider error ({self.client.name}): {error}")
+        if isinstance(error, LLMQueueFullError):
+            # Saturação local, não falha do provedor: não conta para o circuit
+            # breaker e a chamada nunca foi enviada (devolve a cota)
+            self._refund_quota(quota)
+            return
+        # 429/cota estourada conta como falha no circuit breaker; o orçamento de
+        # retentativas do executor evita multiplicar a carga enquanto isso
+        self.client.record_failure(error)
+    
+    def _make_gemini_request(self, prompt: str, timeout: Optional[float] = None, hedge: bool = True,
+                             **generation_config) -> Optional[str]:
+        """
+        Faz requisição segura ao provedor de LLM. generation_config (ex:
+        max_output_tokens, response_mime_type) é repassado ao provedor.
+        timeout/hedge: deadline da chamada (padrão GEMINI_TIMEOUT_SECONDS) e se
+        ela pode ser duplicada pelo hedge do executor (desligar em gerações longas)
+        """
+        allowed, quota = self._can_send_request("LLM request")
+        if not allowed:
             return None
             
         try:
-            # Fazer requisição
-            response = self.model.generate_content(prompt)
-            
-            # Atualizar contador de rate limit
-            self._update_rate_limit_counter()
-            
-            # Extrair resposta
-            content = response.text
+            result = self.executor.generate(prompt, timeout=timeout, hedge=hedge, **generation_config)
+            content = result.text
+            self.client.record_success()
             
             # Log métricas
-            self._log_api_metrics(response, len(prompt))
+            self._log_api_metrics(len(prompt), len(content or ''), result.latency_ms, result.queue_wait_ms)
+            prompts.record_request(prompt, result.latency_ms)
             
             return content.strip() if content else None
             
         except Exception as e:
-            logger.error(f"Gemini API error: {e}")
-            if "quota" in str(e).lower() or "rate" in str(e).lower():
-                # Marcar como indisponível temporariamente
-                cache.set("gemini_temp_disabled", True, 60)  # 1 minuto
+            self._handle_request_error(e, quota)
+            return None
+    
+    async def _make_gemini_request_async(self, prompt: str, timeout: Optional[float] = None, hedge: bool = True,
+                                         **generation_config) -> Optional[str]:
+        """Versão assíncrona de _make_gemini_request (provedor.agenerate)"""
+        allowed, quota = await asyncio.to_thread(self._can_send_request, "async LLM request")
+        if not allowed:
+            return None
+        
+        try:
+            result = await self.executor.agenerate(prompt, timeout=timeout, hedge=hedge, **generation_config)
+            content = result.text
+            self.client.record_success()
+            self._log_api_metrics(len(prompt), len(content or ''), result.latency_ms, result.queue_wait_ms)
+            prompts.record_request(prompt, result.latency_ms)
+            return content.strip() if content else None
+        
+        except Exception as e:
+            self._handle_request_error(e, quota)
             return None
     
-    def _log_api_metrics(self, response, prompt_length: int):
+    def _make_gemini_stream_request(self, prompt: str, **generation_config) -> Iterator[str]:
+        """
+        Versão streaming de _make_gemini_request: produz os trechos de texto
+        conforme chegam do provedor. Não produz nada se a IA estiver indisponível.
+        """
+        allowed, quota = self._can_send_request("LLM stream")
+        if not allowed:
+            return
+        
+        started = time.perf_counter()
+        response_chars = 0
+        try:
+            for text in self.executor.stream(prompt, **generation_config):
+                response_chars += len(text)
+                yield text
+            
+            self.client.record_success()
+            latency_ms = (time.perf_counter() - started) * 1000
+            self._log_api_metrics(len(prompt), response_chars, latency_ms)
+            prompts.record_request(prompt, latency_ms)
+            
+        except Exception as e:
+            self._handle_request_error(e, quota)
+    
+    def _log_api_metrics(self, prompt_length: int, response_chars: int, latency_ms: Optional[float] = None,
+                         queue_wait_ms: Optional[float] = None):
         """Log métricas da API para monitoramento"""
         try:
             metrics = {
                 "timestamp": datetime.now().isoformat(),
+                "provider": self.client.name,
                 "model": settings.GEMINI_MODEL,
                 "prompt_chars": prompt_length,
-                "response_chars": len(response.text) if response.text else 0,
+                "response_chars": response_chars,
+                "latency_ms": round(latency_ms, 1) if latency_ms is not None else None,
+                "queue_wait_ms": round(queue_wait_ms, 1) if queue_wait_ms is not None else None,
             }
             
             # Armazenar métricas em cache
@@ -141,7 +329,7 @@ class AIService:
             daily_metrics.append(metrics)
             cache.set(daily_key, daily_metrics, 86400)  # 24 horas
             
-            logger.info(f"Gemini API used {metrics['response_chars']} chars in response")
+            logger.info(f"{metrics['provider']} used {metrics['response_chars']} chars in response")
             
         except Exception as e:
             logger.error(f"Error logging API metrics: {e}")
@@ -151,7 +339,7 @@ class AIService:
         """
         Gera plano de treino personalizado usando Gemini
         """
-        if not self.is_available or cache.get("gemini_temp_disabled"):
+        if not self.is_available:
             return None
         
         # Buscar histórico do usuário para contexto
@@ -201,62 +389,17 @@ class AIService:
     
     def _build_optimized_workout_prompt(self, profile: UserProfile, duration: int, 
                                       focus: str, difficulty: str, history: Dict) -> str:
-        """Prompt otimizado para Gemini"""
-        return f"""Você é um personal trainer expert. Crie um plano de treino personalizado.
-
-PERFIL DO USUÁRIO:
-- Nome: {profile.user.first_name or 'Usuário'}
-- Objetivo: {profile.goal or 'fitness geral'}
-- Nível: {profile.activity_level or 'iniciante'}
-- Idade: {profile.age or 'não informado'}
-- Histórico: {history.get('recent_activity', 'iniciando')}
-
-ESPECIFICAÇÕES:
-- Duração: {duration} minutos
-- Foco: {focus}
-- Dificuldade: {difficulty}
-
-RESPONDA APENAS COM JSON VÁLIDO (sem markdown):
-{{
-    "workout_name": "Nome motivador",
-    "description": "Descrição inspiradora (máx 100 palavras)",
-    "estimated_duration": {duration},
-    "difficulty_level": "{difficulty}",
-    "target_focus": "{focus}",
-    "exercises": [
-        {{
-            "order": 1,
-            "name": "Nome do exercício",
-            "muscle_group": "grupo muscular",
-            "sets": 3,
-            "reps": "12-15",
-            "rest_seconds": 45,
-            "instructions": "instruções claras",
-            "modifications": "adaptações",
-            "safety_tips": "dicas de segurança"
-        }}
-    ],
-    "warm_up": {{
-        "duration_minutes": 5,
-        "exercises": ["exercício 1", "exercício 2"],
-        "instructions": "instruções de aquecimento"
-    }},
-    "cool_down": {{
-        "duration_minutes": 5,
-        "exercises": ["alongamento 1", "alongamento 2"],
-        "instructions": "instruções de relaxamento"
-    }},
-    "ai_coaching_tips": [
-        "dica técnica",
-        "motivação personalizada"
-    ]
-}}
-
-IMPORTANTE: 
-- Incluir 6-10 exercícios apropriados
-- Instruções de segurança claras
-- Progressão lógica dos exercícios
-- Responda APENAS com o JSON, sem texto adicional"""
+        """Prompt otimizado para Gemini (template 'workout_plan')"""
+        return WORKOUT_PLAN_PROMPT.render(
+            name=profile.user.first_name or 'Usuário',
+            goal=profile.goal or 'fitness geral',
+            level=profile.activity_level or 'iniciante',
+            age=profile.age or 'não informado',
+            history=history.get('recent_activity', 'iniciando'),
+            duration=duration,
+            focus=focus,
+            difficulty=difficulty,
+        )
     
     def _validate_and_enhance_workout_plan(self, plan: Dict) -> Optional[Dict]:
         """Validação robusta do plano de treino"""
@@ -389,7 +532,7 @@ IMPORTANTE:
     
     def analyze_user_progress(self, user_profile: UserProfile) -> Optional[Dict]:
         """Análise de progresso com Gemini"""
-        if not self.is_available or cache.get("gemini_temp_disabled"):
+        if not self.is_available:
             return None
         
         # Coletar dados detalhados
@@ -421,48 +564,37 @@ IMPORTANTE:
         return None
     
     def _collect_detailed_user_progress(self, user) -> Dict:
-        """Coleta dados detalhados para análise"""
+        """Coleta dados detalhados para análise (a partir do rollup UserTrainingStats)"""
         try:
-            from datetime import timedelta
-            from django.utils import timezone
-            from django.db.models import Avg, Count, Sum
+            stats = self._get_training_stats(user)
             
-            now = timezone.now()
             periods = {
-                'week': now - timedelta(days=7),
-                'month': now - timedelta(days=30),
-                'quarter': now - timedelta(days=90)
+                'week': 7,
+                'month': 30,
+                'quarter': 90
             }
             
             data = {'has_sufficient_data': False}
             
-            for period_name, start_date in periods.items():
-                sessions = WorkoutSession.objects.filter(
-                    user=user, 
-                    created_at__gte=start_date
-                )
-                
-                completed_sessions = sessions.filter(completed=True)
-                total_sessions = sessions.count()
+            for period_name, days in periods.items():
+                summary = stats.period_summary(days)
+                total_sessions = summary['started_sessions']
+                completed_sessions = summary['completed_sessions']
                 
                 if total_sessions >= (3 if period_name == 'week' else 5):
                     data['has_sufficient_data'] = True
                 
                 data[f'{period_name}_stats'] = {
                     'total_sessions': total_sessions,
-                    'completed_sessions': completed_sessions.count(),
+                    'completed_sessions': completed_sessions,
                     'completion_rate': round(
-                        completed_sessions.count() / total_sessions * 100, 1
+                        completed_sessions / total_sessions * 100, 1
                     ) if total_sessions > 0 else 0,
-                    'avg_duration': completed_sessions.aggregate(
-                        Avg('actual_duration')
-                    )['actual_duration__avg'] or 0,
-                    'avg_rating': completed_sessions.aggregate(
-                        Avg('user_rating')
-                    )['user_rating__avg'] or 0
+                    'avg_duration': summary['avg_duration'],
+                    'avg_rating': summary['avg_rating']
                 }
             
-            data['trends'] = self._calculate_user_trends(user)
+            data['trends'] = self._calculate_user_trends(user, stats)
             
             return data
             
@@ -470,41 +602,22 @@ IMPORTANTE:
             logger.error(f"Error collecting detailed progress data: {e}")
             return {'has_sufficient_data': False}
     
-    def _calculate_user_trends(self, user) -> Dict:
-        """Calcula tendências do usuário"""
+    def _get_training_stats(self, user):
+        """Linha de rollup do usuário (reconstruída uma vez se ainda não existir)"""
+        stats = UserTrainingStats.objects.filter(user=user).first()
+        if stats is None:
+            stats = UserTrainingStats.rebuild_for_user(user)
+        return stats
+    
+    def _calculate_user_trends(self, user, stats=None) -> Dict:
+        """Calcula tendências do usuário (semanas lidas do rollup, sem consultas extras)"""
         try:
-            from datetime import timedelta
-            from django.utils import timezone
-            
-            weeks_data = []
-            for week in range(4):
-                start_date = timezone.now() - timedelta(days=(week + 1) * 7)
-                end_date = timezone.now() - timedelta(days=week * 7)
-                
-                week_sessions = WorkoutSession.objects.filter(
-                    user=user,
-                    completed=True,
-                    completed_at__range=(start_date, end_date)
-                ).count()
-                
-                weeks_data.append(week_sessions)
-            
-            if len(weeks_data) >= 3:
-                recent_avg = sum(weeks_data[:2]) / 2
-                older_avg = sum(weeks_data[2:]) / 2
-                
-                if recent_avg > older_avg * 1.2:
-                    trend = 'crescente'
-                elif recent_avg < older_avg * 0.8:
-                    trend = 'decrescente'
-                else:
-                    trend = 'estável'
-            else:
-                trend = 'insuficiente'
+            stats = stats or self._get_training_stats(user)
+            weeks_data = stats.weekly_completed(4)
             
             return {
                 'weekly_frequency': weeks_data,
-                'trend': trend,
+                'trend': analytics.weekly_trend(weeks_data),
                 'consistency_score': min(weeks_data) / max(weeks_data) if max(weeks_data) > 0 else 0
             }
             
@@ -567,7 +680,7 @@ IMPORTANTE:
     
     def generate_motivational_content(self, user_profile: UserProfile, context: str) -> Optional[str]:
         """Gera conteúdo motivacional com Gemini"""
-        if not self.is_available or cache.get("gemini_temp_disabled"):
+        if not self.is_available:
             return None
         
         user_context = self._get_user_context(user_profile.user)
@@ -613,21 +726,43 @@ Responda APENAS com a mensagem motivacional, sem aspas ou formatação adicional
             
             total_requests = len(today_metrics)
             
-            rate_limit_data = cache.get(self.rate_limit_cache_key, {"count": 0})
+            quota_usage = self.get_quota_usage()
             
             return {
                 "api_available": self.is_available,
                 "usage_today": {
                     "requests_made": total_requests,
-                    "rate_limit_remaining": max(0, settings.GEMINI_RATE_LIMIT_PER_MINUTE - rate_limit_data.get("count", 0))
+                    "rate_limit_remaining": max(0, settings.GEMINI_RATE_LIMIT_PER_MINUTE - quota_usage["Minute"]),
+                    "daily_quota_remaining": max(0, settings.GEMINI_RATE_LIMIT_PER_DAY - quota_usage["Daily"])
                 },
-                "last_test": self._test_api_connection()
+                "latency_by_provider": self._latency_profile(today_metrics),
+                "executor": self.executor.stats.snapshot(),
+                "prompts": prompts.stats(),
+                "client_status": self.client.get_status()
             }
             
         except Exception as e:
             logger.error(f"Error getting API usage stats: {e}")
             return {"error": "Unable to fetch stats"}
     
+    @staticmethod
+    def _latency_profile(metrics: List[Dict]) -> Dict:
+        """p50/p95 de latência (ms) por provedor a partir das métricas do dia"""
+        latencies: Dict[str, List[float]] = {}
+        for entry in metrics:
+            if entry.get("latency_ms") is not None:
+                latencies.setdefault(entry.get("provider", "gemini"), []).append(entry["latency_ms"])
+        
+        profile = {}
+        for provider, values in latencies.items():
+            values.sort()
+            profile[provider] = {
+                "requests": len(values),
+                "p50_ms": values[len(values) // 2],
+                "p95_ms": values[min(len(values) - 1, int(len(values) * 0.95))],
+            }
+        return profile
+    
     def _get_user_context(self, user) -> Dict:
         """Coleta contexto do usuário com cache"""
         try:
@@ -796,7 +931,7 @@ Seja específico, honesto e construtivo baseado nos dados fornecidos."""
         
         # 🤖 PASSO 2: Se não há treino recomendado, gerar nova recomendação
         
-        if not self.is_available or cache.get("gemini_temp_disabled"):
+        if not self.is_available:
             logger.info("IA indisponível, usando fallback baseado em regras")
             # ✅ MODIFICAR ESTA LINHA:
             fallback = self._generate_rule_based_recommendation(user_profile, workout_history)
@@ -1069,42 +1204,17 @@ Seja específico, honesto e construtivo baseado nos dados fornecidos."""
         ]
         underworked_groups = history.get('underworked_groups', [])
         
-        return f"""Você é um personal trainer expert. Crie UMA recomendação específica para HOJE.
-
-PERFIL DO USUÁRIO:
-- Nome: {profile.user.first_name or 'Usuário'}
-- Objetivo: {profile.goal or 'fitness geral'}
-- Nível: {profile.activity_level or 'iniciante'}
-
-CONTEXTO ATUAL:
-- Dia: {current_day}
-- Treinos esta semana: {history.get('workouts_this_week', 0)}
-- Dias desde último treino: {days_since_text}
-- Frequência semanal: {history.get('weekly_frequency', 'baixa')}
-
-ANÁLISE MUSCULAR:
-- Grupos SOBRECARREGADOS: {', '.join(overtrained_groups) or 'nenhum'}
-- Grupos NEGLIGENCIADOS: {', '.join(underworked_groups) or 'nenhum'}
-
-RESPONDA APENAS COM JSON VÁLIDO (sem markdown):
-{{
-    "recommendation_type": "workout|rest|active_recovery|motivation",
-    "title": "Título curto (máx 40 caracteres)",
-    "message": "Mensagem motivacional (máx 120 caracteres)",
-    "focus_area": "chest|back|legs|cardio|recovery|full_body",
-    "reasoning": "Explicação clara",
-    "intensity": "low|moderate|high",
-    "suggested_duration": 30,
-    "motivational_tip": "Dica prática (máx 80 caracteres)",
-    "emoji": "emoji apropriado"
-}}
-
-IMPORTANTE:
-- Use o nome: {profile.user.first_name or 'Usuário'}
-- Seja específico sobre grupos musculares
-- Se treinou 5+ vezes esta semana → sugerir descanso
-- Se grupo sobrecarregado → recuperação ativa DESSE grupo
-- Se grupo negligenciado → treino do grupo negligenciado"""
+        return DAILY_RECOMMENDATION_PROMPT.render(
+            name=profile.user.first_name or 'Usuário',
+            goal=profile.goal or 'fitness geral',
+            level=profile.activity_level or 'iniciante',
+            current_day=current_day,
+            workouts_this_week=history.get('workouts_this_week', 0),
+            days_since=days_since_text,
+            weekly_frequency=history.get('weekly_frequency', 'baixa'),
+            overtrained=', '.join(overtrained_groups) or 'nenhum',
+            underworked=', '.join(underworked_groups) or 'nenhum',
+        )
 
 
     def _generate_rule_based_recommendation(self, profile: UserProfile,
@@ -1444,4 +1554,17 @@ IMPORTANTE:
         except Exception:
             return 0.5
         
-        
\ No newline at end of file
+        
+
+_shared_ai_service: Optional[AIService] = None
+
+
+def get_ai_service() -> AIService:
+    """
+    Instância de AIService compartilhada pelo processo.
+    Não faz chamada de rede: a saúde da API vem do cliente Gemini em cache.
+    """
+    global _shared_ai_service
+    if _shared_ai_service is None:
+        _shared_ai_service = AIService()
+    return _shared_ai_service
@@ -0,0 +1,242 @@
+"""
+Pipeline offline de recomendações (job noturno)
+
+Em vez de rodar o motor híbrido usuário a usuário (várias consultas cada),
+o lote:
+- carrega catálogo, perfis e histórico de um bloco de usuários em poucas
+  consultas em massa
+- calcula o score de conteúdo de todos os treinos de uma vez por perfil
+  (objetivo, nível de atividade, áreas de foco) com a matriz de features de
+  content_features
+- soma o sinal colaborativo do índice item-item (uma multiplicação esparsa
+  para o bloco inteiro)
+- grava o top-N de cada usuário com bulk_create em Recommendation, com
+  expira_em preenchido; a API serve essas linhas diretamente
+"""
+import time
+import logging
+from dataclasses import dataclass, field
+from datetime import timedelta
+from types import SimpleNamespace
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from apps.users.models import UserProfile
+from apps.workouts.models import UserTrainingStats, Workout, WorkoutSession
+from ..models import Recommendation
+from . import collaborative
+from .content_features import CatalogFeatures, get_catalog_features, score_catalog, top_k
+
+logger = logging.getLogger(__name__)
+
+BATCH_ALGORITHM = 'hybrid'
+BATCH_CHUNK_SIZE = 2000
+RECENT_DAYS = 14
+COLLABORATIVE_WEIGHT = 0.3
+COLLABORATIVE_REASON = 'Popular entre usuários que fizeram os mesmos treinos que você'
+
+
+@dataclass
+class BatchReport:
+    """Resumo de uma execução do lote"""
+    users: int = 0
+    recommendations: int = 0
+    chunks: int = 0
+    seconds: float = 0.0
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def users_per_second(self) -> float:
+        return self.users / self.seconds if self.seconds else 0.0
+
+
+# =============================================================================
+# 👥 DADOS DOS USUÁRIOS (consultas em massa)
+# =============================================================================
+
+def _load_chunk(user_ids: Sequence[int]) -> Tuple[Dict, Dict, Dict]:
+    profiles = {
+        row['user_id']: row for row in
+        UserProfile.objects.filter(user_id__in=user_ids).values('user_id', 'goal', 'activity_level', 'focus_areas')
+    }
+
+    recent_cutoff = timezone.now() - timedelta(days=RECENT_DAYS)
+    seen: Dict[int, set] = {}
+    recent: Dict[int, set] = {}
+    completions: List[Tuple[int, int, float]] = []
+    rows = WorkoutSession.objects.filter(user_id__in=user_ids).values_list(
+        'user_id', 'workout_id', 'completed', 'user_rating', 'created_at', 'notes'
+    )
+    for user_id, workout_id, completed, rating, created_at, notes in rows.iterator():
+        seen.setdefault(user_id, set()).add(workout_id)
+        if created_at >= recent_cutoff:
+            recent.setdefault(user_id, set()).add(workout_id)
+        if completed and UserTrainingStats.CANCEL_NOTE_MARKER not in (notes or ''):
+            completions.append((user_id, workout_id, np.nan if rating is None else rating))
+
+    # Mesmo peso do índice colaborativo, calculado de uma vez para o bloco
+    history: Dict[int, Dict[int, float]] = {}
+    weights = collaborative.interaction_weight(np.array([rating for _, _, rating in completions], dtype=np.float64))
+    for (user_id, workout_id, _), weight in zip(completions, weights):
+        user_history = history.setdefault(user_id, {})
+        user_history[workout_id] = user_history.get(workout_id, 0.0) + float(weight)
+
+    return profiles, {'seen': seen, 'recent': recent}, history
+
+
+def _collaborative_matrix(user_ids: Sequence[int], history: Dict[int, Dict[int, float]],
+                          catalog: CatalogFeatures) -> np.ndarray:
+    """Scores colaborativos do bloco inteiro (usuários × catálogo) em uma multiplicação"""
+    index = collaborative.get_index()
+    result = np.zeros((len(user_ids), len(catalog)), dtype=np.float32)
+    if index.n_items == 0 or not history:
+        return result
+
+    rows, cols, values = [], [], []
+    for row, user_id in enumerate(user_ids):
+        for workout_id, weight in history.get(user_id, {}).items():
+            position = index.position_of(workout_id)
+            if position is not None:
+                rows.append(row)
+                cols.append(position)
+                values.append(np.log1p(weight))
+    if not rows:
+        return result
+
+    user_matrix = sparse.csr_matrix(
+        (np.array(values, dtype=np.float32), (rows, cols)), shape=(len(user_ids), index.n_items)
+    )
+    totals = np.asarray(user_matrix.sum(axis=1)).ravel()
+    totals[totals == 0] = 1.0
+    scores = (user_matrix @ index.neighbours).toarray() / totals[:, None]
+
+    # Reordena as colunas do índice para a ordem do catálogo
+    present, columns = collaborative.index_columns(index, catalog.ids)
+    result[:, present] = scores[:, columns[present]]
+    return result
+
+
+def combine_hybrid_scores(content: np.ndarray, collab: np.ndarray,
+                          recent_positions: Sequence[int], seen_positions: Sequence[int]) -> np.ndarray:
+    """
+    Ranking híbrido de um usuário: conteúdo (0-1, já filtrado por elegibilidade)
+    + COLLABORATIVE_WEIGHT × colaborativo. Sem treinos recentes (regra do
+    conteúdo) nem já feitos sugeridos só pelo colaborativo.
+    """
+    combined = np.minimum(content + COLLABORATIVE_WEIGHT * collab, 1.0)
+    combined[np.asarray(recent_positions, dtype=np.int64)] = 0.0
+    seen = np.asarray(seen_positions, dtype=np.int64)
+    combined[seen[content[seen] == 0]] = 0.0
+    return combined
+
+
+# =============================================================================
+# 🏃 EXECUÇÃO
+# =============================================================================
+
+def score_chunk(user_ids: Sequence[int], catalog: CatalogFeatures, limit: int,
+                reason_builder) -> List[Recommendation]:
+    profiles, sessions, history = _load_chunk(user_ids)
+    cf_scores = _collaborative_matrix(user_ids, history, catalog)
+
+    profile_cache: Dict[Tuple, Tuple[np.ndarray, np.ndarray]] = {}
+    now = timezone.now()
+    expires = now + timedelta(seconds=settings.RECOMMENDATION_BATCH_TTL)
+    objects = []
+
+    for row, user_id in enumerate(user_ids):
+        profile = profiles.get(user_id)
+        key = (profile['goal'], profile['activity_level'], profile['focus_areas']) if profile else (None, 'sedentary', None)
+        if key not in profile_cache:
+            profile_cache[key] = score_catalog(catalog, *key)
+        base_scores, eligible = profile_cache[key]
+
+        content = np.where(eligible, np.minimum(base_scores / 10.0, 1.0), 0.0)
+        collab = cf_scores[row]
+        combined = combine_hybrid_scores(
+            content, collab,
+            catalog.positions_of(sessions['recent'].get(user_id, ())),
+            catalog.positions_of(sessions['seen'].get(user_id, ())),
+        )
+
+        profile_ns = SimpleNamespace(goal=key[0], activity_level=key[1])
+        for position in top_k(combined, limit):
+            workout = catalog.rows[position]
+            if content[position] >= COLLABORATIVE_WEIGHT * collab[position]:
+                reason = reason_builder(SimpleNamespace(
+                    workout_type=workout['workout_type'],
+                    difficulty_level=workout['difficulty_level'],
+                    estimated_duration=workout['estimated_duration'] or 0,
+                ), profile_ns)
+            else:
+                reason = COLLABORATIVE_REASON
+            objects.append(Recommendation(
+                usuario_id=user_id,
+                workout_recomendado_id=workout['id'],
+                algoritmo_utilizado=BATCH_ALGORITHM,
+                score_confianca=round(float(combined[position]), 3),
+                motivo_recomendacao=reason,
+                expira_em=expires,
+            ))
+    return objects
+
+
+def run_batch(user_ids: Iterable[int], limit: int = 5,
+              chunk_size: int = BATCH_CHUNK_SIZE) -> BatchReport:
+    """Gera e grava o top-N de cada usuário (substitui o lote anterior ainda válido)"""
+    from .recommendation_engine import RecommendationEngine
+
+    report = BatchReport()
+    started = time.perf_counter()
+    user_ids = list(user_ids)
+
+    catalog = get_catalog_features()
+    report.timings['catalog'] = time.perf_counter() - started
+    if not len(catalog) or not user_ids:
+        report.seconds = time.perf_counter() - started
+        return report
+
+    reason_builder = RecommendationEngine()._generate_recommendation_reason
+
+    for offset in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[offset:offset + chunk_size]
+        chunk_started = time.perf_counter()
+        objects = score_chunk(chunk, catalog, limit, reason_builder)
+        scored_at = time.perf_counter()
+
+        with transaction.atomic():
+            # Lote anterior deixa de ser servido (continua no histórico)
+            Recommendation.objects.filter(
+                usuario_id__in=chunk, expira_em__gt=timezone.now()
+            ).update(expira_em=timezone.now())
+            Recommendation.objects.bulk_create(objects, batch_size=1000)
+
+        report.timings['scoring'] = report.timings.get('scoring', 0.0) + scored_at - chunk_started
+        report.timings['writing'] = report.timings.get('writing', 0.0) + time.perf_counter() - scored_at
+        report.users += len(chunk)
+        report.recommendations += len(objects)
+        report.chunks += 1
+
+    report.seconds = time.perf_counter() - started
+    logger.info(
+        f"Recommendation batch: {report.users} users, {report.recommendations} rows "
+        f"in {report.seconds:.2f}s ({report.users_per_second:.0f} users/s)"
+    )
+    return report
+
+
+def stored_recommendations(user, limit: int):
+    """Linhas do último lote ainda válidas para o usuário (servidas pela API)"""
+    return list(
+        Recommendation.objects.filter(
+            usuario=user,
+            expira_em__gt=timezone.now(),
+            workout_recomendado__isnull=False,
+            workout_recomendado__is_active=True,
+        ).select_related('workout_recomendado').order_by('-score_confianca', 'id')[:limit]
+    )
@@ -0,0 +1,333 @@
+"""
+Filtragem colaborativa item-item vetorizada
+
+Substitui a busca de "usuários similares" (20 perfis, uma contagem por perfil
+e um Workout.objects.get por item) por um índice pré-calculado:
+- matriz esparsa usuário × treino montada a partir de WorkoutSession
+  (conclusões, ponderadas por user_rating)
+- similaridade de cosseno entre treinos (Xᵀ·X) mantendo apenas os top-K
+  vizinhos de cada treino
+- o índice é gerado offline (manage.py build_cf_index), salvo em .npz e
+  mantido em memória por processo; a consulta é um produto vetor × matriz.
+  O caminho de requisição nunca recalcula o índice: vencido ou ausente, ele
+  é servido como está (ou vazio) até o próximo build_cf_index
+
+O custo da consulta depende do catálogo (treinos) e não do número de
+usuários, então o mesmo índice atende 100k+ usuários.
+"""
+import os
+import threading
+import time
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+
+from apps.workouts.models import UserTrainingStats, Workout, WorkoutSession
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CFIndex:
+    """Vizinhos top-K de cada treino (matriz esparsa itens × itens)"""
+    workout_ids: np.ndarray          # posição -> workout_id
+    neighbours: sparse.csr_matrix    # similaridade (linha = treino de origem)
+    popularity: np.ndarray           # peso total de interações por treino
+    built_at: float
+    n_users: int
+
+    def __post_init__(self):
+        self._position = {int(workout_id): i for i, workout_id in enumerate(self.workout_ids)}
+
+    @property
+    def n_items(self) -> int:
+        return len(self.workout_ids)
+
+    def position_of(self, workout_id: int) -> Optional[int]:
+        return self._position.get(int(workout_id))
+
+
+# =============================================================================
+# 🏗️ CONSTRUÇÃO DO ÍNDICE
+# =============================================================================
+
+def interaction_weight(ratings: np.ndarray) -> np.ndarray:
+    """Peso de uma conclusão: 1.0 sem avaliação, nota/3 com avaliação (1 → 0.33, 5 → 1.67)"""
+    ratings = np.asarray(ratings, dtype=np.float32)
+    return np.where(np.isnan(ratings), 1.0, ratings / 3.0).astype(np.float32)
+
+
+def _load_interactions() -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(user_ids, workout_ids, pesos) das sessões concluídas em treinos do catálogo"""
+    rows = WorkoutSession.objects.filter(
+        completed=True,
+        workout__is_personalized=False,
+        workout__is_active=True,
+    ).exclude(
+        notes__contains=UserTrainingStats.CANCEL_NOTE_MARKER
+    ).values_list('user_id', 'workout_id', 'user_rating')
+
+    data = np.array(
+        [(user_id, workout_id, np.nan if rating is None else rating) for user_id, workout_id, rating in rows.iterator()],
+        dtype=np.float64
+    ).reshape(-1, 3)
+    return data[:, 0].astype(np.int64), data[:, 1].astype(np.int64), interaction_weight(data[:, 2])
+
+
+def build_interaction_matrix(user_ids: np.ndarray, workout_ids: np.ndarray,
+                             weights: np.ndarray) -> Tuple[sparse.csr_matrix, np.ndarray]:
+    """
+    Matriz usuário × treino (CSR). Repetições do mesmo treino somam e são
+    amortecidas com log1p para um usuário assíduo não dominar a similaridade.
+    """
+    unique_users, user_pos = np.unique(user_ids, return_inverse=True)
+    unique_items, item_pos = np.unique(workout_ids, return_inverse=True)
+
+    matrix = sparse.coo_matrix(
+        (weights, (user_pos, item_pos)),
+        shape=(len(unique_users), len(unique_items)),
+        dtype=np.float32
+    ).tocsr()  # soma duplicatas
+    matrix.data = np.log1p(matrix.data)
+    return matrix, unique_items
+
+
+def top_k_per_row(matrix: sparse.csr_matrix, k: int) -> sparse.csr_matrix:
+    """Mantém apenas as k maiores entradas de cada linha"""
+    matrix = matrix.tocsr()
+    indptr, indices, data = [0], [], []
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        row_data = matrix.data[start:end]
+        row_indices = matrix.indices[start:end]
+        if len(row_data) > k:
+            keep = np.argpartition(-row_data, k - 1)[:k]
+            row_data, row_indices = row_data[keep], row_indices[keep]
+        indices.append(row_indices)
+        data.append(row_data)
+        indptr.append(indptr[-1] + len(row_data))
+
+    return sparse.csr_matrix(
+        (np.concatenate(data) if data else np.array([], dtype=np.float32),
+         np.concatenate(indices) if indices else np.array([], dtype=np.int32),
+         np.array(indptr)),
+        shape=matrix.shape
+    )
+
+
+def empty_index(built_at: float = 0.0) -> CFIndex:
+    """Índice sem treinos: o colaborativo não contribui (built_at=0 = sempre vencido)"""
+    return CFIndex(
+        workout_ids=np.array([], dtype=np.int64),
+        neighbours=sparse.csr_matrix((0, 0), dtype=np.float32),
+        popularity=np.array([], dtype=np.float32),
+        built_at=built_at,
+        n_users=0,
+    )
+
+
+def build_index(k: Optional[int] = None, interactions=None) -> CFIndex:
+    """Calcula o índice completo (executado offline pelo comando build_cf_index)"""
+    k = k or getattr(settings, 'CF_NEIGHBOURS', 50)
+    started = time.perf_counter()
+
+    user_ids, workout_ids, weights = interactions if interactions is not None else _load_interactions()
+    if len(user_ids) == 0:
+        return empty_index(built_at=time.time())
+
+    matrix, items = build_interaction_matrix(user_ids, workout_ids, weights)
+
+    # Cosseno item-item: normaliza colunas e multiplica Xᵀ·X (esparso)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    norms[norms == 0] = 1.0
+    normalized = matrix @ sparse.diags(1.0 / norms).astype(np.float32)
+    similarity = (normalized.T @ normalized).tocsr()
+    similarity.setdiag(0)
+    similarity.eliminate_zeros()
+
+    index = CFIndex(
+        workout_ids=items,
+        neighbours=top_k_per_row(similarity, k),
+        popularity=np.asarray(matrix.sum(axis=0)).ravel().astype(np.float32),
+        built_at=time.time(),
+        n_users=matrix.shape[0],
+    )
+    logger.info(
+        f"CF index built: {matrix.shape[0]} users x {len(items)} workouts, "
+        f"{index.neighbours.nnz} neighbour pairs in {time.perf_counter() - started:.2f}s"
+    )
+    return index
+
+
+# =============================================================================
+# 💾 PERSISTÊNCIA (.npz)
+# =============================================================================
+
+def save_index(index: CFIndex, path: Optional[str] = None) -> str:
+    path = path or settings.CF_INDEX_PATH
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp.npz"
+    np.savez_compressed(
+        tmp_path,
+        workout_ids=index.workout_ids,
+        data=index.neighbours.data,
+        indices=index.neighbours.indices,
+        indptr=index.neighbours.indptr,
+        popularity=index.popularity,
+        meta=np.array([index.built_at, index.n_users], dtype=np.float64),
+    )
+    os.replace(tmp_path, path)  # troca atômica para processos que estão lendo
+    return path
+
+
+def load_index(path: Optional[str] = None) -> Optional[CFIndex]:
+    path = path or settings.CF_INDEX_PATH
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as stored:
+        n_items = len(stored['workout_ids'])
+        return CFIndex(
+            workout_ids=stored['workout_ids'],
+            neighbours=sparse.csr_matrix(
+                (stored['data'], stored['indices'], stored['indptr']), shape=(n_items, n_items)
+            ),
+            popularity=stored['popularity'],
+            built_at=float(stored['meta'][0]),
+            n_users=int(stored['meta'][1]),
+        )
+
+
+_index: Optional[CFIndex] = None
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+def _is_fresh(index: Optional[CFIndex], max_age: float) -> bool:
+    return index is not None and time.time() - index.built_at < max_age
+
+
+def get_index() -> CFIndex:
+    """
+    Índice em memória do processo, carregado do arquivo gerado offline.
+
+    Nunca calcula o índice aqui (build_index varre todas as sessões e rodava
+    dentro da requisição, segurando as demais no lock). Vencido ou sem
+    arquivo, serve o índice atual - ou um vazio, só conteúdo - e registra um
+    aviso; o arquivo é relido no máximo a cada CF_INDEX_RELOAD_SECONDS, por
+    uma thread só, para pegar o próximo build_cf_index.
+    """
+    global _index, _index_checked_at
+    max_age = getattr(settings, 'CF_INDEX_MAX_AGE', 60 * 60 * 24)
+    reload_seconds = getattr(settings, 'CF_INDEX_RELOAD_SECONDS', 300)
+    current = _index
+    if _is_fresh(current, max_age) or (current is not None and time.time() - _index_checked_at < reload_seconds):
+        return current
+
+    if not _index_lock.acquire(blocking=False):
+        # Outra thread já está relendo o arquivo: segue com o que houver
+        return current if current is not None else empty_index()
+    try:
+        _index_checked_at = time.time()
+        index = load_index()
+        if index is not None and (_index is None or index.built_at > _index.built_at):
+            _index = index
+        elif _index is None:
+            _index = empty_index()
+
+        if index is None:
+            logger.warning(
+                f"CF index not found at {settings.CF_INDEX_PATH}; collaborative scores "
+                f"disabled until build_cf_index runs"
+            )
+        elif not _is_fresh(_index, max_age):
+            logger.warning(
+                f"CF index is {(time.time() - _index.built_at) / 3600:.1f}h old "
+                f"(CF_INDEX_MAX_AGE={max_age}s); serving it until build_cf_index runs"
+            )
+        return _index
+    finally:
+        _index_lock.release()
+
+
+def set_index(index: Optional[CFIndex]):
+    """Substitui o índice em memória (após rebuild ou em testes)"""
+    global _index, _index_checked_at
+    _index = index
+    _index_checked_at = 0.0
+
+
+# =============================================================================
+# 🔎 CONSULTA
+# =============================================================================
+
+def user_history(user) -> Dict[int, float]:
+    """Interações do usuário (consultadas ao vivo: inclui treinos após o último build)"""
+    weights: Dict[int, float] = {}
+    rows = WorkoutSession.objects.filter(user=user, completed=True).exclude(
+        notes__contains=UserTrainingStats.CANCEL_NOTE_MARKER
+    ).values_list('workout_id', 'user_rating')
+    for workout_id, rating in rows:
+        weight = float(interaction_weight(np.array([np.nan if rating is None else rating]))[0])
+        weights[workout_id] = weights.get(workout_id, 0.0) + weight
+    return weights
+
+
+def score_items(index: CFIndex, history: Dict[int, float]) -> np.ndarray:
+    """Score de cada treino do índice = Σ peso_visto × similaridade(visto, treino)"""
+    scores = np.zeros(index.n_items, dtype=np.float32)
+    positions, values = [], []
+    for workout_id, weight in history.items():
+        position = index.position_of(workout_id)
+        if position is not None:
+            positions.append(position)
+            values.append(np.log1p(weight))
+    if not positions:
+        return scores
+
+    user_vector = sparse.csr_matrix(
+        (np.array(values, dtype=np.float32), (np.zeros(len(positions), dtype=np.int32), positions)),
+        shape=(1, index.n_items)
+    )
+    # Normaliza pelo peso total: média ponderada das similaridades (0-1)
+    scores = np.asarray((user_vector @ index.neighbours).todense()).ravel() / user_vector.sum()
+    scores[positions] = 0.0  # já feitos
+    return scores
+
+
+def index_columns(index: CFIndex, workout_ids: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """(presentes, coluna no índice) para alinhar scores do índice a outra ordem de treinos"""
+    columns = np.array([
+        -1 if index.position_of(workout_id) is None else index.position_of(workout_id)
+        for workout_id in workout_ids
+    ], dtype=np.int64)
+    return columns >= 0, columns
+
+
+def recommend(user, limit: int, exclude: Iterable[int] = (),
+              history: Optional[Dict[int, float]] = None) -> List[Tuple[int, float]]:
+    """Top-N (workout_id, score) para o usuário; lista vazia sem histórico útil"""
+    index = get_index()
+    if index.n_items == 0:
+        return []
+
+    if history is None:
+        history = user_history(user)
+    scores = score_items(index, history)
+
+    for workout_id in exclude:
+        position = index.position_of(workout_id)
+        if position is not None:
+            scores[position] = 0.0
+
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) == 0:
+        return []
+    if len(candidates) > limit:
+        candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+    candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+
+    return [(int(index.workout_ids[i]), float(scores[i])) for i in candidates]
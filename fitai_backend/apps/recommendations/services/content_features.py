@@ -0,0 +1,223 @@
+"""
+Score de conteúdo vetorizado (catálogo × perfil)
+
+_content_based_recommendations buscava limit*2 treinos e pontuava cada um em
+Python com comparações de strings; os melhores candidatos muitas vezes nem
+eram avaliados. Aqui:
+- o catálogo é codificado uma vez em uma matriz de features (tipo,
+  dificuldade, faixa de duração, recomendado, grupos musculares, equipamento)
+- cada perfil vira um vetor de pesos (+ viés) e uma máscara de elegibilidade
+- o catálogo inteiro é pontuado com um produto matriz × vetor e top-k com
+  argpartition
+- a codificação fica em memória do processo e é refeita quando a versão do
+  catálogo (catalog_cache) muda
+
+Os pesos reproduzem RecommendationEngine._calculate_workout_score; os grupos
+musculares de UserProfile.focus_areas somam um bônus extra.
+"""
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from apps.exercises.catalog_cache import get_catalog_version
+from apps.workouts.models import Workout
+
+BASE_SCORE = 5.0
+GOAL_BONUS = 3.0
+LEVEL_BONUS = 2.0
+ADVANCED_PENALTY = 3.0
+DURATION_BONUS = 1.0
+RECOMMENDED_BONUS = 1.5
+FOCUS_BONUS = 1.0  # dividido entre as áreas de foco do perfil
+
+SHORT_DURATION = 30
+LONG_DURATION = 45
+
+DIFFICULTIES = ('beginner', 'intermediate', 'advanced')
+LOW_ACTIVITY = ('sedentary', 'light')
+HIGH_ACTIVITY = ('active', 'very_active')
+
+# objetivo -> (tipos elegíveis, tipos com bônus)
+GOAL_TYPES = {
+    'lose_weight': (('cardio', 'hiit', 'mixed'), ('cardio', 'hiit')),
+    'gain_muscle': (('strength', 'bodybuilding', 'mixed'), ('strength', 'bodybuilding')),
+    'improve_endurance': (('cardio', 'endurance', 'mixed'), ('cardio', 'endurance')),
+}
+
+
+def _split_tags(value: Optional[str]) -> List[str]:
+    return [tag.strip().lower() for tag in (value or '').split(',') if tag.strip()]
+
+
+@dataclass
+class CatalogFeatures:
+    """Treinos do catálogo codificados (linha = treino, coluna = feature)"""
+    version: Optional[int]
+    ids: np.ndarray
+    rows: List[Dict]
+    matrix: np.ndarray             # float32, 0/1
+    columns: Dict[str, int]        # nome da feature -> coluna
+
+    def __post_init__(self):
+        self.position = {int(workout_id): i for i, workout_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def column_vector(self, weights: Dict[str, float]) -> np.ndarray:
+        """Vetor de pesos a partir de {feature: peso} (features ausentes são ignoradas)"""
+        vector = np.zeros(len(self.columns), dtype=np.float32)
+        for name, weight in weights.items():
+            column = self.columns.get(name)
+            if column is not None:
+                vector[column] += weight
+        return vector
+
+    def positions_of(self, workout_ids: Iterable[int]) -> List[int]:
+        return [self.position[w] for w in workout_ids if w in self.position]
+
+
+# =============================================================================
+# 🏗️ CODIFICAÇÃO DO CATÁLOGO
+# =============================================================================
+
+CATALOG_FIELDS = (
+    'id', 'name', 'difficulty_level', 'workout_type', 'estimated_duration',
+    'is_recommended', 'target_muscle_groups', 'equipment_needed',
+)
+
+
+def encode_catalog(rows: Sequence[Dict], version: Optional[int] = None) -> CatalogFeatures:
+    """Matriz de features (one-hot / multi-hot) para as linhas do catálogo"""
+    names = ['recommended', 'duration:short', 'duration:long']
+    names += [f"difficulty:{level}" for level in DIFFICULTIES]
+    known_types = {t for allowed, _ in GOAL_TYPES.values() for t in allowed}
+    known_types |= {row['workout_type'] for row in rows if row['workout_type']}
+    names += [f"type:{t}" for t in sorted(known_types)]
+    names += sorted({f"muscle:{tag}" for row in rows for tag in _split_tags(row['target_muscle_groups'])})
+    names += sorted({f"equipment:{tag}" for row in rows for tag in _split_tags(row['equipment_needed'])})
+    columns = {name: i for i, name in enumerate(names)}
+
+    matrix = np.zeros((len(rows), len(columns)), dtype=np.float32)
+    for i, row in enumerate(rows):
+        active = [f"type:{row['workout_type']}", f"difficulty:{row['difficulty_level']}"]
+        duration = row['estimated_duration']
+        if duration is not None:
+            if duration <= SHORT_DURATION:
+                active.append('duration:short')
+            if duration >= LONG_DURATION:
+                active.append('duration:long')
+        if row['is_recommended']:
+            active.append('recommended')
+        active += [f"muscle:{tag}" for tag in _split_tags(row['target_muscle_groups'])]
+        active += [f"equipment:{tag}" for tag in _split_tags(row['equipment_needed'])]
+        for name in active:
+            column = columns.get(name)
+            if column is not None:
+                matrix[i, column] = 1.0
+
+    return CatalogFeatures(
+        version=version,
+        ids=np.array([row['id'] for row in rows], dtype=np.int64),
+        rows=list(rows),
+        matrix=matrix,
+        columns=columns,
+    )
+
+
+def load_catalog_features(version: Optional[int] = None) -> CatalogFeatures:
+    rows = list(Workout.objects.filter(
+        is_personalized=False, is_active=True
+    ).order_by('id').values(*CATALOG_FIELDS))
+    return encode_catalog(rows, version)
+
+
+_features: Optional[CatalogFeatures] = None
+_features_lock = threading.Lock()
+
+
+def get_catalog_features() -> CatalogFeatures:
+    """Codificação em memória do processo, refeita quando a versão do catálogo muda"""
+    global _features
+    version = get_catalog_version()
+    features = _features
+    if features is not None and features.version == version:
+        return features
+
+    with _features_lock:
+        if _features is None or _features.version != version:
+            _features = load_catalog_features(version)
+        return _features
+
+
+def reset_catalog_features():
+    """Descarta a codificação em memória (usado em testes)"""
+    global _features
+    _features = None
+
+
+# =============================================================================
+# 👤 PERFIL -> PESOS
+# =============================================================================
+
+def profile_weights(features: CatalogFeatures, goal: Optional[str], activity_level: Optional[str],
+                    focus_areas: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (pesos de score, pesos de elegibilidade). A elegibilidade tem duas colunas:
+    nível de dificuldade permitido e tipo permitido para o objetivo.
+    """
+    weights = {'recommended': RECOMMENDED_BONUS}
+    if goal in GOAL_TYPES:
+        for workout_type in GOAL_TYPES[goal][1]:
+            weights[f"type:{workout_type}"] = GOAL_BONUS
+
+    if activity_level in LOW_ACTIVITY:
+        weights['difficulty:beginner'] = LEVEL_BONUS
+        weights['difficulty:advanced'] = -ADVANCED_PENALTY
+        weights['duration:short'] = DURATION_BONUS
+        allowed_levels = ('beginner',)
+    elif activity_level == 'moderate':
+        weights['difficulty:intermediate'] = LEVEL_BONUS
+        allowed_levels = ('beginner', 'intermediate')
+    else:
+        if activity_level in HIGH_ACTIVITY:
+            weights['difficulty:advanced'] = LEVEL_BONUS
+            weights['duration:long'] = DURATION_BONUS
+        allowed_levels = ('intermediate', 'advanced')
+
+    focus = _split_tags(focus_areas)
+    for tag in focus:
+        weights[f"muscle:{tag}"] = weights.get(f"muscle:{tag}", 0.0) + FOCUS_BONUS / len(focus)
+
+    level_mask = features.column_vector({f"difficulty:{level}": 1.0 for level in allowed_levels})
+    if goal in GOAL_TYPES:
+        type_mask = features.column_vector({f"type:{t}": 1.0 for t in GOAL_TYPES[goal][0]})
+    else:
+        type_mask = None
+
+    eligibility = np.stack([level_mask, type_mask if type_mask is not None else level_mask], axis=1)
+    return features.column_vector(weights), eligibility
+
+
+def score_catalog(features: CatalogFeatures, goal: Optional[str], activity_level: Optional[str],
+                  focus_areas: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """(scores, elegíveis) de todo o catálogo: um produto matriz × vetor"""
+    if not len(features):
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=bool)
+
+    weights, eligibility = profile_weights(features, goal, activity_level, focus_areas)
+    scores = np.maximum(BASE_SCORE + features.matrix @ weights, 0.0)
+    eligible = np.all(features.matrix @ eligibility > 0, axis=1)
+    return scores, eligible
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Posições dos k maiores scores positivos, em ordem decrescente"""
+    if k <= 0:
+        return np.array([], dtype=np.int64)
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
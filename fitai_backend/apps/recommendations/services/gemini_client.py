@@ -0,0 +1,382 @@
+"""
+Registro do cliente Gemini compartilhado pelo processo
+
+Antes cada AIService() configurava o SDK e disparava um generate_content("Test")
+só para descobrir se a API estava no ar. Agora existe um único cliente por
+processo:
+- O modelo é criado de forma preguiçosa (na primeira requisição real)
+- A saúde da API fica em cache e é revalidada em background (thread daemon)
+- Um circuit breaker corta as chamadas depois de falhas consecutivas
+- Opcionalmente, um limitador de vazão compartilhado (ex: token bucket entre
+  os processos do comando de lote) regula cada requisição
+
+É o provedor 'gemini' da camada llm_providers (generate/stream/agenerate).
+
+Cache de contexto: para RenderedPrompt com prefixo estático de pelo menos
+GEMINI_CONTEXT_CACHE_MIN_TOKENS, o prefixo vira um CachedContent (SDKs com
+genai.caching) e só o sufixo é enviado. Sem suporte no SDK instalado, ou se
+a criação falhar, o prompt vai inteiro - com o prefixo fixo na frente, o que
+ainda aproveita o cache implícito de prefixo do Gemini.
+
+Timeout: o deadline restante do LLMExecutor vai para o SDK
+(request_options={'timeout': ...}), então uma chamada travada termina e
+devolve a vaga do executor. SDKs sem request_options (0.3.x) não aceitam
+timeout por chamada - o executor só consegue liberar quem chamou.
+"""
+import inspect
+import threading
+import time
+import logging
+from datetime import timedelta
+from typing import Dict, Iterator, Optional
+
+import google.generativeai as genai
+from django.conf import settings
+
+from .llm_providers import LLMProvider, prompt_hash, record_response
+
+SDK_REQUEST_OPTIONS = 'request_options' in inspect.signature(genai.GenerativeModel.generate_content).parameters
+
+
+def _request_kwargs(generation_config: Dict, timeout: Optional[float]) -> Dict:
+    """Argumentos extras de generate_content: config de geração e timeout da chamada"""
+    kwargs = {}
+    if generation_config:
+        kwargs['generation_config'] = generation_config
+    if timeout is not None and SDK_REQUEST_OPTIONS:
+        kwargs['request_options'] = {'timeout': timeout}
+    return kwargs
+from .prompt_registry import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class GeminiClientRegistry(LLMProvider):
+    """Cliente Gemini único por processo com health check preguiçoso e circuit breaker"""
+
+    name = 'gemini'
+
+    CIRCUIT_CLOSED = 'closed'
+    CIRCUIT_OPEN = 'open'
+    CIRCUIT_HALF_OPEN = 'half_open'
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._model = None
+        self._configured_key = None
+
+        # Estado de saúde (None = ainda não verificado)
+        self._healthy: Optional[bool] = None
+        self._last_health_check = 0.0
+        self._refresh_in_progress = False
+
+        # Circuit breaker
+        self._circuit_state = self.CIRCUIT_CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._last_error: Optional[str] = None
+
+        # Limitador externo (objeto com acquire(timeout) -> bool)
+        self._request_limiter = None
+
+        # Cache de contexto: hash do prefixo -> (modelo ou None se falhou, expira_em)
+        self._prefix_models: Dict[str, tuple] = {}
+        self._prefix_hits = 0
+        self._prefix_misses = 0
+
+    # =========================================================================
+    # 🔧 CONFIGURAÇÃO
+    # =========================================================================
+
+    @property
+    def has_api_key(self) -> bool:
+        api_key = getattr(settings, 'GEMINI_API_KEY', '') or ''
+        return bool(api_key.strip())
+
+    @property
+    def model(self):
+        """Modelo Gemini compartilhado (criado na primeira chamada)"""
+        if not self.has_api_key:
+            return None
+
+        if self._model is None or self._configured_key != settings.GEMINI_API_KEY:
+            with self._lock:
+                if self._model is None or self._configured_key != settings.GEMINI_API_KEY:
+                    self._build_model()
+        return self._model
+
+    def _build_model(self):
+        try:
+            genai.configure(api_key=settings.GEMINI_API_KEY)
+            self._model = genai.GenerativeModel(
+                model_name=settings.GEMINI_MODEL,
+                generation_config=self._default_generation_config()
+            )
+            self._configured_key = settings.GEMINI_API_KEY
+            logger.info(f"Gemini client initialized with model {settings.GEMINI_MODEL}")
+        except Exception as e:
+            logger.error(f"Failed to initialize Gemini client: {e}")
+            self._model = None
+            self._configured_key = None
+            self._healthy = False
+
+    @staticmethod
+    def _default_generation_config() -> Dict:
+        """Configuração padrão de todos os modelos (normal e do cache de contexto)"""
+        return {
+            'temperature': settings.GEMINI_TEMPERATURE,
+            'max_output_tokens': settings.GEMINI_MAX_TOKENS,
+        }
+
+    def reset(self):
+        """Descarta modelo e estado (usado em testes e ao trocar a API key)"""
+        with self._lock:
+            self._model = None
+            self._configured_key = None
+            self._healthy = None
+            self._last_health_check = 0.0
+            self._circuit_state = self.CIRCUIT_CLOSED
+            self._consecutive_failures = 0
+            self._opened_at = 0.0
+            self._last_error = None
+            self._prefix_models = {}
+
+    # =========================================================================
+    # 💓 SAÚDE DA API
+    # =========================================================================
+
+    @property
+    def is_available(self) -> bool:
+        """
+        Lê a saúde em cache - nunca faz chamada de rede no caminho da requisição.
+        Enquanto não houver verificação, assume disponível se houver API key;
+        a primeira requisição real (ou o refresh em background) corrige o estado.
+        """
+        if not self.has_api_key or self.model is None:
+            return False
+
+        self._schedule_health_refresh()
+
+        if not self.allow_request():
+            return False
+
+        return self._healthy is not False
+
+    def _schedule_health_refresh(self):
+        interval = getattr(settings, 'GEMINI_HEALTH_CHECK_INTERVAL', 300)
+        if time.time() - self._last_health_check < interval:
+            return
+
+        with self._lock:
+            if self._refresh_in_progress or time.time() - self._last_health_check < interval:
+                return
+            self._refresh_in_progress = True
+            # Marca já para que outras threads não agendem o mesmo refresh
+            self._last_health_check = time.time()
+
+        thread = threading.Thread(target=self._background_refresh, name='gemini-health', daemon=True)
+        thread.start()
+
+    def _background_refresh(self):
+        try:
+            self.check_health()
+        finally:
+            self._refresh_in_progress = False
+
+    def check_health(self) -> bool:
+        """
+        Verificação explícita de saúde (metadados do modelo, sem gerar conteúdo).
+        Usada pelo refresh em background e pelos endpoints de monitoramento.
+        """
+        if self.model is None:
+            self._healthy = False
+            return False
+
+        try:
+            model_name = settings.GEMINI_MODEL
+            if not model_name.startswith('models/'):
+                model_name = f"models/{model_name}"
+            genai.get_model(model_name)
+            healthy = True
+        except Exception as e:
+            logger.warning(f"Gemini health check failed: {e}")
+            self._last_error = str(e)
+            healthy = False
+
+        with self._lock:
+            self._healthy = healthy
+            self._last_health_check = time.time()
+        return healthy
+
+    # =========================================================================
+    # ⚡ CIRCUIT BREAKER
+    # =========================================================================
+
+    def allow_request(self) -> bool:
+        """Retorna False enquanto o circuito estiver aberto"""
+        if self._circuit_state != self.CIRCUIT_OPEN:
+            return True
+
+        reset_seconds = getattr(settings, 'GEMINI_CIRCUIT_RESET_SECONDS', 60)
+        if time.time() - self._opened_at >= reset_seconds:
+            with self._lock:
+                if self._circuit_state == self.CIRCUIT_OPEN:
+                    # Deixa passar uma requisição de teste
+                    self._circuit_state = self.CIRCUIT_HALF_OPEN
+            return True
+
+        return False
+
+    # =========================================================================
+    # 🚦 LIMITADOR DE VAZÃO EXTERNO
+    # =========================================================================
+
+    def set_request_limiter(self, limiter):
+        """Instala (ou remove, com None) um limitador compartilhado entre processos"""
+        self._request_limiter = limiter
+
+    def acquire_request_slot(self) -> bool:
+        """Aguarda vaga no limitador externo; sem limitador, sempre libera"""
+        limiter = self._request_limiter
+        if limiter is None:
+            return True
+        timeout = getattr(settings, 'GEMINI_LIMITER_TIMEOUT', 30)
+        return limiter.acquire(timeout=timeout)
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            self._circuit_state = self.CIRCUIT_CLOSED
+            self._healthy = True
+            self._last_health_check = time.time()
+
+    def record_failure(self, error: Exception = None):
+        threshold = getattr(settings, 'GEMINI_CIRCUIT_FAILURE_THRESHOLD', 5)
+        with self._lock:
+            self._consecutive_failures += 1
+            self._last_error = str(error) if error else self._last_error
+
+            if self._circuit_state == self.CIRCUIT_HALF_OPEN or self._consecutive_failures >= threshold:
+                if self._circuit_state != self.CIRCUIT_OPEN:
+                    logger.warning(
+                        f"Gemini circuit opened after {self._consecutive_failures} consecutive failures"
+                    )
+                self._circuit_state = self.CIRCUIT_OPEN
+                self._opened_at = time.time()
+
+    # =========================================================================
+    # ✨ GERAÇÃO
+    # =========================================================================
+
+    def _cached_prefix_model(self, prompt: str):
+        """Modelo ligado ao CachedContent do prefixo do prompt, ou None"""
+        prefix = getattr(prompt, 'prefix', '')
+        if (not prefix or not hasattr(genai, 'caching')
+                or estimate_tokens(prefix) < settings.GEMINI_CONTEXT_CACHE_MIN_TOKENS):
+            return None
+
+        key = prompt_hash(prefix)
+        now = time.time()
+        with self._lock:
+            entry = self._prefix_models.get(key)
+            if entry and entry[1] > now:
+                if entry[0] is not None:
+                    self._prefix_hits += 1
+                return entry[0]
+            self._prefix_misses += 1
+
+        ttl = settings.GEMINI_CONTEXT_CACHE_TTL_SECONDS
+        try:
+            cached_content = genai.caching.CachedContent.create(
+                model=f"models/{settings.GEMINI_MODEL}",
+                contents=[prefix],
+                ttl=timedelta(seconds=ttl),
+            )
+            model = genai.GenerativeModel.from_cached_content(
+                cached_content=cached_content,
+                generation_config=self._default_generation_config(),
+            )
+        except Exception as e:
+            logger.warning(f"Gemini context cache unavailable for prompt '{getattr(prompt, 'template', '?')}': {e}")
+            model = None
+
+        with self._lock:
+            # Renova um pouco antes do TTL do servidor; falhas só são tentadas de novo depois dele
+            self._prefix_models[key] = (model, now + max(60, ttl - 60))
+        return model
+
+    def _model_and_contents(self, prompt: str):
+        cached_model = self._cached_prefix_model(prompt)
+        if cached_model is not None:
+            return cached_model, prompt.suffix
+        return self.model, prompt
+
+    def prefix_cache_status(self) -> Dict:
+        return {
+            'entries': sum(1 for model, _ in self._prefix_models.values() if model is not None),
+            'hits': self._prefix_hits,
+            'misses': self._prefix_misses,
+            'sdk_support': hasattr(genai, 'caching'),
+        }
+
+    def generate(self, prompt: str, timeout: Optional[float] = None, **generation_config) -> Optional[str]:
+        """Texto completo da resposta (exceções do SDK sobem para quem chamou)"""
+        started = time.perf_counter()
+        model, contents = self._model_and_contents(prompt)
+        response = model.generate_content(contents, **_request_kwargs(generation_config, timeout))
+        text = response.text
+        record_response(prompt, text, (time.perf_counter() - started) * 1000)
+        return text
+
+    async def agenerate(self, prompt: str, timeout: Optional[float] = None, **generation_config) -> Optional[str]:
+        started = time.perf_counter()
+        model, contents = self._model_and_contents(prompt)
+        response = await model.generate_content_async(contents, **_request_kwargs(generation_config, timeout))
+        text = response.text
+        record_response(prompt, text, (time.perf_counter() - started) * 1000)
+        return text
+
+    def stream(self, prompt: str, timeout: Optional[float] = None, **generation_config) -> Iterator[str]:
+        started = time.perf_counter()
+        parts = []
+        model, contents = self._model_and_contents(prompt)
+        response = model.generate_content(contents, stream=True, **_request_kwargs(generation_config, timeout))
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunk sem texto (ex: bloqueado por safety settings)
+                continue
+            if text:
+                parts.append(text)
+                yield text
+        record_response(prompt, ''.join(parts), (time.perf_counter() - started) * 1000)
+
+    def get_status(self) -> Dict:
+        """Snapshot do estado para endpoints de monitoramento"""
+        return {
+            'provider': self.name,
+            'api_key_configured': self.has_api_key,
+            'model_loaded': self._model is not None,
+            'healthy': self._healthy,
+            'last_health_check': self._last_health_check or None,
+            'circuit_state': self._circuit_state,
+            'consecutive_failures': self._consecutive_failures,
+            'last_error': self._last_error,
+            'prefix_cache': self.prefix_cache_status(),
+            'sdk_request_timeout': SDK_REQUEST_OPTIONS,
+        }
+
+
+_registry: Optional[GeminiClientRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_gemini_client() -> GeminiClientRegistry:
+    """Retorna o cliente Gemini compartilhado do processo"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = GeminiClientRegistry()
+    return _registry
@@ -0,0 +1,495 @@
+"""
+Executor de requisições ao LLM (limite de concorrência, deadline, retry e hedge)
+
+_make_gemini_request chamava generate_content de forma síncrona, sem timeout:
+uma chamada lenta prendia o worker indefinidamente e o único backoff era a
+flag global gemini_temp_disabled. O LLMExecutor envolve o provedor:
+- no máximo GEMINI_MAX_IN_FLIGHT chamadas em andamento por processo; quem
+  chega depois espera na fila até GEMINI_QUEUE_TIMEOUT_SECONDS
+- deadline por chamada (GEMINI_TIMEOUT_SECONDS): o worker é liberado quando
+  ela vence e o tempo restante vai para o provedor (timeout do SDK), que
+  desiste da chamada e devolve a vaga - chamadas travadas não acumulam
+- erros transitórios (429/5xx/timeout de rede) são tentados de novo com
+  backoff exponencial com jitter, até GEMINI_MAX_RETRIES, dentro do deadline
+  e de um orçamento de retentativas (GEMINI_RETRY_BUDGET_RATIO das
+  requisições recentes), para não multiplicar a carga durante uma pane
+- hedge: se a resposta demora mais que GEMINI_HEDGE_AFTER_MS (0 = p95
+  observado), dispara uma segunda chamada e usa a que terminar primeiro
+- métricas: espera na fila e latência (p50/p95), retentativas, hedges,
+  timeouts e rejeições
+"""
+import asyncio
+import queue
+import random
+import threading
+import time
+import weakref
+import logging
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional
+
+from django.conf import settings
+
+from .llm_providers import LLMProvider
+
+logger = logging.getLogger(__name__)
+
+HEDGE_MIN_SAMPLES = 20
+RETRY_BUDGET_WINDOW = 10.0   # segundos
+RETRY_BUDGET_MIN = 3         # retentativas sempre permitidas na janela
+
+RETRYABLE_ERRORS = (
+    'ResourceExhausted', 'ServiceUnavailable', 'DeadlineExceeded', 'InternalServerError',
+    'TooManyRequests', 'ConnectionError', 'ReadTimeout',
+)
+RETRYABLE_MESSAGES = ('429', '500', '503', 'unavailable', 'deadline', 'timed out', 'connection reset')
+
+
+class LLMTimeoutError(TimeoutError):
+    """A chamada não terminou dentro do deadline"""
+
+
+class LLMQueueFullError(RuntimeError):
+    """Nenhuma vaga de execução liberada dentro do tempo de fila"""
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (LLMTimeoutError, LLMQueueFullError)):
+        return False
+    if type(error).__name__ in RETRYABLE_ERRORS or isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in RETRYABLE_MESSAGES)
+
+
+@dataclass
+class ExecutionResult:
+    text: Optional[str]
+    queue_wait_ms: float
+    latency_ms: float
+    attempts: int = 1
+    hedged: bool = False
+
+
+# =============================================================================
+# 📊 MÉTRICAS E ORÇAMENTO
+# =============================================================================
+
+class ExecutorStats:
+    """Contadores e amostras recentes (espera na fila / latência) do executor"""
+
+    SAMPLES = 512
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {
+            'requests': 0, 'successes': 0, 'failures': 0, 'timeouts': 0, 'rejected': 0,
+            'retries': 0, 'hedges': 0, 'hedge_wins': 0, 'budget_exhausted': 0,
+        }
+        self.queue_wait = deque(maxlen=self.SAMPLES)
+        self.latency = deque(maxlen=self.SAMPLES)
+        self.in_flight = 0
+
+    def incr(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def observe(self, queue_wait: Optional[float] = None, latency: Optional[float] = None):
+        with self._lock:
+            if queue_wait is not None:
+                self.queue_wait.append(queue_wait)
+            if latency is not None:
+                self.latency.append(latency)
+
+    @staticmethod
+    def _percentile(samples, q: float) -> Optional[float]:
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    def latency_percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            return self._percentile(list(self.latency), q)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            queue_wait, latency = list(self.queue_wait), list(self.latency)
+            snapshot = dict(self.counters, in_flight=self.in_flight)
+
+        def ms(value):
+            return round(value * 1000, 1) if value is not None else None
+
+        snapshot.update({
+            'queue_wait_p50_ms': ms(self._percentile(queue_wait, 0.5)),
+            'queue_wait_p95_ms': ms(self._percentile(queue_wait, 0.95)),
+            'latency_p50_ms': ms(self._percentile(latency, 0.5)),
+            'latency_p95_ms': ms(self._percentile(latency, 0.95)),
+        })
+        return snapshot
+
+
+class RetryBudget:
+    """
+    Retentativas e hedges permitidos na janela: no máximo `ratio` das
+    requisições recentes (com um mínimo fixo para tráfego baixo).
+    """
+
+    def __init__(self, ratio: float, window: float = RETRY_BUDGET_WINDOW, minimum: int = RETRY_BUDGET_MIN):
+        self.ratio = ratio
+        self.window = window
+        self.minimum = minimum
+        self._lock = threading.Lock()
+        self._requests = deque()
+        self._spent = deque()
+
+    def _trim(self, now: float):
+        for events in (self._requests, self._spent):
+            while events and now - events[0] > self.window:
+                events.popleft()
+
+    def record_request(self):
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            self._requests.append(now)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            if len(self._spent) >= max(self.minimum, self.ratio * len(self._requests)):
+                return False
+            self._spent.append(now)
+            return True
+
+
+# =============================================================================
+# 🚀 EXECUTOR
+# =============================================================================
+
+class LLMExecutor:
+    """Executa chamadas a um LLMProvider com os limites acima (um por provedor e processo)"""
+
+    def __init__(self, provider: LLMProvider, max_in_flight: Optional[int] = None,
+                 timeout: Optional[float] = None, queue_timeout: Optional[float] = None,
+                 max_retries: Optional[int] = None, retry_delay: Optional[float] = None,
+                 hedge_after_ms: Optional[float] = None, retry_budget_ratio: Optional[float] = None):
+        self.provider = provider
+        self.max_in_flight = max_in_flight or getattr(settings, 'GEMINI_MAX_IN_FLIGHT', 8)
+        self.timeout = timeout or getattr(settings, 'GEMINI_TIMEOUT_SECONDS', 30)
+        self.queue_timeout = queue_timeout if queue_timeout is not None else \
+            getattr(settings, 'GEMINI_QUEUE_TIMEOUT_SECONDS', 5)
+        self.max_retries = max_retries if max_retries is not None else getattr(settings, 'GEMINI_MAX_RETRIES', 3)
+        self.retry_delay = retry_delay if retry_delay is not None else getattr(settings, 'GEMINI_RETRY_DELAY', 1.0)
+        self.hedge_after_ms = hedge_after_ms if hedge_after_ms is not None else \
+            getattr(settings, 'GEMINI_HEDGE_AFTER_MS', 0)
+        self.budget = RetryBudget(
+            retry_budget_ratio if retry_budget_ratio is not None else
+            getattr(settings, 'GEMINI_RETRY_BUDGET_RATIO', 0.2)
+        )
+        self.stats = ExecutorStats()
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        # Toda tarefa do pool ocupa uma vaga: o pool nunca enfileira
+        self._pool = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='llm-call')
+
+    # =========================================================================
+    # 🎟️ VAGAS
+    # =========================================================================
+
+    def _acquire_slot(self, deadline: float, blocking: bool = True) -> bool:
+        if not blocking:
+            acquired = self._slots.acquire(blocking=False)
+        else:
+            timeout = max(0.0, min(self.queue_timeout, deadline - time.monotonic()))
+            acquired = self._slots.acquire(timeout=timeout)
+        if acquired:
+            with self.stats._lock:
+                self.stats.in_flight += 1
+        return acquired
+
+    def _release_slot(self, *_):
+        with self.stats._lock:
+            self.stats.in_flight -= 1
+        self._slots.release()
+
+    def _queue(self, deadline: float) -> float:
+        """Espera uma vaga; retorna o tempo de fila em segundos"""
+        queued = time.monotonic()
+        if not self._acquire_slot(deadline):
+            self.stats.incr('rejected')
+            raise LLMQueueFullError(f"{self.max_in_flight} LLM calls in flight")
+        queue_wait = time.monotonic() - queued
+        self.stats.observe(queue_wait=queue_wait)
+        return queue_wait
+
+    def _hedge_delay(self, hedge: bool = True) -> Optional[float]:
+        if not hedge or self.hedge_after_ms < 0:
+            return None
+        if self.hedge_after_ms > 0:
+            return self.hedge_after_ms / 1000.0
+        if len(self.stats.latency) < HEDGE_MIN_SAMPLES:
+            return None
+        return self.stats.latency_percentile(0.95)
+
+    def _retry_delay(self, error: Exception, attempt: int, deadline: float) -> Optional[float]:
+        """Espera antes da próxima tentativa (None = não tentar de novo)"""
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        if not self.budget.try_spend():
+            self.stats.incr('budget_exhausted')
+            return None
+        # Full jitter: uniforme entre 0 e o backoff exponencial
+        delay = random.uniform(0, self.retry_delay * (2 ** attempt))
+        if time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    def _finish(self, started: float, queue_wait: float, text: Optional[str], attempts: int,
+                hedged: bool) -> ExecutionResult:
+        latency = time.monotonic() - started
+        self.stats.incr('successes')
+        self.stats.observe(latency=latency)
+        return ExecutionResult(text, queue_wait * 1000, latency * 1000, attempts, hedged)
+
+    def _fail(self, error: Exception):
+        self.stats.incr('timeouts' if isinstance(error, LLMTimeoutError) else 'failures')
+
+    # =========================================================================
+    # 🔁 SÍNCRONO
+    # =========================================================================
+
+    def generate(self, prompt: str, timeout: Optional[float] = None, hedge: bool = True,
+                 **generation_config) -> ExecutionResult:
+        """
+        timeout: deadline desta chamada (padrão GEMINI_TIMEOUT_SECONDS).
+        hedge=False: nunca dispara a segunda chamada (respostas longas e caras,
+        cuja latência não tem nada a ver com o p95 das chamadas curtas)
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self.stats.incr('requests')
+        self.budget.record_request()
+        queue_wait = self._queue(deadline)
+
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                text, hedged = self._attempt(prompt, generation_config, deadline, hedge)
+                return self._finish(started, queue_wait, text, attempt + 1, hedged)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline)
+                if delay is None:
+                    self._fail(e)
+                    raise
+                attempt += 1
+                self.stats.incr('retries')
+                logger.warning(f"Retrying LLM call ({attempt}/{self.max_retries}) in {delay:.2f}s: {e}")
+                time.sleep(delay)
+                if not self._acquire_slot(deadline):
+                    self._fail(LLMTimeoutError())
+                    raise LLMTimeoutError("No LLM slot before the deadline") from e
+
+    @staticmethod
+    def _remaining(deadline: float) -> float:
+        return max(0.001, deadline - time.monotonic())
+
+    def _submit(self, prompt: str, generation_config: Dict, deadline: float):
+        """Envia uma chamada ao pool (a vaga já deve estar reservada), com o deadline restante"""
+        future = self._pool.submit(
+            self.provider.generate, prompt, timeout=self._remaining(deadline), **generation_config
+        )
+        future.add_done_callback(self._release_slot)
+        return future
+
+    def _attempt(self, prompt: str, generation_config: Dict, deadline: float, hedge_enabled: bool = True):
+        """Uma tentativa (com hedge opcional); retorna (texto, houve hedge)"""
+        started = time.monotonic()
+        pending = {self._submit(prompt, generation_config, deadline)}
+        hedge_delay = self._hedge_delay(hedge_enabled)
+        hedge = None
+        error = None
+
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMTimeoutError("LLM call exceeded its deadline")
+
+            wait_for = remaining
+            if hedge is None and hedge_delay is not None:
+                wait_for = min(remaining, max(0.0, hedge_delay - (time.monotonic() - started)))
+
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self.stats.incr('hedge_wins')
+                    # A chamada perdedora termina em background e libera a vaga
+                    return future.result(), hedge is not None
+                error = future.exception()
+
+            if (not done and pending and hedge is None and hedge_delay is not None
+                    and time.monotonic() - started >= hedge_delay):
+                if self.budget.try_spend() and self._acquire_slot(deadline, blocking=False):
+                    hedge = self._submit(prompt, generation_config, deadline)
+                    pending.add(hedge)
+                    self.stats.incr('hedges')
+                else:
+                    hedge_delay = None  # sem orçamento/vaga: só espera a primeira
+
+        raise error
+
+    # =========================================================================
+    # ⚡ ASSÍNCRONO
+    # =========================================================================
+
+    async def agenerate(self, prompt: str, timeout: Optional[float] = None, hedge: bool = True,
+                        **generation_config) -> ExecutionResult:
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self.stats.incr('requests')
+        self.budget.record_request()
+        queue_wait = await asyncio.to_thread(self._queue, deadline)
+
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                text, hedged = await self._aattempt(prompt, generation_config, deadline, hedge)
+                return self._finish(started, queue_wait, text, attempt + 1, hedged)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline)
+                if delay is None:
+                    self._fail(e)
+                    raise
+                attempt += 1
+                self.stats.incr('retries')
+                await asyncio.sleep(delay)
+                if not await asyncio.to_thread(self._acquire_slot, deadline):
+                    self._fail(LLMTimeoutError())
+                    raise LLMTimeoutError("No LLM slot before the deadline") from e
+
+    def _create_task(self, prompt: str, generation_config: Dict, deadline: float) -> asyncio.Task:
+        task = asyncio.ensure_future(
+            self.provider.agenerate(prompt, timeout=self._remaining(deadline), **generation_config)
+        )
+        task.add_done_callback(self._release_slot)
+        return task
+
+    async def _aattempt(self, prompt: str, generation_config: Dict, deadline: float,
+                        hedge_enabled: bool = True):
+        started = time.monotonic()
+        pending = {self._create_task(prompt, generation_config, deadline)}
+        hedge_delay = self._hedge_delay(hedge_enabled)
+        hedge = None
+        error = None
+
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LLMTimeoutError("LLM call exceeded its deadline")
+
+                wait_for = remaining
+                if hedge is None and hedge_delay is not None:
+                    wait_for = min(remaining, max(0.0, hedge_delay - (time.monotonic() - started)))
+
+                done, pending = await asyncio.wait(pending, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.stats.incr('hedge_wins')
+                        return task.result(), hedge is not None
+                    error = task.exception()
+
+                if (not done and pending and hedge is None and hedge_delay is not None
+                        and time.monotonic() - started >= hedge_delay):
+                    if self.budget.try_spend() and self._acquire_slot(deadline, blocking=False):
+                        hedge = self._create_task(prompt, generation_config, deadline)
+                        pending.add(hedge)
+                        self.stats.incr('hedges')
+                    else:
+                        hedge_delay = None
+            raise error
+        finally:
+            # Diferente das threads, tarefas perdedoras podem ser canceladas de fato
+            for task in pending:
+                task.cancel()
+
+    # =========================================================================
+    # 🌊 STREAMING
+    # =========================================================================
+
+    def stream(self, prompt: str, timeout: Optional[float] = None, **generation_config) -> Iterator[str]:
+        """
+        Streaming com vaga e deadline por trecho (o primeiro e cada intervalo
+        entre trechos têm até `timeout`). Só tenta de novo antes do primeiro
+        trecho; sem hedge.
+        """
+        timeout = timeout or self.timeout
+        self.stats.incr('requests')
+        self.budget.record_request()
+        queue_wait = self._queue(time.monotonic() + timeout)
+
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            chunks = queue.Queue()
+            stop = threading.Event()
+            yielded = False
+
+            def produce():
+                try:
+                    # No SDK o timeout vale para o stream inteiro: uma chamada travada termina sozinha
+                    for text in self.provider.stream(prompt, timeout=timeout, **generation_config):
+                        if stop.is_set():
+                            return
+                        chunks.put(('chunk', text))
+                    chunks.put(('done', None))
+                except Exception as e:
+                    chunks.put(('error', e))
+
+            self._pool.submit(produce).add_done_callback(self._release_slot)
+            try:
+                while True:
+                    try:
+                        kind, value = chunks.get(timeout=timeout)
+                    except queue.Empty:
+                        raise LLMTimeoutError(f"No LLM stream chunk within {timeout}s")
+                    if kind == 'chunk':
+                        yielded = True
+                        yield value
+                    elif kind == 'done':
+                        self._finish(started, queue_wait, None, attempt + 1, False)
+                        return
+                    else:
+                        raise value
+            except Exception as e:
+                delay = None if yielded else self._retry_delay(e, attempt, time.monotonic() + timeout)
+                if delay is None:
+                    self._fail(e)
+                    raise
+                attempt += 1
+                self.stats.incr('retries')
+                time.sleep(delay)
+                if not self._acquire_slot(time.monotonic() + timeout):
+                    self._fail(LLMTimeoutError())
+                    raise LLMTimeoutError("No LLM slot for stream retry") from e
+            finally:
+                stop.set()
+
+
+_executors = weakref.WeakKeyDictionary()
+_executors_lock = threading.Lock()
+
+
+def get_llm_executor(provider: LLMProvider) -> LLMExecutor:
+    """Executor compartilhado do provedor (criado na primeira chamada)"""
+    executor = _executors.get(provider)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(provider)
+            if executor is None:
+                executor = _executors[provider] = LLMExecutor(provider)
+    return executor
@@ -0,0 +1,281 @@
+"""
+Camada de provedores de LLM
+
+Todo caminho de IA (AIService, chatbot, geração de treino do onboarding) passa
+por um LLMProvider em vez de falar direto com google.generativeai:
+- GeminiClientRegistry (gemini_client.py): o provedor real
+- LocalStubProvider: responde localmente, sem rede nem cota, repetindo
+  respostas gravadas com latência configurável e determinística. Serve para
+  testes de carga do chat e das recomendações e para comparar perfis de
+  latência entre provedores (manage.py llm_benchmark)
+
+Selecionado por settings.LLM_PROVIDER ('gemini' | 'stub'). Com
+LLM_RECORD_PATH definido, as respostas do Gemini são gravadas (JSONL) para o
+stub reproduzir depois.
+
+Prompts vindos do registro (prompt_registry.RenderedPrompt) carregam um
+prefixo estático; provedores que suportam cache de contexto o reaproveitam.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import logging
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:32]
+
+
+class LLMProvider:
+    """
+    Interface comum: geração síncrona, assíncrona e em streaming.
+    generate/stream/agenerate levantam exceção em erro de provedor; quem chama
+    (AIService) cuida de circuit breaker, rate limit e métricas.
+    """
+
+    name = 'base'
+    uses_quota = True  # sujeito aos limites de GEMINI_RATE_LIMIT_*
+
+    @property
+    def is_available(self) -> bool:
+        return True
+
+    def check_health(self) -> bool:
+        return self.is_available
+
+    # Circuit breaker / limitador externo (no-op por padrão)
+    def allow_request(self) -> bool:
+        return True
+
+    def acquire_request_slot(self) -> bool:
+        return True
+
+    def set_request_limiter(self, limiter):
+        pass
+
+    def record_success(self):
+        pass
+
+    def record_failure(self, error: Exception = None):
+        pass
+
+    def reset(self):
+        pass
+
+    def get_status(self) -> Dict:
+        return {'provider': self.name, 'healthy': self.is_available}
+
+    def prefix_cache_status(self) -> Dict:
+        """Uso do cache de prefixo de prompt (vazio se o provedor não tem)"""
+        return {}
+
+    # Geração. timeout: segundos até o deadline de quem chamou - o provedor
+    # deve desistir da chamada (e liberar a thread/vaga do executor) depois dele
+    def generate(self, prompt: str, timeout: Optional[float] = None, **generation_config) -> Optional[str]:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, timeout: Optional[float] = None, **generation_config) -> Iterator[str]:
+        text = self.generate(prompt, timeout=timeout, **generation_config)
+        if text:
+            yield text
+
+    async def agenerate(self, prompt: str, timeout: Optional[float] = None, **generation_config) -> Optional[str]:
+        return await asyncio.to_thread(self.generate, prompt, timeout=timeout, **generation_config)
+
+
+# =============================================================================
+# 💾 GRAVAÇÃO DE RESPOSTAS (para o stub)
+# =============================================================================
+
+_record_lock = threading.Lock()
+
+
+def record_response(prompt: str, response: Optional[str], latency_ms: float):
+    """Anexa prompt/resposta ao arquivo LLM_RECORD_PATH (se configurado)"""
+    path = getattr(settings, 'LLM_RECORD_PATH', '')
+    if not path or not response:
+        return
+    entry = {
+        'prompt_hash': prompt_hash(prompt),
+        'prompt_preview': prompt[:200],
+        'response': response,
+        'latency_ms': round(latency_ms, 1),
+    }
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with _record_lock, open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    except OSError as e:
+        logger.warning(f"Could not record LLM response: {e}")
+
+
+# =============================================================================
+# 🧪 STUB LOCAL
+# =============================================================================
+
+DEFAULT_STUB_RESPONSE = (
+    "Ótima pergunta! 💪 Mantenha a regularidade: 3 a 4 treinos por semana, "
+    "boa hidratação e descanso adequado fazem toda a diferença."
+)
+
+
+class LocalStubProvider(LLMProvider):
+    """
+    Provedor determinístico sem rede. Para cada prompt:
+    1. resposta gravada com o mesmo hash de prompt, se houver
+    2. primeira gravação cujo 'match' aparece no prompt
+    3. uma gravação escolhida pelo hash do prompt (ou a resposta padrão)
+    A latência é latency_ms ± jitter_ms, derivada do hash (reprodutível).
+
+    Cache de prefixo simulado: a partir da segunda vez que um prefixo de
+    RenderedPrompt aparece, a latência cai na proporção do prefixo
+    (PREFIX_CACHE_SAVING * tamanho do prefixo / tamanho do prompt).
+    """
+
+    name = 'stub'
+    uses_quota = False
+    PREFIX_CACHE_SAVING = 0.5
+
+    def __init__(self, responses_path: Optional[str] = None, latency_ms: Optional[float] = None,
+                 jitter_ms: Optional[float] = None, stream_chunks: Optional[int] = None):
+        self.responses_path = responses_path if responses_path is not None else \
+            getattr(settings, 'LLM_STUB_RESPONSES_PATH', '')
+        self.latency_ms = latency_ms if latency_ms is not None else getattr(settings, 'LLM_STUB_LATENCY_MS', 300)
+        self.jitter_ms = jitter_ms if jitter_ms is not None else getattr(settings, 'LLM_STUB_JITTER_MS', 100)
+        self.stream_chunks = stream_chunks or getattr(settings, 'LLM_STUB_STREAM_CHUNKS', 8)
+        self.by_hash: Dict[str, str] = {}
+        self.by_match: List[tuple] = []
+        self.recorded: List[str] = []
+        self._prefix_cache = set()
+        self._prefix_hits = 0
+        self._prefix_misses = 0
+        self._prefix_lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.responses_path or not os.path.exists(self.responses_path):
+            return
+        with open(self.responses_path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                response = entry.get('response')
+                if not response:
+                    continue
+                self.recorded.append(response)
+                if entry.get('prompt_hash'):
+                    self.by_hash.setdefault(entry['prompt_hash'], response)
+                if entry.get('match'):
+                    self.by_match.append((entry['match'], response))
+
+    def _seed(self, prompt: str) -> int:
+        return int(prompt_hash(prompt)[:8], 16)
+
+    def response_for(self, prompt: str) -> str:
+        key = prompt_hash(prompt)
+        if key in self.by_hash:
+            return self.by_hash[key]
+        for match, response in self.by_match:
+            if match in prompt:
+                return response
+        if self.recorded:
+            return self.recorded[self._seed(prompt) % len(self.recorded)]
+        return DEFAULT_STUB_RESPONSE
+
+    def latency_for(self, prompt: str) -> float:
+        """Latência simulada em segundos"""
+        offset = (self._seed(prompt) % 2001) / 1000.0 - 1.0  # [-1, 1]
+        return max(0.0, self.latency_ms + offset * self.jitter_ms) / 1000.0
+
+    def _prefix_factor(self, prompt: str) -> float:
+        """Fração da latência que sobra com o prefixo em cache (1.0 = sem cache)"""
+        prefix = getattr(prompt, 'prefix', '')
+        if not prefix:
+            return 1.0
+        key = prompt_hash(prefix)
+        with self._prefix_lock:
+            if key not in self._prefix_cache:
+                self._prefix_cache.add(key)
+                self._prefix_misses += 1
+                return 1.0
+            self._prefix_hits += 1
+        return 1.0 - self.PREFIX_CACHE_SAVING * len(prefix) / max(1, len(prompt))
+
+    def prefix_cache_status(self) -> Dict:
+        return {'entries': len(self._prefix_cache), 'hits': self._prefix_hits, 'misses': self._prefix_misses}
+
+    def get_status(self) -> Dict:
+        return {**super().get_status(), 'prefix_cache': self.prefix_cache_status()}
+
+    def _timed_latency(self, prompt: str, timeout: Optional[float]) -> Tuple[float, bool]:
+        """(espera simulada, estourou o timeout) - como o SDK, desiste no timeout"""
+        latency = self.latency_for(prompt) * self._prefix_factor(prompt)
+        if timeout is not None and latency > timeout:
+            return timeout, True
+        return latency, False
+
+    def generate(self, prompt: str, timeout: Optional[float] = None, **generation_config) -> Optional[str]:
+        latency, timed_out = self._timed_latency(prompt, timeout)
+        time.sleep(latency)
+        if timed_out:
+            raise TimeoutError(f"Stub call exceeded {timeout:.2f}s")
+        return self.response_for(prompt)
+
+    async def agenerate(self, prompt: str, timeout: Optional[float] = None, **generation_config) -> Optional[str]:
+        latency, timed_out = self._timed_latency(prompt, timeout)
+        await asyncio.sleep(latency)
+        if timed_out:
+            raise TimeoutError(f"Stub call exceeded {timeout:.2f}s")
+        return self.response_for(prompt)
+
+    def stream(self, prompt: str, timeout: Optional[float] = None, **generation_config) -> Iterator[str]:
+        """Primeiro trecho após ~40% da latência; o resto distribuído nos demais"""
+        text = self.response_for(prompt)
+        total = self.latency_for(prompt) * self._prefix_factor(prompt)
+        chunks = max(1, min(self.stream_chunks, len(text)))
+        size = -(-len(text) // chunks)
+        for i in range(chunks):
+            time.sleep(total * 0.4 if i == 0 else total * 0.6 / max(1, chunks - 1))
+            yield text[i * size:(i + 1) * size]
+
+
+# =============================================================================
+# 🔌 SELEÇÃO DO PROVEDOR
+# =============================================================================
+
+_provider: Optional[LLMProvider] = None
+_provider_lock = threading.Lock()
+
+
+def build_provider(name: str) -> LLMProvider:
+    if name == 'stub':
+        return LocalStubProvider()
+    if name == 'gemini':
+        from .gemini_client import get_gemini_client
+        return get_gemini_client()
+    raise ValueError(f"Unknown LLM provider: {name}")
+
+
+def get_llm_provider() -> LLMProvider:
+    """Provedor configurado em settings.LLM_PROVIDER (compartilhado pelo processo)"""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = build_provider(getattr(settings, 'LLM_PROVIDER', 'gemini'))
+    return _provider
+
+
+def set_llm_provider(provider: Optional[LLMProvider]):
+    """Troca o provedor do processo (benchmarks e testes); None volta ao configurado"""
+    global _provider
+    _provider = provider
@@ -0,0 +1,316 @@
+"""
+Execução paralela do motor de recomendações (comandos de lote)
+
+generate_recommendations e ai_operations generate_batch processavam os
+usuários em série, esperando o Gemini a cada usuário. Aqui:
+- os usuários são divididos em blocos distribuídos a um pool de processos
+  (--workers); cada processo abre a sua própria conexão com o banco
+- dentro de cada processo até --concurrency usuários ficam em andamento ao
+  mesmo tempo (asyncio + threads, já que o ORM e o SDK são síncronos)
+- todas as chamadas ao Gemini passam por um token bucket compartilhado entre
+  os processos, respeitando GEMINI_RATE_LIMIT_PER_MINUTE no total
+- o processo principal grava um checkpoint com os ids concluídos; --resume
+  continua de onde a execução anterior parou. Uma execução que termina sem
+  erros apaga o checkpoint (a próxima começa do zero)
+- o relatório final traz usuários/s e p95 do tempo por usuário
+
+Este módulo não importa models no topo: com o método 'spawn' os processos
+filhos o importam antes de django.setup().
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+logger = logging.getLogger(__name__)
+
+PARALLEL_CHUNK_SIZE = 50
+
+STATUS_SUCCESS = 'success'
+STATUS_EMPTY = 'empty'
+STATUS_SKIPPED = 'skipped'
+STATUS_ERROR = 'error'
+
+# (user_id, status, recomendações criadas, segundos, erro)
+UserResult = Tuple[int, str, int, float, str]
+
+
+# =============================================================================
+# 🚦 TOKEN BUCKET COMPARTILHADO
+# =============================================================================
+
+class SharedTokenBucket:
+    """
+    Token bucket em memória compartilhada (multiprocessing.Value), herdado
+    pelos processos do pool. Reabastece rate_per_minute fichas por minuto,
+    acumulando no máximo `capacity` (rajada).
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None, context=None):
+        context = context or multiprocessing.get_context()
+        self.rate_per_second = max(float(rate_per_minute), 0.001) / 60.0
+        self.capacity = float(capacity or max(1.0, rate_per_minute / 10.0))
+        self._lock = context.Lock()
+        self._tokens = context.Value('d', self.capacity, lock=False)
+        self._updated_at = context.Value('d', time.monotonic(), lock=False)
+
+    def _refill(self, now: float):
+        elapsed = max(0.0, now - self._updated_at.value)
+        self._tokens.value = min(self.capacity, self._tokens.value + elapsed * self.rate_per_second)
+        self._updated_at.value = now
+
+    def try_acquire(self) -> float:
+        """Consome uma ficha; retorna 0 em caso de sucesso ou os segundos até a próxima"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens.value >= 1.0:
+                self._tokens.value -= 1.0
+                return 0.0
+            return (1.0 - self._tokens.value) / self.rate_per_second
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Bloqueia até obter uma ficha (False se estourar o timeout)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire()
+            if wait == 0.0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+
+# =============================================================================
+# 💾 CHECKPOINT
+# =============================================================================
+
+class Checkpoint:
+    """Arquivo texto com um user_id concluído por linha (escrito só pelo processo principal)"""
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.done: Set[int] = self._read() if resume else set()
+        if not resume:
+            open(path, 'w').close()
+
+    def _read(self) -> Set[int]:
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path) as f:
+            return {int(line) for line in f if line.strip().isdigit()}
+
+    def mark(self, user_ids: Iterable[int]):
+        user_ids = [user_id for user_id in user_ids if user_id not in self.done]
+        if not user_ids:
+            return
+        with open(self.path, 'a') as f:
+            f.write(''.join(f"{user_id}\n" for user_id in user_ids))
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.update(user_ids)
+
+    def clear(self):
+        """Remove o arquivo ao fim de uma execução completa"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.done = set()
+
+
+def default_checkpoint_path(name: str) -> str:
+    return os.path.join(settings.RECOMMENDATION_CHECKPOINT_DIR, f"{name}.ckpt")
+
+
+# =============================================================================
+# 📊 RELATÓRIO
+# =============================================================================
+
+@dataclass
+class ParallelReport:
+    """Resumo de uma execução paralela"""
+    users: int = 0
+    succeeded: int = 0
+    empty: int = 0
+    skipped: int = 0
+    errors: int = 0
+    resumed: int = 0
+    recommendations: int = 0
+    seconds: float = 0.0
+    durations: List[float] = field(default_factory=list)
+
+    def add(self, result: UserResult):
+        _, status, created, seconds, _ = result
+        self.users += 1
+        self.recommendations += created
+        if status == STATUS_SUCCESS:
+            self.succeeded += 1
+        elif status == STATUS_EMPTY:
+            self.empty += 1
+        elif status == STATUS_SKIPPED:
+            self.skipped += 1
+        else:
+            self.errors += 1
+        if status != STATUS_SKIPPED:
+            self.durations.append(seconds)
+
+    @property
+    def users_per_second(self) -> float:
+        return self.users / self.seconds if self.seconds else 0.0
+
+    def percentile(self, q: float) -> float:
+        return float(np.percentile(self.durations, q)) if self.durations else 0.0
+
+    @property
+    def p95(self) -> float:
+        return self.percentile(95)
+
+
+# =============================================================================
+# 👷 PROCESSAMENTO (executado nos processos do pool)
+# =============================================================================
+
+def _init_worker(bucket: Optional[SharedTokenBucket]):
+    """Inicializa o processo filho: Django, conexões próprias e limitador compartilhado"""
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+    # Nunca reutilizar conexões herdadas do processo pai (fork)
+    connections.close_all()
+
+    from .llm_providers import get_llm_provider
+    get_llm_provider().set_request_limiter(bucket)
+
+
+def _process_user(user_id: int, algorithm: str, limit: int, force_refresh: bool) -> UserResult:
+    from datetime import timedelta
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from ..models import Recommendation
+    from .recommendation_engine import RecommendationEngine
+
+    started = time.perf_counter()
+    try:
+        user = User.objects.get(id=user_id)
+
+        if not force_refresh:
+            recent_recommendations = Recommendation.objects.filter(
+                usuario=user,
+                data_geracao__gte=timezone.now() - timedelta(days=1)
+            ).count()
+            if recent_recommendations >= limit:
+                return (user_id, STATUS_SKIPPED, 0, time.perf_counter() - started, '')
+
+        recommendations = RecommendationEngine().generate_recommendations(
+            user=user, algorithm=algorithm, limit=limit
+        )
+        status = STATUS_SUCCESS if recommendations else STATUS_EMPTY
+        return (user_id, status, len(recommendations or []), time.perf_counter() - started, '')
+
+    except Exception as e:
+        logger.error(f"Parallel recommendation failed for user {user_id}: {e}")
+        return (user_id, STATUS_ERROR, 0, time.perf_counter() - started, str(e))
+    finally:
+        # Cada thread do executor tem sua própria conexão
+        close_old_connections()
+
+
+async def _run_chunk(user_ids: Sequence[int], algorithm: str, limit: int,
+                     force_refresh: bool, concurrency: int) -> List[UserResult]:
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_one(user_id: int) -> UserResult:
+        async with semaphore:
+            return await asyncio.to_thread(_process_user, user_id, algorithm, limit, force_refresh)
+
+    return await asyncio.gather(*(run_one(user_id) for user_id in user_ids))
+
+
+def process_chunk(args) -> List[UserResult]:
+    """Processa um bloco de usuários com até `concurrency` em andamento"""
+    user_ids, algorithm, limit, force_refresh, concurrency = args
+    return asyncio.run(_run_chunk(user_ids, algorithm, limit, force_refresh, concurrency))
+
+
+# =============================================================================
+# 🚀 ORQUESTRAÇÃO (processo principal)
+# =============================================================================
+
+def run_parallel(user_ids: Sequence[int], algorithm: str = 'hybrid', limit: int = 5,
+                 workers: int = 1, concurrency: int = 4, force_refresh: bool = False,
+                 checkpoint_path: Optional[str] = None, resume: bool = False,
+                 rate_per_minute: Optional[float] = None, chunk_size: int = PARALLEL_CHUNK_SIZE,
+                 on_chunk: Optional[Callable[[List[UserResult], ParallelReport], None]] = None) -> ParallelReport:
+    """
+    Gera recomendações para user_ids em `workers` processos. Com workers=1
+    roda no próprio processo (ainda com concorrência assíncrona e bucket).
+    """
+    report = ParallelReport()
+    checkpoint = Checkpoint(checkpoint_path, resume=resume) if checkpoint_path else None
+
+    pending = list(user_ids)
+    if checkpoint and checkpoint.done:
+        pending = [user_id for user_id in pending if user_id not in checkpoint.done]
+        report.resumed = len(user_ids) - len(pending)
+        if not pending:
+            logger.warning(
+                f"Checkpoint {checkpoint.path} already covers all {len(user_ids)} users; "
+                f"nothing to do (run without --resume to start over)"
+            )
+
+    chunks = [
+        (pending[i:i + chunk_size], algorithm, limit, force_refresh, concurrency)
+        for i in range(0, len(pending), chunk_size)
+    ]
+
+    context = multiprocessing.get_context()
+    bucket = SharedTokenBucket(
+        rate_per_minute or settings.GEMINI_RATE_LIMIT_PER_MINUTE, context=context
+    )
+
+    def collect(results: List[UserResult]):
+        for result in results:
+            report.add(result)
+        if checkpoint:
+            # Erros não entram no checkpoint: serão tentados de novo no --resume
+            checkpoint.mark(result[0] for result in results if result[1] != STATUS_ERROR)
+        if on_chunk:
+            on_chunk(results, report)
+
+    started = time.perf_counter()
+    if workers <= 1:
+        from .llm_providers import get_llm_provider
+        client = get_llm_provider()
+        client.set_request_limiter(bucket)
+        try:
+            for chunk in chunks:
+                collect(process_chunk(chunk))
+        finally:
+            client.set_request_limiter(None)
+    else:
+        # Fecha as conexões do pai antes do fork: os filhos abrem as suas
+        connections.close_all()
+        with context.Pool(processes=workers, initializer=_init_worker, initargs=(bucket,)) as pool:
+            for results in pool.imap_unordered(process_chunk, chunks):
+                collect(results)
+
+    report.seconds = time.perf_counter() - started
+    if checkpoint and not report.errors:
+        # Todos concluídos: um --resume futuro não deve pular ninguém
+        checkpoint.clear()
+    logger.info(
+        f"Parallel recommendations: {report.users} users in {report.seconds:.2f}s "
+        f"({report.users_per_second:.1f} users/s, p95 {report.p95:.2f}s)"
+    )
+    return report
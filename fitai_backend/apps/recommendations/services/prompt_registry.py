@@ -0,0 +1,162 @@
+"""
+Registro de prompts com prefixo estático e sufixo por usuário
+
+Os builders de prompt (_build_fitness_chat_system_prompt,
+_build_optimized_workout_prompt, _build_daily_recommendation_prompt_simple,
+_build_weekly_plan_prompt, _build_onboarding_prompt) remontavam com f-strings,
+a cada chamada, textos grandes e quase todos estáticos, com os dados do
+usuário espalhados no meio. Aqui:
+- cada prompt é um PromptTemplate registrado uma vez: `prefix` é texto fixo
+  (persona, regras, esquema JSON) e `suffix` é um template pré-compilado
+  (Formatter.parse roda no registro, não a cada render) com os dados do usuário
+- o prefixo vem sempre primeiro e idêntico byte a byte, o que permite ao
+  provedor reaproveitá-lo (cache de contexto do Gemini quando disponível,
+  cache implícito de prefixo, ou o cache simulado do LocalStubProvider)
+- render() devolve um RenderedPrompt: uma str comum (funciona em qualquer
+  caminho que já recebia texto) que carrega nome do template, prefixo e sufixo
+- o registro guarda, por template, tamanho estimado (tokens) dos prompts
+  enviados e a latência das respostas, para ver quais prompts pesam mais
+"""
+import threading
+from collections import deque
+from string import Formatter
+from typing import Deque, Dict, List, Optional, Tuple
+
+STATS_WINDOW = 500  # últimas amostras por template
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimativa de tokens sem tokenizador: a mesma regra de Message.tokens_used
+    (palavras * 1.3), mas nunca menos que caracteres / 4 (URLs, JSON, números)
+    """
+    if not text:
+        return 0
+    return max(int(len(text.split()) * 1.3), len(text) // 4)
+
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class RenderedPrompt(str):
+    """Prompt pronto (prefixo + sufixo) que lembra de qual template veio"""
+
+    def __new__(cls, template: str, prefix: str, suffix: str):
+        rendered = super().__new__(cls, prefix + suffix)
+        rendered.template = template
+        rendered.prefix = prefix
+        rendered.suffix = suffix
+        return rendered
+
+    def extend(self, text: str) -> 'RenderedPrompt':
+        """Acrescenta texto dinâmico ao sufixo mantendo o prefixo (ex: histórico do chat)"""
+        return RenderedPrompt(self.template, self.prefix, self.suffix + text)
+
+
+class PromptTemplate:
+    """Prefixo fixo + sufixo no formato str.format, compilado uma vez"""
+
+    def __init__(self, name: str, prefix: str, suffix: str):
+        self.name = name
+        self.prefix = prefix
+        self._parts: List[Tuple[str, Optional[str], str, Optional[str]]] = list(Formatter().parse(suffix))
+        self.fields = {field for _, field, _, _ in self._parts if field is not None}
+        self.prefix_tokens = estimate_tokens(prefix)
+        self.renders = 0
+
+    def render(self, **values) -> RenderedPrompt:
+        missing = self.fields - values.keys()
+        if missing:
+            raise KeyError(f"Prompt '{self.name}' sem valores para: {', '.join(sorted(missing))}")
+
+        out = []
+        for literal, field, spec, conversion in self._parts:
+            out.append(literal)
+            if field is None:
+                continue
+            value = values[field]
+            if conversion == 'r':
+                value = repr(value)
+            elif conversion == 's':
+                value = str(value)
+            out.append(format(value, spec or ''))
+        self.renders += 1
+        return RenderedPrompt(self.name, self.prefix, ''.join(out))
+
+
+class _TemplateStats:
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens: Deque[int] = deque(maxlen=STATS_WINDOW)
+        self.suffix_tokens: Deque[int] = deque(maxlen=STATS_WINDOW)
+        self.latency_ms: Deque[float] = deque(maxlen=STATS_WINDOW)
+
+
+class PromptRegistry:
+    def __init__(self):
+        self._templates: Dict[str, PromptTemplate] = {}
+        self._stats: Dict[str, _TemplateStats] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, prefix: str, suffix: str) -> PromptTemplate:
+        template = PromptTemplate(name, prefix, suffix)
+        with self._lock:
+            self._templates[name] = template
+            self._stats.setdefault(name, _TemplateStats())
+        return template
+
+    def get(self, name: str) -> PromptTemplate:
+        return self._templates[name]
+
+    def render(self, template_name: str, /, **values) -> RenderedPrompt:
+        return self.get(template_name).render(**values)
+
+    def record_request(self, prompt: str, latency_ms: Optional[float] = None):
+        """Registra um prompt enviado ao provedor (ignora textos que não vieram do registro)"""
+        if not isinstance(prompt, RenderedPrompt) or prompt.template not in self._stats:
+            return
+        with self._lock:
+            stats = self._stats[prompt.template]
+            stats.requests += 1
+            stats.prompt_tokens.append(estimate_tokens(prompt))
+            stats.suffix_tokens.append(estimate_tokens(prompt.suffix))
+            if latency_ms is not None:
+                stats.latency_ms.append(latency_ms)
+
+    def stats(self) -> Dict[str, Dict]:
+        """Tamanho e latência por template (p50/p95 das últimas STATS_WINDOW requisições)"""
+        with self._lock:
+            snapshot = {}
+            for name, stats in self._stats.items():
+                template = self._templates[name]
+                prompt_tokens = list(stats.prompt_tokens)
+                p50_tokens = _percentile(prompt_tokens, 0.5)
+                snapshot[name] = {
+                    'renders': template.renders,
+                    'requests': stats.requests,
+                    'prefix_tokens': template.prefix_tokens,
+                    'suffix_tokens_p50': _percentile(list(stats.suffix_tokens), 0.5),
+                    'prompt_tokens_p50': p50_tokens,
+                    'prompt_tokens_p95': _percentile(prompt_tokens, 0.95),
+                    'prefix_share': round(template.prefix_tokens / p50_tokens, 2) if p50_tokens else None,
+                    'latency_p50_ms': _percentile(list(stats.latency_ms), 0.5),
+                    'latency_p95_ms': _percentile(list(stats.latency_ms), 0.95),
+                }
+            return snapshot
+
+    def reset_stats(self):
+        with self._lock:
+            for name in self._stats:
+                self._stats[name] = _TemplateStats()
+                self._templates[name].renders = 0
+
+
+prompts = PromptRegistry()
+
+
+def get_prompt_registry() -> PromptRegistry:
+    return prompts
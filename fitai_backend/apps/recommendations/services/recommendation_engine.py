@@ -1,18 +1,28 @@
 import logging
+from types import SimpleNamespace
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
+
+import numpy as np
 from django.utils import timezone
 from django.db.models import Q, Count, Avg
 from django.contrib.auth.models import User
 
 from apps.users.models import UserProfile
+from apps.workouts import analytics
 from apps.workouts.models import Workout, WorkoutSession, ExerciseLog
 from apps.exercises.models import Exercise
 from ..models import Recommendation
-from .ai_service import AIService
+from .ai_service import get_ai_service
+from . import collaborative
+from .batch_recommender import COLLABORATIVE_REASON, COLLABORATIVE_WEIGHT, combine_hybrid_scores
+from .content_features import top_k
+from .user_context import UserContext
 
 logger = logging.getLogger(__name__)
 
+AI_WEIGHT = 0.5  # bônus no ranking híbrido para treinos escolhidos pela IA
+
 
 class RecommendationEngine:
     """
@@ -20,11 +30,12 @@ class RecommendationEngine:
     - IA (OpenAI) para recomendações avançadas
     - Algoritmos baseados em regras (fallback)
     - Machine Learning simples baseado em histórico
-    - Filtros colaborativos básicos
+    - Filtragem colaborativa item-item (índice NumPy/SciPy pré-calculado)
     """
     
     def __init__(self):
-        self.ai_service = AIService()
+        self.ai_service = get_ai_service()
+        self.last_timings: Dict[str, float] = {}
         self.algorithms = {
             'ai_personalized': self._ai_personalized_recommendations,
             'content_based': self._content_based_recommendations, 
@@ -44,32 +55,41 @@ class RecommendationEngine:
         
         Returns:
             Lista de dicionários com recomendações
+            (tempo por etapa, em ms, fica em self.last_timings)
         """
+        context = UserContext.load(user)
         try:
             if algorithm not in self.algorithms:
                 algorithm = 'hybrid'
             
-            recommendations = self.algorithms[algorithm](user, limit)
+            recommendations = self.algorithms[algorithm](user, limit, context)
             
             # Salvar recomendações no banco
-            self._save_recommendations(user, recommendations, algorithm)
+            with context.stage('save'):
+                self._save_recommendations(user, recommendations, algorithm)
             
             return recommendations
             
         except Exception as e:
             logger.error(f"Error generating recommendations for user {user.id}: {e}")
             # Fallback para recomendações básicas
-            return self._content_based_recommendations(user, limit)
+            return self._content_based_recommendations(user, limit, context)
+        finally:
+            self.last_timings = context.timings
     
-    def _ai_personalized_recommendations(self, user: User, limit: int) -> List[Dict]:
+    def _ai_personalized_recommendations(self, user: User, limit: int,
+                                         context: Optional[UserContext] = None) -> List[Dict]:
         """Recomendações usando IA da OpenAI"""
+        context = context or UserContext.load(user)
         try:
-            profile = UserProfile.objects.get(user=user)
+            profile = context.profile
+            if profile is None:
+                return self._content_based_recommendations(user, limit, context)
             
             # Verificar se IA está disponível
             if not self.ai_service.is_available:
                 logger.info("AI not available, falling back to content-based")
-                return self._content_based_recommendations(user, limit)
+                return self._content_based_recommendations(user, limit, context)
             
             # Analisar progresso primeiro para contexto
             progress_analysis = self.ai_service.analyze_user_progress(profile)
@@ -89,76 +109,18 @@ class RecommendationEngine:
                 return self._process_ai_recommendations(ai_recommendations, available_workouts)
             
             # Fallback se IA falhou
-            return self._content_based_recommendations(user, limit)
+            return self._content_based_recommendations(user, limit, context)
             
-        except UserProfile.DoesNotExist:
-            return self._content_based_recommendations(user, limit)
         except Exception as e:
             logger.error(f"AI recommendations failed: {e}")
-            return self._content_based_recommendations(user, limit)
+            return self._content_based_recommendations(user, limit, context)
     
-    def _content_based_recommendations(self, user: User, limit: int) -> List[Dict]:
+    def _content_based_recommendations(self, user: User, limit: int,
+                                       context: Optional[UserContext] = None) -> List[Dict]:
         """Recomendações baseadas no perfil e histórico do usuário"""
-        try:
-            profile = UserProfile.objects.get(user=user)
-            recommendations = []
-            
-            # Filtro base por nível de atividade
-            workout_filter = Q()
-            
-            if profile.activity_level in ['sedentary', 'light']:
-                workout_filter &= Q(difficulty_level='beginner')
-            elif profile.activity_level == 'moderate':
-                workout_filter &= Q(difficulty_level__in=['beginner', 'intermediate'])
-            else:
-                workout_filter &= Q(difficulty_level__in=['intermediate', 'advanced'])
-            
-            # Filtro por objetivo
-            if profile.goal == 'lose_weight':
-                workout_filter &= Q(workout_type__in=['cardio', 'hiit', 'mixed'])
-            elif profile.goal == 'gain_muscle':
-                workout_filter &= Q(workout_type__in=['strength', 'bodybuilding', 'mixed'])
-            elif profile.goal == 'improve_endurance':
-                workout_filter &= Q(workout_type__in=['cardio', 'endurance', 'mixed'])
-            
-            # Buscar treinos que o usuário NÃO fez recentemente
-            recent_workouts = WorkoutSession.objects.filter(
-                user=user,
-                created_at__gte=timezone.now() - timedelta(days=14)
-            ).values_list('workout_id', flat=True)
-            
-            if recent_workouts:
-                workout_filter &= ~Q(id__in=recent_workouts)
-            
-            # Buscar treinos
-            workouts = Workout.objects.filter(workout_filter)[:limit * 2]  # Buscar mais para scoring
-            
-            # Calcular score para cada treino
-            scored_workouts = []
-            for workout in workouts:
-                score = self._calculate_workout_score(user, workout, profile)
-                if score > 0:
-                    scored_workouts.append({
-                        'workout': workout,
-                        'score': score,
-                        'reason': self._generate_recommendation_reason(workout, profile)
-                    })
-            
-            # Ordenar por score e retornar top N
-            scored_workouts.sort(key=lambda x: x['score'], reverse=True)
-            
-            for item in scored_workouts[:limit]:
-                recommendations.append({
-                    'workout_id': item['workout'].id,
-                    'workout_name': item['workout'].name,
-                    'confidence_score': min(item['score'] / 10.0, 1.0),  # Normalizar para 0-1
-                    'reason': item['reason'],
-                    'algorithm_used': 'content_based'
-                })
-            
-            return recommendations
-            
-        except UserProfile.DoesNotExist:
+        context = context or UserContext.load(user)
+        
+        if context.profile is None:
             # Usuário sem perfil - recomendações genéricas para iniciantes
             beginner_workouts = Workout.objects.filter(difficulty_level='beginner')[:limit]
             return [{
@@ -168,94 +130,126 @@ class RecommendationEngine:
                 'reason': 'Recomendado para iniciantes',
                 'algorithm_used': 'content_based'
             } for w in beginner_workouts]
-    
-    def _collaborative_filtering(self, user: User, limit: int) -> List[Dict]:
-        """Filtro colaborativo: usuários similares fizeram estes treinos"""
-        try:
-            profile = UserProfile.objects.get(user=user)
-            
-            # Encontrar usuários similares
-            similar_users = self._find_similar_users(user, profile)
-            
-            if not similar_users:
-                # Fallback para content-based
-                return self._content_based_recommendations(user, limit)
-            
-            # Treinos populares entre usuários similares
-            popular_workouts = WorkoutSession.objects.filter(
-                user__in=similar_users,
-                completed=True,
-                user_rating__gte=4  # Apenas treinos bem avaliados
-            ).values('workout').annotate(
-                popularity=Count('workout'),
-                avg_rating=Avg('user_rating')
-            ).order_by('-popularity', '-avg_rating')
+        
+        with context.stage('content'):
+            # Catálogo inteiro pontuado de uma vez (matriz de features × pesos do perfil)
+            features, scores = context.content_scores()
             
-            # Excluir treinos já feitos pelo usuário
-            user_workouts = WorkoutSession.objects.filter(user=user).values_list('workout_id', flat=True)
-            popular_workouts = popular_workouts.exclude(workout__in=user_workouts)
+            # Não recomendar treinos que o usuário fez recentemente
+            scores = scores.copy()
+            scores[features.positions_of(context.recent_workouts)] = 0.0
             
             recommendations = []
-            for item in popular_workouts[:limit]:
-                try:
-                    workout = Workout.objects.get(id=item['workout'])
+            for position in top_k(scores, limit):
+                workout = features.rows[position]
+                recommendations.append({
+                    'workout_id': workout['id'],
+                    'workout_name': workout['name'],
+                    'confidence_score': min(float(scores[position]) / 10.0, 1.0),  # Normalizar para 0-1
+                    'reason': self._catalog_reason(workout, context.profile),
+                    'algorithm_used': 'content_based'
+                })
+        
+        return recommendations
+    
+    def _collaborative_filtering(self, user: User, limit: int,
+                                 context: Optional[UserContext] = None) -> List[Dict]:
+        """Filtro colaborativo item-item: quem fez seus treinos também fez estes"""
+        context = context or UserContext.load(user)
+        try:
+            with context.stage('collaborative'):
+                # Excluir treinos já feitos pelo usuário
+                scored = collaborative.recommend(
+                    user, limit, exclude=context.seen_workouts, history=context.history
+                )
+                features, _ = context.content_scores()
+                
+                recommendations = []
+                for workout_id, score in scored:
+                    position = features.position.get(workout_id)
+                    if position is None:
+                        continue  # fora do catálogo ativo
                     recommendations.append({
-                        'workout_id': workout.id,
-                        'workout_name': workout.name,
-                        'confidence_score': min(item['popularity'] / 5.0, 1.0),  # Normalizar
-                        'reason': f'Popular entre usuários com perfil similar (avaliação média: {item["avg_rating"]:.1f})',
+                        'workout_id': workout_id,
+                        'workout_name': features.rows[position]['name'],
+                        'confidence_score': round(min(score, 1.0), 3),
+                        'reason': COLLABORATIVE_REASON,
                         'algorithm_used': 'collaborative'
                     })
-                except Workout.DoesNotExist:
-                    continue
             
-            # Se não achou suficientes, completar com content-based
+            # Sem histórico/vizinhos suficientes: completar com content-based
             if len(recommendations) < limit:
-                content_recs = self._content_based_recommendations(user, limit - len(recommendations))
-                recommendations.extend(content_recs)
+                chosen = {rec['workout_id'] for rec in recommendations}
+                for rec in self._content_based_recommendations(user, limit, context):
+                    if rec['workout_id'] not in chosen:
+                        recommendations.append(rec)
             
             return recommendations[:limit]
             
-        except UserProfile.DoesNotExist:
-            return self._content_based_recommendations(user, limit)
+        except Exception as e:
+            logger.error(f"Collaborative filtering failed: {e}")
+            return self._content_based_recommendations(user, limit, context)
     
-    def _hybrid_recommendations(self, user: User, limit: int) -> List[Dict]:
-        """Combina múltiplos algoritmos para melhores recomendações"""
-        recommendations = []
-        
-        # 50% IA (se disponível) ou content-based
-        ai_limit = max(1, limit // 2)
-        if self.ai_service.is_available:
-            ai_recs = self._ai_personalized_recommendations(user, ai_limit)
-        else:
-            ai_recs = self._content_based_recommendations(user, ai_limit)
+    def _hybrid_recommendations(self, user: User, limit: int,
+                                context: Optional[UserContext] = None) -> List[Dict]:
+        """
+        Combina os algoritmos em um único ranking: os scores de conteúdo,
+        colaborativo e (se disponível) IA são somados por treino do catálogo,
+        em vez de concatenar listas separadas.
+        """
+        context = context or UserContext.load(user)
         
-        # 30% collaborative filtering
-        collab_limit = max(1, int(limit * 0.3))
-        collab_recs = self._collaborative_filtering(user, collab_limit)
+        with context.stage('content'):
+            features, content = context.content_scores()
+            content = np.minimum(content / 10.0, 1.0)
         
-        # 20% content-based (para diversidade)
-        content_limit = limit - len(ai_recs) - len(collab_recs)
-        if content_limit > 0:
-            content_recs = self._content_based_recommendations(user, content_limit)
-        else:
-            content_recs = []
+        with context.stage('collaborative'):
+            collab = context.collaborative_scores()
         
-        # Combinar e remover duplicatas
-        all_recs = ai_recs + collab_recs + content_recs
-        seen_workouts = set()
+        # Escolhas da IA (quando o Gemini devolve treinos do catálogo)
+        ai_picks = {}
+        if self.ai_service.is_available:
+            with context.stage('ai'):
+                for rec in self._ai_personalized_recommendations(user, max(1, limit // 2), context):
+                    if rec.get('algorithm_used') == 'ai_personalized' and rec['workout_id'] in features.position:
+                        ai_picks[features.position[rec['workout_id']]] = rec
         
-        for rec in all_recs:
-            if rec['workout_id'] not in seen_workouts:
-                rec['algorithm_used'] = 'hybrid'
-                recommendations.append(rec)
-                seen_workouts.add(rec['workout_id'])
-                
-                if len(recommendations) >= limit:
-                    break
+        with context.stage('ranking'):
+            combined = combine_hybrid_scores(
+                content, collab,
+                features.positions_of(context.recent_workouts),
+                features.positions_of(context.seen_workouts),
+            )
+            for position, rec in ai_picks.items():
+                combined[position] = min(combined[position] + AI_WEIGHT * rec['confidence_score'], 1.0)
+            
+            recommendations = []
+            for position in top_k(combined, limit):
+                workout = features.rows[position]
+                if position in ai_picks:
+                    reason = ai_picks[position]['reason']
+                elif content[position] >= COLLABORATIVE_WEIGHT * collab[position]:
+                    reason = self._catalog_reason(workout, context.profile)
+                else:
+                    reason = COLLABORATIVE_REASON
+                recommendations.append({
+                    'workout_id': workout['id'],
+                    'workout_name': workout['name'],
+                    'confidence_score': round(float(combined[position]), 3),
+                    'reason': reason,
+                    'algorithm_used': 'hybrid'
+                })
         
         return recommendations
     
+    def _catalog_reason(self, workout: Dict, profile: Optional[UserProfile]) -> str:
+        """Motivo da recomendação a partir de uma linha do catálogo (values())"""
+        return self._generate_recommendation_reason(SimpleNamespace(
+            workout_type=workout['workout_type'],
+            difficulty_level=workout['difficulty_level'],
+            estimated_duration=workout['estimated_duration'] or 0,
+        ), profile or SimpleNamespace(goal=None, activity_level='sedentary'))
+    
     def _calculate_workout_score(self, user: User, workout: Workout, profile: UserProfile) -> float:
         """Calcula score de relevância de um treino para o usuário"""
         score = 5.0  # Score base
@@ -292,26 +286,6 @@ class RecommendationEngine:
         
         return max(0, score)
     
-    def _find_similar_users(self, user: User, profile: UserProfile) -> List[int]:
-        """Encontra usuários com perfil similar"""
-        similar_users = UserProfile.objects.filter(
-            goal=profile.goal,
-            activity_level=profile.activity_level
-        ).exclude(user=user)
-        
-        # Filtrar apenas usuários com atividade recente
-        active_users = []
-        for similar_profile in similar_users[:20]:  # Limite para performance
-            recent_sessions = WorkoutSession.objects.filter(
-                user=similar_profile.user,
-                created_at__gte=timezone.now() - timedelta(days=30)
-            ).count()
-            
-            if recent_sessions >= 3:  # Usuários ativos
-                active_users.append(similar_profile.user.id)
-        
-        return active_users[:10]  # Top 10 usuários similares
-    
     def _generate_recommendation_reason(self, workout: Workout, profile: UserProfile) -> str:
         """Gera explicação para a recomendação"""
         reasons = []
@@ -366,83 +340,21 @@ class RecommendationEngine:
                 wtype = session.workout.workout_type
                 workout_types[wtype] = workout_types.get(wtype, 0) + 1
             
+            # Consistência e tendência (uma consulta de datas de conclusão)
+            summary = analytics.summarize_user(user)
+            
             return {
                 'total_workouts': recent_sessions.count(),
                 'avg_rating': recent_sessions.aggregate(Avg('user_rating'))['user_rating__avg'] or 0,
                 'favorite_muscle_groups': sorted(muscle_groups.items(), key=lambda x: x[1], reverse=True)[:3],
                 'favorite_workout_types': sorted(workout_types.items(), key=lambda x: x[1], reverse=True)[:2],
-                'consistency_score': self._calculate_consistency_score(user),
-                'improvement_trend': self._calculate_improvement_trend(user)
+                'consistency_score': summary.consistency,
+                'improvement_trend': summary.improvement_trend
             }
         except Exception as e:
             logger.error(f"Error building user context: {e}")
             return {'total_workouts': 0}
     
-    def _calculate_consistency_score(self, user: User) -> float:
-        """Calcula score de consistência do usuário (0-1)"""
-        try:
-            # Últimas 4 semanas
-            weeks_data = []
-            for week in range(4):
-                start_date = timezone.now() - timedelta(days=(week + 1) * 7)
-                end_date = timezone.now() - timedelta(days=week * 7)
-                
-                week_sessions = WorkoutSession.objects.filter(
-                    user=user,
-                    completed=True,
-                    completed_at__gte=start_date,
-                    completed_at__lt=end_date
-                ).count()
-                
-                weeks_data.append(week_sessions)
-            
-            # Score baseado na regularidade
-            if not weeks_data or max(weeks_data) == 0:
-                return 0.0
-            
-            # Penalizar semanas sem atividade
-            weeks_with_activity = len([w for w in weeks_data if w > 0])
-            consistency = weeks_with_activity / 4.0
-            
-            return min(consistency, 1.0)
-            
-        except Exception:
-            return 0.5  # Score neutro em caso de erro
-    
-    def _calculate_improvement_trend(self, user: User) -> str:
-        """Calcula tendência de melhoria do usuário"""
-        try:
-            # Comparar últimas 2 semanas com 2 semanas anteriores
-            now = timezone.now()
-            
-            # Últimas 2 semanas
-            recent_sessions = WorkoutSession.objects.filter(
-                user=user,
-                completed=True,
-                completed_at__gte=now - timedelta(days=14)
-            ).count()
-            
-            # 2 semanas anteriores
-            previous_sessions = WorkoutSession.objects.filter(
-                user=user,
-                completed=True,
-                completed_at__gte=now - timedelta(days=28),
-                completed_at__lt=now - timedelta(days=14)
-            ).count()
-            
-            if previous_sessions == 0:
-                return 'iniciante'
-            
-            if recent_sessions > previous_sessions:
-                return 'melhorando'
-            elif recent_sessions == previous_sessions:
-                return 'estável'
-            else:
-                return 'em declínio'
-                
-        except Exception:
-            return 'estável'
-    
     def _request_ai_recommendations(self, profile: UserProfile, context: Dict, 
                                   available_workouts: List[Dict], limit: int) -> Optional[List]:
         """Solicita recomendações personalizadas à IA"""
@@ -457,26 +369,9 @@ class RecommendationEngine:
         return []
     
     def _save_recommendations(self, user: User, recommendations: List[Dict], algorithm: str):
-        """Salva recomendações no banco de dados"""
+        """Salva recomendações no banco (1 consulta de deduplicação + 1 bulk_create)"""
         try:
-            for rec in recommendations:
-                workout_id = rec['workout_id']
-                
-                # Verificar se já existe recomendação recente para este treino
-                existing = Recommendation.objects.filter(
-                    usuario=user,
-                    workout_recomendado_id=workout_id,
-                    data_geracao__gte=timezone.now() - timedelta(days=1)
-                ).exists()
-                
-                if not existing:
-                    Recommendation.objects.create(
-                        usuario=user,
-                        workout_recomendado_id=workout_id,
-                        algoritmo_utilizado=algorithm,
-                        score_confianca=rec['confidence_score'],
-                        motivo_recomendacao=rec['reason']
-                    )
+            Recommendation.bulk_create_new({user.id: recommendations}, algorithm)
         except Exception as e:
             logger.error(f"Error saving recommendations: {e}")
 
@@ -0,0 +1,113 @@
+"""
+Contexto do usuário por requisição para o motor de recomendações
+
+O híbrido chamava IA, colaborativo e conteúdo de forma independente; cada um
+buscava UserProfile e varria WorkoutSession de novo (4-6 leituras do perfil
+por requisição). UserContext carrega tudo uma vez:
+- perfil (1 consulta)
+- sessões do usuário (1 consulta com values_list): treinos vistos, recentes
+  e o histórico ponderado usado pela filtragem colaborativa
+e guarda os vetores de score já calculados e o tempo gasto em cada etapa.
+"""
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from django.utils import timezone
+
+from apps.users.models import UserProfile
+from apps.workouts.models import UserTrainingStats, WorkoutSession
+from . import collaborative
+from .batch_recommender import RECENT_DAYS
+from .content_features import CatalogFeatures, get_catalog_features, score_catalog
+
+
+class UserContext:
+    """Dados do usuário carregados uma vez e compartilhados pelos algoritmos"""
+
+    def __init__(self, user, profile: Optional[UserProfile], seen_workouts: Set[int],
+                 recent_workouts: Set[int], history: Dict[int, float]):
+        self.user = user
+        self.profile = profile
+        self.seen_workouts = seen_workouts          # qualquer sessão
+        self.recent_workouts = recent_workouts      # sessões criadas nos últimos 14 dias
+        self.history = history                      # conclusões ponderadas pela avaliação
+        self.timings: Dict[str, float] = {}         # etapa -> ms
+        self._content: Optional[Tuple[CatalogFeatures, np.ndarray]] = None
+        self._collaborative: Optional[np.ndarray] = None
+
+    @classmethod
+    def load(cls, user) -> 'UserContext':
+        started = time.perf_counter()
+        profile = UserProfile.objects.filter(user=user).first()
+
+        recent_cutoff = timezone.now() - timedelta(days=RECENT_DAYS)
+        seen, recent = set(), set()
+        completions: List[Tuple[int, float]] = []
+        rows = WorkoutSession.objects.filter(user=user).values_list(
+            'workout_id', 'completed', 'user_rating', 'created_at', 'notes'
+        )
+        for workout_id, completed, rating, created_at, notes in rows:
+            seen.add(workout_id)
+            if created_at >= recent_cutoff:
+                recent.add(workout_id)
+            if completed and UserTrainingStats.CANCEL_NOTE_MARKER not in (notes or ''):
+                completions.append((workout_id, np.nan if rating is None else rating))
+
+        # Mesmo peso do índice colaborativo
+        history: Dict[int, float] = {}
+        weights = collaborative.interaction_weight(np.array([rating for _, rating in completions], dtype=np.float64))
+        for (workout_id, _), weight in zip(completions, weights):
+            history[workout_id] = history.get(workout_id, 0.0) + float(weight)
+
+        context = cls(user, profile, seen, recent, history)
+        context.timings['context'] = round((time.perf_counter() - started) * 1000, 2)
+        return context
+
+    @contextmanager
+    def stage(self, name: str):
+        """Acumula o tempo (ms) de uma etapa em self.timings"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.timings[name] = round(self.timings.get(name, 0.0) + elapsed, 2)
+
+    # =========================================================================
+    # 🧮 SCORES (calculados uma vez por requisição)
+    # =========================================================================
+
+    def content_scores(self) -> Tuple[CatalogFeatures, np.ndarray]:
+        """
+        Score de conteúdo (0-10) de todo o catálogo; 0 para não elegíveis.
+        Sem perfil, usa as regras de iniciante (como o lote noturno).
+        """
+        if self._content is None:
+            features = get_catalog_features()
+            if self.profile is not None:
+                key = (self.profile.goal, self.profile.activity_level, self.profile.focus_areas)
+            else:
+                key = (None, 'sedentary', None)
+            scores, eligible = score_catalog(features, *key)
+            self._content = (features, np.where(eligible, scores, 0.0))
+        return self._content
+
+    def collaborative_scores(self) -> np.ndarray:
+        """Score colaborativo (0-1) alinhado às posições do catálogo"""
+        if self._collaborative is None:
+            features, _ = self.content_scores()
+            index = collaborative.get_index()
+            aligned = np.zeros(len(features), dtype=np.float32)
+            if index.n_items and self.history:
+                scores = collaborative.score_items(index, self.history)
+                present, columns = collaborative.index_columns(index, features.ids)
+                aligned[present] = scores[columns[present]]
+            self._collaborative = aligned
+        return self._collaborative
+
+    def positions(self, workout_ids) -> List[int]:
+        features, _ = self.content_scores()
+        return features.positions_of(workout_ids)
@@ -1,3 +1,672 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from apps.workouts.models import Workout, WorkoutSession
+from .services import collaborative
+from .services.ai_service import AIService, get_ai_service
+from .services.gemini_client import GeminiClientRegistry
+from .services.llm_executor import LLMExecutor, LLMQueueFullError, LLMTimeoutError
+from .services.llm_providers import LocalStubProvider, prompt_hash
+from .services.prompt_registry import PromptRegistry, RenderedPrompt
+
+
+class GeminiClientRegistryTest(TestCase):
+    """Cliente Gemini compartilhado: sem probe na construção + circuit breaker"""
+
+    def setUp(self):
+        self.registry = GeminiClientRegistry()
+
+    @override_settings(GEMINI_API_KEY='')
+    def test_unavailable_without_api_key(self):
+        self.assertFalse(self.registry.is_available)
+        self.assertIsNone(self.registry.model)
+
+    @override_settings(GEMINI_API_KEY='test-key')
+    @patch('google.generativeai.GenerativeModel')
+    @patch('google.generativeai.configure')
+    def test_ai_service_construction_makes_no_api_call(self, mock_configure, mock_model):
+        with patch('apps.recommendations.services.ai_service.get_llm_provider', return_value=self.registry):
+            ai_service = AIService()
+
+        mock_model.return_value.generate_content.assert_not_called()
+        mock_configure.assert_not_called()
+
+        # Modelo é criado apenas uma vez, na primeira leitura
+        self.assertIsNotNone(ai_service.model)
+        self.assertIsNotNone(ai_service.model)
+        self.assertEqual(mock_model.call_count, 1)
+        mock_model.return_value.generate_content.assert_not_called()
+
+    @override_settings(GEMINI_API_KEY='test-key', GEMINI_CIRCUIT_FAILURE_THRESHOLD=2,
+                       GEMINI_CIRCUIT_RESET_SECONDS=60, GEMINI_HEALTH_CHECK_INTERVAL=3600)
+    @patch('google.generativeai.GenerativeModel')
+    @patch('google.generativeai.configure')
+    def test_circuit_breaker_opens_and_recovers(self, mock_configure, mock_model):
+        self.registry._last_health_check = 10 ** 12  # evita refresh em background
+        self.assertTrue(self.registry.is_available)
+
+        self.registry.record_failure(Exception('boom'))
+        self.assertTrue(self.registry.allow_request())
+        self.registry.record_failure(Exception('boom'))
+
+        self.assertFalse(self.registry.allow_request())
+        self.assertFalse(self.registry.is_available)
+        self.assertEqual(self.registry.get_status()['circuit_state'], 'open')
+
+        # Após o tempo de reset, uma requisição de teste é liberada
+        self.registry._opened_at -= 61
+        self.assertTrue(self.registry.allow_request())
+        self.assertEqual(self.registry.get_status()['circuit_state'], 'half_open')
+
+        self.registry.record_success()
+        self.assertEqual(self.registry.get_status()['circuit_state'], 'closed')
+        self.assertTrue(self.registry.is_available)
+
+    def test_get_ai_service_is_shared(self):
+        self.assertIs(get_ai_service(), get_ai_service())
+
+    @override_settings(GEMINI_CONTEXT_CACHE_MIN_TOKENS=1, GEMINI_TEMPERATURE=0.3, GEMINI_MAX_TOKENS=512)
+    def test_context_cached_model_keeps_generation_config(self):
+        import google.generativeai as genai
+
+        prompt = RenderedPrompt('teste', 'Prefixo fixo do prompt. ' * 10, 'Sufixo')
+        with patch.object(genai, 'caching', create=True), \
+                patch.object(genai.GenerativeModel, 'from_cached_content', create=True) as from_cached:
+            self.assertIs(self.registry._cached_prefix_model(prompt), from_cached.return_value)
+
+        self.assertEqual(from_cached.call_args.kwargs['generation_config'],
+                         {'temperature': 0.3, 'max_output_tokens': 512})
+
+
+class LocalStubProviderTest(TestCase):
+    """Stub local: respostas gravadas, latência determinística e mesmo caminho do AIService"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        path = os.path.join(self.tmp.name, 'responses.jsonl')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'prompt_hash': prompt_hash('oi'), 'response': 'Olá! Bora treinar?'}) + '\n')
+            f.write(json.dumps({'match': 'JSON', 'response': '{"workout_name": "Stub"}'}) + '\n')
+        self.stub = LocalStubProvider(responses_path=path, latency_ms=0, jitter_ms=0, stream_chunks=4)
+
+    def test_replays_recorded_responses(self):
+        self.assertEqual(self.stub.generate('oi'), 'Olá! Bora treinar?')
+        self.assertEqual(self.stub.generate('Responda em JSON'), '{"workout_name": "Stub"}')
+        # Sem correspondência: escolha determinística entre as gravadas
+        self.assertEqual(self.stub.generate('outra coisa'), self.stub.generate('outra coisa'))
+
+    def test_stream_and_async_match_generate(self):
+        self.assertEqual(''.join(self.stub.stream('oi')), 'Olá! Bora treinar?')
+        self.assertEqual(len(list(self.stub.stream('oi'))), 4)
+        self.assertEqual(asyncio.run(self.stub.agenerate('oi')), 'Olá! Bora treinar?')
+
+    def test_latency_is_deterministic_within_jitter(self):
+        stub = LocalStubProvider(responses_path='', latency_ms=200, jitter_ms=50)
+        self.assertEqual(stub.latency_for('abc'), stub.latency_for('abc'))
+        self.assertTrue(0.15 <= stub.latency_for('abc') <= 0.25)
+
+    @override_settings(GEMINI_RATE_LIMIT_PER_MINUTE=1)
+    def test_ai_service_uses_stub_without_quota(self):
+        with patch('apps.recommendations.services.ai_service.get_llm_provider', return_value=self.stub):
+            ai_service = AIService()
+
+        self.assertEqual(ai_service._make_gemini_request('oi'), 'Olá! Bora treinar?')
+        self.assertEqual(ai_service._make_gemini_request('oi'), 'Olá! Bora treinar?')
+        self.assertEqual(''.join(ai_service._make_gemini_stream_request('oi')), 'Olá! Bora treinar?')
+        self.assertEqual(asyncio.run(ai_service._make_gemini_request_async('oi')), 'Olá! Bora treinar?')
+
+    def test_quota_is_refunded_when_call_is_never_sent(self):
+        self.stub.uses_quota = True
+        with patch('apps.recommendations.services.ai_service.get_llm_provider', return_value=self.stub):
+            ai_service = AIService()
+        ai_service.reset_quota()
+
+        with patch.object(self.stub, 'acquire_request_slot', return_value=False):
+            self.assertIsNone(ai_service._make_gemini_request('oi'))
+        with patch.object(ai_service.executor, 'generate', side_effect=LLMQueueFullError('cheio')):
+            self.assertIsNone(ai_service._make_gemini_request('oi'))
+        self.assertEqual(ai_service.get_quota_usage(), {'Minute': 0, 'Daily': 0})
+
+        self.assertEqual(ai_service._make_gemini_request('oi'), 'Olá! Bora treinar?')
+        self.assertEqual(ai_service.get_quota_usage(), {'Minute': 1, 'Daily': 1})
+
+
+    def test_rate_limit_error_does_not_disable_service(self):
+        with patch('apps.recommendations.services.ai_service.get_llm_provider', return_value=self.stub):
+            ai_service = AIService()
+
+        with patch.object(ai_service.executor, 'generate', side_effect=Exception('429 rate limit exceeded')):
+            self.assertIsNone(ai_service._make_gemini_request('oi'))
+        # Sem flag global: quem decide é o circuit breaker do provedor
+        self.assertTrue(ai_service.is_available)
+        self.assertEqual(ai_service._make_gemini_request('oi'), 'Olá! Bora treinar?')
+
+
+class PromptRegistryTest(TestCase):
+    """Prompts com prefixo fixo: render, cache de prefixo no stub e estatísticas por template"""
+
+    def setUp(self):
+        self.registry = PromptRegistry()
+        self.template = self.registry.register(
+            'teste', prefix='Você é um personal trainer. Responda em JSON {"a": 1}.\n',
+            suffix='Nome: {name} | IMC: {bmi:.1f}'
+        )
+
+    def test_render_keeps_static_prefix(self):
+        prompt = self.registry.render('teste', name='Ana', bmi=22.345)
+        self.assertIsInstance(prompt, RenderedPrompt)
+        self.assertEqual(prompt, 'Você é um personal trainer. Responda em JSON {"a": 1}.\nNome: Ana | IMC: 22.3')
+        self.assertEqual(prompt.prefix, self.template.prefix)
+        self.assertEqual(prompt.extend('!').suffix, 'Nome: Ana | IMC: 22.3!')
+        with self.assertRaises(KeyError):
+            self.template.render(name='Ana')
+
+    def test_stub_reuses_cached_prefix(self):
+        stub = LocalStubProvider(responses_path='', latency_ms=0, jitter_ms=0)
+        first = self.template.render(name='Ana', bmi=22.0)
+        second = self.template.render(name='Bruno', bmi=27.0)
+        self.assertEqual(stub._prefix_factor(first), 1.0)
+        self.assertLess(stub._prefix_factor(second), 1.0)
+        self.assertEqual(stub._prefix_factor('texto sem template'), 1.0)
+        self.assertEqual(stub.prefix_cache_status(), {'entries': 1, 'hits': 1, 'misses': 1})
+
+    def test_ai_service_records_size_and_latency_per_template(self):
+        stub = LocalStubProvider(responses_path='', latency_ms=0, jitter_ms=0)
+        with patch('apps.recommendations.services.ai_service.get_llm_provider', return_value=stub), \
+                patch('apps.recommendations.services.ai_service.prompts', self.registry):
+            ai_service = AIService()
+            ai_service._make_gemini_request(self.template.render(name='Ana', bmi=22.0))
+            ai_service._make_gemini_request('prompt solto')
+
+        stats = self.registry.stats()['teste']
+        self.assertEqual((stats['renders'], stats['requests']), (1, 1))
+        self.assertGreater(stats['prompt_tokens_p50'], stats['suffix_tokens_p50'])
+        self.assertIsNotNone(stats['latency_p50_ms'])
+
+
+class LLMExecutorTest(TestCase):
+    """Executor: deadline, retry com jitter, hedge e limite de chamadas simultâneas"""
+
+    class FakeProvider(LocalStubProvider):
+        def __init__(self, delays, errors=(), honor_timeout=False):
+            super().__init__(responses_path='', latency_ms=0, jitter_ms=0)
+            self.delays = list(delays)
+            self.errors = list(errors)
+            self.honor_timeout = honor_timeout
+            self.calls = 0
+            self.active = 0
+            self.max_active = 0
+            self._lock = threading.Lock()
+
+        def generate(self, prompt, timeout=None, **generation_config):
+            with self._lock:
+                index = self.calls
+                self.calls += 1
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+            try:
+                delay = self.delays[min(index, len(self.delays) - 1)]
+                if self.honor_timeout and timeout is not None and delay > timeout:
+                    # Como o SDK: DeadlineExceeded logo depois do timeout da chamada
+                    time.sleep(timeout + 0.02)
+                    raise TimeoutError('deadline exceeded')
+                time.sleep(delay)
+                if index < len(self.errors) and self.errors[index]:
+                    raise self.errors[index]
+                return f'resposta {index}'
+            finally:
+                with self._lock:
+                    self.active -= 1
+
+    def _executor(self, provider, **options):
+        options.setdefault('retry_delay', 0.01)
+        options.setdefault('hedge_after_ms', -1)
+        return LLMExecutor(provider, **options)
+
+    def test_deadline_frees_the_caller(self):
+        executor = self._executor(self.FakeProvider([1.0]), timeout=0.1)
+        started = time.monotonic()
+        with self.assertRaises(LLMTimeoutError):
+            executor.generate('lento')
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(executor.stats.snapshot()['timeouts'], 1)
+
+    def test_retries_transient_errors_only(self):
+        provider = self.FakeProvider([0], errors=[Exception('503 Service Unavailable')])
+        result = self._executor(provider).generate('oi')
+        self.assertEqual((result.text, result.attempts), ('resposta 1', 2))
+
+        provider = self.FakeProvider([0], errors=[ValueError('prompt inválido')])
+        with self.assertRaises(ValueError):
+            self._executor(provider).generate('oi')
+        self.assertEqual(provider.calls, 1)
+
+    def test_hedge_wins_over_slow_call(self):
+        executor = self._executor(self.FakeProvider([0.5, 0.01]), hedge_after_ms=50, timeout=2)
+        result = executor.generate('cauda')
+        self.assertEqual(result.text, 'resposta 1')
+        self.assertTrue(result.hedged)
+        self.assertLess(result.latency_ms, 400)
+        self.assertEqual(executor.stats.snapshot()['hedge_wins'], 1)
+
+    def test_long_call_without_hedge_uses_own_deadline(self):
+        provider = self.FakeProvider([0.3, 0.01])
+        executor = self._executor(provider, hedge_after_ms=50, timeout=0.1)
+        result = executor.generate('plano longo', timeout=2, hedge=False)
+        self.assertEqual(result.text, 'resposta 0')
+        self.assertFalse(result.hedged)
+        self.assertEqual(provider.calls, 1)
+
+    def test_hung_calls_give_their_slots_back(self):
+        provider = self.FakeProvider([5.0], honor_timeout=True)
+        executor = self._executor(provider, max_in_flight=2, queue_timeout=0.05, timeout=0.1, max_retries=0)
+        for _ in range(4):
+            with self.assertRaises(LLMTimeoutError):
+                executor.generate('travada')
+            time.sleep(0.05)
+
+        self.assertEqual(executor.stats.snapshot()['in_flight'], 0)
+        self.assertEqual(executor.stats.snapshot()['rejected'], 0)
+
+    def test_in_flight_is_bounded(self):
+        provider = self.FakeProvider([0.05])
+        executor = self._executor(provider, max_in_flight=2, queue_timeout=5)
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            results = list(pool.map(lambda i: executor.generate(f'p{i}'), range(6)))
+        self.assertEqual(len(results), 6)
+        self.assertEqual(provider.max_active, 2)
+        self.assertGreater(max(result.queue_wait_ms for result in results), 0)
+
+    def test_async_and_stream(self):
+        executor = self._executor(LocalStubProvider(responses_path='', latency_ms=0, jitter_ms=0))
+        result = asyncio.run(executor.agenerate('oi'))
+        self.assertEqual(result.text, ''.join(executor.stream('oi')))
+
+
+class RateLimitUserDecoratorTest(TestCase):
+    """rate_limit_user: 429 após o limite, headers e respostas de erro não contam"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(username='rl_user')
+
+    def test_limits_successful_requests_only(self):
+        from rest_framework.decorators import api_view
+        from rest_framework.response import Response
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from .views import rate_limit_user
+
+        @api_view(['GET'])
+        @rate_limit_user(max_requests_per_hour=2)
+        def view(request):
+            return Response({}, status=int(request.GET.get('status', 200)))
+
+        factory = APIRequestFactory()
+
+        def call(status_code=200):
+            request = factory.get('/', {'status': status_code})
+            force_authenticate(request, user=self.user)
+            return view(request)
+
+        self.assertEqual(call(500).status_code, 500)
+        first = call()
+        self.assertEqual(first['X-RateLimit-Hourly-Remaining'], '1')
+        self.assertEqual(call()['X-RateLimit-Hourly-Remaining'], '0')
+        blocked = call()
+        self.assertEqual(blocked.status_code, 429)
+        self.assertEqual(blocked.data['current_usage']['hourly'], 2)
+
+
+class CollaborativeFilteringTest(TestCase):
+    """Índice item-item esparso e consulta vetorizada"""
+
+    def setUp(self):
+        self.workouts = [
+            Workout.objects.create(name=f'Treino {i}', description='teste') for i in range(4)
+        ]
+        self.users = [User.objects.create_user(username=f'cf_user_{i}') for i in range(4)]
+
+        # Quem faz o treino 0 também faz o treino 1; o treino 3 é isolado
+        for user in self.users[:3]:
+            self._complete(user, self.workouts[0], rating=5)
+            self._complete(user, self.workouts[1], rating=4)
+        self._complete(self.users[3], self.workouts[2])
+        self._complete(self.users[3], self.workouts[3])
+
+        self.target = User.objects.create_user(username='cf_target')
+        self._complete(self.target, self.workouts[0])
+        collaborative.set_index(None)
+
+    def tearDown(self):
+        collaborative.set_index(None)
+
+    def _complete(self, user, workout, rating=None):
+        WorkoutSession.objects.create(user=user, workout=workout, completed=True, user_rating=rating)
+
+    def test_top_k_keeps_largest_entries(self):
+        from scipy import sparse
+
+        matrix = sparse.csr_matrix(np.array([[0.1, 0.9, 0.5, 0.0], [0.3, 0.0, 0.0, 0.2]], dtype=np.float32))
+        pruned = collaborative.top_k_per_row(matrix, 1).toarray()
+        np.testing.assert_allclose(pruned, [[0, 0.9, 0, 0], [0.3, 0, 0, 0]], rtol=1e-6)
+
+    def test_recommends_co_completed_workout(self):
+        collaborative.set_index(collaborative.build_index())  # gerado offline em produção
+        scored = collaborative.recommend(self.target, limit=3)
+
+        self.assertEqual(scored[0][0], self.workouts[1].id)
+        self.assertNotIn(self.workouts[0].id, [workout_id for workout_id, _ in scored])
+        self.assertNotIn(self.workouts[3].id, [workout_id for workout_id, _ in scored])
+
+    def test_index_roundtrip_and_cold_start(self):
+        import os
+        import tempfile
+
+        index = collaborative.build_index(k=2)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = collaborative.save_index(index, os.path.join(tmp, 'cf.npz'))
+            loaded = collaborative.load_index(path)
+
+        np.testing.assert_array_equal(loaded.workout_ids, index.workout_ids)
+        self.assertEqual(loaded.neighbours.nnz, index.neighbours.nnz)
+
+        collaborative.set_index(loaded)
+        new_user = User.objects.create_user(username='cf_cold')
+        self.assertEqual(collaborative.recommend(new_user, limit=3), [])
+
+
+    def test_stale_or_missing_index_is_served_without_rebuild(self):
+        import os
+        import tempfile
+
+        stale = collaborative.build_index(k=2)
+        stale.built_at -= 3600
+        with tempfile.TemporaryDirectory() as tmp, \
+                override_settings(CF_INDEX_PATH=os.path.join(tmp, 'cf.npz'), CF_INDEX_MAX_AGE=60), \
+                patch.object(collaborative, 'build_index') as build:
+            # Sem arquivo: colaborativo vazio, com aviso
+            with self.assertLogs(collaborative.logger, 'WARNING'):
+                self.assertEqual(collaborative.recommend(self.target, limit=3), [])
+
+            # Vencido: continua servindo o índice antigo
+            collaborative.set_index(stale)
+            with self.assertLogs(collaborative.logger, 'WARNING'):
+                self.assertIs(collaborative.get_index(), stale)
+            self.assertEqual(collaborative.recommend(self.target, limit=3)[0][0], self.workouts[1].id)
+
+        build.assert_not_called()
+
+class BatchRecommendationTest(TestCase):
+    """Lote offline: top-N gravado com bulk_create e servido pela API"""
+
+    def setUp(self):
+        from apps.users.models import UserProfile
+
+        self.users = [User.objects.create_user(username=f'batch_user_{i}') for i in range(3)]
+        for user in self.users:
+            UserProfile.objects.create(user=user, goal='lose_weight', activity_level='sedentary')
+        self.cardio = [
+            Workout.objects.create(name=f'Cardio {i}', description='teste', difficulty_level='beginner',
+                                   workout_type='cardio', estimated_duration=20)
+            for i in range(4)
+        ]
+        Workout.objects.create(name='Força avançada', description='teste', difficulty_level='advanced',
+                               workout_type='strength', estimated_duration=60)
+        collaborative.set_index(None)
+
+    def tearDown(self):
+        collaborative.set_index(None)
+
+    def test_content_scores_match_engine_rules(self):
+        from .services.content_features import load_catalog_features, score_catalog
+        from .services.recommendation_engine import RecommendationEngine
+        from apps.users.models import UserProfile
+
+        catalog = load_catalog_features()
+        profile = UserProfile.objects.get(user=self.users[0])
+        engine = RecommendationEngine()
+        for goal, level in [('lose_weight', 'sedentary'), ('gain_muscle', 'very_active'), (None, 'moderate')]:
+            profile.goal, profile.activity_level = goal, level
+            scores, eligible = score_catalog(catalog, goal, level)
+            for position, workout in enumerate(Workout.objects.filter(id__in=catalog.ids).order_by('id')):
+                self.assertAlmostEqual(scores[position], engine._calculate_workout_score(self.users[0], workout, profile))
+        scores, eligible = score_catalog(catalog, 'lose_weight', 'sedentary')
+        self.assertEqual(eligible.sum(), 4)
+
+    def test_batch_writes_top_n_and_api_serves_rows(self):
+        from rest_framework.test import APIClient
+        from .models import Recommendation
+        from .services.batch_recommender import run_batch
+
+        WorkoutSession.objects.create(user=self.users[0], workout=self.cardio[0], completed=True)
+
+        report = run_batch([user.id for user in self.users], limit=2)
+        self.assertEqual(report.users, 3)
+        self.assertEqual(Recommendation.objects.filter(expira_em__isnull=False).count(), 6)
+        recommended = Recommendation.objects.filter(usuario=self.users[0]).values_list('workout_recomendado_id', flat=True)
+        self.assertNotIn(self.cardio[0].id, recommended)
+
+        # Um novo lote substitui o anterior (que fica só no histórico)
+        run_batch([self.users[0].id], limit=2)
+        self.assertEqual(len(self._active(self.users[0])), 2)
+
+        client = APIClient()
+        client.force_authenticate(user=self.users[0])
+        response = client.get('/api/v1/recommendations/personalized/', {'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['metadata']['precomputed'])
+        self.assertEqual(
+            {r['recommendation_id'] for r in response.data['personalized_recommendations']},
+            {rec.id for rec in self._active(self.users[0])}
+        )
+
+    def test_chunk_history_uses_index_weights(self):
+        from .services.batch_recommender import _load_chunk
+
+        WorkoutSession.objects.create(user=self.users[0], workout=self.cardio[0], completed=True, user_rating=5)
+        WorkoutSession.objects.create(user=self.users[0], workout=self.cardio[0], completed=True)
+        _, _, history = _load_chunk([self.users[0].id])
+
+        expected = collaborative.interaction_weight(np.array([5.0, np.nan])).sum()
+        self.assertAlmostEqual(history[self.users[0].id][self.cardio[0].id], float(expected), places=5)
+
+    def _active(self, user):
+        from .services.batch_recommender import stored_recommendations
+        return stored_recommendations(user, 10)
+
+
+class ParallelRunnerTest(TestCase):
+    """Modo paralelo: token bucket compartilhado, checkpoint/resume e relatório"""
+
+    def test_token_bucket_limits_burst(self):
+        from .services.parallel_runner import SharedTokenBucket
+
+        bucket = SharedTokenBucket(rate_per_minute=60, capacity=2)
+        self.assertTrue(bucket.acquire(timeout=0))
+        self.assertTrue(bucket.acquire(timeout=0))
+        self.assertFalse(bucket.acquire(timeout=0))
+        self.assertGreater(bucket.try_acquire(), 0)
+
+    def test_resume_skips_checkpointed_users_and_retries_errors(self):
+        import os
+        import tempfile
+        from .services import parallel_runner
+
+        def fake_process_user(user_id, algorithm, limit, force_refresh):
+            if user_id == 3:
+                return (user_id, parallel_runner.STATUS_ERROR, 0, 0.01, 'falhou')
+            return (user_id, parallel_runner.STATUS_SUCCESS, limit, 0.01 * user_id, '')
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'run.ckpt')
+            with patch.object(parallel_runner, '_process_user', side_effect=fake_process_user) as mocked:
+                report = parallel_runner.run_parallel(
+                    [1, 2, 3, 4], limit=2, concurrency=2, checkpoint_path=path, chunk_size=3
+                )
+                self.assertEqual((report.users, report.succeeded, report.errors), (4, 3, 1))
+                self.assertEqual(report.recommendations, 6)
+                self.assertAlmostEqual(report.p95, float(np.percentile([0.01, 0.02, 0.01, 0.04], 95)))
+
+                mocked.reset_mock()
+                resumed = parallel_runner.run_parallel(
+                    [1, 2, 3, 4], limit=2, checkpoint_path=path, resume=True
+                )
+                self.assertEqual(resumed.resumed, 3)
+                self.assertEqual([c.args[0] for c in mocked.call_args_list], [3])
+
+    def test_checkpoint_cleared_after_complete_run(self):
+        import os
+        import tempfile
+        from .services import parallel_runner
+
+        def fake_process_user(user_id, algorithm, limit, force_refresh):
+            return (user_id, parallel_runner.STATUS_SUCCESS, limit, 0.01, '')
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'run.ckpt')
+            with patch.object(parallel_runner, '_process_user', side_effect=fake_process_user) as mocked:
+                parallel_runner.run_parallel([1, 2], limit=2, checkpoint_path=path)
+                self.assertFalse(os.path.exists(path))
+
+                # Checkpoint antigo que já cobre todos: avisa em vez de terminar calado
+                parallel_runner.Checkpoint(path).mark([1, 2])
+                mocked.reset_mock()
+                with self.assertLogs(parallel_runner.logger, 'WARNING'):
+                    report = parallel_runner.run_parallel([1, 2], limit=2, checkpoint_path=path, resume=True)
+                self.assertEqual((report.resumed, report.users), (2, 0))
+                mocked.assert_not_called()
+
+
+class ContentFeaturesTest(TestCase):
+    """Score de conteúdo vetorizado: catálogo inteiro avaliado e cache por versão"""
+
+    def setUp(self):
+        from apps.users.models import UserProfile
+        from .services import content_features
+
+        content_features.reset_catalog_features()
+        self.user = User.objects.create_user(username='content_user')
+        UserProfile.objects.create(user=self.user, goal='gain_muscle', activity_level='moderate',
+                                   focus_areas='Peito, Costas')
+        for i in range(6):
+            Workout.objects.create(name=f'Força {i}', description='teste', difficulty_level='beginner',
+                                   workout_type='strength', estimated_duration=40)
+        # Melhor candidato criado por último (antes ficava fora do corte limit*2)
+        self.best = Workout.objects.create(name='Peito e costas', description='teste',
+                                           difficulty_level='intermediate', workout_type='strength',
+                                           estimated_duration=40, target_muscle_groups='peito,costas',
+                                           equipment_needed='halteres')
+
+    def tearDown(self):
+        from .services import content_features
+        content_features.reset_catalog_features()
+
+    def test_best_workout_found_beyond_first_rows(self):
+        from .services.recommendation_engine import RecommendationEngine
+
+        recommendations = RecommendationEngine()._content_based_recommendations(self.user, 2)
+        self.assertEqual(len(recommendations), 2)
+        self.assertEqual(recommendations[0]['workout_id'], self.best.id)
+        self.assertEqual(recommendations[0]['confidence_score'], 1.0)
+
+    def test_encoding_rebuilt_when_catalog_changes(self):
+        from .services import content_features
+
+        features = content_features.get_catalog_features()
+        self.assertIs(content_features.get_catalog_features(), features)
+        self.assertIn('equipment:halteres', features.columns)
+
+        Workout.objects.create(name='Yoga', description='teste', difficulty_level='beginner',
+                               workout_type='yoga', estimated_duration=20)
+        rebuilt = content_features.get_catalog_features()
+        self.assertIsNot(rebuilt, features)
+        self.assertEqual(len(rebuilt), len(features) + 1)
+
+
+class SaveRecommendationsTest(TestCase):
+    """Persistência em lote: pares já recomendados no último dia são ignorados"""
+
+    def test_dedup_in_one_query_and_one_insert(self):
+        from .models import Recommendation
+        from .services.recommendation_engine import RecommendationEngine
+
+        user = User.objects.create_user(username='save_user')
+        workouts = [
+            Workout.objects.create(name=f'Treino {i}', description='teste', workout_type='cardio')
+            for i in range(4)
+        ]
+        Recommendation.objects.create(usuario=user, workout_recomendado=workouts[0], algoritmo_utilizado='hybrid',
+                                      score_confianca=0.5, motivo_recomendacao='antiga')
+        recs = [
+            {'workout_id': w.id, 'confidence_score': 0.8, 'reason': 'nova'}
+            for w in workouts + [workouts[1]]
+        ]
+
+        engine = RecommendationEngine()
+        with self.assertNumQueries(2):
+            engine._save_recommendations(user, recs, 'hybrid')
+
+        self.assertEqual(Recommendation.objects.filter(usuario=user).count(), 4)
+        self.assertEqual(Recommendation.objects.get(workout_recomendado=workouts[0]).motivo_recomendacao, 'antiga')
+
+
+class HybridUserContextTest(TestCase):
+    """Híbrido: contexto carregado uma vez, ranking único e tempos por etapa"""
+
+    def setUp(self):
+        from apps.users.models import UserProfile
+        from .services import content_features
+
+        content_features.reset_catalog_features()
+        collaborative.set_index(None)
+        self.user = User.objects.create_user(username='hybrid_user')
+        UserProfile.objects.create(user=self.user, goal='lose_weight', activity_level='sedentary')
+        self.workouts = [
+            Workout.objects.create(name=f'Cardio {i}', description='teste', difficulty_level='beginner',
+                                   workout_type='cardio', estimated_duration=20)
+            for i in range(4)
+        ]
+        WorkoutSession.objects.create(user=self.user, workout=self.workouts[0], completed=True)
+        collaborative.set_index(collaborative.build_index())  # gerado offline em produção
+
+    def tearDown(self):
+        from .services import content_features
+        content_features.reset_catalog_features()
+        collaborative.set_index(None)
+
+    def test_history_matches_collaborative_weights(self):
+        from .services.user_context import UserContext
+
+        WorkoutSession.objects.create(user=self.user, workout=self.workouts[1], completed=True, user_rating=2)
+        self.assertEqual(UserContext.load(self.user).history, collaborative.user_history(self.user))
+
+    def test_profile_and_sessions_loaded_once(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .services.recommendation_engine import RecommendationEngine
+
+        engine = RecommendationEngine()
+        with patch.object(type(engine.ai_service), 'is_available', new=False), \
+                CaptureQueriesContext(connection) as queries:
+            recommendations = engine.generate_recommendations(self.user, 'hybrid', limit=3)
+
+        tables = [q['sql'] for q in queries.captured_queries]
+        self.assertEqual(sum('"users_userprofile"' in sql and sql.startswith('SELECT') for sql in tables), 1)
+        self.assertEqual(sum(sql.startswith('SELECT') and 'FROM "workouts_workoutsession"' in sql for sql in tables), 1)
+
+        self.assertEqual(len(recommendations), 3)
+        self.assertNotIn(self.workouts[0].id, [rec['workout_id'] for rec in recommendations])
+        self.assertTrue(all(rec['algorithm_used'] == 'hybrid' for rec in recommendations))
+        self.assertTrue({'context', 'content', 'collaborative', 'ranking', 'save'} <= set(engine.last_timings))
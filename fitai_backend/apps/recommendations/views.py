@@ -12,72 +12,72 @@ from functools import wraps
 
 from .models import Recommendation
 from .services.recommendation_engine import RecommendationEngine
-from .services.ai_service import AIService
+from .services.ai_service import get_ai_service
+from .services.batch_recommender import stored_recommendations
 from apps.users.models import UserProfile
 from apps.workouts.models import Workout, WorkoutSession
+from apps.exercises.catalog_cache import get_or_build
+from apps.core import rate_limit
 
 import logging
 import time
 
 logger = logging.getLogger(__name__)
 
+USER_AI_SCOPE = 'user_ai'
+
 
 def rate_limit_user(max_requests_per_hour=20, max_requests_per_day=100):
     """
-    Decorator para rate limiting por usuário
+    Decorator para rate limiting por usuário (contadores atômicos de
+    apps.core.rate_limit; só requisições bem-sucedidas contam)
     """
+    windows = (rate_limit.hourly(max_requests_per_hour), rate_limit.daily(max_requests_per_day))
+    
     def decorator(view_func):
         @wraps(view_func)
         def wrapper(request, *args, **kwargs):
             if not request.user.is_authenticated:
                 return view_func(request, *args, **kwargs)
             
-            user_id = request.user.id
-            now = datetime.now()
-            
-            # Chaves de rate limiting
-            hourly_key = f"user_ai_requests_{user_id}_{now.strftime('%Y%m%d%H')}"
-            daily_key = f"user_ai_requests_{user_id}_{now.strftime('%Y%m%d')}"
-            
-            # Verificar limites
-            hourly_requests = cache.get(hourly_key, 0)
-            daily_requests = cache.get(daily_key, 0)
+            # Reserva a vaga antes de executar: sem corrida entre verificar e contar
+            limit = rate_limit.hit(USER_AI_SCOPE, request.user.id, windows)
+            current_usage = {
+                'hourly': limit.usage['Hourly'],
+                'daily': limit.usage['Daily']
+            }
             
-            if hourly_requests >= max_requests_per_hour:
+            if limit.exceeded is windows[0]:
                 return Response({
                     'error': 'Rate limit excedido',
                     'message': f'Máximo de {max_requests_per_hour} requisições por hora',
-                    'retry_after': 3600 - (now.minute * 60 + now.second),
-                    'current_usage': {
-                        'hourly': hourly_requests,
-                        'daily': daily_requests
-                    }
-                }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+                    'retry_after': limit.retry_after,
+                    'current_usage': current_usage
+                }, status=status.HTTP_429_TOO_MANY_REQUESTS, headers=limit.headers())
             
-            if daily_requests >= max_requests_per_day:
+            if limit.exceeded is windows[1]:
                 return Response({
                     'error': 'Rate limit diário excedido',
                     'message': f'Máximo de {max_requests_per_day} requisições por dia',
-                    'retry_after': 86400 - (now.hour * 3600 + now.minute * 60 + now.second),
-                    'current_usage': {
-                        'hourly': hourly_requests,
-                        'daily': daily_requests
-                    }
-                }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+                    'retry_after': limit.retry_after,
+                    'current_usage': current_usage
+                }, status=status.HTTP_429_TOO_MANY_REQUESTS, headers=limit.headers())
             
             # Executar view
-            response = view_func(request, *args, **kwargs)
+            try:
+                response = view_func(request, *args, **kwargs)
+            except Exception:
+                rate_limit.refund(limit)
+                raise
             
-            # Atualizar contadores apenas se a requisição foi bem-sucedida
-            if 200 <= response.status_code < 300:
-                cache.set(hourly_key, hourly_requests + 1, 3600)
-                cache.set(daily_key, daily_requests + 1, 86400)
-                
-                # Adicionar headers de rate limiting
-                response['X-RateLimit-Hourly-Limit'] = str(max_requests_per_hour)
-                response['X-RateLimit-Hourly-Remaining'] = str(max_requests_per_hour - hourly_requests - 1)
-                response['X-RateLimit-Daily-Limit'] = str(max_requests_per_day)
-                response['X-RateLimit-Daily-Remaining'] = str(max_requests_per_day - daily_requests - 1)
+            # Só requisições bem-sucedidas consomem o limite
+            if not 200 <= response.status_code < 300:
+                rate_limit.refund(limit)
+                return response
+            
+            # Adicionar headers de rate limiting
+            for header, value in limit.headers().items():
+                response[header] = value
             
             return response
         return wrapper
@@ -88,7 +88,7 @@ def rate_limit_user(max_requests_per_hour=20, max_requests_per_day=100):
 def test_recommendations_api(request):
     """Teste básico da API de recomendações com status detalhado"""
     try:
-        ai_service = AIService()
+        ai_service = get_ai_service()
     except Exception as e:
         logger.error(f"Error initializing AIService: {e}")
         ai_service = None
@@ -130,12 +130,42 @@ def test_recommendations_api(request):
     return Response(system_status)
 
 
+def _workout_summary(workout):
+    return {
+        'id': workout.id,
+        'name': workout.name,
+        'description': workout.description,
+        'difficulty_level': workout.difficulty_level,
+        'estimated_duration': workout.estimated_duration,
+        'workout_type': workout.workout_type,
+        'target_muscle_groups': workout.target_muscle_groups,
+        'calories_estimate': workout.calories_estimate
+    }
+
+
+def _stored_recommendations_payload(user, limit):
+    """Top-N gravado pelo lote noturno (uma consulta com select_related)"""
+    stored = stored_recommendations(user, limit)
+    return [{
+        'recommendation_id': rec.id,
+        'workout': _workout_summary(rec.workout_recomendado),
+        'ai_analysis': {
+            'confidence_score': rec.score_confianca,
+            'recommendation_reason': rec.motivo_recomendacao,
+            'algorithm_used': rec.algoritmo_utilizado,
+            'personalization_factors': []
+        }
+    } for rec in stored]
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 @rate_limit_user(max_requests_per_hour=50)
 def get_personalized_recommendations(request):
     """
     Recomendações personalizadas com rate limiting e cache inteligente
+    Serve o top-N pré-calculado pelo lote noturno; sem lote válido (ou com
+    ?refresh=true / outro algoritmo) calcula na hora como antes.
     """
     start_time = time.time()
     
@@ -148,50 +178,54 @@ def get_personalized_recommendations(request):
         # Cache key para esta requisição
         cache_key = f"recommendations_{request.user.id}_{algorithm}_{limit}"
         
+        enriched_recommendations = []
+        served_from_store = False
+        stage_timings = {}
+        
+        # Lote pré-calculado (generate_recommendations --batch)
+        if not force_refresh and algorithm == 'hybrid':
+            enriched_recommendations = _stored_recommendations_payload(request.user, limit)
+            served_from_store = bool(enriched_recommendations)
+        
         # Verificar cache (a menos que force_refresh)
-        if not force_refresh:
+        if not served_from_store and not force_refresh:
             cached_recommendations = cache.get(cache_key)
             if cached_recommendations:
                 cached_recommendations['from_cache'] = True
                 cached_recommendations['cache_hit'] = True
                 return Response(cached_recommendations)
         
-        # Gerar recomendações
-        try:
-            recommendation_engine = RecommendationEngine()
-            recommendations = recommendation_engine.generate_recommendations(
-                user=request.user,
-                algorithm=algorithm,
-                limit=limit
-            )
-        except Exception as e:
-            logger.error(f"Error initializing RecommendationEngine: {e}")
-            recommendations = []
-        
-        if not recommendations:
-            return Response({
-                'personalized_recommendations': [],
-                'message': 'Não foi possível gerar recomendações no momento',
-                'suggestion': 'Tente novamente em alguns minutos ou complete mais treinos'
-            }, status=status.HTTP_204_NO_CONTENT)
-        
-        # Enriquecer dados com informações dos treinos
-        enriched_recommendations = []
-        for rec in recommendations:
+        if not served_from_store:
+            # Gerar recomendações
             try:
-                workout = Workout.objects.get(id=rec['workout_id'])
+                recommendation_engine = RecommendationEngine()
+                recommendations = recommendation_engine.generate_recommendations(
+                    user=request.user,
+                    algorithm=algorithm,
+                    limit=limit
+                )
+                stage_timings = recommendation_engine.last_timings
+            except Exception as e:
+                logger.error(f"Error initializing RecommendationEngine: {e}")
+                recommendations = []
+            
+            if not recommendations:
+                return Response({
+                    'personalized_recommendations': [],
+                    'message': 'Não foi possível gerar recomendações no momento',
+                    'suggestion': 'Tente novamente em alguns minutos ou complete mais treinos'
+                }, status=status.HTTP_204_NO_CONTENT)
+            
+            # Enriquecer dados com informações dos treinos (uma consulta)
+            workouts = Workout.objects.in_bulk([rec['workout_id'] for rec in recommendations])
+            for rec in recommendations:
+                workout = workouts.get(rec['workout_id'])
+                if workout is None:
+                    logger.warning(f"Workout {rec['workout_id']} not found")
+                    continue
                 enriched_recommendations.append({
                     'recommendation_id': rec.get('id'),
-                    'workout': {
-                        'id': workout.id,
-                        'name': workout.name,
-                        'description': workout.description,
-                        'difficulty_level': workout.difficulty_level,
-                        'estimated_duration': workout.estimated_duration,
-                        'workout_type': workout.workout_type,
-                        'target_muscle_groups': workout.target_muscle_groups,
-                        'calories_estimate': workout.calories_estimate
-                    },
+                    'workout': _workout_summary(workout),
                     'ai_analysis': {
                         'confidence_score': rec['confidence_score'],
                         'recommendation_reason': rec['reason'],
@@ -199,9 +233,6 @@ def get_personalized_recommendations(request):
                         'personalization_factors': rec.get('personalization_factors', [])
                     }
                 })
-            except Workout.DoesNotExist:
-                logger.warning(f"Workout {rec['workout_id']} not found")
-                continue
         
         # Informações do usuário para contexto
         try:
@@ -220,7 +251,7 @@ def get_personalized_recommendations(request):
         
         # IA Status
         try:
-            ai_service = AIService()
+            ai_service = get_ai_service()
             ai_available = ai_service.is_available
         except Exception:
             ai_available = False
@@ -241,14 +272,17 @@ def get_personalized_recommendations(request):
                 'total_recommendations': len(enriched_recommendations),
                 'generated_at': timezone.now().isoformat(),
                 'response_time_ms': round((time.time() - start_time) * 1000, 2),
-                'from_cache': False
+                'from_cache': False,
+                'precomputed': served_from_store,
+                'stage_timings_ms': stage_timings
             },
             'user_context': user_context,
             'ai_features': ai_features
         }
         
-        # Cache por 30 minutos
-        cache.set(cache_key, response_data, 1800)
+        # Cache por 30 minutos (o lote gravado já é a fonte rápida)
+        if not served_from_store:
+            cache.set(cache_key, response_data, 1800)
         
         return Response(response_data)
         
@@ -688,7 +722,7 @@ def analyze_progress_ai(request):
     
     # Tentar análise com IA
     try:
-        ai_service = AIService()
+        ai_service = get_ai_service()
         if ai_service.is_available:
             ai_analysis = ai_service.analyze_user_progress(profile)
             
@@ -785,7 +819,7 @@ def generate_motivational_message(request):
         
         # Tentar gerar com IA
         try:
-            ai_service = AIService()
+            ai_service = get_ai_service()
             if ai_service.is_available:
                 motivational_message = ai_service.generate_motivational_content(profile, context)
                 
@@ -1227,38 +1261,39 @@ def generate_rule_based_workout(duration, focus, difficulty, profile):
             'quality_score': 75.0
         }
     
-    # Cache para exercícios filtrados
-    cache_key = f"exercises_{focus}_{difficulty}"
-    exercises_query = cache.get(cache_key)
+    def build_exercise_pool():
+        exercises_query = Exercise.objects.all()
+        
+        # Filtro por foco
+        focus_mapping = {
+            'upper': ['chest', 'back', 'shoulders', 'arms'],
+            'lower': ['legs', 'glutes'],
+            'cardio': ['cardio'],
+            'strength': ['chest', 'back', 'legs', 'shoulders'],
+            'full_body': None,  # Inclui todos
+            'flexibility': ['flexibility', 'stretching']
+        }
+        
+        if focus in focus_mapping and focus_mapping[focus]:
+            exercises_query = exercises_query.filter(muscle_group__in=focus_mapping[focus])
+        
+        # Filtro por dificuldade
+        if difficulty == 'beginner':
+            exercises_query = exercises_query.filter(difficulty_level='beginner')
+        elif difficulty == 'intermediate':
+            exercises_query = exercises_query.filter(difficulty_level__in=['beginner', 'intermediate'])
+        
+        # Apenas os campos usados (dicts, não instâncias de model)
+        return list(exercises_query.values('name', 'muscle_group', 'instructions')[:12])
     
-    if not exercises_query:
-        try:
-            exercises_query = Exercise.objects.all()
-            
-            # Filtro por foco
-            focus_mapping = {
-                'upper': ['chest', 'back', 'shoulders', 'arms'],
-                'lower': ['legs', 'glutes'],
-                'cardio': ['cardio'],
-                'strength': ['chest', 'back', 'legs', 'shoulders'],
-                'full_body': None,  # Inclui todos
-                'flexibility': ['flexibility', 'stretching']
-            }
-            
-            if focus in focus_mapping and focus_mapping[focus]:
-                exercises_query = exercises_query.filter(muscle_group__in=focus_mapping[focus])
-            
-            # Filtro por dificuldade
-            if difficulty == 'beginner':
-                exercises_query = exercises_query.filter(difficulty_level='beginner')
-            elif difficulty == 'intermediate':
-                exercises_query = exercises_query.filter(difficulty_level__in=['beginner', 'intermediate'])
-            
-            exercises_query = list(exercises_query[:12])
-            cache.set(cache_key, exercises_query, 3600)  # Cache por 1 hora
-        except Exception as e:
-            logger.error(f"Error querying exercises: {e}")
-            exercises_query = []
+    # Cache versionado do catálogo: invalidado quando exercícios mudam
+    try:
+        exercises_query = get_or_build(
+            'rule_based_exercises', {'focus': focus, 'difficulty': difficulty}, build_exercise_pool
+        )
+    except Exception as e:
+        logger.error(f"Error querying exercises: {e}")
+        exercises_query = []
     
     # Se não conseguiu buscar exercícios, usar fallback
     if not exercises_query:
@@ -1286,12 +1321,12 @@ def generate_rule_based_workout(duration, focus, difficulty, profile):
         
         workout_exercises.append({
             'order': i,
-            'name': exercise.name,
-            'muscle_group': exercise.muscle_group,
+            'name': exercise['name'],
+            'muscle_group': exercise['muscle_group'],
             'sets': sets,
             'reps': reps,
             'rest_seconds': rest,
-            'instructions': exercise.instructions or 'Execute com controle e boa forma',
+            'instructions': exercise['instructions'] or 'Execute com controle e boa forma',
             'modifications': f'Ajuste intensidade: {difficulty}',
             'safety_tips': 'Pare se sentir dor. Mantenha respiração controlada.'
         })
@@ -1544,7 +1579,7 @@ def get_daily_ai_recommendation(request):
             title = "🎯 Foco Total"
         
         # Gerar mensagem motivacional
-        ai_service = AIService()
+        ai_service = get_ai_service()
         
         if ai_service.is_available:
             motivational_message = ai_service.generate_motivational_content(
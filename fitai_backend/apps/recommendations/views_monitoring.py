@@ -12,13 +12,17 @@ from django.contrib.auth.models import User
 from django.utils import timezone
 from django.db.models import Count, Avg, Q
 from django.core.cache import cache
+from django.conf import settings
 from datetime import datetime, timedelta
 import json
 
 from .models import Recommendation
-from .services.ai_service import AIService
+from .services.ai_service import get_ai_service
 from .services.recommendation_engine import RecommendationEngine
+from .views import USER_AI_SCOPE
+from apps.core import rate_limit
 from apps.users.models import UserProfile
+from apps.workouts import analytics
 from apps.workouts.models import WorkoutSession, ExerciseLog
 
 
@@ -29,7 +33,7 @@ def ai_status_check(request):
     Status rápido do sistema de IA para usuários
     Endpoint público para verificar disponibilidade
     """
-    ai_service = AIService()
+    ai_service = get_ai_service()
     
     # Status básico
     status_info = {
@@ -44,8 +48,9 @@ def ai_status_check(request):
     }
     
     # Rate limits do usuário (sem expor detalhes internos)
-    rate_limit_key = f"user_ai_requests_{request.user.id}_{datetime.now().strftime('%Y%m%d%H')}"
-    user_requests_this_hour = cache.get(rate_limit_key, 0)
+    user_requests_this_hour = rate_limit.peek(
+        USER_AI_SCOPE, request.user.id, (rate_limit.hourly(20),)
+    )['Hourly']
     
     status_info['user_limits'] = {
         'requests_this_hour': user_requests_this_hour,
@@ -83,7 +88,7 @@ def ai_admin_dashboard(request):
     thirty_days_ago = timezone.now() - timedelta(days=30)
     seven_days_ago = timezone.now() - timedelta(days=7)
     
-    ai_service = AIService()
+    ai_service = get_ai_service()
     
     # 1. Status geral do sistema
     system_status = {
@@ -218,7 +223,7 @@ def trigger_ai_maintenance(request):
     
     elif action == 'refresh_stats':
         # Recalcular estatísticas
-        ai_service = AIService()
+        ai_service = get_ai_service()
         stats = ai_service.get_api_usage_stats()
         return Response({
             'action': 'refresh_stats',
@@ -229,7 +234,7 @@ def trigger_ai_maintenance(request):
     
     elif action == 'test_api':
         # Testar conectividade da API
-        ai_service = AIService()
+        ai_service = get_ai_service()
         connection_test = ai_service._test_api_connection()
         return Response({
             'action': 'test_api',
@@ -283,7 +288,7 @@ def user_ai_insights(request):
         'workout_patterns': {
             'total_workouts': completed_sessions.count(),
             'completion_rate': completed_sessions.count() / user_sessions.count() * 100 if user_sessions.count() > 0 else 0,
-            'avg_duration': completed_sessions.aggregate(Avg('actual_duration'))['actual_duration__avg'] or 0,
+            'avg_duration': completed_sessions.aggregate(Avg('duration_minutes'))['duration_minutes__avg'] or 0,
             'consistency_score': _calculate_user_consistency(request.user, thirty_days_ago)
         },
         'progress_indicators': {
@@ -364,14 +369,16 @@ def _get_recommendation_statistics(thirty_days_ago):
 def _get_performance_metrics():
     """Coleta métricas de performance"""
     # Rate limits atuais
-    ai_service = AIService()
-    rate_limit_data = cache.get(ai_service.rate_limit_cache_key, {"count": 0})
+    ai_service = get_ai_service()
+    quota_usage = ai_service.get_quota_usage()
     
     return {
         'api_rate_limit': {
-            'requests_this_hour': rate_limit_data.get('count', 0),
-            'limit_per_hour': 50,
-            'utilization_percentage': rate_limit_data.get('count', 0) / 50 * 100
+            'requests_this_minute': quota_usage['Minute'],
+            'limit_per_minute': settings.GEMINI_RATE_LIMIT_PER_MINUTE,
+            'requests_today': quota_usage['Daily'],
+            'limit_per_day': settings.GEMINI_RATE_LIMIT_PER_DAY,
+            'utilization_percentage': quota_usage['Minute'] / max(1, settings.GEMINI_RATE_LIMIT_PER_MINUTE) * 100
         },
         'cache_status': {
             'cache_backend': 'redis' if 'redis' in str(cache._cache) else 'memory',
@@ -427,8 +434,8 @@ def _get_system_alerts(ai_service):
         })
     
     # Verificar rate limits
-    rate_limit_data = cache.get(ai_service.rate_limit_cache_key, {"count": 0})
-    if rate_limit_data.get('count', 0) > 40:
+    quota_usage = ai_service.get_quota_usage()
+    if quota_usage['Daily'] > settings.GEMINI_RATE_LIMIT_PER_DAY * 0.8:
         alerts.append({
             'level': 'warning',
             'message': 'Rate limit próximo do limite',
@@ -527,24 +534,14 @@ def _calculate_engagement_score(thirty_days_ago):
 
 
 def _calculate_user_consistency(user, start_date):
-    """Calcula score de consistência do usuário"""
-    sessions = WorkoutSession.objects.filter(
-        user=user,
-        created_at__gte=start_date,
-        completed=True
-    ).order_by('completed_at')
+    """Calcula score de consistência do usuário (% de dias do período com treino)"""
+    summary = analytics.summarize_user(user, since=start_date)
     
-    if sessions.count() < 2:
+    if summary.total_workouts < 2:
         return 0
     
-    # Análise simples de consistência baseada na regularidade
-    dates = [s.completed_at.date() for s in sessions]
-    unique_dates = set(dates)
-    
-    days_with_workouts = len(unique_dates)
     total_days = (timezone.now().date() - start_date.date()).days
-    
-    return days_with_workouts / total_days * 100
+    return summary.active_day_ratio(total_days) * 100
 
 
 def _assess_goal_alignment(profile, sessions):
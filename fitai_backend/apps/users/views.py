@@ -428,82 +428,36 @@ def login_user(request):
     })
 
 # ============================================================
-# ANALYTICS - Estatísticas do usuário (SEM MIGRATIONS)
+# ANALYTICS - Estatísticas do usuário (rollup UserTrainingStats)
 # ============================================================
 
 @api_view(['GET'])
 def user_analytics(request):
     """
     Retorna estatísticas completas do usuário
-    USA APENAS WorkoutSession existente - NÃO PRECISA DE MIGRATIONS
+    Lê uma única linha de UserTrainingStats (mantida a cada treino concluído)
     """
     firebase_uid, error_response = verify_firebase_token(request)
     if error_response:
         return error_response
     
     try:
+        from apps.workouts.models import UserTrainingStats
+        
         profile, _ = get_or_create_user_and_profile(firebase_uid)
         user = profile.user
         
-        print(f"📊 Calculando analytics para user_id={user.id}")
+        print(f"📊 Lendo analytics para user_id={user.id}")
         
-        # Importar WorkoutSession
-        try:
-            from workouts.models import WorkoutSession, ExerciseLog
-        except ImportError:
-            print("⚠️ Models de workout não encontrados")
-            return _return_empty_analytics()
-        
-        # Pegar treinos concluídos dos últimos 90 dias
-        ninety_days_ago = timezone.now() - timedelta(days=90)
-        sessions = WorkoutSession.objects.filter(
-            user=user,
-            completed_at__isnull=False,
-            completed_at__gte=ninety_days_ago
-        ).order_by('-completed_at')
-        
-        if not sessions.exists():
-            print("ℹ️ Nenhum treino concluído encontrado")
-            return _return_empty_analytics()
-        
-        # Estatísticas básicas
-        total_workouts = sessions.count()
-        total_duration = sessions.aggregate(total=Sum('duration_minutes'))['total'] or 0
-        total_calories = sessions.aggregate(total=Sum('calories_burned'))['total'] or 0
-        
-        # Dias ativos
-        active_dates = sessions.values_list('completed_at__date', flat=True).distinct()
-        active_days = len(set(active_dates))
-        
-        # Calcular streak
-        current_streak = _calculate_workout_streak_simple(sessions)
-        
-        # Treinos por categoria
-        workouts_by_category = _calculate_workouts_by_category(sessions)
-        
-        # Frequência de grupos musculares
-        muscle_group_frequency = _calculate_muscle_frequency_simple(sessions)
-        
-        # Exercício favorito
-        favorite_exercise, favorite_count = _get_favorite_exercise_simple(user)
-        
-        # Duração média
-        average_duration = float(total_duration / total_workouts) if total_workouts > 0 else 0.0
-        
-        analytics_data = {
-            'total_workouts': total_workouts,
-            'total_duration': total_duration,
-            'total_calories': total_calories,
-            'active_days': active_days,
-            'current_streak': current_streak,
-            'workouts_by_category': workouts_by_category,
-            'muscle_group_frequency': muscle_group_frequency,
-            'favorite_exercise': favorite_exercise,
-            'favorite_exercise_count': favorite_count,
-            'average_duration': round(average_duration, 1),
-        }
+        stats = UserTrainingStats.objects.filter(user=user).first()
+        if stats is None:
+            # Usuário anterior ao rollup: reconstrói uma vez a partir do histórico
+            stats = UserTrainingStats.rebuild_for_user(user)
         
-        print(f"✅ Analytics: {total_workouts} treinos, {active_days} dias ativos")
+        analytics_data = stats.analytics_payload(days=90)
+        
+        print(f"✅ Analytics: {analytics_data['total_workouts']} treinos, "
+              f"{analytics_data['active_days']} dias ativos")
         return Response(analytics_data)
         
     except Exception as e:
@@ -529,82 +483,6 @@ def _return_empty_analytics():
     })
 
 
-def _calculate_workout_streak_simple(sessions):
-    """Calcula streak de dias consecutivos"""
-    try:
-        workout_dates = set(sessions.values_list('completed_at__date', flat=True))
-        if not workout_dates:
-            return 0
-        
-        current_date = timezone.now().date()
-        streak = 0
-        
-        # Verificar se treinou hoje ou ontem (permite 1 dia de descanso)
-        if current_date not in workout_dates and (current_date - timedelta(days=1)) not in workout_dates:
-            return 0
-        
-        # Contar dias consecutivos
-        while current_date in workout_dates:
-            streak += 1
-            current_date = current_date - timedelta(days=1)
-            if streak > 365:  # Limite de segurança
-                break
-        
-        return streak
-        
-    except Exception as e:
-        print(f"⚠️ Erro ao calcular streak: {e}")
-        return 0
-
-
-def _calculate_workouts_by_category(sessions):
-    """Calcula distribuição de treinos por categoria"""
-    category_counts = defaultdict(int)
-    
-    for session in sessions:
-        if session.workout:
-            category = session.workout.workout_type or 'Geral'
-            category_counts[category] += 1
-    
-    return dict(category_counts)
-
-
-def _calculate_muscle_frequency_simple(sessions):
-    """Calcula frequência de grupos musculares"""
-    muscle_frequency = defaultdict(int)
-    
-    for session in sessions:
-        if session.workout and session.workout.target_muscle_groups:
-            groups = [g.strip() for g in session.workout.target_muscle_groups.split(',')]
-            for group in groups:
-                if group:
-                    muscle_frequency[group] += 1
-    
-    return dict(muscle_frequency)
-
-
-def _get_favorite_exercise_simple(user):
-    """Encontra exercício mais realizado"""
-    try:
-        from workouts.models import ExerciseLog
-        
-        exercise_counts = ExerciseLog.objects.filter(
-            session__user=user,
-            status='completed'
-        ).values('exercise__name').annotate(
-            count=Count('id')
-        ).order_by('-count').first()
-        
-        if exercise_counts:
-            return exercise_counts['exercise__name'], exercise_counts['count']
-        
-        return 'Nenhum', 0
-        
-    except Exception as e:
-        print(f"⚠️ Erro ao buscar exercício favorito: {e}")
-        return 'Nenhum', 0
-
-
 # ============================================================
 # PESO - USA current_weight DO UserProfile (SEM MIGRATIONS)
 # ============================================================
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Workout, WorkoutSession
+from .models import Workout, WorkoutSession, UserTrainingStats
 
 admin.site.register(Workout)
-admin.site.register(WorkoutSession)
\ No newline at end of file
+admin.site.register(WorkoutSession)
+admin.site.register(UserTrainingStats)
@@ -0,0 +1,146 @@
+"""
+Consistência, semanas e tendência a partir das datas de conclusão
+
+Cada tela/serviço calculava esses números com suas próprias consultas
+(4 counts por semana no motor de recomendações, 2 para a tendência, sessões
+inteiras carregadas no monitoramento). Aqui:
+- as datas de conclusão de um usuário vêm de uma única consulta
+  (values_list + TruncDate no fuso do projeto; sessões canceladas não contam)
+- semanas, consistência e tendência saem de uma passada com NumPy
+- summarize_users faz o mesmo para muitos usuários com uma consulta só
+
+Streak não é calculado aqui: a fonte única é o rollup UserTrainingStats
+(current_streak/longest_streak e effective_streak), mantido a cada conclusão.
+"""
+import datetime
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import UserTrainingStats, WorkoutSession
+
+DEFAULT_WEEKS = 4
+TREND_DAYS = 14
+
+
+@dataclass
+class TrainingSummary:
+    """Indicadores de regularidade de um usuário"""
+    total_workouts: int = 0
+    active_days: int = 0
+    last_workout_date: Optional[datetime.date] = None
+    weekly_counts: List[int] = field(default_factory=lambda: [0] * DEFAULT_WEEKS)  # índice 0 = últimos 7 dias
+    recent_count: int = 0       # últimos 14 dias
+    previous_count: int = 0     # 14 dias anteriores
+    days: np.ndarray = field(default_factory=lambda: np.array([], dtype=np.int64), repr=False)  # ordinais distintos
+
+    @property
+    def consistency(self) -> float:
+        """Fração das semanas analisadas com pelo menos um treino (0-1)"""
+        if not self.weekly_counts:
+            return 0.0
+        return sum(1 for count in self.weekly_counts if count > 0) / len(self.weekly_counts)
+
+    @property
+    def improvement_trend(self) -> str:
+        """Últimas 2 semanas comparadas com as 2 anteriores"""
+        if self.previous_count == 0:
+            return 'iniciante'
+        if self.recent_count > self.previous_count:
+            return 'melhorando'
+        if self.recent_count == self.previous_count:
+            return 'estável'
+        return 'em declínio'
+
+    def active_day_ratio(self, days: int, today: Optional[datetime.date] = None) -> float:
+        """Dias com treino / dias do período (usado pelo monitoramento)"""
+        if days <= 0:
+            return 0.0
+        age = (today or timezone.localdate()).toordinal() - self.days
+        return int(np.count_nonzero((age >= 0) & (age < days))) / days
+
+
+def weekly_trend(weekly_counts: List[int]) -> str:
+    """Classificação usada pela análise de IA: média das 2 semanas recentes vs 2 anteriores"""
+    if len(weekly_counts) < 3:
+        return 'insuficiente'
+    recent_avg = sum(weekly_counts[:2]) / 2
+    older_avg = sum(weekly_counts[2:]) / len(weekly_counts[2:])
+    if recent_avg > older_avg * 1.2:
+        return 'crescente'
+    if recent_avg < older_avg * 0.8:
+        return 'decrescente'
+    return 'estável'
+
+
+# =============================================================================
+# 📥 DATAS DE CONCLUSÃO
+# =============================================================================
+
+def _completion_rows(user_filter: Dict, since: Optional[datetime.datetime]):
+    queryset = WorkoutSession.objects.filter(
+        completed=True, completed_at__isnull=False, **user_filter
+    ).exclude(
+        notes__contains=UserTrainingStats.CANCEL_NOTE_MARKER
+    )
+    if since is not None:
+        queryset = queryset.filter(completed_at__gte=since)
+    return queryset.annotate(
+        day=TruncDate('completed_at', tzinfo=timezone.get_current_timezone())
+    )
+
+
+def completion_dates(user, since: Optional[datetime.datetime] = None) -> List[datetime.date]:
+    """Datas (locais) de cada treino concluído, uma consulta"""
+    return list(_completion_rows({'user': user}, since).values_list('day', flat=True))
+
+
+def bulk_completion_dates(user_ids: Iterable[int],
+                          since: Optional[datetime.datetime] = None) -> Dict[int, List[datetime.date]]:
+    """Datas de conclusão de vários usuários em uma consulta"""
+    dates: Dict[int, List[datetime.date]] = {}
+    for user_id, day in _completion_rows({'user_id__in': list(user_ids)}, since).values_list('user_id', 'day'):
+        dates.setdefault(user_id, []).append(day)
+    return dates
+
+
+# =============================================================================
+# 🧮 CÁLCULO (uma passada)
+# =============================================================================
+
+def summarize(dates: Iterable[datetime.date], today: Optional[datetime.date] = None,
+              weeks: int = DEFAULT_WEEKS) -> TrainingSummary:
+    today = today or timezone.localdate()
+    ordinals = np.fromiter((day.toordinal() for day in dates if day is not None), dtype=np.int64)
+    summary = TrainingSummary(weekly_counts=[0] * weeks, days=np.unique(ordinals))
+    if not len(ordinals):
+        return summary
+
+    today_ordinal = today.toordinal()
+    age = today_ordinal - ordinals
+    in_weeks = (age >= 0) & (age < weeks * 7)
+    summary.weekly_counts = np.bincount(age[in_weeks] // 7, minlength=weeks).tolist()
+    summary.recent_count = int(np.count_nonzero((age >= 0) & (age < TREND_DAYS)))
+    summary.previous_count = int(np.count_nonzero((age >= TREND_DAYS) & (age < 2 * TREND_DAYS)))
+    summary.total_workouts = len(ordinals)
+
+    summary.active_days = len(summary.days)
+    summary.last_workout_date = datetime.date.fromordinal(int(summary.days[-1]))
+    return summary
+
+
+def summarize_user(user, today: Optional[datetime.date] = None, weeks: int = DEFAULT_WEEKS,
+                   since: Optional[datetime.datetime] = None) -> TrainingSummary:
+    return summarize(completion_dates(user, since), today, weeks)
+
+
+def summarize_users(user_ids: Iterable[int], today: Optional[datetime.date] = None,
+                    weeks: int = DEFAULT_WEEKS,
+                    since: Optional[datetime.datetime] = None) -> Dict[int, TrainingSummary]:
+    """Variante em massa: uma consulta para todos os usuários"""
+    user_ids = list(user_ids)
+    dates = bulk_completion_dates(user_ids, since)
+    return {user_id: summarize(dates.get(user_id, ()), today, weeks) for user_id in user_ids}
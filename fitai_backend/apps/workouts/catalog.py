@@ -0,0 +1,154 @@
+"""
+Camada de consulta do catálogo de treinos
+
+Centraliza as listagens de treinos (catálogo público, recomendados pela IA e
+personalizados do usuário) em consultas únicas:
+- exercise_count vem da coluna desnormalizada (sem N+1 de .count()),
+  recalculada por subquery anotada nos signals de WorkoutExercise
+- leitura via .values() (sem instanciar models nem serializers)
+- paginação por keyset (cursor opaco) em vez de OFFSET
+"""
+import base64
+import json
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Workout, WorkoutExercise
+
+
+# Campos retornados pelas listagens (fast path)
+CATALOG_LIST_FIELDS = (
+    'id', 'name', 'description', 'difficulty_level', 'estimated_duration',
+    'target_muscle_groups', 'equipment_needed', 'workout_type',
+    'calories_estimate', 'exercise_count', 'is_personalized', 'is_recommended',
+    'created_at',
+)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+
+# =============================================================================
+# 🔎 QUERYSETS BASE
+# =============================================================================
+
+def public_catalog_queryset():
+    """Treinos públicos do catálogo (exclui personalizados e treinos de IA)"""
+    return Workout.objects.filter(
+        is_personalized=False,
+        is_recommended=False,
+        is_active=True
+    )
+
+
+def user_recommended_queryset(user):
+    """Treinos gerados pela IA para o usuário"""
+    return Workout.objects.filter(
+        is_recommended=True,
+        is_personalized=True,
+        created_by_user=user,
+        is_active=True
+    )
+
+
+def user_personalized_queryset(user):
+    """Treinos criados manualmente pelo usuário"""
+    return Workout.objects.filter(
+        is_personalized=True,
+        is_recommended=False,
+        created_by_user=user,
+        is_active=True
+    )
+
+
+# =============================================================================
+# 🔢 CONTAGEM DE EXERCÍCIOS
+# =============================================================================
+
+def _exercise_count_subquery():
+    return Coalesce(
+        Subquery(
+            WorkoutExercise.objects.filter(workout=OuterRef('pk'))
+            .order_by().values('workout').annotate(total=Count('id')).values('total'),
+            output_field=IntegerField()
+        ),
+        Value(0)
+    )
+
+
+def refresh_exercise_counts(workout_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Recalcula Workout.exercise_count com um único UPDATE ... SET = (subquery).
+    Sem workout_ids recalcula o catálogo inteiro.
+    """
+    queryset = Workout.objects.all()
+    if workout_ids is not None:
+        queryset = queryset.filter(id__in=list(workout_ids))
+
+    return queryset.update(exercise_count=_exercise_count_subquery())
+
+
+# =============================================================================
+# 📄 PAGINAÇÃO KEYSET
+# =============================================================================
+
+def encode_cursor(values: Sequence) -> str:
+    raw = json.dumps([v.isoformat() if hasattr(v, 'isoformat') else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Optional[List]:
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, TypeError):
+        return None
+
+
+def parse_page_size(value, default: int = DEFAULT_PAGE_SIZE) -> int:
+    try:
+        return max(1, min(int(value), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return default
+
+
+def keyset_page(queryset, ordering: Tuple[str, ...], cursor: Optional[str],
+                limit: int, fields: Sequence[str] = CATALOG_LIST_FIELDS) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Retorna (linhas, próximo_cursor) ordenando por `ordering`.
+    O último campo de `ordering` deve ser único (ex: 'id' / '-id') e nenhum
+    campo pode ser nulo. Todos os campos devem ter a mesma direção.
+    """
+    descending = ordering[0].startswith('-')
+    keys = [field.lstrip('-') for field in ordering]
+
+    queryset = queryset.order_by(*ordering)
+
+    if cursor:
+        values = decode_cursor(cursor)
+        if values and len(values) == len(keys):
+            lookup = 'lt' if descending else 'gt'
+            # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y)
+            condition = Q()
+            for i, key in enumerate(keys):
+                clause = Q(**{f'{key}__{lookup}': values[i]})
+                for previous_key, previous_value in zip(keys[:i], values[:i]):
+                    clause &= Q(**{previous_key: previous_value})
+                condition |= clause
+            queryset = queryset.filter(condition)
+
+    select_fields = list(dict.fromkeys(list(fields) + keys))
+    rows = list(queryset.values(*select_fields)[:limit + 1])
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][key] for key in keys])
+
+    return rows, next_cursor
+
+
+def list_rows(queryset, fields: Sequence[str] = CATALOG_LIST_FIELDS) -> List[Dict]:
+    """Listagem completa (sem paginação) em uma única consulta .values()"""
+    return list(queryset.values(*fields))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+
+from apps.workouts.models import UserTrainingStats, WorkoutSession
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o rollup UserTrainingStats a partir das sessões de treino'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user-id',
+            type=int,
+            help='Reconstruir apenas para este usuário'
+        )
+        parser.add_argument(
+            '--missing-only',
+            action='store_true',
+            help='Processar apenas usuários que ainda não têm rollup'
+        )
+
+    def handle(self, *args, **options):
+        users_query = User.objects.filter(
+            id__in=WorkoutSession.objects.values_list('user_id', flat=True).distinct()
+        )
+
+        if options['user_id']:
+            users_query = User.objects.filter(id=options['user_id'])
+
+        if options['missing_only']:
+            users_query = users_query.filter(training_stats__isnull=True)
+
+        total_users = users_query.count()
+        if total_users == 0:
+            self.stdout.write(self.style.WARNING('Nenhum usuário para processar.'))
+            return
+
+        self.stdout.write(f'📊 Reconstruindo estatísticas de {total_users} usuários...\n')
+
+        processed = 0
+        errors = 0
+        for user in users_query.iterator():
+            try:
+                stats = UserTrainingStats.rebuild_for_user(user)
+                processed += 1
+                self.stdout.write(f'  ✅ {user.username}: {stats.total_workouts} treinos')
+            except Exception as e:
+                errors += 1
+                self.stdout.write(self.style.ERROR(f'  ❌ {user.username}: {e}'))
+
+        self.stdout.write(
+            self.style.SUCCESS(f'\n🎉 Concluído: {processed} usuários processados, {errors} erros')
+        )
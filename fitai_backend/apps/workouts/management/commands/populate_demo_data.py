@@ -222,16 +222,18 @@ class Command(BaseCommand):
                 is_completed = random.random() < 0.85
                 
                 # Criar sessão
+                # Incompletas são registradas como canceladas: só pode existir
+                # uma sessão em andamento por usuário (unique_active_session_per_user)
                 session = WorkoutSession.objects.create(
                     user=user,
                     workout=workout,
                     started_at=session_date,
-                    completed=is_completed,
-                    completed_at=session_date + timedelta(minutes=random.randint(15, 60)) if is_completed else None,
+                    completed=True,
+                    completed_at=session_date + timedelta(minutes=random.randint(15, 60) if is_completed else random.randint(5, 25)),
                     duration_minutes=random.randint(20, 50) if is_completed else random.randint(5, 25),
                     calories_burned=random.randint(100, 400) if is_completed else random.randint(50, 150),
                     user_rating=random.randint(3, 5) if is_completed else None,
-                    notes=f"Sessão {'completa' if is_completed else 'incompleta'} - {workout.name}"
+                    notes=f"Sessão completa - {workout.name}" if is_completed else f"Sessão cancelada pelo usuário - {workout.name}"
                 )
                 
                 total_sessions += 1
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:47
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_exercise_count(apps, schema_editor):
+    Workout = apps.get_model('workouts', 'Workout')
+    WorkoutExercise = apps.get_model('workouts', 'WorkoutExercise')
+
+    count_subquery = WorkoutExercise.objects.filter(
+        workout=OuterRef('pk')
+    ).order_by().values('workout').annotate(total=Count('id')).values('total')
+
+    Workout.objects.update(
+        exercise_count=Coalesce(Subquery(count_subquery, output_field=IntegerField()), Value(0))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0004_workout_deleted_at_workout_deleted_by_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workout',
+            name='exercise_count',
+            field=models.PositiveIntegerField(default=0, help_text='Número de exercícios no treino (atualizado automaticamente)'),
+        ),
+        migrations.RunPython(backfill_exercise_count, migrations.RunPython.noop),
+    ]
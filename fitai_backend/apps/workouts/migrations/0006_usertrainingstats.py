@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('workouts', '0005_workout_exercise_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserTrainingStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_workouts', models.PositiveIntegerField(default=0)),
+                ('total_duration', models.PositiveIntegerField(default=0, help_text='Minutos totais')),
+                ('total_calories', models.PositiveIntegerField(default=0)),
+                ('current_streak', models.PositiveIntegerField(default=0)),
+                ('longest_streak', models.PositiveIntegerField(default=0)),
+                ('last_workout_date', models.DateField(blank=True, null=True)),
+                ('daily_buckets', models.JSONField(blank=True, default=dict)),
+                ('category_counts', models.JSONField(blank=True, default=dict)),
+                ('muscle_group_counts', models.JSONField(blank=True, default=dict)),
+                ('exercise_counts', models.JSONField(blank=True, default=dict)),
+                ('favorite_exercise', models.CharField(blank=True, default='', max_length=100)),
+                ('favorite_exercise_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='training_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Estatística de Treino',
+                'verbose_name_plural': 'Estatísticas de Treino',
+            },
+        ),
+    ]
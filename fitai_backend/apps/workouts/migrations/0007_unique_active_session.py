@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:57
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def close_duplicate_active_sessions(apps, schema_editor):
+    """Mantém apenas a sessão ativa mais recente de cada usuário"""
+    WorkoutSession = apps.get_model('workouts', 'WorkoutSession')
+
+    seen_users = set()
+    for session in WorkoutSession.objects.filter(completed=False).order_by('user_id', '-created_at', '-id'):
+        if session.user_id not in seen_users:
+            seen_users.add(session.user_id)
+            continue
+
+        cancel_note = f"Sessão cancelada pelo usuário em {timezone.now().strftime('%d/%m/%Y às %H:%M')} (sessão duplicada)"
+        session.completed = True
+        session.completed_at = timezone.now()
+        session.notes = f"{session.notes}\n{cancel_note}" if session.notes else cancel_note
+        session.save(update_fields=['completed', 'completed_at', 'notes'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0006_usertrainingstats'),
+    ]
+
+    operations = [
+        migrations.RunPython(close_duplicate_active_sessions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='workoutsession',
+            constraint=models.UniqueConstraint(condition=models.Q(('completed', False)), fields=('user',), name='unique_active_session_per_user'),
+        ),
+    ]
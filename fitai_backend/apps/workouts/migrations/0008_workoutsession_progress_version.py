@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0007_unique_active_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workoutsession',
+            name='progress_version',
+            field=models.PositiveIntegerField(default=0, help_text='Incrementado a cada alteração nos logs (polling ?since=)'),
+        ),
+    ]
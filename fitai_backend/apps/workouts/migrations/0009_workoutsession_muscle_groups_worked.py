@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 05:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0008_workoutsession_progress_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workoutsession',
+            name='muscle_groups_worked',
+            field=models.CharField(blank=True, default='', help_text='Grupos musculares realmente trabalhados (separados por vírgula)', max_length=200),
+        ),
+    ]
@@ -1,5 +1,10 @@
-from django.db import models
+import datetime
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.utils import timezone
 from apps.exercises.models import Exercise
 
 class Workout(models.Model):
@@ -64,6 +69,12 @@ class Workout(models.Model):
     )
     # ============================================================
 
+    # Contador desnormalizado (mantido pelos signals de WorkoutExercise)
+    exercise_count = models.PositiveIntegerField(
+        default=0,
+        help_text="Número de exercícios no treino (atualizado automaticamente)"
+    )
+
     
     def __str__(self):
         status = " (DELETADO)" if not self.is_active else ""
@@ -121,14 +132,31 @@ class WorkoutSession(models.Model):
                                     help_text="Avaliação do usuário (1-5)")
     notes = models.TextField(blank=True, null=True,
                            help_text="Observações da sessão")
+    muscle_groups_worked = models.CharField(max_length=200, blank=True, default='',
+                                          help_text="Grupos musculares realmente trabalhados (separados por vírgula)")
+    progress_version = models.PositiveIntegerField(default=0,
+                                                 help_text="Incrementado a cada alteração nos logs (polling ?since=)")
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
         status = "Completo" if self.completed else "Em andamento"
         return f"{self.user.username} - {self.workout.name} ({status})"
 
+    def get_muscle_groups(self) -> list:
+        """Grupos trabalhados na sessão (fallback: grupos-alvo do treino)"""
+        groups = self.muscle_groups_worked or self.workout.target_muscle_groups or ''
+        return [g.strip() for g in groups.split(',') if g.strip()]
+
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            # Uma única sessão em andamento por usuário
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=models.Q(completed=False),
+                name='unique_active_session_per_user'
+            ),
+        ]
 
 class ExerciseLog(models.Model):
     """Log detalhado de cada exercício durante uma sessão"""
@@ -150,4 +178,299 @@ class ExerciseLog(models.Model):
         return f"{self.session.user.username} - {self.workout_exercise.exercise.name}"
 
     class Meta:
-        ordering = ['workout_exercise__order_in_workout']
\ No newline at end of file
+        ordering = ['workout_exercise__order_in_workout']
+
+class UserTrainingStats(models.Model):
+    """
+    Rollup incremental das estatísticas de treino do usuário.
+
+    Atualizado em start/complete_workout_session, evita varrer 90 dias de
+    sessões (e seus workouts) a cada leitura de analytics. A leitura é um
+    único SELECT desta linha.
+
+    daily_buckets: {"AAAA-MM-DD": {"s": iniciadas, "w": concluídas, "d": minutos,
+                    "c": calorias, "r": soma_notas, "rn": qtd_notas,
+                    "cat": {tipo: n}, "mg": {grupo: n}}}
+    """
+    BUCKET_RETENTION_DAYS = 365
+    CANCEL_NOTE_MARKER = 'Sessão cancelada pelo usuário'
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='training_stats')
+
+    # Totais (desde sempre)
+    total_workouts = models.PositiveIntegerField(default=0)
+    total_duration = models.PositiveIntegerField(default=0, help_text="Minutos totais")
+    total_calories = models.PositiveIntegerField(default=0)
+
+    # Streak de dias consecutivos terminando em last_workout_date
+    current_streak = models.PositiveIntegerField(default=0)
+    longest_streak = models.PositiveIntegerField(default=0)
+    last_workout_date = models.DateField(null=True, blank=True)
+
+    # Histogramas (desde sempre)
+    daily_buckets = models.JSONField(default=dict, blank=True)
+    category_counts = models.JSONField(default=dict, blank=True)
+    muscle_group_counts = models.JSONField(default=dict, blank=True)
+    exercise_counts = models.JSONField(default=dict, blank=True)
+
+    favorite_exercise = models.CharField(max_length=100, blank=True, default='')
+    favorite_exercise_count = models.PositiveIntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Estatísticas - {self.user.username} ({self.total_workouts} treinos)"
+
+    class Meta:
+        verbose_name = "Estatística de Treino"
+        verbose_name_plural = "Estatísticas de Treino"
+
+    # ============================================================
+    # ✍️ ESCRITA INCREMENTAL
+    # ============================================================
+
+    @staticmethod
+    def _local_date(value):
+        if value is None:
+            return timezone.localdate()
+        if timezone.is_aware(value):
+            return timezone.localtime(value).date()
+        return value.date() if hasattr(value, 'date') else value
+
+    @classmethod
+    def _locked_for_user(cls, user):
+        """(linha travada, criada agora?) - linha nova nasce vazia"""
+        stats, created = cls.objects.get_or_create(user=user)
+        return cls.objects.select_for_update().get(pk=stats.pk), created
+
+    @classmethod
+    def record_session_started(cls, user, started_at=None):
+        """Conta uma sessão iniciada no bucket do dia (usado na taxa de conclusão)"""
+        with transaction.atomic():
+            stats, created = cls._locked_for_user(user)
+            if created:
+                # Usuário sem backfill: parte do histórico (a sessão já está gravada)
+                return cls.rebuild_for_user(user)
+            bucket = stats._bucket(cls._local_date(started_at))
+            bucket['s'] = bucket.get('s', 0) + 1
+            stats._prune_buckets()
+            stats.save(update_fields=['daily_buckets', 'updated_at'])
+        return stats
+
+    @classmethod
+    def record_completed_session(cls, session, muscle_groups=None, exercise_names=None):
+        """
+        Incorpora uma sessão concluída.
+        muscle_groups: grupos realmente trabalhados (default: alvo do workout)
+        exercise_names: exercícios concluídos (default: consulta aos logs)
+        """
+        if muscle_groups is None:
+            muscle_groups = session.get_muscle_groups()
+        if exercise_names is None:
+            exercise_names = list(ExerciseLog.objects.filter(
+                session=session, completed=True, skipped=False
+            ).values_list('workout_exercise__exercise__name', flat=True))
+
+        with transaction.atomic():
+            stats, created = cls._locked_for_user(session.user)
+            if created:
+                # Usuário sem backfill: parte do histórico (a sessão já está gravada)
+                return cls.rebuild_for_user(session.user)
+            stats._apply_session(
+                completed_on=cls._local_date(session.completed_at),
+                duration=session.duration_minutes or 0,
+                calories=session.calories_burned or 0,
+                rating=session.user_rating,
+                category=session.workout.workout_type or 'Geral',
+                muscle_groups=muscle_groups,
+                exercise_names=exercise_names,
+            )
+            stats._prune_buckets()
+            stats.save()
+        return stats
+
+    @classmethod
+    def rebuild_for_user(cls, user):
+        """Recalcula o rollup do zero a partir das sessões (backfill)"""
+        sessions = list(
+            WorkoutSession.objects.filter(user=user)
+            .select_related('workout')
+            .order_by('created_at')
+        )
+
+        exercises_by_session = defaultdict(list)
+        for session_id, name in ExerciseLog.objects.filter(
+            session__user=user, completed=True, skipped=False
+        ).values_list('session_id', 'workout_exercise__exercise__name'):
+            exercises_by_session[session_id].append(name)
+
+        with transaction.atomic():
+            stats, _ = cls._locked_for_user(user)
+            stats._reset()
+
+            completed = []
+            for session in sessions:
+                bucket = stats._bucket(cls._local_date(session.started_at or session.created_at))
+                bucket['s'] = bucket.get('s', 0) + 1
+                if session.completed and session.completed_at and \
+                        cls.CANCEL_NOTE_MARKER not in (session.notes or ''):
+                    completed.append(session)
+
+            for session in sorted(completed, key=lambda s: s.completed_at):
+                stats._apply_session(
+                    completed_on=cls._local_date(session.completed_at),
+                    duration=session.duration_minutes or 0,
+                    calories=session.calories_burned or 0,
+                    rating=session.user_rating,
+                    category=session.workout.workout_type or 'Geral',
+                    muscle_groups=session.get_muscle_groups(),
+                    exercise_names=exercises_by_session.get(session.id, []),
+                )
+
+            stats._prune_buckets()
+            stats.save()
+        return stats
+
+    def _reset(self):
+        self.total_workouts = 0
+        self.total_duration = 0
+        self.total_calories = 0
+        self.current_streak = 0
+        self.longest_streak = 0
+        self.last_workout_date = None
+        self.daily_buckets = {}
+        self.category_counts = {}
+        self.muscle_group_counts = {}
+        self.exercise_counts = {}
+        self.favorite_exercise = ''
+        self.favorite_exercise_count = 0
+
+    def _bucket(self, day) -> dict:
+        return self.daily_buckets.setdefault(day.isoformat(), {})
+
+    def _apply_session(self, completed_on, duration, calories, rating, category,
+                       muscle_groups, exercise_names):
+        duration = int(duration or 0)
+        calories = int(calories or 0)
+
+        # Totais
+        self.total_workouts += 1
+        self.total_duration += duration
+        self.total_calories += calories
+
+        # Bucket diário
+        bucket = self._bucket(completed_on)
+        bucket['w'] = bucket.get('w', 0) + 1
+        bucket['d'] = bucket.get('d', 0) + duration
+        bucket['c'] = bucket.get('c', 0) + calories
+        if rating:
+            bucket['r'] = bucket.get('r', 0) + int(rating)
+            bucket['rn'] = bucket.get('rn', 0) + 1
+        day_categories = bucket.setdefault('cat', {})
+        day_categories[category] = day_categories.get(category, 0) + 1
+        day_groups = bucket.setdefault('mg', {})
+        for group in muscle_groups:
+            day_groups[group] = day_groups.get(group, 0) + 1
+
+        # Histogramas
+        self.category_counts[category] = self.category_counts.get(category, 0) + 1
+        for group in muscle_groups:
+            self.muscle_group_counts[group] = self.muscle_group_counts.get(group, 0) + 1
+        for name in exercise_names:
+            if not name:
+                continue
+            count = self.exercise_counts.get(name, 0) + 1
+            self.exercise_counts[name] = count
+            if count > self.favorite_exercise_count:
+                self.favorite_exercise = name
+                self.favorite_exercise_count = count
+
+        # Streak
+        if self.last_workout_date is None or completed_on > self.last_workout_date:
+            if self.last_workout_date and completed_on - self.last_workout_date == timedelta(days=1):
+                self.current_streak += 1
+            else:
+                self.current_streak = 1
+            self.last_workout_date = completed_on
+        elif completed_on == self.last_workout_date and self.current_streak == 0:
+            self.current_streak = 1
+        self.longest_streak = max(self.longest_streak, self.current_streak)
+
+    def _prune_buckets(self):
+        cutoff = (timezone.localdate() - timedelta(days=self.BUCKET_RETENTION_DAYS)).isoformat()
+        for day in [d for d in self.daily_buckets if d < cutoff]:
+            del self.daily_buckets[day]
+
+    # ============================================================
+    # 📖 LEITURA
+    # ============================================================
+
+    def effective_streak(self, today=None) -> int:
+        """Streak atual considerando hoje/ontem (sem treino há 2+ dias zera)"""
+        today = today or timezone.localdate()
+        if not self.last_workout_date or today - self.last_workout_date > timedelta(days=1):
+            return 0
+        return self.current_streak
+
+    def window_buckets(self, days: int, today=None) -> dict:
+        """Buckets dos últimos `days` dias (inclui hoje)"""
+        today = today or timezone.localdate()
+        start = (today - timedelta(days=days - 1)).isoformat()
+        end = today.isoformat()
+        return {day: bucket for day, bucket in self.daily_buckets.items() if start <= day <= end}
+
+    def period_summary(self, days: int, today=None) -> dict:
+        """Agregados de um período a partir dos buckets"""
+        buckets = self.window_buckets(days, today).values()
+        started = sum(b.get('s', 0) for b in buckets)
+        completed = sum(b.get('w', 0) for b in buckets)
+        duration = sum(b.get('d', 0) for b in buckets)
+        calories = sum(b.get('c', 0) for b in buckets)
+        rating_sum = sum(b.get('r', 0) for b in buckets)
+        rating_count = sum(b.get('rn', 0) for b in buckets)
+
+        categories, groups = {}, {}
+        for bucket in buckets:
+            for key, value in bucket.get('cat', {}).items():
+                categories[key] = categories.get(key, 0) + value
+            for key, value in bucket.get('mg', {}).items():
+                groups[key] = groups.get(key, 0) + value
+
+        return {
+            'started_sessions': started,
+            'completed_sessions': completed,
+            'total_duration': duration,
+            'total_calories': calories,
+            'active_days': sum(1 for b in buckets if b.get('w')),
+            'avg_duration': duration / completed if completed else 0,
+            'avg_rating': rating_sum / rating_count if rating_count else 0,
+            'workouts_by_category': categories,
+            'muscle_group_frequency': groups,
+        }
+
+    def weekly_completed(self, weeks: int = 4, today=None) -> list:
+        """Treinos concluídos por semana (índice 0 = últimos 7 dias)"""
+        today = today or timezone.localdate()
+        counts = [0] * weeks
+        for day, bucket in self.daily_buckets.items():
+            age = (today - datetime.date.fromisoformat(day)).days
+            if 0 <= age < weeks * 7:
+                counts[age // 7] += bucket.get('w', 0)
+        return counts
+
+    def analytics_payload(self, days: int = 90, today=None) -> dict:
+        """Formato do endpoint de analytics (compatível com o Flutter)"""
+        summary = self.period_summary(days, today)
+        total_workouts = summary['completed_sessions']
+        return {
+            'total_workouts': total_workouts,
+            'total_duration': summary['total_duration'],
+            'total_calories': summary['total_calories'],
+            'active_days': summary['active_days'],
+            'current_streak': self.effective_streak(today),
+            'workouts_by_category': summary['workouts_by_category'],
+            'muscle_group_frequency': summary['muscle_group_frequency'],
+            'favorite_exercise': self.favorite_exercise or 'Nenhum',
+            'favorite_exercise_count': self.favorite_exercise_count,
+            'average_duration': round(summary['avg_duration'], 1),
+        }
@@ -0,0 +1,299 @@
+"""
+Read model do progresso da sessão ativa
+
+Os clientes fazem polling destes dados durante todo o treino. Aqui:
+- sessão, logs, WorkoutExercise e Exercise vêm de uma única consulta com JOIN
+- os contadores de progresso são calculados em memória
+- WorkoutSession.progress_version é incrementado a cada alteração nos logs;
+  com ?since=<versão> o cliente recebe uma resposta vazia quando nada mudou
+- mutações em lote (fila offline do app) aplicadas com um único bulk_update
+"""
+from typing import Dict, Iterable, List, Optional, Set
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import ExerciseLog, WorkoutSession
+
+
+# =============================================================================
+# 🔢 VERSÃO DO PROGRESSO
+# =============================================================================
+
+def format_version(session_id: int, progress_version: int) -> str:
+    # Inclui o id da sessão: uma nova sessão nunca reaproveita a versão anterior
+    return f"{session_id}.{progress_version}"
+
+
+def get_active_version(user) -> Optional[str]:
+    """Versão da sessão ativa (consulta de uma linha, dois campos)"""
+    row = WorkoutSession.objects.filter(
+        user=user, completed=False
+    ).values('id', 'progress_version').first()
+    if row is None:
+        return None
+    return format_version(row['id'], row['progress_version'])
+
+
+def bump_version(session_id: int) -> None:
+    """Marca o progresso da sessão como alterado (UPDATE atômico com F())"""
+    WorkoutSession.objects.filter(id=session_id).update(
+        progress_version=F('progress_version') + 1
+    )
+
+
+# =============================================================================
+# 📖 LEITURA
+# =============================================================================
+
+def summarize_logs(exercise_logs: Iterable[ExerciseLog]) -> Dict:
+    """Contadores de progresso calculados em memória"""
+    total_exercises = 0
+    completed_exercises = 0
+    for log in exercise_logs:
+        total_exercises += 1
+        if log.completed:
+            completed_exercises += 1
+
+    return {
+        'total_exercises': total_exercises,
+        'completed_exercises': completed_exercises,
+        'progress_percentage': round(completed_exercises / total_exercises * 100, 1) if total_exercises > 0 else 0
+    }
+
+
+def count_progress(session_id: int) -> Dict:
+    """Contadores de progresso em um único aggregate (após mutações)"""
+    counts = ExerciseLog.objects.filter(session_id=session_id).aggregate(
+        total=Count('id'),
+        completed=Count('id', filter=Q(completed=True))
+    )
+    total_exercises = counts['total'] or 0
+    completed_exercises = counts['completed'] or 0
+    return {
+        'total_exercises': total_exercises,
+        'completed_exercises': completed_exercises,
+        'progress_percentage': round(completed_exercises / total_exercises * 100, 1) if total_exercises > 0 else 0
+    }
+
+
+def build_session_payload(session: WorkoutSession, exercise_logs) -> Dict:
+    """
+    Payload da sessão ativa (sessão + progresso + exercícios)
+    exercise_logs devem vir com workout_exercise__exercise carregado.
+    """
+    exercise_logs = list(exercise_logs)
+    exercises_data = []
+    for log in exercise_logs:
+        exercises_data.append({
+            'id': log.id,
+            'exercise_name': log.workout_exercise.exercise.name,
+            'planned_sets': log.workout_exercise.sets,
+            'planned_reps': log.workout_exercise.reps,
+            'sets_completed': log.sets_completed,
+            'reps_completed': log.reps_completed,
+            'completed': log.completed,
+            'skipped': log.skipped,
+            'order': log.workout_exercise.order_in_workout
+        })
+
+    return {
+        'session': {
+            'id': session.id,
+            'workout_name': session.workout.name,
+            'started_at': session.started_at,
+            'duration_so_far': int((timezone.now() - session.started_at).total_seconds() / 60) if session.started_at else 0
+        },
+        'progress': summarize_logs(exercise_logs),
+        'exercises': exercises_data,
+        'version': format_version(session.id, session.progress_version)
+    }
+
+
+def load_active_session_progress(user) -> Optional[Dict]:
+    """
+    Payload completo da sessão ativa em uma única consulta
+    (logs + sessão + treino + exercícios via select_related).
+    """
+    exercise_logs = list(
+        ExerciseLog.objects.filter(session__user=user, session__completed=False)
+        .select_related('session__workout', 'workout_exercise__exercise')
+        .order_by('workout_exercise__order_in_workout')
+    )
+
+    if exercise_logs:
+        session = exercise_logs[0].session
+    else:
+        # Treino sem exercícios: a sessão não aparece no JOIN
+        session = WorkoutSession.objects.select_related('workout').filter(
+            user=user, completed=False
+        ).first()
+        if session is None:
+            return None
+
+    return build_session_payload(session, exercise_logs)
+
+
+# =============================================================================
+# ✍️ MUTAÇÕES DOS LOGS
+# =============================================================================
+
+LOG_ACTIONS = ('update', 'complete', 'skip')
+UPDATABLE_LOG_FIELDS = ('sets_completed', 'reps_completed', 'weight_used', 'rest_time_actual', 'notes')
+
+MAX_SETS = 100
+MAX_WEIGHT_KG = 1000.0
+MAX_REST_SECONDS = 3600
+MAX_REPS_LENGTH = ExerciseLog._meta.get_field('reps_completed').max_length
+
+
+class LogMutationError(ValueError):
+    """Mutação inválida no lote (o lote inteiro é descartado)"""
+
+    def __init__(self, message: str, index: Optional[int] = None):
+        super().__init__(message)
+        self.index = index
+
+
+def _parse_int(field: str, value, maximum: int) -> int:
+    if isinstance(value, bool):
+        raise LogMutationError(f"{field} deve ser um número inteiro")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise LogMutationError(f"{field} deve ser um número inteiro")
+    if not number.is_integer() or not 0 <= number <= maximum:
+        raise LogMutationError(f"{field} deve ser um inteiro entre 0 e {maximum}")
+    return int(number)
+
+
+def _parse_weight(field: str, value) -> float:
+    if isinstance(value, bool):
+        raise LogMutationError(f"{field} deve ser um número")
+    try:
+        weight = float(value)
+    except (TypeError, ValueError):
+        raise LogMutationError(f"{field} deve ser um número")
+    # NaN falha nas duas comparações
+    if not 0 <= weight <= MAX_WEIGHT_KG:
+        raise LogMutationError(f"{field} deve estar entre 0 e {MAX_WEIGHT_KG:g} kg")
+    return weight
+
+
+def _parse_text(field: str, value, max_length: Optional[int] = None) -> str:
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise LogMutationError(f"{field} deve ser texto")
+    text = str(value).strip()
+    if max_length is not None and len(text) > max_length:
+        raise LogMutationError(f"{field} deve ter no máximo {max_length} caracteres")
+    return text
+
+
+LOG_FIELD_PARSERS = {
+    'sets_completed': lambda value: _parse_int('sets_completed', value, MAX_SETS),
+    'reps_completed': lambda value: _parse_text('reps_completed', value, MAX_REPS_LENGTH),
+    'weight_used': lambda value: _parse_weight('weight_used', value),
+    'rest_time_actual': lambda value: _parse_int('rest_time_actual', value, MAX_REST_SECONDS),
+    'notes': lambda value: _parse_text('notes', value),
+}
+
+
+def apply_update(exercise_log: ExerciseLog, data: Dict) -> Set[str]:
+    """
+    Atualiza os campos fornecidos (validados e convertidos para o tipo do
+    modelo); retorna os campos alterados. Valor inválido: LogMutationError,
+    antes de alterar qualquer campo.
+    """
+    values = {
+        field: LOG_FIELD_PARSERS[field](data[field])
+        for field in UPDATABLE_LOG_FIELDS
+        if data.get(field) is not None
+    }
+    for field, value in values.items():
+        setattr(exercise_log, field, value)
+    return set(values)
+
+
+def apply_complete(exercise_log: ExerciseLog) -> Set[str]:
+    exercise_log.completed = True
+    exercise_log.completed_at = timezone.now()
+    changed = {'completed', 'completed_at'}
+
+    # Se não tem dados de progresso, usar os planejados
+    if not exercise_log.sets_completed:
+        exercise_log.sets_completed = exercise_log.workout_exercise.sets
+        changed.add('sets_completed')
+    if not exercise_log.reps_completed:
+        exercise_log.reps_completed = exercise_log.workout_exercise.reps or "Completo"
+        changed.add('reps_completed')
+    return changed
+
+
+def apply_skip(exercise_log: ExerciseLog, reason: str) -> Set[str]:
+    exercise_log.skipped = True
+    exercise_log.completed = True  # Marca como "processado"
+    exercise_log.completed_at = timezone.now()
+    exercise_log.notes = f"Pulado: {reason}"
+    return {'skipped', 'completed', 'completed_at', 'notes'}
+
+
+def apply_log_mutations(user, mutations: List[Dict]) -> Dict:
+    """
+    Aplica, em ordem e em uma transação, mutações sobre os logs da sessão ativa.
+    Cada mutação: {"log_id": int, "action": "update"|"complete"|"skip", ...campos}
+    Retorna o payload atualizado da sessão (mesmo formato de current_session_status).
+    """
+    if not isinstance(mutations, list) or not mutations:
+        raise LogMutationError("Envie uma lista 'mutations' não vazia")
+
+    with transaction.atomic():
+        session = WorkoutSession.objects.select_for_update(of=('self',)).select_related('workout').filter(
+            user=user, completed=False
+        ).first()
+        if session is None:
+            raise WorkoutSession.DoesNotExist()
+
+        exercise_logs = list(
+            ExerciseLog.objects.filter(session=session)
+            .select_related('workout_exercise__exercise')
+            .order_by('workout_exercise__order_in_workout')
+        )
+        logs_by_id = {log.id: log for log in exercise_logs}
+
+        changed_logs = {}
+        changed_fields = set()
+        for index, mutation in enumerate(mutations):
+            if not isinstance(mutation, dict):
+                raise LogMutationError("Mutação inválida", index)
+
+            try:
+                exercise_log = logs_by_id.get(int(mutation.get('log_id')))
+            except (TypeError, ValueError):
+                exercise_log = None
+            if exercise_log is None:
+                raise LogMutationError("Log de exercício não encontrado na sessão ativa", index)
+
+            action = mutation.get('action', 'update')
+            if action == 'update':
+                try:
+                    fields = apply_update(exercise_log, mutation)
+                except LogMutationError as e:
+                    raise LogMutationError(str(e), index)
+            elif action == 'complete':
+                fields = apply_complete(exercise_log)
+            elif action == 'skip':
+                fields = apply_skip(exercise_log, mutation.get('reason', 'Sem motivo especificado'))
+            else:
+                raise LogMutationError(f"Ação inválida: {action} (use {', '.join(LOG_ACTIONS)})", index)
+
+            if fields:
+                changed_logs[exercise_log.id] = exercise_log
+                changed_fields |= fields
+
+        if changed_logs:
+            ExerciseLog.objects.bulk_update(list(changed_logs.values()), sorted(changed_fields))
+            bump_version(session.id)
+            session.progress_version += 1
+
+    return build_session_payload(session, exercise_logs)
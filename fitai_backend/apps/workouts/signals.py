@@ -0,0 +1,41 @@
+"""
+Signals do app de treinos
+- Mantém Workout.exercise_count sincronizado com a tabela WorkoutExercise
+- Invalida o cache versionado do catálogo quando um treino público muda
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from apps.exercises.catalog_cache import bump_catalog_version
+from .models import Workout, WorkoutExercise
+from .catalog import refresh_exercise_counts
+
+
+def _is_catalog_workout(workout_id) -> bool:
+    return Workout.objects.filter(
+        id=workout_id, is_personalized=False, is_recommended=False
+    ).exists()
+
+
+@receiver(post_save, sender=WorkoutExercise)
+def workout_exercise_saved(sender, instance, created, **kwargs):
+    if created and not kwargs.get('raw'):
+        refresh_exercise_counts([instance.workout_id])
+    if _is_catalog_workout(instance.workout_id):
+        bump_catalog_version()
+
+
+@receiver(post_delete, sender=WorkoutExercise)
+def workout_exercise_deleted(sender, instance, **kwargs):
+    refresh_exercise_counts([instance.workout_id])
+    if _is_catalog_workout(instance.workout_id):
+        bump_catalog_version()
+
+
+@receiver(post_save, sender=Workout)
+@receiver(post_delete, sender=Workout)
+def workout_changed(sender, instance, **kwargs):
+    # Treinos personalizados não fazem parte do catálogo; os recomendados entram
+    # na matriz de features do motor de recomendações (content_features)
+    if not instance.is_personalized:
+        bump_catalog_version()
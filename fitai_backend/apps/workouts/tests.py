@@ -1,3 +1,419 @@
+from django.db import IntegrityError, connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+from rest_framework import status
 
-# Create your tests here.
+from apps.exercises.models import Exercise
+from .models import Workout, WorkoutExercise, WorkoutSession, ExerciseLog, UserTrainingStats
+
+
+class WorkoutCatalogTest(TestCase):
+    """Listagens do catálogo: exercise_count desnormalizado e paginação keyset"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='catalog_user', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.exercises = [
+            Exercise.objects.create(name=f'Exercício {i}', description='teste', muscle_group='legs')
+            for i in range(3)
+        ]
+        self.workouts = [
+            Workout.objects.create(name=f'Treino {i}', description='teste', difficulty_level='beginner')
+            for i in range(5)
+        ]
+        for order, exercise in enumerate(self.exercises, 1):
+            WorkoutExercise.objects.create(
+                workout=self.workouts[0], exercise=exercise, order_in_workout=order
+            )
+
+    def test_exercise_count_follows_workout_exercises(self):
+        self.workouts[0].refresh_from_db()
+        self.assertEqual(self.workouts[0].exercise_count, 3)
+
+        WorkoutExercise.objects.filter(workout=self.workouts[0]).first().delete()
+        self.workouts[0].refresh_from_db()
+        self.assertEqual(self.workouts[0].exercise_count, 2)
+
+    def test_list_workouts_single_query(self):
+        # 1 consulta para montar o catálogo (a autenticação é forçada)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/workouts/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        payload = response.json()
+        self.assertEqual(payload['total'], 5)
+        counts = {row['id']: row['exercise_count'] for row in payload['workouts']}
+        self.assertEqual(counts[self.workouts[0].id], 3)
+
+    def test_list_workouts_served_from_catalog_cache(self):
+        first = self.client.get('/api/v1/workouts/')
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/v1/workouts/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Alterar um treino público invalida o payload
+        self.workouts[1].name = 'Treino renomeado'
+        self.workouts[1].save()
+        changed = self.client.get('/api/v1/workouts/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+
+    def test_list_workouts_keyset_pagination(self):
+        seen = []
+        cursor = None
+        while True:
+            params = {'limit': 2}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get('/api/v1/workouts/', params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(row['id'] for row in response.data['workouts'])
+            cursor = response.data['next_cursor']
+            if not cursor:
+                break
+
+        self.assertEqual(seen, sorted(w.id for w in self.workouts))
+
+    def test_my_workouts_cursor_by_created_at(self):
+        for i in range(3):
+            Workout.objects.create(
+                name=f'Meu treino {i}', description='teste',
+                is_personalized=True, created_by_user=self.user
+            )
+
+        first = self.client.get('/api/v1/workouts/my-workouts/', {'limit': 2})
+        self.assertEqual(len(first.data['my_workouts']), 2)
+        self.assertTrue(first.data['has_more'])
+
+        second = self.client.get('/api/v1/workouts/my-workouts/', {'limit': 2, 'cursor': first.data['next_cursor']})
+        self.assertEqual(len(second.data['my_workouts']), 1)
+        self.assertFalse(second.data['has_more'])
+
+        ids = [row['id'] for row in first.data['my_workouts'] + second.data['my_workouts']]
+        self.assertEqual(len(set(ids)), 3)
+
+
+class UserTrainingStatsTest(TestCase):
+    """Rollup incremental das estatísticas usado pelo analytics"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='stats_user', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.exercise = Exercise.objects.create(name='Agachamento', description='teste', muscle_group='legs')
+        self.workout = Workout.objects.create(
+            name='Pernas', description='teste', workout_type='strength', target_muscle_groups='legs'
+        )
+        WorkoutExercise.objects.create(workout=self.workout, exercise=self.exercise, order_in_workout=1)
+
+    def _complete_workout(self):
+        self.client.post(f'/api/v1/workouts/{self.workout.id}/start/')
+        session = WorkoutSession.objects.get(user=self.user, completed=False)
+        session.exercise_logs.update(completed=True)
+        response = self.client.post('/api/v1/sessions/complete/', {'user_rating': 4}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_completed_session_updates_rollup(self):
+        self._complete_workout()
+
+        stats = UserTrainingStats.objects.get(user=self.user)
+        self.assertEqual(stats.total_workouts, 1)
+        self.assertEqual(stats.current_streak, 1)
+        self.assertEqual(stats.category_counts, {'strength': 1})
+        self.assertEqual(stats.favorite_exercise, 'Agachamento')
+
+        summary = stats.period_summary(7)
+        self.assertEqual(summary['started_sessions'], 1)
+        self.assertEqual(summary['completed_sessions'], 1)
+        self.assertEqual(summary['avg_rating'], 4)
+
+    def test_analytics_reads_single_rollup_row(self):
+        self._complete_workout()
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/analytics/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_workouts'], 1)
+        self.assertEqual(response.data['muscle_group_frequency'], {'legs': 1})
+
+    def test_rebuild_matches_incremental(self):
+        self._complete_workout()
+        incremental = UserTrainingStats.objects.get(user=self.user)
+
+        rebuilt = UserTrainingStats.rebuild_for_user(self.user)
+        self.assertEqual(rebuilt.total_workouts, incremental.total_workouts)
+        self.assertEqual(rebuilt.daily_buckets.keys(), incremental.daily_buckets.keys())
+        self.assertEqual(rebuilt.favorite_exercise, 'Agachamento')
+
+
+    def test_first_write_keeps_history_of_user_without_backfill(self):
+        self._complete_workout()
+        UserTrainingStats.objects.filter(user=self.user).delete()  # anterior ao rollup
+
+        self._complete_workout()
+
+        stats = UserTrainingStats.objects.get(user=self.user)
+        self.assertEqual(stats.total_workouts, 2)
+        self.assertEqual(stats.period_summary(7)['started_sessions'], 2)
+        self.assertEqual(stats.exercise_counts, {'Agachamento': 2})
+
+class StartWorkoutSessionTest(TestCase):
+    """Início de sessão atômico com bulk_create e uma sessão ativa por usuário"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='session_user', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.workout = Workout.objects.create(name='Full body', description='teste')
+        for order in range(1, 6):
+            exercise = Exercise.objects.create(name=f'Exercício {order}', description='teste', muscle_group='legs')
+            WorkoutExercise.objects.create(workout=self.workout, exercise=exercise, order_in_workout=order)
+
+    def test_start_returns_full_session_payload(self):
+        response = self.client.post(f'/api/v1/workouts/{self.workout.id}/start/')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['total_exercises'], 5)
+        self.assertEqual(response.data['progress']['total_exercises'], 5)
+        self.assertEqual([e['order'] for e in response.data['exercises']], [1, 2, 3, 4, 5])
+        self.assertTrue(all(e['id'] for e in response.data['exercises']))
+
+        current = self.client.get('/api/v1/sessions/current/')
+        self.assertEqual(current.data['exercises'], response.data['exercises'])
+
+    def test_start_inserts_exercise_logs_in_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(f'/api/v1/workouts/{self.workout.id}/start/')
+
+        log_inserts = [q for q in queries.captured_queries
+                       if q['sql'].startswith('INSERT INTO "workouts_exerciselog"')]
+        self.assertEqual(len(log_inserts), 1)
+        self.assertEqual(ExerciseLog.objects.filter(session__user=self.user).count(), 5)
+
+    def test_second_active_session_is_rejected(self):
+        self.client.post(f'/api/v1/workouts/{self.workout.id}/start/')
+        response = self.client.post(f'/api/v1/workouts/{self.workout.id}/start/')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(WorkoutSession.objects.filter(user=self.user, completed=False).count(), 1)
+
+    def test_constraint_blocks_concurrent_active_sessions(self):
+        WorkoutSession.objects.create(user=self.user, workout=self.workout)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            WorkoutSession.objects.create(user=self.user, workout=self.workout)
+
+    def test_current_session_single_query_and_since_delta(self):
+        self.client.post(f'/api/v1/workouts/{self.workout.id}/start/')
+
+        with self.assertNumQueries(1):
+            current = self.client.get('/api/v1/sessions/current/')
+        self.assertEqual(current.data['progress']['total_exercises'], 5)
+        version = current.data['version']
+
+        with self.assertNumQueries(1):
+            unchanged = self.client.get('/api/v1/sessions/current/', {'since': version})
+        self.assertEqual(unchanged.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        log_id = current.data['exercises'][0]['id']
+        completed = self.client.post(f'/api/v1/exercises/{log_id}/complete/')
+        self.assertEqual(completed.data['session_progress']['completed_exercises'], 1)
+
+        changed = self.client.get('/api/v1/sessions/current/', {'since': version})
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(changed.data['version'], version)
+        self.assertEqual(changed.data['progress']['completed_exercises'], 1)
+
+    def test_batch_log_mutations(self):
+        start = self.client.post(f'/api/v1/workouts/{self.workout.id}/start/')
+        log_ids = [e['id'] for e in start.data['exercises']]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/v1/sessions/current/logs/batch/', {
+                'mutations': [
+                    {'log_id': log_ids[0], 'action': 'update', 'sets_completed': 2, 'weight_used': 20},
+                    {'log_id': log_ids[0], 'action': 'complete'},
+                    {'log_id': log_ids[1], 'action': 'skip', 'reason': 'Sem equipamento'},
+                ]
+            }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['progress']['completed_exercises'], 2)
+        self.assertNotEqual(response.data['version'], start.data['version'])
+        log_updates = [q for q in queries.captured_queries
+                       if q['sql'].startswith('UPDATE "workouts_exerciselog"')]
+        self.assertEqual(len(log_updates), 1)
+
+        first = ExerciseLog.objects.get(id=log_ids[0])
+        self.assertEqual((first.sets_completed, first.weight_used, first.completed), (2, 20, True))
+        self.assertTrue(ExerciseLog.objects.get(id=log_ids[1]).skipped)
+
+    def test_batch_rejects_unknown_log_atomically(self):
+        start = self.client.post(f'/api/v1/workouts/{self.workout.id}/start/')
+        log_id = start.data['exercises'][0]['id']
+
+        response = self.client.post('/api/v1/sessions/current/logs/batch/', {
+            'mutations': [
+                {'log_id': log_id, 'action': 'complete'},
+                {'log_id': 999999, 'action': 'complete'},
+            ]
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['mutation_index'], 1)
+        self.assertFalse(ExerciseLog.objects.get(id=log_id).completed)
+
+    def test_batch_rejects_invalid_values_with_index(self):
+        start = self.client.post(f'/api/v1/workouts/{self.workout.id}/start/')
+        log_id = start.data['exercises'][0]['id']
+
+        for bad in ({'sets_completed': 'abc'}, {'weight_used': -5}, {'rest_time_actual': 2.5},
+                    {'reps_completed': 'x' * 50}):
+            response = self.client.post('/api/v1/sessions/current/logs/batch/', {
+                'mutations': [
+                    {'log_id': log_id, 'action': 'update', 'sets_completed': '3', 'weight_used': '22.5'},
+                    dict(bad, log_id=log_id, action='update'),
+                ]
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, bad)
+            self.assertEqual(response.data['mutation_index'], 1)
+
+        self.assertEqual(ExerciseLog.objects.get(id=log_id).sets_completed, 0)
+        single = self.client.post(f'/api/v1/exercises/{log_id}/update/', {'sets_completed': 'abc'}, format='json')
+        self.assertEqual(single.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_complete_session_keeps_catalog_workout_untouched(self):
+        from apps.users.models import UserProgress
+
+        self.workout.target_muscle_groups = 'legs, glutes'
+        self.workout.save()
+        start = self.client.post(f'/api/v1/workouts/{self.workout.id}/start/')
+        self.client.post(f'/api/v1/exercises/{start.data["exercises"][0]["id"]}/complete/')
+        self.client.post(f'/api/v1/exercises/{start.data["exercises"][1]["id"]}/skip/')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/v1/sessions/complete/', format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['exercise_summary'],
+                         {'total_exercises': 5, 'completed_exercises': 1,
+                          'skipped_exercises': 1, 'completion_rate': 20.0})
+        self.assertFalse(any(q['sql'].startswith('UPDATE "workouts_workout"')
+                             for q in queries.captured_queries))
+
+        self.workout.refresh_from_db()
+        self.assertEqual(self.workout.target_muscle_groups, 'legs, glutes')
+        session = WorkoutSession.objects.get(user=self.user)
+        self.assertEqual(session.muscle_groups_worked, 'legs')
+        self.assertEqual(UserProgress.objects.get(user=self.user).total_workouts, 1)
+
+
+class WorkoutHistoryTest(TestCase):
+    """Histórico: consulta única com contagens anotadas e cursor por data"""
+
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        self.user = User.objects.create_user(username='history_user', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        workout = Workout.objects.create(name='Costas', description='teste', workout_type='strength')
+        exercises = [
+            WorkoutExercise.objects.create(
+                workout=workout,
+                exercise=Exercise.objects.create(name=f'Remada {i}', description='teste', muscle_group='back'),
+                order_in_workout=i
+            )
+            for i in range(3)
+        ]
+        now = timezone.now()
+        for day in range(5):
+            session = WorkoutSession.objects.create(
+                user=self.user, workout=workout, completed=True,
+                completed_at=now - timedelta(days=day), duration_minutes=30
+            )
+            for i, we in enumerate(exercises):
+                ExerciseLog.objects.create(session=session, workout_exercise=we, completed=True, skipped=(i == 0))
+
+    def test_history_single_query_with_counts(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/sessions/history/')
+
+        self.assertEqual(response.data['count'], 5)
+        row = response.data['results'][0]
+        self.assertEqual((row['total_exercises'], row['exercises_completed']), (3, 2))
+        self.assertEqual(row['category'], 'strength')
+
+    def test_history_cursor_and_compact_fields(self):
+        first = self.client.get('/api/v1/sessions/history/', {'limit': 3, 'fields': 'compact'})
+        self.assertTrue(first.data['has_more'])
+        self.assertNotIn('notes', first.data['results'][0])
+
+        second = self.client.get('/api/v1/sessions/history/', {'limit': 3, 'cursor': first.data['next_cursor']})
+        self.assertFalse(second.data['has_more'])
+
+        dates = [row['date'] for row in first.data['results'] + second.data['results']]
+        self.assertEqual(len(dates), 5)
+        self.assertEqual(dates, sorted(dates, reverse=True))
+
+
+class TrainingAnalyticsTest(TestCase):
+    """Semanas, consistência e tendência a partir das datas de conclusão"""
+
+    def test_summarize_single_pass(self):
+        import datetime
+        from .analytics import summarize
+
+        today = datetime.date(2025, 3, 31)
+        days_ago = [0, 1, 1, 2, 5, 6, 20, 21]
+        summary = summarize([today - datetime.timedelta(days=d) for d in days_ago], today=today)
+
+        self.assertEqual(summary.active_days, 7)
+        self.assertEqual(summary.last_workout_date, today)
+        self.assertEqual(summary.weekly_counts, [6, 0, 1, 1])
+        self.assertEqual(summary.consistency, 0.75)
+        self.assertEqual((summary.recent_count, summary.previous_count), (6, 2))
+        self.assertEqual(summary.improvement_trend, 'melhorando')
+
+    def test_streak_comes_from_rollup(self):
+        import datetime
+        from django.utils import timezone
+
+        user = User.objects.create_user(username='streak_user')
+        workout = Workout.objects.create(name='Treino', description='teste')
+        now = timezone.now()
+        for days_ago in [0, 1, 1, 2, 5, 6, 20, 21]:
+            done = now - datetime.timedelta(days=days_ago)
+            WorkoutSession.objects.create(user=user, workout=workout, completed=True, completed_at=done)
+
+        stats = UserTrainingStats.rebuild_for_user(user)
+        today = timezone.localdate()
+        self.assertEqual(stats.effective_streak(today), 3)   # hoje, ontem, anteontem
+        self.assertEqual(stats.longest_streak, 3)
+        self.assertEqual(stats.effective_streak(today + datetime.timedelta(days=3)), 0)
+
+    def test_bulk_variant_uses_one_query_and_skips_cancelled(self):
+        from django.utils import timezone
+        from .analytics import summarize_users
+
+        workout = Workout.objects.create(name='Treino', description='teste')
+        users = [User.objects.create_user(username=f'analytics_{i}') for i in range(3)]
+        now = timezone.now()
+        for user in users[:2]:
+            WorkoutSession.objects.create(user=user, workout=workout, completed=True, completed_at=now)
+        WorkoutSession.objects.create(user=users[1], workout=workout, completed=True, completed_at=now,
+                                      notes=UserTrainingStats.CANCEL_NOTE_MARKER)
+
+        with self.assertNumQueries(1):
+            summaries = summarize_users([user.id for user in users])
+
+        self.assertEqual([summaries[user.id].total_workouts for user in users], [1, 1, 0])
+        self.assertEqual(summaries[users[0].id].active_days, 1)
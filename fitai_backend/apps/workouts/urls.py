@@ -20,6 +20,7 @@ urlpatterns = [
     path('exercises/<int:exercise_log_id>/update/', views.update_exercise_progress, name='update_exercise_progress'),
     path('exercises/<int:exercise_log_id>/complete/', views.complete_exercise, name='complete_exercise'),
     path('exercises/<int:exercise_log_id>/skip/', views.skip_exercise, name='skip_exercise'),
+    path('sessions/current/logs/batch/', views.batch_update_exercise_logs, name='batch_update_exercise_logs'),
     path('sessions/pause/', views.pause_session, name='pause_session'),
     path('sessions/complete/', views.complete_workout_session, name='complete_workout_session'),
    # path('sessions/cancel/', views.cancel_active_session, name='cancel_session'),
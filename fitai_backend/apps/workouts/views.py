@@ -2,14 +2,18 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from django.db.models import Q, Avg, Count
+from django.db import IntegrityError, transaction
+from django.db.models import Q, Avg, Count, F
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from .models import Workout, WorkoutExercise, WorkoutSession, ExerciseLog
+from .models import Workout, WorkoutExercise, WorkoutSession, ExerciseLog, UserTrainingStats
+from . import catalog, session_progress
 from apps.users.models import UserProfile
 from apps.exercises.models import Exercise
-import google.generativeai as genai
+from apps.exercises.catalog_cache import cached_catalog_response
 from apps.recommendations.services.recommendation_engine import RecommendationEngine
-from apps.recommendations.services.ai_service import AIService
+from apps.recommendations.services.ai_service import get_ai_service
+from apps.recommendations.services.prompt_registry import prompts
 import logging
 from django.conf import settings
 import re
@@ -17,44 +21,54 @@ import json
 from datetime import datetime, timedelta
 from .video_library import find_video_for_exercise 
 
+logger = logging.getLogger(__name__)
+
 @api_view(['GET'])
 def test_workouts_api(request):
     return Response({"message": "Workouts API funcionando!"})
 
+def _paginated_catalog_rows(request, queryset, ordering, default_limit=None):
+    """
+    Fast path das listagens: uma consulta .values() com exercise_count desnormalizado.
+    Paginação keyset ativada por ?limit= / ?cursor= (ou quando há default_limit).
+    """
+    cursor = request.query_params.get('cursor')
+    limit = request.query_params.get('limit')
+    
+    if cursor is None and limit is None and default_limit is None:
+        return catalog.list_rows(queryset.order_by(*ordering)), None
+    
+    page_size = catalog.parse_page_size(limit, default=default_limit or catalog.DEFAULT_PAGE_SIZE)
+    return catalog.keyset_page(queryset, ordering, cursor, page_size)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def list_workouts(request):
     """Lista todos os treinos disponíveis"""
-   # workouts = Workout.objects.all()
-   # SÓ TREINOS PÚBLICOS (catálogo)
-    workouts = Workout.objects.filter(
-        is_personalized=False,  # Exclui TODOS os treinos personalizados
-        is_recommended=False,   #  Exclui treinos de IA
-        is_active=True  
-    )
-    data = []
-    
-    for workout in workouts:
-        # Contar exercícios no treino
-        exercise_count = WorkoutExercise.objects.filter(workout=workout).count()
+    # SÓ TREINOS PÚBLICOS (catálogo) - uma única consulta, sem N+1
+    queryset = catalog.public_catalog_queryset()
+    
+    if request.query_params.get('cursor') is None and request.query_params.get('limit') is None:
+        # Sem paginação: payload completo no cache versionado do catálogo (ETag)
+        def build():
+            data = catalog.list_rows(queryset)
+            return {
+                'workouts': data,
+                'total': len(data),
+                'next_cursor': None,
+                'has_more': False
+            }
         
-        data.append({
-            'id': workout.id,
-            'name': workout.name,
-            'description': workout.description,
-            'difficulty_level': workout.difficulty_level,
-            'estimated_duration': workout.estimated_duration,
-            'target_muscle_groups': workout.target_muscle_groups,
-            'workout_type': workout.workout_type,
-            'calories_estimate': workout.calories_estimate,
-            'exercise_count': exercise_count,
-            'is_personalized': False,  # Sempre False nesta lista
-            'is_recommended': False, # Sempre False nesta lista
-        })
+        return cached_catalog_response(request, 'list_workouts', None, build)
+    
+    data, next_cursor = _paginated_catalog_rows(request, queryset, ('id',))
     
     return Response({
         'workouts': data,
-        'total': len(data)
+        'total': len(data),
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
     })
 
 @api_view(['GET'])
@@ -73,62 +87,29 @@ def recommended_workouts(request):
     - Treinos de IA de outros usuários
     - Treinos do catálogo
     - Treinos criados manualmente pelo usuário
+    
+    📄 Paginação: ?limit= (padrão 50) e ?cursor= (next_cursor da página anterior)
     """
     try:
         profile = UserProfile.objects.get(user=request.user)
         
-        # ============================================================
-        # ✅ FILTRO CORRETO: APENAS TREINOS DE IA DO USUÁRIO ATUAL
-        # ============================================================
-        
-         # Query base
-        workouts = Workout.objects.filter(
-            is_recommended=True,
-            is_personalized=True,
-            created_by_user=request.user,
-            is_active=True
-        ).order_by('-created_at')[:50]
-        
-        # DEBUG COMPLETO
-        print("="*80)
-        print(f"🔍 DEBUG RECOMMENDED_WORKOUTS")
-        print(f"User: {request.user.username}")
-        print(f"Total na query: {workouts.count()}")
-        print("IDs retornados:")
-        for w in workouts:
-            print(f"  {w.id}: {w.name} | {w.created_at}")
-        print("="*80)
-        
-        data = []
-        for workout in workouts:
-            exercise_count = WorkoutExercise.objects.filter(workout=workout).count()
-            
-            # ✅ Verificação extra de segurança
-            if workout.created_by_user != request.user:
-                print(f'⚠️ ALERTA: Treino {workout.id} não pertence ao usuário!')
-                continue  # Pula este treino
-            
-            data.append({
-                'id': workout.id,
-                'name': workout.name,
-                'description': workout.description,
-                'difficulty_level': workout.difficulty_level,
-                'estimated_duration': workout.estimated_duration,
-                'workout_type': workout.workout_type,
-                'calories_estimate': workout.calories_estimate,
-                'exercise_count': exercise_count,
-                'is_recommended': True,            # ✅ Sempre True nesta lista (treinos de IA)
-                'is_personalized': True,           # ✅ Sempre True nesta lista
-                'created_at': workout.created_at,  # ✅ Data de criação
-                'source': 'ai_recommendation',     # ✅ Identificador da fonte
-                'recommendation_reason': f"Treino personalizado pela IA baseado no seu perfil"
-            })
+        # ✅ APENAS TREINOS DE IA DO USUÁRIO ATUAL (filtro já garante a posse)
+        data, next_cursor = _paginated_catalog_rows(
+            request,
+            catalog.user_recommended_queryset(request.user),
+            ('-created_at', '-id'),
+            default_limit=50
+        )
         
-        print(f'   Retornando: {len(data)} treinos')
+        for row in data:
+            row['source'] = 'ai_recommendation'
+            row['recommendation_reason'] = "Treino personalizado pela IA baseado no seu perfil"
         
         return Response({
             'recommended_workouts': data,
             'total': len(data),
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
             'source': 'ai_recommendation',
             'user_goal': profile.goal,
             'activity_level': profile.activity_level,
@@ -201,159 +182,197 @@ def workout_detail(request, workout_id):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def start_workout_session(request, workout_id):
-    """Inicia uma nova sessão de treino"""
+    """
+    Inicia uma nova sessão de treino
+    Operação atômica: sessão + todos os ExerciseLog em um único bulk_create.
+    A constraint unique_active_session_per_user garante uma sessão ativa por usuário.
+    Retorna o mesmo payload de current_session_status (sem precisar de outra chamada).
+    """
     try:
         workout = Workout.objects.get(id=workout_id)
-        
-        # Verificar se já tem sessão em andamento
-        active_session = WorkoutSession.objects.filter(
-            user=request.user, 
-            completed=False
-        ).first()
-        
-        if active_session:
-            return Response({
-                "error": "Você já tem uma sessão em andamento",
-                "active_session_id": active_session.id,
-                "active_workout": active_session.workout.name
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Criar nova sessão
-        session = WorkoutSession.objects.create(
-            user=request.user,
-            workout=workout,
-            started_at=timezone.now()
-        )
-        
-        # Criar logs para cada exercício do treino
-        workout_exercises = WorkoutExercise.objects.filter(workout=workout)
-        for we in workout_exercises:
-            ExerciseLog.objects.create(
-                session=session,
-                workout_exercise=we
-            )
-        
-        return Response({
-            "message": "Sessão iniciada com sucesso",
-            "session_id": session.id,
-            "workout_name": workout.name,
-            "started_at": session.started_at,
-            "total_exercises": workout_exercises.count()
-        }, status=status.HTTP_201_CREATED)
-        
     except Workout.DoesNotExist:
         return Response({"error": "Treino não encontrado"}, 
                        status=status.HTTP_404_NOT_FOUND)
+    
+    workout_exercises = list(
+        WorkoutExercise.objects.filter(workout=workout)
+        .select_related('exercise')
+        .order_by('order_in_workout')
+    )
+    
+    try:
+        with transaction.atomic():
+            # Verificar se já tem sessão em andamento
+            active_session = WorkoutSession.objects.filter(
+                user=request.user, 
+                completed=False
+            ).select_related('workout').first()
+            
+            if active_session:
+                return _active_session_conflict(active_session)
+            
+            # Criar nova sessão
+            session = WorkoutSession.objects.create(
+                user=request.user,
+                workout=workout,
+                started_at=timezone.now()
+            )
+            
+            # Criar logs para cada exercício do treino (um único INSERT)
+            exercise_logs = ExerciseLog.objects.bulk_create([
+                ExerciseLog(session=session, workout_exercise=we)
+                for we in workout_exercises
+            ])
+    except IntegrityError:
+        # Outra requisição criou a sessão ativa entre a verificação e o INSERT
+        active_session = WorkoutSession.objects.filter(
+            user=request.user,
+            completed=False
+        ).select_related('workout').first()
+        if active_session:
+            return _active_session_conflict(active_session)
+        raise
+    
+    # 📊 Rollup de estatísticas (taxa de conclusão)
+    try:
+        UserTrainingStats.record_session_started(request.user, session.started_at)
+    except Exception:
+        logger.exception(f"Erro ao atualizar estatísticas de treino (início da sessão {session.id})")
+    
+    payload = session_progress.build_session_payload(session, exercise_logs)
+    payload.update({
+        "message": "Sessão iniciada com sucesso",
+        "session_id": session.id,
+        "workout_name": workout.name,
+        "started_at": session.started_at,
+        "total_exercises": len(exercise_logs)
+    })
+    return Response(payload, status=status.HTTP_201_CREATED)
+
+
+def _active_session_conflict(active_session):
+    return Response({
+        "error": "Você já tem uma sessão em andamento",
+        "active_session_id": active_session.id,
+        "active_workout": active_session.workout.name
+    }, status=status.HTTP_400_BAD_REQUEST)
+
+
+# Campos do histórico (uma consulta .values() com contagens anotadas)
+HISTORY_FIELDS = (
+    'id', 'history_date', 'duration_minutes', 'calories_burned', 'user_rating', 'notes',
+    'muscle_groups_worked', 'workout__name', 'workout__estimated_duration',
+    'workout__calories_estimate', 'workout__workout_type', 'workout__target_muscle_groups',
+    'total_exercises', 'exercises_completed',
+)
+HISTORY_COMPACT_KEYS = (
+    'id', 'workout_name', 'date', 'duration', 'calories', 'category',
+    'exercises_completed', 'total_exercises',
+)
+
+
+def _history_queryset(user):
+    """Sessões concluídas com contagens de exercícios anotadas (sem N+1)"""
+    return WorkoutSession.objects.filter(
+        user=user,
+        completed=True
+    ).annotate(
+        history_date=Coalesce('completed_at', 'created_at'),
+        total_exercises=Count('exercise_logs'),
+        # Sessão concluída: todos os logs contam como completos, exceto os pulados
+        exercises_completed=Count('exercise_logs', filter=Q(exercise_logs__skipped=False)),
+    )
+
+
+def _history_row(row, compact=False):
+    date = row['history_date'].isoformat()
+    groups = row['muscle_groups_worked'] or row['workout__target_muscle_groups'] or ''
+    muscle_groups = [g.strip() for g in groups.split(',') if g.strip()]
+    
+    item = {
+        'id': row['id'],
+        'workout_name': row['workout__name'],
+        'name': row['workout__name'],
+        'date': date,
+        'completed_at': date,
+        'duration': row['duration_minutes'] or row['workout__estimated_duration'] or 0,
+        'calories': row['calories_burned'] or row['workout__calories_estimate'] or 0,
+        'category': row['workout__workout_type'] or 'Geral',
+        'muscle_groups': muscle_groups,
+        'focus_areas': muscle_groups,
+        'exercises_completed': row['exercises_completed'],
+        'total_exercises': row['total_exercises'],
+        'completed': True,
+        'user_rating': row['user_rating'],
+        'notes': row['notes'] or ''
+    }
+    if compact:
+        return {key: item[key] for key in HISTORY_COMPACT_KEYS}
+    return item
+
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def workout_history(request):
     """
     Histórico de treinos do usuário - formato compatível com Flutter
+    Uma consulta por página: contagens via Count(filter=Q(...)),
+    paginação por cursor (data de conclusão) e ?fields=compact opcional.
     """
-    from django.db.models import Sum, Count
-    from datetime import timedelta
-    
-    sessions = WorkoutSession.objects.filter(
-        user=request.user,
-        completed=True
-    ).select_related('workout').order_by('-completed_at')[:50]
+    page_size = catalog.parse_page_size(request.query_params.get('limit'), default=catalog.DEFAULT_PAGE_SIZE)
+    compact = request.query_params.get('fields') == 'compact'
+    
+    rows, next_cursor = catalog.keyset_page(
+        _history_queryset(request.user),
+        ('-history_date', '-id'),
+        request.query_params.get('cursor'),
+        page_size,
+        fields=HISTORY_FIELDS
+    )
     
-    if not sessions.exists():
+    if not rows and not request.query_params.get('cursor'):
         return Response({
             'results': [],
             'count': 0,
+            'next_cursor': None,
+            'has_more': False,
             'message': 'Nenhum treino concluído ainda'
         })
     
-    history = []
-    for session in sessions:
-        exercise_logs = ExerciseLog.objects.filter(session=session)
-        total_exercises = exercise_logs.count()
-        
-        # ✅ CORREÇÃO: Se a sessão foi concluída, contar todos os logs como completos
-        # (exceto os pulados)
-        if session.completed:
-            completed_exercises = exercise_logs.exclude(skipped=True).count()
-        else:
-            completed_exercises = exercise_logs.filter(completed=True, skipped=False).count()
-        
-        date = session.completed_at if session.completed_at else session.created_at
-        
-        muscle_groups = []
-        if session.workout.target_muscle_groups:
-            muscle_groups = [g.strip() for g in session.workout.target_muscle_groups.split(',')]
-        
-        history.append({
-            'id': session.id,
-            'workout_name': session.workout.name,
-            'name': session.workout.name,
-            'date': date.isoformat(),
-            'completed_at': date.isoformat(),
-            'duration': session.duration_minutes or session.workout.estimated_duration or 0,
-            'calories': session.calories_burned or session.workout.calories_estimate or 0,
-            'category': session.workout.workout_type or 'Geral',
-            'muscle_groups': muscle_groups,
-            'focus_areas': muscle_groups,
-            'exercises_completed': completed_exercises,  # ✅ Agora correto
-            'total_exercises': total_exercises,
-            'completed': True,
-            'user_rating': session.user_rating,
-            'notes': session.notes or ''
-        })
+    history = [_history_row(row, compact) for row in rows]
     
     return Response({
         'results': history,
         'sessions': history,
         'count': len(history),
-        'total': len(history)
+        'total': len(history),
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
     })
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def current_session_status(request):
-    """Status da sessão atual do usuário"""
-    try:
-        session = WorkoutSession.objects.get(user=request.user, completed=False)
-        
-        # Pegar logs dos exercícios
-        exercise_logs = ExerciseLog.objects.filter(session=session).order_by('workout_exercise__order_in_workout')
-        
-        exercises_data = []
-        for log in exercise_logs:
-            exercises_data.append({
-                'id': log.id,
-                'exercise_name': log.workout_exercise.exercise.name,
-                'planned_sets': log.workout_exercise.sets,
-                'planned_reps': log.workout_exercise.reps,
-                'sets_completed': log.sets_completed,
-                'reps_completed': log.reps_completed,
-                'completed': log.completed,
-                'skipped': log.skipped,
-                'order': log.workout_exercise.order_in_workout
-            })
-        
-        total_exercises = len(exercises_data)
-        completed_exercises = len([e for e in exercises_data if e['completed']])
-        
-        return Response({
-            'session': {
-                'id': session.id,
-                'workout_name': session.workout.name,
-                'started_at': session.started_at,
-                'duration_so_far': int((timezone.now() - session.started_at).total_seconds() / 60) if session.started_at else 0
-            },
-            'progress': {
-                'total_exercises': total_exercises,
-                'completed_exercises': completed_exercises,
-                'progress_percentage': round(completed_exercises / total_exercises * 100, 1) if total_exercises > 0 else 0
-            },
-            'exercises': exercises_data
-        })
-        
-    except WorkoutSession.DoesNotExist:
+    """
+    Status da sessão atual do usuário
+    ?since=<version>: 304 sem corpo se o progresso não mudou desde essa versão
+    """
+    since = request.query_params.get('since')
+    
+    if since:
+        version = session_progress.get_active_version(request.user)
+        if version is None:
+            return Response({"message": "Nenhuma sessão ativa encontrada"}, 
+                           status=status.HTTP_404_NOT_FOUND)
+        if version == since:
+            return Response(status=status.HTTP_304_NOT_MODIFIED)
+    
+    payload = session_progress.load_active_session_progress(request.user)
+    if payload is None:
         return Response({"message": "Nenhuma sessão ativa encontrada"}, 
                        status=status.HTTP_404_NOT_FOUND)
+    
+    return Response(payload)
         
 # ADICIONAR AO FINAL DO ARQUIVO apps/workouts/views.py
 
@@ -362,32 +381,20 @@ def current_session_status(request):
 def update_exercise_progress(request, exercise_log_id):
     """Atualiza progresso de um exercício específico"""
     try:
-        exercise_log = ExerciseLog.objects.get(
+        exercise_log = ExerciseLog.objects.select_related('workout_exercise__exercise').get(
             id=exercise_log_id,
             session__user=request.user,
             session__completed=False
         )
         
-        # Dados que podem ser atualizados
-        sets_completed = request.data.get('sets_completed')
-        reps_completed = request.data.get('reps_completed')
-        weight_used = request.data.get('weight_used')
-        rest_time_actual = request.data.get('rest_time_actual')
-        notes = request.data.get('notes')
-        
-        # Atualizar campos fornecidos
-        if sets_completed is not None:
-            exercise_log.sets_completed = sets_completed
-        if reps_completed is not None:
-            exercise_log.reps_completed = reps_completed
-        if weight_used is not None:
-            exercise_log.weight_used = weight_used
-        if rest_time_actual is not None:
-            exercise_log.rest_time_actual = rest_time_actual
-        if notes is not None:
-            exercise_log.notes = notes
-            
-        exercise_log.save()
+        # Atualizar apenas os campos fornecidos
+        try:
+            changed_fields = session_progress.apply_update(exercise_log, request.data)
+        except session_progress.LogMutationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if changed_fields:
+            exercise_log.save(update_fields=sorted(changed_fields))
+            session_progress.bump_version(exercise_log.session_id)
         
         return Response({
             "message": "Progresso atualizado com sucesso",
@@ -410,28 +417,21 @@ def update_exercise_progress(request, exercise_log_id):
 def complete_exercise(request, exercise_log_id):
     """Marca um exercício como completo"""
     try:
-        exercise_log = ExerciseLog.objects.get(
+        exercise_log = ExerciseLog.objects.select_related('workout_exercise__exercise').get(
             id=exercise_log_id,
             session__user=request.user,
             session__completed=False
         )
         
-        # Marcar como completo
-        exercise_log.completed = True
-        exercise_log.completed_at = timezone.now()
-        
-        # Se não tem dados de progresso, usar os planejados
-        if not exercise_log.sets_completed:
-            exercise_log.sets_completed = exercise_log.workout_exercise.sets
-        if not exercise_log.reps_completed:
-            exercise_log.reps_completed = exercise_log.workout_exercise.reps or "Completo"
-            
-        exercise_log.save()
+        # Marcar como completo (sets/reps planejados se não houver progresso)
+        changed_fields = session_progress.apply_complete(exercise_log)
+        exercise_log.save(update_fields=sorted(changed_fields))
+        session_progress.bump_version(exercise_log.session_id)
         
-        # Verificar se todos os exercícios da sessão foram completados
-        session = exercise_log.session
-        total_exercises = ExerciseLog.objects.filter(session=session).count()
-        completed_exercises = ExerciseLog.objects.filter(session=session, completed=True).count()
+        # Verificar se todos os exercícios da sessão foram completados (um único aggregate)
+        progress = session_progress.count_progress(exercise_log.session_id)
+        total_exercises = progress['total_exercises']
+        completed_exercises = progress['completed_exercises']
         
         return Response({
             "message": "Exercício concluído com sucesso",
@@ -458,7 +458,7 @@ def complete_exercise(request, exercise_log_id):
 def skip_exercise(request, exercise_log_id):
     """Pula um exercício"""
     try:
-        exercise_log = ExerciseLog.objects.get(
+        exercise_log = ExerciseLog.objects.select_related('workout_exercise__exercise').get(
             id=exercise_log_id,
             session__user=request.user,
             session__completed=False
@@ -466,11 +466,9 @@ def skip_exercise(request, exercise_log_id):
         
         reason = request.data.get('reason', 'Sem motivo especificado')
         
-        exercise_log.skipped = True
-        exercise_log.completed = True  # Marca como "processado"
-        exercise_log.completed_at = timezone.now()
-        exercise_log.notes = f"Pulado: {reason}"
-        exercise_log.save()
+        changed_fields = session_progress.apply_skip(exercise_log, reason)
+        exercise_log.save(update_fields=sorted(changed_fields))
+        session_progress.bump_version(exercise_log.session_id)
         
         return Response({
             "message": "Exercício pulado",
@@ -486,6 +484,34 @@ def skip_exercise(request, exercise_log_id):
         return Response({"error": "Log de exercício não encontrado"}, 
                        status=status.HTTP_404_NOT_FOUND)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_update_exercise_logs(request):
+    """
+    Aplica um lote ordenado de mutações nos logs da sessão ativa
+    (sincronização da fila offline do app em uma única requisição).
+    
+    Body: {"mutations": [{"log_id": 1, "action": "update", "sets_completed": 2},
+                         {"log_id": 1, "action": "complete"},
+                         {"log_id": 2, "action": "skip", "reason": "..."}]}
+    Tudo ou nada: uma mutação inválida descarta o lote inteiro.
+    """
+    try:
+        payload = session_progress.apply_log_mutations(
+            request.user, request.data.get('mutations')
+        )
+    except WorkoutSession.DoesNotExist:
+        return Response({"error": "Nenhuma sessão ativa encontrada"}, 
+                       status=status.HTTP_404_NOT_FOUND)
+    except session_progress.LogMutationError as e:
+        return Response({
+            "error": str(e),
+            "mutation_index": e.index
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    payload["message"] = "Progresso sincronizado com sucesso"
+    return Response(payload)
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def pause_session(request):
@@ -515,108 +541,117 @@ def pause_session(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def complete_workout_session(request, session_id=None):
-    """Finaliza completamente uma sessão de treino"""
+    """
+    Finaliza completamente uma sessão de treino
+    - Estatísticas dos logs em um único aggregate condicional
+    - Grupos musculares trabalhados salvos na própria sessão (não no Workout do catálogo)
+    - UserProgress.total_workouts incrementado com F() (sem read-modify-write)
+    """
+    from apps.users.models import UserProgress
+    
     try:
-        # Se session_id foi passado na URL, usar esse
-        # Senão, buscar a sessão ativa do usuário
-        if session_id:
-            session = WorkoutSession.objects.get(
-                id=session_id,
-                user=request.user,
-                completed=False
-            )
-            print(f'✅ Usando session_id da URL: {session_id}')
-        else:
-            session = WorkoutSession.objects.get(
-                user=request.user,
-                completed=False
+        with transaction.atomic():
+            # Se session_id foi passado na URL, usar esse
+            # Senão, buscar a sessão ativa do usuário
+            sessions = WorkoutSession.objects.select_for_update(of=('self',)).select_related('workout')
+            if session_id:
+                session = sessions.get(
+                    id=session_id,
+                    user=request.user,
+                    completed=False
+                )
+                print(f'✅ Usando session_id da URL: {session_id}')
+            else:
+                session = sessions.get(
+                    user=request.user,
+                    completed=False
+                )
+                print(f'✅ Usando session ativa do usuário')
+            
+            # Dados opcionais fornecidos pelo usuário
+            user_rating = request.data.get('user_rating')
+            calories_burned = request.data.get('calories_burned')
+            user_notes = request.data.get('notes', '')
+            
+            # ✅ CORREÇÃO 1: CALCULAR DURAÇÃO REAL
+            if session.started_at:
+                duration = timezone.now() - session.started_at
+                duration_minutes = int(duration.total_seconds() / 60)
+                session.duration_minutes = duration_minutes
+                print(f'⏱️ Duração REAL calculada: {duration_minutes} min')
+            else:
+                # Fallback para duração estimada
+                session.duration_minutes = session.workout.estimated_duration or 30
+                print(f'⚠️ Usando duração estimada: {session.duration_minutes} min')
+            
+            # Estatísticas da sessão (uma consulta)
+            exercise_stats = ExerciseLog.objects.filter(session=session).aggregate(
+                total=Count('id'),
+                completed=Count('id', filter=Q(completed=True, skipped=False)),
+                skipped=Count('id', filter=Q(skipped=True))
             )
-            print(f'✅ Usando session ativa do usuário')
-        
-        # Dados opcionais fornecidos pelo usuário
-        user_rating = request.data.get('user_rating')
-        calories_burned = request.data.get('calories_burned')
-        user_notes = request.data.get('notes', '')
-        
-        # ✅ CORREÇÃO 1: CALCULAR DURAÇÃO REAL
-        if session.started_at:
-            duration = timezone.now() - session.started_at
-            duration_minutes = int(duration.total_seconds() / 60)
-            session.duration_minutes = duration_minutes
-            print(f'⏱️ Duração REAL calculada: {duration_minutes} min')
-        else:
-            # Fallback para duração estimada
-            session.duration_minutes = session.workout.estimated_duration or 30
-            print(f'⚠️ Usando duração estimada: {session.duration_minutes} min')
-        
-        # ✅ CORREÇÃO 2: SALVAR GRUPOS MUSCULARES REAIS
-        # Buscar os exercícios realizados na sessão
-        exercise_logs = ExerciseLog.objects.filter(
-            session=session,
-            completed=True,
-            skipped=False
-        ).select_related('workout_exercise__exercise')
-        
-        # Coletar grupos musculares únicos dos exercícios REALIZADOS
-        muscle_groups_set = set()
-        for log in exercise_logs:
-            muscle_group = log.workout_exercise.exercise.muscle_group
-            if muscle_group:
-                muscle_groups_set.add(muscle_group)
-        
-        # Se não realizou nenhum exercício, usar os grupos do workout
-        if not muscle_groups_set and session.workout.target_muscle_groups:
-            muscle_groups_list = [
-                g.strip() 
-                for g in session.workout.target_muscle_groups.split(',')
-                if g.strip()
-            ]
-        else:
-            muscle_groups_list = list(muscle_groups_set)
-        
-        # Salvar como string separada por vírgula
-        session.workout.target_muscle_groups = ', '.join(muscle_groups_list)
-        session.workout.save()
-        
-        print(f'💪 Grupos musculares salvos: {muscle_groups_list}')
-        
-        # Finalizar sessão
-        session.completed = True
-        session.completed_at = timezone.now()
-        
-        if user_rating and 1 <= int(user_rating) <= 5:
-            session.user_rating = user_rating
-        if calories_burned:
-            session.calories_burned = calories_burned
-        if user_notes:
-            session.notes = f"{session.notes or ''}\nNotas finais: {user_notes}".strip()
+            total_exercises = exercise_stats['total']
+            completed_exercises = exercise_stats['completed']
+            skipped_exercises = exercise_stats['skipped']
             
-        session.save()
+            # ✅ CORREÇÃO 2: SALVAR GRUPOS MUSCULARES REAIS
+            # Exercícios REALIZADOS (nome + grupo muscular, sem instanciar models)
+            performed = list(ExerciseLog.objects.filter(
+                session=session,
+                completed=True,
+                skipped=False
+            ).values_list('workout_exercise__exercise__name', 'workout_exercise__exercise__muscle_group'))
+            
+            muscle_groups_list = sorted({group for _, group in performed if group})
+            
+            # Se não realizou nenhum exercício, usar os grupos do workout
+            if not muscle_groups_list and session.workout.target_muscle_groups:
+                muscle_groups_list = [
+                    g.strip() 
+                    for g in session.workout.target_muscle_groups.split(',')
+                    if g.strip()
+                ]
+            
+            # Salvar na sessão (o Workout é compartilhado - não é alterado)
+            session.muscle_groups_worked = ', '.join(muscle_groups_list)[:200]
+            
+            print(f'💪 Grupos musculares salvos: {muscle_groups_list}')
+            
+            # Finalizar sessão
+            session.completed = True
+            session.completed_at = timezone.now()
+            
+            if user_rating and 1 <= int(user_rating) <= 5:
+                session.user_rating = user_rating
+            if calories_burned:
+                session.calories_burned = calories_burned
+            if user_notes:
+                session.notes = f"{session.notes or ''}\nNotas finais: {user_notes}".strip()
+                
+            session.save(update_fields=[
+                'completed', 'completed_at', 'duration_minutes', 'muscle_groups_worked',
+                'user_rating', 'calories_burned', 'notes'
+            ])
+            
+            # Atualizar progresso do usuário (UPDATE atômico)
+            if not UserProgress.objects.filter(user=request.user).update(
+                total_workouts=F('total_workouts') + 1
+            ):
+                UserProgress.objects.create(user=request.user, total_workouts=1)
         
         print(f'✅ Sessão {session.id} finalizada com sucesso!')
         print(f'   Duração: {session.duration_minutes}min')
         print(f'   Grupos musculares: {muscle_groups_list}')
         
-        # Estatísticas da sessão
-        total_exercises = ExerciseLog.objects.filter(session=session).count()
-        completed_exercises = ExerciseLog.objects.filter(
-            session=session, 
-            completed=True, 
-            skipped=False
-        ).count()
-        skipped_exercises = ExerciseLog.objects.filter(
-            session=session, 
-            skipped=True
-        ).count()
-        
-        # Atualizar progresso do usuário
-        from apps.users.models import UserProgress
+        # 📊 Atualizar rollup de estatísticas (analytics sem varrer sessões)
         try:
-            progress = UserProgress.objects.get(user=request.user)
-            progress.total_workouts += 1
-            progress.save()
-        except UserProgress.DoesNotExist:
-            UserProgress.objects.create(user=request.user, total_workouts=1)
+            UserTrainingStats.record_completed_session(
+                session,
+                muscle_groups=muscle_groups_list,
+                exercise_names=[name for name, _ in performed]
+            )
+        except Exception:
+            logger.exception(f"Erro ao atualizar estatísticas de treino (conclusão da sessão {session.id})")
         
         return Response({
             "message": "Treino finalizado com sucesso! Parabéns! 🎉",
@@ -694,108 +729,15 @@ def cancel_active_session(request, session_id):
 def user_analytics(request):
     """
     Analytics completas do usuário - formato compatível com Flutter
+    Leitura de uma única linha do rollup UserTrainingStats (últimos 90 dias)
     """
-    from django.db.models import Sum, Avg, Count
-    from datetime import timedelta
-    from collections import defaultdict
-    
-    # Períodos de análise
-    now = timezone.now()
-    ninety_days_ago = now - timedelta(days=90)
-    
-    # Sessões do usuário
-    all_sessions = WorkoutSession.objects.filter(
-        user=request.user, 
-        completed=True,
-        completed_at__gte=ninety_days_ago
-    )
-    
-    if not all_sessions.exists():
-        return Response({
-            'total_workouts': 0,
-            'total_duration': 0,
-            'total_calories': 0,
-            'active_days': 0,
-            'current_streak': 0,
-            'workouts_by_category': {},
-            'muscle_group_frequency': {},
-            'favorite_exercise': 'Nenhum',
-            'favorite_exercise_count': 0,
-            'average_duration': 0.0,
-        })
-    
-    # Estatísticas básicas
-    total_workouts = all_sessions.count()
-    total_duration = all_sessions.aggregate(total=Sum('duration_minutes'))['total'] or 0
-    total_calories = all_sessions.aggregate(total=Sum('calories_burned'))['total'] or 0
-    
-    # Dias ativos (dias únicos com treino)
-    active_dates = all_sessions.values_list('completed_at__date', flat=True).distinct()
-    active_days = len(set(active_dates))
-    
-    # Calcular streak de dias consecutivos
-    current_streak = 0
-    workout_dates = set(all_sessions.values_list('completed_at__date', flat=True))
-    if workout_dates:
-        current_date = now.date()
-        # Permitir streak mesmo se não treinou hoje (considera ontem)
-        if current_date not in workout_dates:
-            current_date = current_date - timedelta(days=1)
-        
-        while current_date in workout_dates:
-            current_streak += 1
-            current_date = current_date - timedelta(days=1)
-            if current_streak > 365:  # Limite de segurança
-                break
-    
-    # Treinos por categoria
-    workouts_by_category = defaultdict(int)
-    for session in all_sessions:
-        category = session.workout.workout_type or 'Geral'
-        workouts_by_category[category] += 1
-    
-    # Frequência de grupos musculares
-    muscle_group_frequency = defaultdict(int)
-    for session in all_sessions:
-        if session.workout.target_muscle_groups:
-            groups = [g.strip() for g in session.workout.target_muscle_groups.split(',')]
-            for group in groups:
-                if group:
-                    muscle_group_frequency[group] += 1
-    
-    # Exercício favorito
-    favorite_exercise = 'Nenhum'
-    favorite_count = 0
-    try:
-        exercise_counts = ExerciseLog.objects.filter(
-            session__user=request.user,
-            completed=True,
-            skipped=False
-        ).values('workout_exercise__exercise__name').annotate(
-            count=Count('id')
-        ).order_by('-count').first()
-        
-        if exercise_counts:
-            favorite_exercise = exercise_counts['workout_exercise__exercise__name']
-            favorite_count = exercise_counts['count']
-    except Exception as e:
-        print(f"Erro ao buscar exercício favorito: {e}")
+    stats = UserTrainingStats.objects.filter(user=request.user).first()
     
-    # Duração média
-    average_duration = float(total_duration / total_workouts) if total_workouts > 0 else 0.0
+    if stats is None:
+        # Usuário ainda sem rollup (anterior ao backfill): constrói uma vez
+        stats = UserTrainingStats.rebuild_for_user(request.user)
     
-    return Response({
-        'total_workouts': total_workouts,
-        'total_duration': total_duration,
-        'total_calories': total_calories,
-        'active_days': active_days,
-        'current_streak': current_streak,
-        'workouts_by_category': dict(workouts_by_category),
-        'muscle_group_frequency': dict(muscle_group_frequency),
-        'favorite_exercise': favorite_exercise,
-        'favorite_exercise_count': favorite_count,
-        'average_duration': round(average_duration, 1),
-    })
+    return Response(stats.analytics_payload(days=90))
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -1052,34 +994,17 @@ def generate_ai_workout_plan(request):
 @permission_classes([IsAuthenticated])
 def my_personalized_workouts(request):
     """Lista apenas treinos personalizados criados pelo usuário"""
-    workouts = Workout.objects.filter(
-        is_personalized=True,
-        is_recommended=False,
-        created_by_user=request.user,
-        is_active=True
-    ).order_by('-created_at')
-    
-    data = []
-    for workout in workouts:
-        exercise_count = WorkoutExercise.objects.filter(workout=workout).count()
-        data.append({
-            'id': workout.id,
-            'name': workout.name,
-            'description': workout.description,
-            'difficulty_level': workout.difficulty_level,
-            'estimated_duration': workout.estimated_duration,
-            'target_muscle_groups': workout.target_muscle_groups,
-            'equipment_needed': workout.equipment_needed,
-            'calories_estimate': workout.calories_estimate,
-            'workout_type': workout.workout_type,
-            'exercise_count': exercise_count,
-            'is_personalized': workout.is_personalized,
-            'created_at': workout.created_at
-        })
+    data, next_cursor = _paginated_catalog_rows(
+        request,
+        catalog.user_personalized_queryset(request.user),
+        ('-created_at', '-id')
+    )
     
     return Response({
         'my_workouts': data,
-        'total': len(data)
+        'total': len(data),
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
     })
 
 @api_view(['POST'])
@@ -1508,55 +1433,49 @@ def get_available_exercises_for_editing(request):
     - search (query param)
     """
     try:
-        # Iniciar query
-        exercises = Exercise.objects.all()
-        
         # Filtros opcionais
         muscle_group = request.GET.get('muscle_group')
         difficulty = request.GET.get('difficulty_level')
         search = request.GET.get('search')
         
-        if muscle_group and muscle_group != 'all':
-            exercises = exercises.filter(muscle_group=muscle_group)
-        
-        if difficulty and difficulty != 'all':
-            exercises = exercises.filter(difficulty_level=difficulty)
-        
-        if search:
-            from django.db.models import Q
-            exercises = exercises.filter(
-                Q(name__icontains=search) | Q(description__icontains=search)
-            )
-        
-        # Limitar a 100 resultados
-        exercises = exercises[:100]
-        
-        exercises_data = []
-        for exercise in exercises:
-            exercises_data.append({
-                'id': exercise.id,
-                'name': exercise.name,
-                'description': exercise.description,
-                'muscle_group': exercise.muscle_group,
-                'difficulty_level': exercise.difficulty_level,
-                'equipment_needed': exercise.equipment_needed,
-                'duration_minutes': exercise.duration_minutes,
-                'video_url': exercise.video_url,
-                #'image_url': exercise.image_url,
-            })
-        
-        print(f'✅ {len(exercises_data)} exercícios disponíveis')
-        
-        return Response({
-            'success': True,
-            'exercises': exercises_data,
-            'total': len(exercises_data),
-            'filters_applied': {
-                'muscle_group': muscle_group,
-                'difficulty_level': difficulty,
-                'search': search
+        def build():
+            exercises = Exercise.objects.all()
+            
+            if muscle_group and muscle_group != 'all':
+                exercises = exercises.filter(muscle_group=muscle_group)
+            
+            if difficulty and difficulty != 'all':
+                exercises = exercises.filter(difficulty_level=difficulty)
+            
+            if search:
+                exercises = exercises.filter(
+                    Q(name__icontains=search) | Q(description__icontains=search)
+                )
+            
+            # Limitar a 100 resultados
+            exercises_data = list(exercises.values(
+                'id', 'name', 'description', 'muscle_group', 'difficulty_level',
+                'equipment_needed', 'duration_minutes', 'video_url',
+            )[:100])
+            
+            return {
+                'success': True,
+                'exercises': exercises_data,
+                'total': len(exercises_data),
+                'filters_applied': {
+                    'muscle_group': muscle_group,
+                    'difficulty_level': difficulty,
+                    'search': search
+                }
             }
-        })
+        
+        # Payload pronto no cache versionado do catálogo (ETag / If-None-Match)
+        return cached_catalog_response(
+            request,
+            'available_exercises_for_editing',
+            {'muscle_group': muscle_group, 'difficulty_level': difficulty, 'search': search},
+            build
+        )
         
     except Exception as e:
         print(f'❌ Erro ao buscar exercícios: {str(e)}')
@@ -2156,6 +2075,64 @@ def _extract_user_data_from_profile(profile):
 # ✅ PROMPT PLANO SEMANAL - Usando dados reais
 # ============================================================
 
+# Esquema e regras fixos no prefixo; dados do perfil no sufixo (ver prompt_registry)
+WEEKLY_PLAN_PROMPT = prompts.register(
+    'weekly_plan',
+    prefix='''
+Você é um personal trainer expert criando um PLANO SEMANAL.
+
+✅ JSON (SEM markdown, SEM comentários):
+{
+  "weekly_plan": [
+    {
+      "day_name": "Segunda",
+      "workout_name": "Nome Motivacional",
+      "description": "Descrição curta (máx 80 chars)",
+      "difficulty_level": "beginner|intermediate|advanced",
+      "estimated_duration": 45,
+      "target_muscle_groups": "grupos",
+      "equipment_needed": "equipamentos do usuário",
+      "workout_type": "strength",
+      "calories_estimate": 250,
+      "exercises": [
+        {
+          "name": "Nome do Exercício",
+          "description": "Como fazer (máx 100 chars)",
+          "muscle_group": "grupo",
+          "difficulty_level": "beginner|intermediate|advanced",
+          "equipment_needed": "equip",
+          "duration_minutes": 5,
+          "sets": 3,
+          "reps": "12",
+          "rest_time": 60,
+          "order_in_workout": 1,
+          "instructions": ["Passo 1", "Passo 2"],
+          "tips": ["Dica 1"]
+        }
+      ]
+    }
+  ]
+}
+
+🎯 IMPORTANTE:
+- Descrições CURTAS (evitar texto longo)
+- JSON válido (fechar todas chaves)
+''',
+    suffix='''
+👤 PERFIL: {nome}, {idade} anos, {sexo}
+📊 Dados: {peso_atual}kg → {peso_desejado}kg | Altura: {altura}cm | IMC: {bmi:.1f}
+💪 Nível: {nivel_texto} | Meta: {metas}
+📅 Frequência: {frequencia}x/semana | Tempo: {tempo}min/treino
+
+⚠️ REGRA CRÍTICA: Crie EXATAMENTE {frequencia} treinos.
+- {ex_count} exercícios por treino
+- difficulty_level: "{difficulty}" | estimated_duration: {duration}
+- equipment_needed: "{equipamentos}"
+
+Distribuição: {focos_texto}
+'''
+)
+
 def _build_weekly_plan_prompt(user_data):
     """
     Prompt para PLANO SEMANAL usando dados do UserProfile real
@@ -2247,63 +2224,92 @@ def _build_weekly_plan_prompt(user_data):
         else:
             dias_treino_texto = ', '.join(dias_semana[:frequencia])
     
-    # PROMPT EM PORTUGUÊS
-    return f'''
-Você é um personal trainer expert criando um PLANO SEMANAL.
+    return WEEKLY_PLAN_PROMPT.render(
+        nome=nome, idade=idade, sexo=sexo,
+        peso_atual=peso_atual, peso_desejado=peso_desejado, altura=altura, bmi=bmi,
+        nivel_texto=nivel_texto, metas=metas,
+        frequencia=frequencia, tempo=tempo,
+        ex_count=ex_count, difficulty=difficulty, duration=duration,
+        equipamentos=equipamentos, focos_texto=focos_texto,
+    )
 
-👤 PERFIL: {nome}, {idade} anos, {sexo}
-📊 Dados: {peso_atual}kg → {peso_desejado}kg | Altura: {altura}cm | IMC: {bmi:.1f}
-💪 Nível: {nivel_texto} | Meta: {metas}
-📅 Frequência: {frequencia}x/semana | Tempo: {tempo}min/treino
 
-⚠️ REGRA CRÍTICA: Crie EXATAMENTE {frequencia} treinos.
+# ============================================================
+# ✅ PROMPT TREINO ÚNICO - Usando dados reais
+# ============================================================
 
-✅ JSON (SEM markdown, SEM comentários):
-{{
-  "weekly_plan": [
-    {{
-      "day_name": "Segunda",
-      "workout_name": "Nome Motivacional",
-      "description": "Descrição curta (máx 80 chars)",
-      "difficulty_level": "{difficulty}",
-      "estimated_duration": {duration},
-      "target_muscle_groups": "grupos",
-      "equipment_needed": "{equipamentos}",
-      "workout_type": "strength",
-      "calories_estimate": 250,
-      "exercises": [
-        {{
-          "name": "Nome do Exercício",
-          "description": "Como fazer (máx 100 chars)",
-          "muscle_group": "grupo",
-          "difficulty_level": "{difficulty}",
-          "equipment_needed": "equip",
-          "duration_minutes": 5,
-          "sets": 3,
-          "reps": "12",
-          "rest_time": 60,
-          "order_in_workout": 1,
-          "instructions": ["Passo 1", "Passo 2"],
-          "tips": ["Dica 1"]
-        }}
-      ]
-    }}
+ONBOARDING_PROMPT = prompts.register(
+    'onboarding_workout',
+    prefix='''
+Você é um personal trainer expert criando um TREINO PERSONALIZADO.
+
+⚠️ JSON (sem markdown):
+{
+  "workout_name": "Nome Motivacional",
+  "description": "Foco e objetivo (máx 120 chars)",
+  "difficulty_level": "beginner|intermediate|advanced",
+  "estimated_duration": 45,
+  "target_muscle_groups": "áreas de foco do usuário",
+  "equipment_needed": "equipamentos do usuário",
+  "workout_type": "full_body",
+  "calories_estimate": 250,
+  "exercises": [
+    {
+      "name": "Nome Específico em Português",
+      "description": "Execução clara (máx 150 chars)",
+      "muscle_group": "grupo",
+      "difficulty_level": "beginner|intermediate|advanced",
+      "equipment_needed": "equipamento",
+      "duration_minutes": 5,
+      "sets": 3,
+      "reps": "12-15",
+      "rest_time": 60,
+      "order_in_workout": 1,
+      "instructions": ["Passo 1", "Passo 2", "Passo 3"],
+      "tips": ["Dica 1", "Dica 2"]
+    }
   ]
-}}
+}
 
-🎯 IMPORTANTE:
-- EXATAMENTE {frequencia} treinos
-- {ex_count} exercícios por treino
-- Descrições CURTAS (evitar texto longo)
-- JSON válido (fechar todas chaves)
+✅ REGRAS:
+1. Português brasileiro
+2. Exercícios específicos (ex: "Rosca Martelo")
+''',
+    suffix='''
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+📋 PERFIL
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+👤 {nome}, {idade} anos, {sexo}
+⚖️ {peso_atual}kg → Meta: {peso_desejado}kg
+📏 {altura}cm | IMC: {bmi:.1f} ({bmi_status})
+💪 Nível: {nivel_texto}
 
-Distribuição: {focos_texto}
-'''
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+🎯 OBJETIVOS
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+✅ Metas: {metas}
+🎪 Focos: {areas}
+🏋️ Preferências: {tipos}
+🛠️ Equipamentos: {equip}
+⏰ Tempo: {tempo}
+{limitacoes}
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
+🎯 CRIAR TREINO:
+• {ex_count} exercícios ESPECÍFICOS
+• Duração: {duration} minutos (estimated_duration)
+• Nível: {difficulty} (difficulty_level)
+• PORTUGUÊS BRASILEIRO
 
-# ============================================================
-# ✅ PROMPT TREINO ÚNICO - Usando dados reais
-# ============================================================
+✅ REGRAS DESTE TREINO:
+3. Respeitar: {equip}
+4. Focar: {areas}
+5. Nível: {nivel_texto}
+{evitar}
+
+Crie o treino perfeito para {nome}! 💪
+'''
+)
 
 def _build_onboarding_prompt(user_data):
     """
@@ -2361,73 +2367,15 @@ def _build_onboarding_prompt(user_data):
         ex_count = 10
         duration = 60
     
-    return f'''
-Você é um personal trainer expert criando um TREINO PERSONALIZADO.
-
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-📋 PERFIL
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-👤 {nome}, {idade} anos, {sexo}
-⚖️ {peso_atual}kg → Meta: {peso_desejado}kg
-📏 {altura}cm | IMC: {bmi:.1f} ({bmi_status})
-💪 Nível: {nivel_texto}
-
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-🎯 OBJETIVOS
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-✅ Metas: {metas}
-🎪 Focos: {areas}
-🏋️ Preferências: {tipos}
-🛠️ Equipamentos: {equip}
-⏰ Tempo: {tempo}
-{f'⚠️ LIMITAÇÕES: {limitacoes}' if limitacoes else ''}
-
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-
-🎯 CRIAR TREINO:
-• {ex_count} exercícios ESPECÍFICOS
-• Duração: {duration} minutos
-• Nível: {difficulty}
-• PORTUGUÊS BRASILEIRO
-
-⚠️ JSON (sem markdown):
-{{
-  "workout_name": "Nome Motivacional",
-  "description": "Foco e objetivo (máx 120 chars)",
-  "difficulty_level": "{difficulty}",
-  "estimated_duration": {duration},
-  "target_muscle_groups": "{areas}",
-  "equipment_needed": "{equip}",
-  "workout_type": "full_body",
-  "calories_estimate": 250,
-  "exercises": [
-    {{
-      "name": "Nome Específico em Português",
-      "description": "Execução clara (máx 150 chars)",
-      "muscle_group": "grupo",
-      "difficulty_level": "{difficulty}",
-      "equipment_needed": "equipamento",
-      "duration_minutes": 5,
-      "sets": 3,
-      "reps": "12-15",
-      "rest_time": 60,
-      "order_in_workout": 1,
-      "instructions": ["Passo 1", "Passo 2", "Passo 3"],
-      "tips": ["Dica 1", "Dica 2"]
-    }}
-  ]
-}}
-
-✅ REGRAS:
-1. Português brasileiro
-2. Exercícios específicos (ex: "Rosca Martelo")
-3. Respeitar: {equip}
-4. Focar: {areas}
-5. Nível: {nivel_texto}
-{f'6. EVITAR: {limitacoes}' if limitacoes else ''}
-
-Crie o treino perfeito para {nome}! 💪
-'''
+    return ONBOARDING_PROMPT.render(
+        nome=nome, idade=idade, sexo=sexo,
+        peso_atual=peso_atual, peso_desejado=peso_desejado, altura=altura,
+        bmi=bmi, bmi_status=bmi_status, nivel_texto=nivel_texto,
+        metas=metas, areas=areas, tipos=tipos, equip=equip, tempo=tempo,
+        limitacoes=f'⚠️ LIMITAÇÕES: {limitacoes}' if limitacoes else '',
+        evitar=f'6. EVITAR: {limitacoes}' if limitacoes else '',
+        ex_count=ex_count, duration=duration, difficulty=difficulty,
+    )
 
 
 # ============================================================
@@ -2439,9 +2387,6 @@ Crie o treino perfeito para {nome}! 💪
 def generate_onboarding_workout(request):
     """Gera PLANO SEMANAL ou TREINO ÚNICO usando UserProfile real"""
     try:
-        from django.conf import settings
-        import google.generativeai as genai
-        
         user = request.user
         
         # ✅ BUSCAR PERFIL REAL
@@ -2472,23 +2417,24 @@ def generate_onboarding_workout(request):
             print(f"📝 Gerando treino único")
             ai_prompt = _build_onboarding_prompt(user_data)
         
-        # ✅ CHAMAR IA
-        api_key = getattr(settings, 'GEMINI_API_KEY', '')
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY não configurada")
-        
-        genai.configure(api_key=api_key)
-        model_name = getattr(settings, 'GEMINI_MODEL', 'gemini-2.0-flash-exp')
-        model = genai.GenerativeModel(model_name)
-        
-        generation_config = {
-            'max_output_tokens': 16384,
-            'temperature': 0.7,  # ✅ Aumentar criatividade
-            'response_mime_type': 'application/json',
-        }
+        # ✅ CHAMAR IA (provedor configurado: Gemini ou stub local)
+        ai_service = get_ai_service()
+        if not ai_service.is_available:
+            raise ValueError("IA indisponível (GEMINI_API_KEY não configurada?)")
+        
+        # Geração longa: deadline próprio e sem hedge (uma segunda chamada de 16k tokens dobraria custo e cota)
+        response_text = ai_service._make_gemini_request(
+            ai_prompt,
+            timeout=settings.GEMINI_LONG_TIMEOUT_SECONDS,
+            hedge=False,
+            max_output_tokens=16384,
+            temperature=0.7,  # ✅ Aumentar criatividade
+            response_mime_type='application/json',
+        )
+        if not response_text:
+            raise ValueError("Sem resposta da IA")
         
-        response = model.generate_content(ai_prompt, generation_config=generation_config)
-        plan_data = _extract_json_from_ai_response(response.text)
+        plan_data = _extract_json_from_ai_response(response_text)
 
         if not plan_data:
             raise ValueError("JSON inválido retornado pela IA")
@@ -2765,7 +2711,7 @@ def smart_recommendation_view(request):
         
         ai_recommendation = None
         try:
-            ai_service = AIService()
+            ai_service = get_ai_service()
             ai_recommendation = ai_service.generate_daily_recommendation(profile)
             
             if ai_recommendation:
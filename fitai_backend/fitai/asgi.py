@@ -3,6 +3,11 @@ ASGI config for fitai project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Servir via ASGI (ex: uvicorn fitai.asgi:application) habilita o streaming real do
+chatbot: POST /api/v1/chat/conversations/{id}/message/?stream=true responde com
+Server-Sent Events enviando os tokens do Gemini conforme chegam, sem prender um
+worker durante a geração. Sob WSGI o mesmo endpoint funciona, porém bufferizado.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -11,6 +16,6 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fitai.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fitai.settings.development')
 
 application = get_asgi_application()
@@ -190,6 +190,14 @@ GEMINI_MODEL = config('GEMINI_MODEL', default='gemini-2.5-flash')  # Modelo mais
 GEMINI_MAX_TOKENS = config('GEMINI_MAX_TOKENS', default=1000, cast=int)
 GEMINI_TEMPERATURE = config('GEMINI_TEMPERATURE', default=0.7, cast=float)
 
+# Provedor de LLM: 'gemini' (produção) ou 'stub' (local, sem rede - testes de carga)
+LLM_PROVIDER = config('LLM_PROVIDER', default='gemini')
+LLM_RECORD_PATH = config('LLM_RECORD_PATH', default='')  # grava respostas do Gemini (JSONL) para o stub
+LLM_STUB_RESPONSES_PATH = config('LLM_STUB_RESPONSES_PATH', default='')  # respostas gravadas que o stub repete
+LLM_STUB_LATENCY_MS = config('LLM_STUB_LATENCY_MS', default=300, cast=float)
+LLM_STUB_JITTER_MS = config('LLM_STUB_JITTER_MS', default=100, cast=float)
+LLM_STUB_STREAM_CHUNKS = config('LLM_STUB_STREAM_CHUNKS', default=8, cast=int)
+
 # AI Features Control
 AI_FEATURES_ENABLED = bool(GEMINI_API_KEY.strip())  # Só ativa se tiver API key válida
 AI_FALLBACK_TO_RULES = True  # Sempre usar fallbacks quando IA indisponível
@@ -197,6 +205,7 @@ AI_FALLBACK_TO_RULES = True  # Sempre usar fallbacks quando IA indisponível
 # Rate Limiting Configuration (Gemini tem limites mais generosos)
 GEMINI_RATE_LIMIT_PER_MINUTE = config('GEMINI_RATE_LIMIT_PER_MINUTE', default=15, cast=int)
 GEMINI_RATE_LIMIT_PER_DAY = config('GEMINI_RATE_LIMIT_PER_DAY', default=1500, cast=int)
+GEMINI_LIMITER_TIMEOUT = config('GEMINI_LIMITER_TIMEOUT', default=30, cast=int)  # espera máxima no token bucket compartilhado (s)
 
 # AI Quality & Monitoring
 AI_QUALITY_THRESHOLD = config('AI_QUALITY_THRESHOLD', default=70.0, cast=float)
@@ -205,8 +214,20 @@ AI_CACHE_TIMEOUT = config('AI_CACHE_TIMEOUT', default=3600, cast=int)
 
 # Gemini Timeout & Retry Configuration
 GEMINI_TIMEOUT_SECONDS = config('GEMINI_TIMEOUT_SECONDS', default=30, cast=int)
+GEMINI_LONG_TIMEOUT_SECONDS = config('GEMINI_LONG_TIMEOUT_SECONDS', default=180, cast=int)  # gerações longas (plano de onboarding, 16k tokens)
 GEMINI_MAX_RETRIES = config('GEMINI_MAX_RETRIES', default=3, cast=int)
 GEMINI_RETRY_DELAY = config('GEMINI_RETRY_DELAY', default=1.0, cast=float)
+GEMINI_MAX_IN_FLIGHT = config('GEMINI_MAX_IN_FLIGHT', default=8, cast=int)  # chamadas simultâneas por processo
+GEMINI_QUEUE_TIMEOUT_SECONDS = config('GEMINI_QUEUE_TIMEOUT_SECONDS', default=5, cast=float)  # espera máxima por uma vaga
+GEMINI_HEDGE_AFTER_MS = config('GEMINI_HEDGE_AFTER_MS', default=0, cast=float)  # 0 = p95 observado, <0 = sem hedge
+GEMINI_RETRY_BUDGET_RATIO = config('GEMINI_RETRY_BUDGET_RATIO', default=0.2, cast=float)  # retries+hedges / requisições
+GEMINI_CONTEXT_CACHE_MIN_TOKENS = config('GEMINI_CONTEXT_CACHE_MIN_TOKENS', default=1024, cast=int)  # prefixos menores não vão para o cache de contexto
+GEMINI_CONTEXT_CACHE_TTL_SECONDS = config('GEMINI_CONTEXT_CACHE_TTL_SECONDS', default=3600, cast=int)
+
+# Cliente Gemini compartilhado (health check em background + circuit breaker)
+GEMINI_HEALTH_CHECK_INTERVAL = config('GEMINI_HEALTH_CHECK_INTERVAL', default=300, cast=int)  # segundos
+GEMINI_CIRCUIT_FAILURE_THRESHOLD = config('GEMINI_CIRCUIT_FAILURE_THRESHOLD', default=5, cast=int)
+GEMINI_CIRCUIT_RESET_SECONDS = config('GEMINI_CIRCUIT_RESET_SECONDS', default=60, cast=int)
 
 # AI Content Safety (Gemini tem filtros nativos)
 AI_CONTENT_FILTERING = config('AI_CONTENT_FILTERING', default=True, cast=bool)
@@ -433,6 +454,18 @@ RECOMMENDATION_CONFIG = {
     'cache_recommendations': True,
 }
 
+# Filtragem colaborativa item-item (índice pré-calculado com NumPy/SciPy)
+CF_INDEX_PATH = config('CF_INDEX_PATH', default=str(BASE_DIR / 'data' / 'cf_index.npz'))
+CF_NEIGHBOURS = config('CF_NEIGHBOURS', default=50, cast=int)  # vizinhos mantidos por treino
+CF_INDEX_MAX_AGE = config('CF_INDEX_MAX_AGE', default=60 * 60 * 24, cast=int)  # segundos
+CF_INDEX_RELOAD_SECONDS = config('CF_INDEX_RELOAD_SECONDS', default=300, cast=int)  # releitura do .npz vencido/ausente
+
+# Lote noturno de recomendações (generate_recommendations --batch)
+RECOMMENDATION_BATCH_TTL = config('RECOMMENDATION_BATCH_TTL', default=60 * 60 * 36, cast=int)  # segundos
+
+# Modo paralelo (generate_recommendations / ai_operations generate_batch --workers)
+RECOMMENDATION_CHECKPOINT_DIR = config('RECOMMENDATION_CHECKPOINT_DIR', default=str(BASE_DIR / 'data' / 'checkpoints'))
+
 # =============================================================================
 # 🚦 RATE LIMITING CONFIGURATION
 # =============================================================================
@@ -516,6 +549,22 @@ CHATBOT_CONTEXT_SETTINGS = {
     'CONTEXT_RELEVANCE_THRESHOLD': 0.5,
     'MAX_CONTEXT_AGE_HOURS': 72,  # 3 dias
     'AUTO_UPDATE_USER_PREFERENCES': True,
+    # Resumo incremental da conversa (services/conversation_summary.py)
+    'PROMPT_TOKEN_BUDGET': config('CHATBOT_PROMPT_TOKEN_BUDGET', default=1800, cast=int),  # tokens estimados por prompt
+    'RECENT_MESSAGES': 6,          # mensagens mantidas na íntegra no prompt
+    'MIN_RECENT_MESSAGES': 2,      # mínimo na íntegra mesmo estourando o orçamento
+    'SUMMARY_EVERY_TURNS': 3,      # turnos fora da janela antes de resumir
+    'SUMMARY_MAX_TOKENS': 300,     # tamanho máximo do resumo
+}
+
+# Cache semântico de respostas do chat (services/response_cache.py)
+CHATBOT_RESPONSE_CACHE = {
+    'ENABLED': config('CHATBOT_RESPONSE_CACHE_ENABLED', default=True, cast=bool),
+    'TTL_SECONDS': config('CHATBOT_RESPONSE_CACHE_TTL', default=86400, cast=int),  # 24 horas
+    'SIMILARITY_THRESHOLD': 0.75,  # Jaccard mínimo entre as mensagens normalizadas
+    'MIN_TOKENS': 2,               # mensagens menores dependem do contexto ("e quantas séries?")
+    'MAX_TOKENS': 30,              # mensagens longas raramente se repetem
+    'EXCLUDED_INTENTS': ['injury_concern'],
 }
 
 # Prompts especializados por tipo de conversa